@@ -0,0 +1,113 @@
+"""
+Gunicorn configuration for the tracking API.
+
+Every setting can be overridden from the environment (or .env). The app is
+preloaded in the master so Django, DRF and the URLconf are imported once and
+shared copy-on-write by the workers; connections are closed before forking
+and the in-process write buffers are drained when a worker exits.
+"""
+import importlib.util
+import logging
+import multiprocessing
+import os
+import time
+
+from decouple import config as env
+
+logger = logging.getLogger('gunicorn.error')
+
+_config_loaded_at = time.monotonic()
+
+cpu_count = multiprocessing.cpu_count()
+
+worker_class = env('GUNICORN_WORKER_CLASS', default='sync')
+threads = env('GUNICORN_THREADS', default=1, cast=int)
+if worker_class == 'sync' and threads > 1:
+    # gunicorn does this too; being explicit keeps the logged settings honest
+    worker_class = 'gthread'
+
+_async_classes = {'gevent': 'gevent', 'eventlet': 'eventlet'}
+if worker_class in _async_classes and importlib.util.find_spec(_async_classes[worker_class]) is None:
+    raise RuntimeError(
+        f"GUNICORN_WORKER_CLASS={worker_class} needs the '{_async_classes[worker_class]}' package"
+    )
+
+# Sync workers serve one request each, so run more of them than cores to hide
+# I/O waits; threaded and async workers get their concurrency in-process.
+_default_workers = cpu_count * 2 + 1 if worker_class == 'sync' else cpu_count + 1
+_max_workers = env('GUNICORN_MAX_WORKERS', default=8, cast=int)
+workers = env('WEB_CONCURRENCY', default=min(_default_workers, _max_workers), cast=int)
+worker_connections = env('GUNICORN_WORKER_CONNECTIONS', default=1000, cast=int)
+
+# Django settings size the connection pools from these, so publish what was chosen
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ['GUNICORN_THREADS'] = str(threads)
+
+bind = env('GUNICORN_BIND', default=f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+wsgi_app = 'tracking_api.wsgi:application'
+preload_app = env('GUNICORN_PRELOAD', default=True, cast=bool)
+
+timeout = env('GUNICORN_TIMEOUT', default=30, cast=int)
+graceful_timeout = env('GUNICORN_GRACEFUL_TIMEOUT', default=30, cast=int)
+keepalive = env('GUNICORN_KEEPALIVE', default=5, cast=int)
+max_requests = env('GUNICORN_MAX_REQUESTS', default=0, cast=int)
+max_requests_jitter = env('GUNICORN_MAX_REQUESTS_JITTER', default=0, cast=int)
+
+# Seconds worker_exit may spend draining buffers; keep it under graceful_timeout
+drain_timeout = env('GUNICORN_DRAIN_TIMEOUT', default=10, cast=float)
+
+accesslog = env('GUNICORN_ACCESS_LOG', default=None)
+loglevel = env('GUNICORN_LOG_LEVEL', default='info')
+
+
+def _django_ready():
+    from django.apps import apps
+    return apps.ready
+
+
+def when_ready(server):
+    from tracking.lifecycle import format_memory, memory_usage
+
+    server.log.info(
+        f"Master ready in {time.monotonic() - _config_loaded_at:.2f}s: "
+        f"worker_class={worker_class} workers={workers} threads={threads} "
+        f"preload={preload_app} {format_memory(memory_usage())}"
+    )
+
+
+def pre_fork(server, worker):
+    worker.fork_started_at = time.monotonic()
+    if preload_app and _django_ready():
+        # Workers must not inherit open sockets or the master's pools
+        from tracking.lifecycle import close_connections
+        close_connections()
+
+
+def post_fork(server, worker):
+    if _django_ready():
+        from tracking.lifecycle import discard_inherited_connections
+        discard_inherited_connections()
+
+
+def post_worker_init(worker):
+    from tracking.lifecycle import format_memory, memory_usage
+    from tracking.profiling import install_signal_handler
+
+    # gunicorn resets worker signal handlers after fork, so install ours here
+    install_signal_handler()
+
+    worker.log.info(
+        f"Worker {worker.pid} booted in "
+        f"{time.monotonic() - getattr(worker, 'fork_started_at', _config_loaded_at):.2f}s "
+        f"{format_memory(memory_usage())}"
+    )
+
+
+def worker_exit(server, worker):
+    if not _django_ready():
+        return
+    from tracking.lifecycle import close_connections, run_shutdown_hooks
+
+    results = run_shutdown_hooks(drain_timeout)
+    close_connections()
+    worker.log.info(f"Worker {worker.pid} drained: {results}")
@@ -1,20 +1,182 @@
+import hashlib
+import re
+import uuid
+
 from django.contrib import admin
-from .models import TrackingNumberRequest, APIMetrics
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+from .models import TrackingNumberRequest, APIMetrics, LaneDailyRollup, TrackingNumberFormat
+from .pagination import InvalidCursor, estimated_count, keyset_page
+from .replicas import replica_reads
+
+CURSOR_VAR = 'cursor'
+TRACKING_NUMBER_PREFIX = re.compile(r'^[A-Z0-9]{1,16}$')
+
+# Fills the example number shown for a tracking number format
+EXAMPLE_DIGEST = int(hashlib.sha256(b'example').hexdigest(), 16)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator whose count comes from planner statistics or a capped COUNT."""
+
+    @cached_property
+    def count(self):
+        count, self.is_estimate = estimated_count(self.object_list)
+        return count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist paginated by a (created_at, id) cursor instead of OFFSET.
+
+    Every page is an index seek from the previous page's last row, and the
+    total is an estimate, so neither deep pages nor the row count scan the
+    table. Only "next" and "first page" navigation is offered.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Changing filters, search or hierarchy restarts from the first page
+        remove = list(remove or [])
+        if not new_params or CURSOR_VAR not in new_params:
+            remove.append(CURSOR_VAR)
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.cursor = request.GET.get(CURSOR_VAR)
+        try:
+            result_list, next_cursor = keyset_page(self.queryset, self.cursor, self.list_per_page)
+        except InvalidCursor:
+            raise IncorrectLookupParameters
+
+        self.result_count = paginator.count
+        self.result_count_is_estimate = paginator.is_estimate
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = bool(next_cursor or self.cursor)
+        self.paginator = paginator
+        self.next_page_url = next_cursor and self.get_query_string({CURSOR_VAR: next_cursor})
+        self.first_page_url = self.cursor and self.get_query_string()
+
+
+class ReplicaChangeListMixin:
+    """Render changelists from a read replica; actions and edits stay on the primary."""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with replica_reads():
+            return super().changelist_view(request, extra_context)
+
+
+class LaneListFilter(admin.SimpleListFilter):
+    """Filter by lane, offering only lanes that appear in the daily rollups."""
+
+    title = 'lane'
+    parameter_name = 'lane'
+
+    def lookups(self, request, model_admin):
+        lanes = LaneDailyRollup.objects.values_list(
+            'origin_country_id', 'destination_country_id'
+        ).distinct().order_by('origin_country_id', 'destination_country_id')
+        return [(f'{o}-{d}', f'{o} → {d}') for o, d in lanes]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            origin, destination = self.value().split('-')
+        except ValueError:
+            raise IncorrectLookupParameters
+        return queryset.filter(origin_country_id=origin, destination_country_id=destination)
 
 
 @admin.register(TrackingNumberRequest)
-class TrackingNumberRequestAdmin(admin.ModelAdmin):
+class TrackingNumberRequestAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = [
-        'tracking_number', 'customer_name', 'origin_country_id', 
+        'tracking_number', 'customer_name', 'origin_country_id',
         'destination_country_id', 'weight', 'created_at'
     ]
-    list_filter = ['origin_country_id', 'destination_country_id', 'created_at']
-    search_fields = ['tracking_number', 'customer_name', 'customer_slug']
+    list_filter = [LaneListFilter]
+    date_hierarchy = 'created_at'
+    search_fields = ['tracking_number']
+    search_help_text = 'Tracking number prefix, or an exact correlation ID.'
     readonly_fields = ['id', 'created_at', 'correlation_id']
+    ordering = ['-created_at', '-id']
+    sortable_by = []
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search through indexes only.
+
+        A tracking-number prefix becomes a range on the unique tracking_number
+        index (numbers are [A-Z0-9], so every match sorts between the prefix and
+        the prefix padded with 'Z'); a UUID matches correlation_id exactly.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        try:
+            return queryset.filter(correlation_id=str(uuid.UUID(term))), False
+        except ValueError:
+            pass
+        prefix = term.upper()
+        if not TRACKING_NUMBER_PREFIX.match(prefix):
+            return queryset.none(), False
+        return queryset.filter(
+            tracking_number__gte=prefix,
+            tracking_number__lte=prefix.ljust(16, 'Z')
+        ), False
 
 
 @admin.register(APIMetrics)
-class APIMetricsAdmin(admin.ModelAdmin):
+class APIMetricsAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['endpoint', 'method', 'status_code', 'response_time_ms', 'timestamp']
     list_filter = ['endpoint', 'method', 'status_code', 'timestamp']
     readonly_fields = ['timestamp', 'correlation_id']
+
+
+@admin.register(TrackingNumberFormat)
+class TrackingNumberFormatAdmin(admin.ModelAdmin):
+    list_display = ['customer_id', 'template', 'length', 'space_bits', 'expected_volume', 'updated_at']
+    search_fields = ['customer_id']
+    readonly_fields = ['length', 'space_bits', 'example', 'created_at', 'updated_at']
+
+    def _compiled(self, obj):
+        from .formats import TemplateError, compile_template
+
+        try:
+            return compile_template(obj.template) if obj and obj.template else None
+        except TemplateError:
+            return None
+
+    @admin.display(description='Length')
+    def length(self, obj):
+        compiled = self._compiled(obj)
+        return compiled.length if compiled else '-'
+
+    @admin.display(description='Random bits')
+    def space_bits(self, obj):
+        compiled = self._compiled(obj)
+        return f'{compiled.space_bits:.1f}' if compiled else '-'
+
+    @admin.display(description='Example')
+    def example(self, obj):
+        compiled = self._compiled(obj)
+        return compiled.format('MY', 'ID', EXAMPLE_DIGEST) if compiled else '-'
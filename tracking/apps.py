@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class TrackingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tracking'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from . import checks  # noqa: F401
+        from .formats import _format_changed
+        from .models import TrackingNumberFormat
+        from .sqlite import configure_connection
+
+        connection_created.connect(configure_connection, dispatch_uid='tracking_sqlite_tuning')
+        post_save.connect(_format_changed, sender=TrackingNumberFormat, dispatch_uid='tracking_format_saved')
+        post_delete.connect(_format_changed, sender=TrackingNumberFormat, dispatch_uid='tracking_format_deleted')
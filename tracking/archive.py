@@ -0,0 +1,336 @@
+import bisect
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+from .shards import get_shards
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_VERSION = 1
+TRAILER = struct.Struct('<Q8s')  # footer length, magic
+TRAILER_MAGIC = b'TNARC001'
+ARCHIVE_SUFFIX = '.tna'
+MANIFEST_NAME = 'manifest.json'
+
+# Stored per block, one list per column
+COLUMNS = (
+    'tracking_number', 'id', 'origin_country_id', 'destination_country_id', 'weight', 'customer_id',
+    'customer_name', 'customer_slug', 'request_timestamp', 'created_at', 'correlation_id'
+)
+
+
+def _archive_dir(directory: Optional[str] = None) -> str:
+    return directory or settings.ARCHIVE_DIR
+
+
+def archive_path(directory: str, day, origin: str, destination: str) -> str:
+    """One file per day per lane: <dir>/YYYY/MM/DD/<origin><destination>.tna"""
+    return os.path.join(directory, f'{day:%Y}', f'{day:%m}', f'{day:%d}', f'{origin}{destination}{ARCHIVE_SUFFIX}')
+
+
+def _encode_row(row) -> Dict[str, Any]:
+    return {
+        'tracking_number': row.tracking_number,
+        'id': str(row.id),
+        'origin_country_id': row.origin_country_id,
+        'destination_country_id': row.destination_country_id,
+        'weight': str(row.weight),
+        'customer_id': str(row.customer_id),
+        'customer_name': row.customer_name,
+        'customer_slug': row.customer_slug,
+        'request_timestamp': row.request_timestamp.isoformat(),
+        'created_at': row.created_at.isoformat(),
+        'correlation_id': row.correlation_id,
+    }
+
+
+def _decode_row(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **values,
+        'weight': Decimal(values['weight']),
+        'request_timestamp': datetime.fromisoformat(values['request_timestamp']),
+        'created_at': datetime.fromisoformat(values['created_at']),
+    }
+
+
+def write_archive(path: str, rows: List[Dict[str, Any]], day, lane: Tuple[str, str]) -> Dict[str, Any]:
+    """
+    Write rows (encoded, any order) to an archive file and return its footer.
+
+    Rows are sorted by tracking number and cut into blocks of
+    ARCHIVE_BLOCK_ROWS. Each block is stored column by column as JSON and
+    compressed with zlib. The footer records the file's min/max tracking
+    number and created_at plus the first number and position of every
+    block, so a lookup decompresses one block at most.
+    """
+    rows = sorted(rows, key=lambda row: row['tracking_number'])
+    block_rows = getattr(settings, 'ARCHIVE_BLOCK_ROWS', 1000)
+    level = getattr(settings, 'ARCHIVE_COMPRESSION_LEVEL', 6)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    blocks = []
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as output:
+        offset = 0
+        for start in range(0, len(rows), block_rows):
+            chunk = rows[start:start + block_rows]
+            columns = {column: [row[column] for row in chunk] for column in COLUMNS}
+            data = zlib.compress(json.dumps(columns, separators=(',', ':')).encode(), level)
+            output.write(data)
+            blocks.append([chunk[0]['tracking_number'], offset, len(data), len(chunk)])
+            offset += len(data)
+
+        footer = {
+            'version': ARCHIVE_VERSION,
+            'day': day.isoformat(),
+            'origin_country_id': lane[0],
+            'destination_country_id': lane[1],
+            'rows': len(rows),
+            'min_tracking_number': rows[0]['tracking_number'] if rows else None,
+            'max_tracking_number': rows[-1]['tracking_number'] if rows else None,
+            'min_created_at': min(row['created_at'] for row in rows) if rows else None,
+            'max_created_at': max(row['created_at'] for row in rows) if rows else None,
+            'blocks': blocks,
+        }
+        encoded = json.dumps(footer, separators=(',', ':')).encode()
+        output.write(encoded)
+        output.write(TRAILER.pack(len(encoded), TRAILER_MAGIC))
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(temp_path, path)
+    return footer
+
+
+def read_footer(path: str) -> Dict[str, Any]:
+    with open(path, 'rb') as archive:
+        archive.seek(-TRAILER.size, os.SEEK_END)
+        length, magic = TRAILER.unpack(archive.read(TRAILER.size))
+        if magic != TRAILER_MAGIC:
+            raise ValueError(f'{path} is not a tracking archive')
+        archive.seek(-TRAILER.size - length, os.SEEK_END)
+        return json.loads(archive.read(length))
+
+
+def read_block(path: str, offset: int, length: int) -> List[Dict[str, Any]]:
+    """Decompress one block back into row dicts (values still encoded)."""
+    with open(path, 'rb') as archive:
+        archive.seek(offset)
+        columns = json.loads(zlib.decompress(archive.read(length)))
+    return [dict(zip(COLUMNS, values)) for values in zip(*(columns[column] for column in COLUMNS))]
+
+
+def read_archive(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield every row of an archive file, encoded, in tracking number order."""
+    for _, offset, length, _ in read_footer(path)['blocks']:
+        yield from read_block(path, offset, length)
+
+
+def _manifest_path(directory: str) -> str:
+    return os.path.join(directory, MANIFEST_NAME)
+
+
+def _read_manifest(directory: str) -> Dict[str, Any]:
+    try:
+        with open(_manifest_path(directory)) as manifest:
+            return json.load(manifest)
+    except FileNotFoundError:
+        return {'version': ARCHIVE_VERSION, 'files': {}}
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]):
+    temp_path = _manifest_path(directory) + '.tmp'
+    with open(temp_path, 'w') as output:
+        json.dump(manifest, output, separators=(',', ':'), sort_keys=True)
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(temp_path, _manifest_path(directory))
+
+
+def _manifest_entry(footer: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in footer.items() if key not in ('blocks', 'version')}
+
+
+def _archivable(alias: str):
+    """
+    A shard's tracking requests the daily rollups have counted.
+
+    Rows the rollups have not folded in yet stay in the table, so archiving
+    never takes anything out of the analytics. The watermark is an insert
+    position, so rows inserted late with an old created_at (loaded audit
+    segments, lease reports) stay as well.
+    """
+    from .models import RollupWatermark, TrackingNumberRequest
+    from .rollups import rolled_up, watermark_name
+
+    table = TrackingNumberRequest.objects.using(alias)
+    watermark = RollupWatermark.objects.filter(name=watermark_name(alias)).first()
+    if watermark is None or watermark.last_inserted_at is None:
+        return table
+    return table.filter(rolled_up(watermark))
+
+
+def archive_before(
+    cutoff: datetime, directory: Optional[str] = None, chunk_size: Optional[int] = None,
+    dry_run: bool = False
+) -> Dict[str, int]:
+    """
+    Move rows created before `cutoff` out of tracking_requests into archive files.
+
+    Works one UTC day at a time, streaming the day's rows lane by lane in
+    tracking number order. A day's files and the manifest are written and
+    fsync'ed before that day's rows are deleted, so a crash at worst leaves
+    rows in both places; rerunning merges them into the existing files.
+    With DATABASE_SHARDS the shards are archived one after the other into
+    the same files, which merge the same way.
+    """
+    directory = _archive_dir(directory)
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    stats = {'days': 0, 'files': 0, 'rows': 0}
+    os.makedirs(directory, exist_ok=True)
+
+    shards = [_archivable(alias) for alias in get_shards()]
+    shards = [rows for rows in shards if rows.filter(created_at__lt=cutoff).exists()]
+    if not shards:
+        return stats
+
+    with open(os.path.join(directory, 'archive.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f'Another archive run is using {directory}')
+
+        manifest = _read_manifest(directory)
+        for table in shards:
+            _archive_shard(table, cutoff, directory, manifest, chunk_size, dry_run, stats)
+    return stats
+
+
+def _archive_shard(table, cutoff: datetime, directory: str, manifest: Dict[str, Any], chunk_size: int,
+                   dry_run: bool, stats: Dict[str, int]):
+    first = table.filter(created_at__lt=cutoff).order_by('created_at').values_list('created_at', flat=True).first()
+    if first is None:
+        return
+    day = first.astimezone(dt_timezone.utc).date()
+    while datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc) < cutoff:
+        start = datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+        end = min(start + timedelta(days=1), cutoff)
+        queryset = table.filter(created_at__gte=start, created_at__lt=end)
+        rows = queryset.order_by('origin_country_id', 'destination_country_id', 'tracking_number')
+        archived_ids = []
+        for lane, lane_rows in groupby(
+            rows.iterator(chunk_size=chunk_size), key=lambda row: (row.origin_country_id, row.destination_country_id)
+        ):
+            encoded = [_encode_row(row) for row in lane_rows]
+            archived_ids.extend(row['id'] for row in encoded)
+            if dry_run:
+                stats['files'] += 1
+                continue
+            path = archive_path(directory, day, *lane)
+            if os.path.exists(path):
+                known = {row['id'] for row in encoded}
+                encoded.extend(row for row in read_archive(path) if row['id'] not in known)
+            footer = write_archive(path, encoded, day, lane)
+            manifest['files'][os.path.relpath(path, directory)] = _manifest_entry(footer)
+            stats['files'] += 1
+
+        if archived_ids and not dry_run:
+            _write_manifest(directory, manifest)
+            for offset in range(0, len(archived_ids), 1000):
+                table.filter(id__in=archived_ids[offset:offset + 1000]).delete()
+        if archived_ids:
+            stats['days'] += 1
+            stats['rows'] += len(archived_ids)
+            logger.info(f"Archived {len(archived_ids)} tracking requests of {day} from {table.db}")
+        day += timedelta(days=1)
+
+
+class ArchiveReader:
+    """
+    Finds archived rows, opening as few files as possible.
+
+    The manifest (min/max tracking number per file) is re-read when it
+    changes, and prunes the file list without touching the files. For
+    each remaining file the cached footer's sparse index names the one
+    block that could hold the number, and only that block is decompressed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._manifest: Dict[str, Any] = {}
+        self._manifest_key: Optional[Tuple[str, int]] = None
+        self._footers: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self.stats = {'lookups': 0, 'files_searched': 0, 'blocks_read': 0}
+
+    def _files(self, directory: str) -> Dict[str, Any]:
+        try:
+            mtime = os.stat(_manifest_path(directory)).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            if self._manifest_key != (directory, mtime):
+                self._manifest = _read_manifest(directory)['files']
+                self._manifest_key = (directory, mtime)
+                self._footers.clear()
+            return self._manifest
+
+    def _footer(self, path: str) -> Dict[str, Any]:
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._footers.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = self._footers[path] = (mtime, read_footer(path))
+        return cached[1]
+
+    def find(self, tracking_number: str, directory: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The archived row of a tracking number, or None."""
+        directory = _archive_dir(directory)
+        self.stats['lookups'] += 1
+        candidates = [
+            name for name, entry in self._files(directory).items()
+            if entry['rows'] and entry['min_tracking_number'] <= tracking_number <= entry['max_tracking_number']
+        ]
+        for name in sorted(candidates, reverse=True):
+            path = os.path.join(directory, name)
+            try:
+                blocks = self._footer(path)['blocks']
+            except FileNotFoundError:
+                continue
+            self.stats['files_searched'] += 1
+            position = bisect.bisect_right([block[0] for block in blocks], tracking_number) - 1
+            if position < 0:
+                continue
+            _, offset, length, _ = blocks[position]
+            self.stats['blocks_read'] += 1
+            for row in read_block(path, offset, length):
+                if row['tracking_number'] == tracking_number:
+                    return _decode_row(row)
+        return None
+
+    def count(self, directory: Optional[str] = None) -> int:
+        """Rows in the archive, from the manifest."""
+        return sum(entry['rows'] for entry in self._files(_archive_dir(directory)).values())
+
+    def tracking_numbers(self, directory: Optional[str] = None) -> Iterator[str]:
+        """Every archived tracking number, file by file."""
+        directory = _archive_dir(directory)
+        for name in sorted(self._files(directory)):
+            for row in read_archive(os.path.join(directory, name)):
+                yield row['tracking_number']
+
+
+archive_reader = ArchiveReader()
+
+
+def find_archived(tracking_number: str) -> Optional[Dict[str, Any]]:
+    """Look a tracking number up in the archive, if ARCHIVE_DIR holds one."""
+    return archive_reader.find(tracking_number)
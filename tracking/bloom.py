@@ -0,0 +1,308 @@
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TNBLOOM1'
+# magic, bits, hashes, numbers added
+HEADER = struct.Struct('<8sQIQ')
+
+
+def optimal_size(capacity: int, error_rate: float) -> Tuple[int, int]:
+    """Bits and hash count for `capacity` items at the given false positive rate."""
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    bits = (bits + 7) // 8 * 8
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+class BloomFilter:
+    """
+    Bloom filter over an mmap of a file, shared by every process that maps it.
+
+    A "no" is definitive; a "yes" may be a false positive. Positions come
+    from one 128-bit BLAKE2b digest split into two hashes (double hashing).
+    Reads take no lock; add() must be called with the file locked (see
+    IssuedNumbers) because setting a bit rewrites its whole byte.
+    """
+
+    def __init__(self, path: str, writable: bool = True):
+        self.path = path
+        self._file = open(path, 'r+b' if writable else 'rb')
+        try:
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            )
+            magic, self.num_bits, self.num_hashes, _ = HEADER.unpack_from(self._map)
+        except (ValueError, struct.error):
+            self._file.close()
+            raise ValueError(f'{path} is not a tracking number filter')
+        if magic != MAGIC or len(self._map) != HEADER.size + self.num_bits // 8:
+            self.close()
+            raise ValueError(f'{path} is not a tracking number filter')
+        stat = os.fstat(self._file.fileno())
+        self.inode = (stat.st_dev, stat.st_ino)
+
+    @classmethod
+    def create(cls, path: str, capacity: int, error_rate: float) -> 'BloomFilter':
+        """Write an empty filter sized for `capacity` numbers to `path`."""
+        num_bits, num_hashes = optimal_size(capacity, error_rate)
+        with open(path, 'wb') as output:
+            output.write(HEADER.pack(MAGIC, num_bits, num_hashes, 0))
+            output.truncate(HEADER.size + num_bits // 8)
+        return cls(path)
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    @property
+    def count(self) -> int:
+        return HEADER.unpack_from(self._map)[3]
+
+    def _positions(self, number: str):
+        h1, h2 = struct.unpack('<QQ', hashlib.blake2b(number.encode(), digest_size=16).digest())
+        h2 |= 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, number: str) -> bool:
+        data = self._map
+        offset = HEADER.size
+        for position in self._positions(number):
+            if not data[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, number: str):
+        data = self._map
+        offset = HEADER.size
+        for position in self._positions(number):
+            data[offset + (position >> 3)] |= 1 << (position & 7)
+
+    def add_many(self, numbers: Iterable[str]) -> int:
+        added = 0
+        for number in numbers:
+            self.add(number)
+            added += 1
+        struct.pack_into('<Q', self._map, HEADER.size - 8, self.count + added)
+        return added
+
+    def merge(self, other: 'BloomFilter') -> bool:
+        """OR another filter's bits into this one; False if their sizes differ."""
+        if (other.num_bits, other.num_hashes) != (self.num_bits, self.num_hashes):
+            return False
+        start = HEADER.size
+        merged = int.from_bytes(self._map[start:], 'little') | int.from_bytes(other._map[start:], 'little')
+        self._map[start:] = merged.to_bytes(self.num_bits // 8, 'little')
+        return True
+
+    def fill_ratio(self) -> float:
+        """Share of bits set; the false positive rate is about fill_ratio ** num_hashes."""
+        ones = int.from_bytes(self._map[HEADER.size:], 'little').bit_count()
+        return ones / self.num_bits
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+@contextmanager
+def locked(bloom: BloomFilter):
+    """Hold the exclusive lock writers and rebuilds take on a filter file."""
+    fcntl.flock(bloom.fileno(), fcntl.LOCK_EX)
+    try:
+        yield bloom
+    finally:
+        fcntl.flock(bloom.fileno(), fcntl.LOCK_UN)
+
+
+class IssuedNumbers:
+    """
+    This process' view of the issued-number filter at BLOOM_PATH.
+
+    The file is re-stat'ed on every call, so a filter swapped in by
+    rebuild_issued_filter is picked up at once. Writers hold an exclusive
+    flock while setting bits; the rebuild takes the same lock to fold the
+    old file's bits into the new one before replacing it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._filter: Optional[BloomFilter] = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[BloomFilter]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        bloom = self._filter
+        if bloom is not None and bloom.inode == (stat.st_dev, stat.st_ino) and self._pid == os.getpid():
+            return bloom
+        with self._lock:
+            # flock is held per open file, so a forked child must not reuse the parent's
+            if self._filter is not None and self._pid == os.getpid():
+                self._filter.close()
+            try:
+                self._filter = BloomFilter(self.path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Cannot open issued-number filter: {str(e)}")
+                self._filter = None
+            self._pid = os.getpid()
+            return self._filter
+
+    def might_contain(self, number: str) -> Optional[bool]:
+        """False if `number` was never issued, True if it may have been, None without a filter."""
+        bloom = self.current()
+        return None if bloom is None else number in bloom
+
+    def add(self, numbers: Iterable[str]):
+        """Record issued numbers; a no-op until the filter has been built."""
+        numbers = list(numbers)
+        for _ in range(3):
+            bloom = self.current()
+            if bloom is None:
+                return
+            with locked(bloom):
+                # A rebuild may have replaced the file while we waited for the lock
+                if bloom is self.current():
+                    bloom.add_many(numbers)
+                    return
+
+
+_issued: Optional[IssuedNumbers] = None
+
+
+def get_issued_numbers() -> Optional[IssuedNumbers]:
+    """The issued-number filter, or None when BLOOM_PATH is unset."""
+    global _issued
+    path = getattr(settings, 'BLOOM_PATH', '')
+    if not path:
+        return None
+    if _issued is None or _issued.path != path:
+        _issued = IssuedNumbers(path)
+    return _issued
+
+
+def record_issued(*numbers: str):
+    """Add newly issued numbers to the filter, if there is one."""
+    issued = get_issued_numbers()
+    if issued is None:
+        return
+    try:
+        issued.add(numbers)
+    except OSError as e:
+        logger.warning(f"Failed to record issued numbers in filter: {str(e)}")
+
+
+def might_be_issued(number: str) -> Optional[bool]:
+    """False if the filter proves `number` was never issued, None without a usable filter."""
+    issued = get_issued_numbers()
+    return None if issued is None else issued.might_contain(number)
+
+
+def _numbers_outside_table() -> Iterator[str]:
+    """Issued numbers kept in the cold archive or in audit segments not loaded yet."""
+    from .archive import archive_reader
+    from .segments import AUDIT_STORE_SEGMENTS, get_audit_store, segment_tracking_numbers
+
+    yield from archive_reader.tracking_numbers()
+    if get_audit_store() == AUDIT_STORE_SEGMENTS:
+        yield from segment_tracking_numbers()
+
+
+def rebuild_filter(
+    path: Optional[str] = None, capacity: Optional[int] = None,
+    error_rate: Optional[float] = None, chunk_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Build the filter from tracking_requests and swap it in atomically.
+
+    Numbers are streamed from the table in chunks, followed by those in the
+    cold archive and unloaded audit segments, into a new file sized
+    for at least twice the current row count. Numbers issued while the scan
+    ran are not lost: under the old file's lock its bits are OR-ed in (when
+    the sizes match) right before the rename, and rows created since the
+    scan began, less ROLLUP_SAFETY_LAG_SECONDS, are added again afterwards.
+    """
+    from .models import TrackingNumberRequest
+
+    path = path or settings.BLOOM_PATH
+    if not path:
+        raise ValueError('BLOOM_PATH is not set')
+    error_rate = error_rate or getattr(settings, 'BLOOM_ERROR_RATE', 0.001)
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    from .archive import archive_reader
+    from .shards import get_shards
+
+    shards = get_shards()
+    rows = sum(TrackingNumberRequest.objects.using(alias).count() for alias in shards) + archive_reader.count()
+    capacity = max(capacity or getattr(settings, 'BLOOM_CAPACITY', 10_000_000), rows * 2, 1)
+
+    started = timezone.now()
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    bloom = BloomFilter.create(temp_path, capacity, error_rate)
+    try:
+        added = 0
+        for alias in shards:
+            numbers = TrackingNumberRequest.objects.using(alias).values_list('tracking_number', flat=True)
+            added += bloom.add_many(numbers.iterator(chunk_size=chunk_size))
+        added += bloom.add_many(_numbers_outside_table())
+
+        merged = False
+        try:
+            old = BloomFilter(path)
+        except (FileNotFoundError, ValueError):
+            old = None
+        if old is None:
+            bloom.flush()
+            os.replace(temp_path, path)
+        else:
+            with locked(old):
+                merged = bloom.merge(old)
+                bloom.flush()
+                os.replace(temp_path, path)
+            old.close()
+    except BaseException:
+        bloom.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # Writers that waited on the old file's lock now land in this one
+    since = started - timedelta(seconds=getattr(settings, 'ROLLUP_SAFETY_LAG_SECONDS', 60))
+    with locked(bloom):
+        for alias in shards:
+            recent = TrackingNumberRequest.objects.using(alias).filter(
+                created_at__gte=since
+            ).values_list('tracking_number', flat=True)
+            bloom.add_many(recent.iterator(chunk_size=chunk_size))
+    stats = {
+        'path': path,
+        'numbers': added,
+        'capacity': capacity,
+        'bits': bloom.num_bits,
+        'hashes': bloom.num_hashes,
+        'bytes': HEADER.size + bloom.num_bits // 8,
+        'merged': merged,
+        'fill_ratio': bloom.fill_ratio(),
+    }
+    bloom.close()
+    logger.info(f"Rebuilt issued-number filter with {added} numbers ({stats['bytes']} bytes)")
+    return stats
@@ -0,0 +1,412 @@
+import logging
+import multiprocessing
+import os
+import struct
+import threading
+from array import array
+from collections import defaultdict
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+from .bloom import get_issued_numbers, record_issued
+from .lifecycle import register_shutdown_hook
+from .replicas import note_writes
+from .shards import database_for, existing_numbers
+from .sqlite import writer_lock
+
+logger = logging.getLogger(__name__)
+
+# Per-parcel input columns; customer fields are shared by the whole batch
+PARCEL_FIELDS = ('origin_country_id', 'destination_country_id', 'weight', 'created_at')
+
+# Output record per parcel: tracking number, origin + destination,
+# weight in grams, created_at in microseconds since the epoch (UTC)
+RESULT_RECORD = struct.Struct('<16s4sqq')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MIN_CHUNK_ROWS = 1000
+MAX_ATTEMPTS = 3
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a batch: one number per parcel (None if invalid) plus errors by index."""
+
+    tracking_numbers: List[Optional[str]]
+    errors: Dict[int, Dict[str, List[str]]] = field(default_factory=dict)
+    written: int = 0
+    # (origin, destination, weight_grams, created_us) per parcel, for persisting
+    rows: List[Optional[Tuple[str, str, int, int]]] = field(default_factory=list, repr=False)
+
+
+def _pack_columns(parcels: Sequence[Any]) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """
+    Encode parcels as columns: a missing-field mask, then per field a uint32
+    offsets array followed by the UTF-8 values back to back.
+    """
+    n = len(parcels)
+    mask = bytearray(n)
+    chunks = []
+    layout = []
+    position = n
+    for bit, name in enumerate(PARCEL_FIELDS):
+        values = []
+        for i, parcel in enumerate(parcels):
+            value = parcel.get(name) if isinstance(parcel, dict) else None
+            if value is None:
+                mask[i] |= 1 << bit
+                values.append(b'')
+            else:
+                values.append(str(value).encode())
+        offsets = array('I', [0])
+        offsets.extend(accumulate(len(v) for v in values))
+        blob = b''.join(values)
+        layout.append((position, position + len(offsets) * offsets.itemsize))
+        chunks.append(offsets.tobytes())
+        chunks.append(blob)
+        position += len(offsets) * offsets.itemsize + len(blob)
+    return bytes(mask) + b''.join(chunks), layout
+
+
+def _unpack_rows(buf, layout: List[Tuple[int, int]], lo: int, hi: int) -> List[Dict[str, str]]:
+    """Decode parcels lo..hi from a buffer written by _pack_columns."""
+    mask = buf[lo:hi]
+    columns = []
+    for offsets_start, blob_start in layout:
+        offsets = buf[offsets_start:blob_start].cast('I')
+        columns.append([
+            bytes(buf[blob_start + offsets[i]:blob_start + offsets[i + 1]]).decode()
+            for i in range(lo, hi)
+        ])
+        offsets.release()
+    rows = []
+    for j in range(hi - lo):
+        rows.append({
+            name: columns[bit][j]
+            for bit, name in enumerate(PARCEL_FIELDS)
+            if not mask[j] & (1 << bit)
+        })
+    mask.release()
+    return rows
+
+
+def _generate_rows(
+    rows: List[Dict[str, str]], customer: Dict[str, str], salt: str, base: int, out, out_offset: int
+) -> Dict[int, Dict[str, List[str]]]:
+    """
+    Validate and number parcels, packing results into `out` at out_offset.
+
+    Returns serializer errors keyed by the parcel's index in the batch.
+    """
+    from rest_framework.exceptions import ValidationError
+    from .serializers import TrackingNumberRequestSerializer
+    from .services import TrackingNumberGenerator
+
+    # One serializer validates every row: building a serializer (and deep
+    # copying its fields) per row costs several times the validation itself
+    serializer = TrackingNumberRequestSerializer()
+    errors = {}
+    for j, row in enumerate(rows):
+        index = base + j
+        try:
+            data = serializer.run_validation({**row, **customer})
+        except ValidationError as e:
+            errors[index] = {k: [str(m) for m in v] for k, v in e.detail.items()}
+            continue
+        created_at = data['created_at']
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=dt_timezone.utc)
+        number = TrackingNumberGenerator.compute_tracking_number(
+            data['origin_country_id'], data['destination_country_id'], float(data['weight']),
+            created_at, customer['customer_id'], customer['customer_slug'], f'{salt}{index:x}',
+            template=customer.get('format_template')
+        )
+        RESULT_RECORD.pack_into(
+            out, out_offset + j * RESULT_RECORD.size,
+            number.encode(),
+            (data['origin_country_id'] + data['destination_country_id']).encode(),
+            int(data['weight'] * 1000),
+            (created_at - EPOCH) // timedelta(microseconds=1)
+        )
+    return errors
+
+
+def _init_worker(settings_module: Optional[str]):
+    """Set up Django in a pool worker started with forkserver or spawn."""
+    if settings_module:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _worker_generate(in_name, layout, out_name, lo, hi, customer, salt):
+    """Pool task: process parcels lo..hi between the shared input and output blocks."""
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    try:
+        rows = _unpack_rows(shm_in.buf, layout, lo, hi)
+        return _generate_rows(rows, customer, salt, lo, shm_out.buf, lo * RESULT_RECORD.size)
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return this process' bulk worker pool, starting it on first use."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            method = getattr(settings, 'BULK_START_METHOD', 'forkserver')
+            if method not in multiprocessing.get_all_start_methods():
+                method = 'spawn'
+            _pool = ProcessPoolExecutor(
+                max_workers=get_worker_count(),
+                mp_context=multiprocessing.get_context(method),
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),)
+            )
+            _pool_pid = pid
+    return _pool
+
+
+def shutdown_pool(wait: bool = True):
+    """Stop the bulk worker pool if this process started one."""
+    global _pool
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+register_shutdown_hook('bulk_pool', lambda timeout: shutdown_pool())
+
+
+def get_worker_count() -> int:
+    return max(1, getattr(settings, 'BULK_WORKERS', None) or os.cpu_count() or 1)
+
+
+def _split(n: int, workers: int) -> List[Tuple[int, int]]:
+    """Split n rows into about four chunks per worker, each at least MIN_CHUNK_ROWS."""
+    chunks = max(1, min(workers * 4, n // MIN_CHUNK_ROWS))
+    size = -(-n // chunks)
+    return [(lo, min(lo + size, n)) for lo in range(0, n, size)]
+
+
+def generate_batch(parcels: Sequence[Any], customer: Dict[str, str], salt: str) -> BatchResult:
+    """
+    Validate and number a batch of parcels for one customer.
+
+    Batches of at least BULK_PARALLEL_THRESHOLD parcels are split across the
+    process pool so validation and hashing run on every core instead of
+    behind one worker's GIL. Parcels travel to the workers, and results come
+    back, as packed columns in shared memory rather than pickled dicts; only
+    the (rare) validation errors are pickled.
+    """
+    n = len(parcels)
+    out = bytearray(n * RESULT_RECORD.size)
+    threshold = getattr(settings, 'BULK_PARALLEL_THRESHOLD', 5000)
+    workers = get_worker_count()
+
+    if n < threshold or workers == 1:
+        rows = [
+            {k: str(p[k]) for k in PARCEL_FIELDS if p.get(k) is not None} if isinstance(p, dict) else {}
+            for p in parcels
+        ]
+        errors = _generate_rows(rows, customer, salt, 0, out, 0)
+    else:
+        errors = _generate_parallel(parcels, customer, salt, workers, out)
+
+    result = BatchResult(tracking_numbers=[None] * n, errors=errors, rows=[None] * n)
+    for i, (number, lane, grams, created_us) in enumerate(RESULT_RECORD.iter_unpack(out)):
+        if i in errors:
+            continue
+        lane = lane.decode()
+        result.tracking_numbers[i] = number.rstrip(b'\0').decode()
+        result.rows[i] = (lane[:2], lane[2:], grams, created_us)
+    return result
+
+
+def _generate_parallel(parcels, customer, salt, workers, out) -> Dict[int, Dict[str, List[str]]]:
+    global _pool
+    n = len(parcels)
+    packed, layout = _pack_columns(parcels)
+    shm_in = shared_memory.SharedMemory(create=True, size=max(1, len(packed)))
+    shm_out = shared_memory.SharedMemory(create=True, size=len(out))
+    try:
+        shm_in.buf[:len(packed)] = packed
+        del packed
+        pool = get_pool()
+        futures = [
+            pool.submit(_worker_generate, shm_in.name, layout, shm_out.name, lo, hi, customer, salt)
+            for lo, hi in _split(n, workers)
+        ]
+        errors = {}
+        for future in futures:
+            errors.update(future.result())
+        out[:] = shm_out.buf[:len(out)]
+        return errors
+    except BrokenProcessPool:
+        logger.error("Bulk worker pool broke; it will be restarted on next use")
+        with _pool_lock:
+            _pool = None
+        raise
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+
+
+def persist_batch(
+    result: BatchResult, customer: Dict[str, str], correlation_id: str, salt: Optional[str] = None
+) -> int:
+    """
+    Log a batch's tracking numbers, renumbering any that collide.
+
+    Numbers duplicated within the batch or already issued are regenerated
+    with a new salt (derived from `salt`, default the correlation id), like
+    the retries of the single-number path, and checked again. Only numbers
+    the issued-number filter cannot rule out are looked up. The rows are
+    inserted all or nothing, bypassing the group commit buffer; if another
+    request takes one of the numbers in the meantime, the batch is checked
+    and renumbered again. Raises IntegrityError if it still collides after
+    MAX_ATTEMPTS renumberings.
+    """
+    from .services import TrackingNumberGenerator
+
+    salt = salt or correlation_id
+    issued = get_issued_numbers() if getattr(settings, 'BLOOM_TRUST_NEGATIVE', True) else None
+    valid = [i for i, number in enumerate(result.tracking_numbers) if number is not None]
+    attempt = 0
+    while True:
+        clashes = _clashes(result, valid, issued)
+        if not clashes:
+            try:
+                result.written = _insert_batch(_instances(result, valid, customer, correlation_id))
+                break
+            except IntegrityError as e:
+                # Taken by a concurrent request since the check; nothing was written
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                attempt += 1
+                logger.warning(
+                    f"Batch insert collided, checking again: {str(e)}",
+                    extra={'correlation_id': correlation_id}
+                )
+                continue
+        if attempt == MAX_ATTEMPTS:
+            raise IntegrityError(
+                f"{len(clashes)} tracking numbers in batch still collide after {MAX_ATTEMPTS} attempts"
+            )
+        attempt += 1
+        logger.warning(
+            f"Renumbering {len(clashes)} colliding tracking numbers in batch (attempt {attempt})",
+            extra={'correlation_id': correlation_id}
+        )
+        for i in clashes:
+            origin, destination, grams, created_us = result.rows[i]
+            result.tracking_numbers[i] = TrackingNumberGenerator.compute_tracking_number(
+                origin, destination, grams / 1000, EPOCH + timedelta(microseconds=created_us),
+                customer['customer_id'], customer['customer_slug'], f'{salt}{i:x}r{attempt}',
+                template=customer.get('format_template')
+            )
+
+    record_issued(*(result.tracking_numbers[i] for i in valid))
+    return result.written
+
+
+def _clashes(result: BatchResult, valid: List[int], issued) -> Set[int]:
+    """Indexes of numbers repeated within the batch or already in tracking_requests."""
+    seen = set()
+    clashes = set()
+    for i in valid:
+        number = result.tracking_numbers[i]
+        if number in seen:
+            clashes.add(i)
+        seen.add(number)
+    bloom = issued.current() if issued is not None else None
+    numbers = [number for number in seen if number in bloom] if bloom is not None else list(seen)
+    existing = existing_numbers(numbers)
+    if existing:
+        clashes.update(i for i in valid if result.tracking_numbers[i] in existing)
+    return clashes
+
+
+def _instances(result: BatchResult, valid: List[int], customer: Dict[str, str], correlation_id: str) -> List[Any]:
+    from .models import TrackingNumberRequest
+
+    instances = []
+    for i in valid:
+        origin, destination, grams, created_us = result.rows[i]
+        instances.append(TrackingNumberRequest(
+            tracking_number=result.tracking_numbers[i],
+            origin_country_id=origin,
+            destination_country_id=destination,
+            weight=Decimal(grams) / 1000,
+            customer_id=customer['customer_id'],
+            customer_name=customer['customer_name'],
+            customer_slug=customer['customer_slug'],
+            request_timestamp=EPOCH + timedelta(microseconds=created_us),
+            correlation_id=correlation_id
+        ))
+    return instances
+
+
+def _insert_batch(instances: List[Any]) -> int:
+    """
+    Insert every row or none.
+
+    Each shard the rows touch gets one transaction, in WRITE_BUFFER_MAX_BATCH
+    row INSERTs; the transactions are held open together and only commit
+    once every shard has taken its rows.
+    """
+    from .models import TrackingNumberRequest
+
+    by_database: Dict[str, List[Any]] = defaultdict(list)
+    for instance in instances:
+        by_database[database_for(instance)].append(instance)
+    chunk_size = getattr(settings, 'WRITE_BUFFER_MAX_BATCH', 500)
+    with ExitStack() as stack:
+        # Same lock order in every worker
+        for using in sorted(by_database):
+            rows = by_database[using]
+            stack.enter_context(writer_lock(connections[using]))
+            stack.enter_context(transaction.atomic(using=using))
+            if using == DEFAULT_DB_ALIAS:
+                # Explicit .using() bypasses ReplicaRouter.db_for_write, which marks read-your-writes
+                note_writes(rows)
+            TrackingNumberRequest.objects.using(using).bulk_create(rows, batch_size=chunk_size)
+    return len(instances)
+
+
+def issue_batch(
+    parcels: Sequence[Any], customer: Dict[str, str], correlation_id: str, persist: bool = True
+) -> BatchResult:
+    """Generate numbers for a batch and, unless it has invalid parcels, log them."""
+    from .correlation import unique_salt
+    from .formats import get_customer_template
+
+    # Workers get the template itself and compile it once per process
+    customer = {**customer, 'format_template': get_customer_template(customer['customer_id'])}
+    salt = unique_salt(correlation_id)
+    result = generate_batch(parcels, customer, salt)
+    if persist and not result.errors:
+        persist_batch(result, customer, correlation_id, salt)
+    return result
@@ -0,0 +1,108 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from django.conf import settings
+
+from .lifecycle import register_shutdown_hook
+from .linelog import BackgroundLineWriter
+
+CAPTURE_VERSION = 1
+
+# Request bodies are only kept for methods that carry one
+BODY_METHODS = ('POST', 'PUT', 'PATCH')
+
+
+def start_capture(request) -> Optional[Dict[str, Any]]:
+    """
+    Decide whether to capture this request and, if so, snapshot what replay needs.
+
+    Called before the view runs: the body has to be read here, because
+    once DRF has parsed the request stream it can no longer be accessed.
+    Bodies over CAPTURE_MAX_BODY_BYTES are left out and the record marked.
+    Returns None when the request is not sampled.
+    """
+    rate = getattr(settings, 'CAPTURE_SAMPLE_RATE', 0.0)
+    if rate <= 0 or not getattr(settings, 'CAPTURE_PATH', '') or random.random() >= rate:
+        return None
+
+    record: Dict[str, Any] = {
+        'v': CAPTURE_VERSION,
+        'ts': round(time.time(), 6),
+        'method': request.method,
+        'path': request.path,
+        'query': request.META.get('QUERY_STRING', ''),
+    }
+    if request.method in BODY_METHODS:
+        record['content_type'] = request.META.get('CONTENT_TYPE', '')
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > getattr(settings, 'CAPTURE_MAX_BODY_BYTES', 65536):
+            record['body_omitted'] = True
+        else:
+            try:
+                record['body'] = request.body.decode('utf-8')
+            except UnicodeDecodeError:
+                record['body_omitted'] = True
+    return record
+
+
+def finish_capture(record: Dict[str, Any], status_code: int, response_ms: float):
+    """Add the outcome to a captured request and queue it for writing."""
+    record['status'] = status_code
+    record['ms'] = round(response_ms, 3)
+    writer = get_writer()
+    if writer is not None:
+        writer.submit(record)
+
+
+def _encode_record(record: Dict[str, Any]) -> str:
+    return json.dumps(record, separators=(',', ':'))
+
+
+def read_capture(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yield captured requests in file order, skipping blank lines."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get('v') != CAPTURE_VERSION:
+            raise ValueError(f"Line {number}: unsupported capture version {record.get('v')!r}")
+        yield record
+
+
+_writer: Optional[BackgroundLineWriter] = None
+_writer_pid: Optional[int] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> Optional[BackgroundLineWriter]:
+    """Return this process' capture writer, or None when CAPTURE_PATH is unset."""
+    global _writer, _writer_pid
+    path = getattr(settings, 'CAPTURE_PATH', '')
+    if not path:
+        return None
+    pid = os.getpid()
+    if _writer is not None and _writer_pid == pid and _writer.path == path:
+        return _writer
+    with _writer_lock:
+        if _writer is None or _writer_pid != pid or _writer.path != path:
+            _writer = BackgroundLineWriter(path, _encode_record, name='traffic-capture')
+            _writer_pid = pid
+    return _writer
+
+
+def shutdown_writer(timeout: Optional[float] = None):
+    """Write out queued requests and stop the capture thread."""
+    global _writer
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.stop(timeout)
+        _writer = None
+
+
+register_shutdown_hook('traffic_capture', shutdown_writer)
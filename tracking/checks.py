@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register('database')
+def check_connection_pool_sizing(app_configs, **kwargs):
+    """Warn when the configured pools can exhaust PostgreSQL's max_connections."""
+    errors = []
+    if not getattr(settings, 'DB_POOL_ENABLED', False):
+        return errors
+
+    if settings.DATABASES['default']['ENGINE'] != 'tracking.db_backends.postgresql_pool':
+        errors.append(Warning(
+            'DB_POOL_ENABLED is set but the default database is not PostgreSQL.',
+            hint='Connection pooling is only available for postgresql:// DATABASE_URLs.',
+            id='tracking.W001',
+        ))
+        return errors
+
+    total = settings.WEB_CONCURRENCY * settings.DB_POOL_MAX_SIZE
+    if total > settings.DB_MAX_CONNECTIONS:
+        errors.append(Warning(
+            f'{settings.WEB_CONCURRENCY} workers x DB_POOL_MAX_SIZE={settings.DB_POOL_MAX_SIZE} '
+            f'can open {total} connections, above DB_MAX_CONNECTIONS={settings.DB_MAX_CONNECTIONS}.',
+            hint='Lower DB_POOL_MAX_SIZE or WEB_CONCURRENCY, or raise max_connections on the server.',
+            id='tracking.W002',
+        ))
+    if settings.DB_POOL_MAX_SIZE < settings.GUNICORN_THREADS:
+        errors.append(Warning(
+            f'DB_POOL_MAX_SIZE={settings.DB_POOL_MAX_SIZE} is below GUNICORN_THREADS='
+            f'{settings.GUNICORN_THREADS}; request threads will queue for connections.',
+            hint='Size the pool to at least one connection per request thread.',
+            id='tracking.W003',
+        ))
+    return errors
+
+
+@register('database')
+def check_replica_stickiness(app_configs, **kwargs):
+    """Warn when read-your-writes stickiness cannot be seen by the other workers."""
+    if not getattr(settings, 'DATABASE_REPLICAS', None) or settings.WEB_CONCURRENCY < 2:
+        return []
+    alias = getattr(settings, 'REPLICA_STICKY_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if backend != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [Warning(
+        f'REPLICA_STICKY_CACHE_ALIAS={alias!r} is a per-process cache, so a write only sends '
+        f'reads of its correlation id to the primary in the worker that made it.',
+        hint='Point REPLICA_STICKY_CACHE_ALIAS at a cache shared by all workers (e.g. Redis or Memcached).',
+        id='tracking.W004',
+    )]
+
+
+@register('database')
+def check_shard_key(app_configs, **kwargs):
+    """Warn about a SHARD_KEY the shard router does not know."""
+    from .shards import SHARD_KEYS
+
+    shard_key = getattr(settings, 'SHARD_KEY', 'customer')
+    if shard_key in SHARD_KEYS:
+        return []
+    return [Warning(
+        f'SHARD_KEY={shard_key!r} is not a shard key; rows are sharded by customer.',
+        hint=f"Set SHARD_KEY to one of: {', '.join(SHARD_KEYS)}.",
+        id='tracking.W005',
+    )]
@@ -0,0 +1,86 @@
+import itertools
+import logging
+import os
+import random
+import re
+from contextvars import ContextVar, Token
+from typing import Optional
+
+# Inbound ids must fit TrackingNumberRequest.correlation_id and be safe to log
+INBOUND_CORRELATION_ID = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._:-]{0,35}$')
+
+_VERSION_BITS = 0x4000 << 64 | 0x8000 << 48
+_VERSION_MASK = 0xf000 << 64 | 0xc000 << 48
+
+_correlation_id: ContextVar[Optional[str]] = ContextVar('tracking_correlation_id', default=None)
+
+
+def new_correlation_id() -> str:
+    """
+    Return a random version 4 UUID string.
+
+    Drawn from the `random` module, which is reseeded in every forked
+    worker, rather than os.urandom, so minting one costs no syscall.
+    Correlation ids only need to be unique, not unguessable.
+    """
+    digits = '%032x' % (random.getrandbits(128) & ~_VERSION_MASK | _VERSION_BITS)
+    return f'{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}'
+
+
+def resolve_correlation_id(inbound: Optional[str]) -> str:
+    """Reuse a well-formed inbound X-Correlation-ID, or mint a new id."""
+    if inbound and INBOUND_CORRELATION_ID.fullmatch(inbound):
+        return inbound
+    return new_correlation_id()
+
+
+_salt_counter = itertools.count()
+_process_salt = ''
+
+
+def _reset_process_salt():
+    global _salt_counter, _process_salt
+    _salt_counter = itertools.count()
+    _process_salt = '%08x' % random.getrandbits(32)
+
+
+_reset_process_salt()
+os.register_at_fork(after_in_child=_reset_process_salt)
+
+
+def unique_salt(correlation_id: str) -> str:
+    """
+    Salt for the tracking numbers of one request.
+
+    Callers may send the same X-Correlation-ID twice (a client retry), so the
+    id alone no longer makes the salt unique; a per-process random prefix
+    and counter do, without drawing fresh entropy per request.
+    """
+    return f'{correlation_id}{_process_salt}{next(_salt_counter):x}'
+
+
+def get_correlation_id() -> Optional[str]:
+    """The correlation id of the request being served, if any."""
+    return _correlation_id.get()
+
+
+def current_correlation_id() -> str:
+    """The current correlation id, or a fresh one outside a request (commands, direct calls)."""
+    return _correlation_id.get() or new_correlation_id()
+
+
+def set_correlation_id(correlation_id: str) -> Token:
+    return _correlation_id.set(correlation_id)
+
+
+def reset_correlation_id(token: Token):
+    _correlation_id.reset(token)
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Stamp every log record with the current correlation id unless one was passed in `extra`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, 'correlation_id'):
+            record.correlation_id = _correlation_id.get() or '-'
+        return True
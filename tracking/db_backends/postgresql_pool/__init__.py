@@ -0,0 +1,5 @@
+"""
+PostgreSQL backend with psycopg 3 connection pooling.
+
+Select it with DB_POOL_ENABLED=True; see tracking_api/settings.py.
+"""
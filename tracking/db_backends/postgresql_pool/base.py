@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+from typing import Any, Dict
+
+from django.db.backends.postgresql import base
+from psycopg import IsolationLevel
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL wrapper that borrows connections from a psycopg_pool.ConnectionPool.
+
+    Pool options come from OPTIONS['pool'] and are passed straight to
+    ConnectionPool. Django "closes" the connection at the end of each request
+    (CONN_MAX_AGE must be 0), which returns it to the pool instead of tearing
+    down the socket. One pool exists per database alias per process; a pool
+    inherited across fork() is discarded and rebuilt lazily in the child.
+    """
+
+    _connection_pools: Dict[str, Any] = {}
+    _pool_pids: Dict[str, int] = {}
+    _pools_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict['OPTIONS'].get('pool')
+        if not pool_options:
+            return None
+
+        pid = os.getpid()
+        if self._pool_pids.get(self.alias) == pid:
+            return self._connection_pools[self.alias]
+
+        with self._pools_lock:
+            if self._pool_pids.get(self.alias) != pid:
+                from psycopg_pool import ConnectionPool
+
+                connect_kwargs = self.get_connection_params()
+                # Django switches autocommit itself once it holds the connection
+                connect_kwargs['autocommit'] = True
+                check = (
+                    ConnectionPool.check_connection
+                    if self.settings_dict['CONN_HEALTH_CHECKS'] else None
+                )
+                self._connection_pools[self.alias] = ConnectionPool(
+                    kwargs=connect_kwargs,
+                    open=True,
+                    configure=self._configure_connection,
+                    check=check,
+                    name=f'{self.alias}-{pid}',
+                    **pool_options
+                )
+                self._pool_pids[self.alias] = pid
+                logger.info(
+                    f"Opened connection pool for '{self.alias}' "
+                    f"(min={pool_options.get('min_size')}, max={pool_options.get('max_size')})"
+                )
+        return self._connection_pools[self.alias]
+
+    def close_pool(self):
+        """Close this alias' pool if this process owns it."""
+        with self._pools_lock:
+            pool = self._connection_pools.pop(self.alias, None)
+            pid = self._pool_pids.pop(self.alias, None)
+        if pool is not None and pid == os.getpid():
+            pool.close()
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = IsolationLevel(
+            options.get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        connection = self.pool.getconn()
+        if 'isolation_level' in options:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def init_connection_state(self):
+        if self.pool is None:
+            return super().init_connection_state()
+        # Pooled connections were configured by the pool when they were opened
+        base.BaseDatabaseWrapper.init_connection_state(self)
+
+    def _configure_connection(self, connection):
+        """Set time zone and role on a freshly opened pooled connection."""
+        timezone_name = self.timezone_name
+        if timezone_name and connection.info.parameter_status('TimeZone') != timezone_name:
+            with connection.cursor() as cursor:
+                cursor.execute(self.ops.set_time_zone_sql(), [timezone_name])
+        if new_role := self.settings_dict['OPTIONS'].get('assume_role'):
+            with connection.cursor() as cursor:
+                cursor.execute(self.ops.compose_sql('SET ROLE %s', [new_role]))
+
+    def _close(self):
+        if self.connection is not None and self.pool is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
+                self.connection = None
+            return
+        return super()._close()
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Return psycopg_pool statistics for every pool opened in this process."""
+    pid = os.getpid()
+    return {
+        alias: pool.get_stats()
+        for alias, pool in list(DatabaseWrapper._connection_pools.items())
+        if DatabaseWrapper._pool_pids.get(alias) == pid
+    }
@@ -3,6 +3,8 @@ from rest_framework.response import Response
 from rest_framework import status
 import logging
 
+from .correlation import get_correlation_id
+
 logger = logging.getLogger(__name__)
 
 
@@ -46,7 +48,7 @@ def custom_exception_handler(exc, context):
     """Custom exception handler for the API."""
     
     # Get correlation ID from request if available
-    correlation_id = getattr(context.get('request'), 'correlation_id', None)
+    correlation_id = getattr(context.get('request'), 'correlation_id', None) or get_correlation_id()
     
     # Call REST framework's default exception handler first
     response = exception_handler(exc, context)
@@ -0,0 +1,125 @@
+import csv
+import heapq
+import json
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .filters import filter_tracking_requests
+from .shards import get_shards
+
+EXPORT_FIELDS = (
+    'tracking_number',
+    'origin_country_id',
+    'destination_country_id',
+    'weight',
+    'customer_id',
+    'customer_name',
+    'customer_slug',
+    'request_timestamp',
+    'created_at',
+    'correlation_id',
+)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows are grouped into chunks of roughly this many bytes per yield
+FLUSH_BYTES = 64 * 1024
+
+
+def _chunk_size() -> int:
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def export_rows(filters: Dict[str, Any], using: str = 'default') -> Iterator[tuple]:
+    """
+    Stream tracking request rows matching the filters as tuples of EXPORT_FIELDS.
+
+    Rows come from iterator(chunk_size=...), which uses a server-side cursor
+    on PostgreSQL, so memory stays flat regardless of the result size. The
+    cursor is read inside a transaction: outside one Django declares it WITH
+    HOLD, which makes PostgreSQL materialize the whole result before the
+    first row is returned.
+
+    With DATABASE_SHARDS every shard is streamed at once and the rows are
+    merged in created_at order; `using` stands in for the default database.
+    """
+    shards = get_shards()
+    if len(shards) == 1:
+        yield from _shard_rows(filters, using)
+        return
+    streams = [_shard_rows(filters, using if alias == DEFAULT_DB_ALIAS else alias) for alias in shards]
+    yield from heapq.merge(*streams, key=itemgetter(EXPORT_FIELDS.index('created_at')))
+
+
+def _shard_rows(filters: Dict[str, Any], using: str) -> Iterator[tuple]:
+    from .models import TrackingNumberRequest
+
+    queryset = filter_tracking_requests(
+        TrackingNumberRequest.objects.using(using), filters
+    ).order_by('created_at').values_list(*EXPORT_FIELDS)
+
+    if connections[using].vendor == 'postgresql':
+        with transaction.atomic(using=using):
+            yield from queryset.iterator(chunk_size=_chunk_size())
+    else:
+        yield from queryset.iterator(chunk_size=_chunk_size())
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class _Echo:
+    """File-like object whose write() returns the data instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    """Encode rows as CSV with a header line."""
+    writer = csv.writer(_Echo())
+    buffer = [writer.writerow(EXPORT_FIELDS)]
+    size = 0
+    for row in rows:
+        line = writer.writerow([_format_value(v) for v in row])
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    yield ''.join(buffer)
+
+
+def iter_ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    """Encode rows as newline-delimited JSON objects."""
+    buffer = []
+    size = 0
+    for row in rows:
+        line = json.dumps(
+            dict(zip(EXPORT_FIELDS, (_format_value(v) for v in row))),
+            separators=(',', ':')
+        ) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def iter_export(export_format: str, filters: Dict[str, Any], using: str = 'default') -> Iterator[str]:
+    """Stream an export of tracking requests in the given format."""
+    encoder = iter_csv if export_format == 'csv' else iter_ndjson
+    return encoder(export_rows(filters, using=using))
@@ -0,0 +1,64 @@
+import re
+import uuid
+
+from rest_framework import serializers
+
+
+def parse_lane(value):
+    """Parse a lane such as "MY-ID" into (origin_country_id, destination_country_id)."""
+    match = re.match(r'^([A-Z]{2})-([A-Z]{2})$', value.upper())
+    if not match:
+        raise ValueError("lane must be two ISO 3166-1 alpha-2 codes joined by '-' (e.g., 'MY-ID')")
+    return match.group(1), match.group(2)
+
+
+class TrackingRequestFilterSerializer(serializers.Serializer):
+    """Serializer for filters over logged tracking requests."""
+    
+    customer_id = serializers.CharField(required=False)
+    lane = serializers.CharField(required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    
+    def validate_customer_id(self, value):
+        """Validate customer_id is a valid UUID."""
+        try:
+            return str(uuid.UUID(value))
+        except (ValueError, TypeError):
+            raise serializers.ValidationError(
+                "customer_id must be a valid UUID (e.g., 'de619854-b59b-425e-9db4-943979e1bd49')"
+            )
+    
+    def validate_lane(self, value):
+        """Validate lane is ORIGIN-DESTINATION in ISO 3166-1 alpha-2 codes."""
+        try:
+            return parse_lane(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+    
+    def validate(self, attrs):
+        """Validate the time range is not inverted."""
+        if attrs.get('since') and attrs.get('until') and attrs['since'] >= attrs['until']:
+            raise serializers.ValidationError({'until': 'until must be later than since'})
+        return attrs
+
+
+class CustomerHistoryQuerySerializer(TrackingRequestFilterSerializer):
+    """Serializer for customer history query parameters."""
+    
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(required=False, default=50, min_value=1, max_value=200)
+
+
+def filter_tracking_requests(queryset, filters):
+    """Apply validated TrackingRequestFilterSerializer data to a queryset."""
+    if filters.get('customer_id'):
+        queryset = queryset.filter(customer_id=filters['customer_id'])
+    if filters.get('lane'):
+        origin, destination = filters['lane']
+        queryset = queryset.filter(origin_country_id=origin, destination_country_id=destination)
+    if filters.get('since'):
+        queryset = queryset.filter(created_at__gte=filters['since'])
+    if filters.get('until'):
+        queryset = queryset.filter(created_at__lt=filters['until'])
+    return queryset
@@ -0,0 +1,263 @@
+import math
+import operator
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+BASE36_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+DECIMAL_DIGITS = BASE36_DIGITS[:10]
+LETTERS = BASE36_DIGITS[10:]
+MAX_LENGTH = 16
+
+TOKEN = re.compile(r'\{([a-z0-9]+)(?::([a-z0-9]+))?\}')
+LITERAL = re.compile(r'[A-Z0-9]*')
+
+# Op codes of a compiled template
+_LITERAL, _ORIGIN, _DESTINATION, _BASE36, _DIGITS, _CHECK = range(6)
+
+
+class TemplateError(ValueError):
+    """Raised for a template that cannot produce valid tracking numbers."""
+
+
+# Luhn doubles every other digit from the right, summing the digits of the product
+_LUHN_DOUBLED = str.maketrans('0123456789', '0246813579')
+
+
+def luhn_digit(digits: str) -> str:
+    """Luhn (mod 10) check digit of a string of decimal digits."""
+    reversed_digits = digits[::-1]
+    # Sum the ASCII codes and subtract '0' once per digit
+    total = sum(reversed_digits[0::2].translate(_LUHN_DOUBLED).encode()) + sum(reversed_digits[1::2].encode())
+    return str(-(total - 48 * len(digits)) % 10)
+
+
+MOD11_WEIGHTS = (8, 6, 4, 2, 3, 5, 9, 7)
+_MOD11_WEIGHTS = MOD11_WEIGHTS * (MAX_LENGTH // len(MOD11_WEIGHTS))
+
+
+def mod11_digit(digits: str) -> str:
+    """Mod-11 check digit with the UPU S10 weights (8 6 4 2 3 5 9 7, repeated)."""
+    weights = _MOD11_WEIGHTS[:len(digits)]
+    total = sum(map(operator.mul, digits.encode(), weights)) - 48 * sum(weights)
+    check = 11 - total % 11
+    return '0' if check == 10 else '5' if check == 11 else str(check)
+
+
+CHECK_DIGITS: Dict[str, Callable[[str], str]] = {
+    'luhn': luhn_digit,
+    'mod11': mod11_digit,
+}
+
+
+class CompiledFormat:
+    """
+    A parsed template, ready to turn a digest into a tracking number.
+
+    Literal runs are merged at compile time and field widths are turned
+    into moduli, so formatting is one pass over a short list of ops.
+    """
+
+    __slots__ = ('template', 'length', 'space', '_ops')
+
+    def __init__(self, template: str, ops: List[Tuple[int, object]], length: int, space: int):
+        self.template = template
+        self.length = length
+        self.space = space
+        self._ops = ops
+
+    @property
+    def space_bits(self) -> float:
+        return math.log2(self.space)
+
+    def characters(self) -> List[str]:
+        """The characters each position of the template's numbers can hold."""
+        positions: List[str] = []
+        for op, arg in self._ops:
+            if op == _LITERAL:
+                positions.extend(arg)
+            elif op in (_ORIGIN, _DESTINATION):
+                positions.extend([LETTERS] * 2)
+            elif op == _BASE36:
+                positions.extend([BASE36_DIGITS] * arg)
+            elif op == _DIGITS:
+                positions.extend([DECIMAL_DIGITS] * arg[0])
+            else:
+                positions.append(DECIMAL_DIGITS)
+        return positions
+
+    def format(self, origin: str, destination: str, digest: int) -> str:
+        """Fill the template's random fields from `digest`, a large non-negative integer."""
+        parts = []
+        last_digits = ''
+        for op, arg in self._ops:
+            if op == _LITERAL:
+                parts.append(arg)
+            elif op == _ORIGIN:
+                parts.append(origin)
+            elif op == _DESTINATION:
+                parts.append(destination)
+            elif op == _BASE36:
+                chars = []
+                for _ in range(arg):
+                    digest, remainder = divmod(digest, 36)
+                    chars.append(BASE36_DIGITS[remainder])
+                parts.append(''.join(chars))
+            elif op == _DIGITS:
+                width, modulus = arg
+                digest, value = divmod(digest, modulus)
+                last_digits = f'{value:0{width}d}'
+                parts.append(last_digits)
+            else:
+                parts.append(arg(last_digits))
+        return ''.join(parts)
+
+    def __repr__(self):
+        return f'CompiledFormat({self.template!r})'
+
+
+def _width(kind: str, arg: Optional[str]) -> int:
+    if arg is None or not arg.isdigit() or not 1 <= int(arg) <= MAX_LENGTH:
+        raise TemplateError(f"{{{kind}:N}} needs a width between 1 and {MAX_LENGTH}")
+    return int(arg)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(template: str) -> CompiledFormat:
+    """
+    Parse a template such as "RBX{digits:9}{check:mod11}" once.
+
+    Fields: {origin} and {destination} (2 letters each), {base36:N} and
+    {digits:N} (N characters taken from the hash), and {check:luhn} or
+    {check:mod11}, a check digit over the {digits:N} field just before it.
+    Text outside braces is copied as is and must be [A-Z0-9].
+    """
+    ops: List[Tuple[int, object]] = []
+    length = 0
+    space = 1
+    position = 0
+
+    def literal(text):
+        if not LITERAL.fullmatch(text):
+            raise TemplateError(f"Literal text {text!r} may only contain A-Z and 0-9")
+        if text:
+            if ops and ops[-1][0] == _LITERAL:
+                ops[-1] = (_LITERAL, ops[-1][1] + text)
+            else:
+                ops.append((_LITERAL, text))
+
+    for match in TOKEN.finditer(template):
+        text = template[position:match.start()]
+        literal(text)
+        length += len(text)
+        position = match.end()
+
+        kind, arg = match.groups()
+        if kind in ('origin', 'destination'):
+            if arg is not None:
+                raise TemplateError(f"{{{kind}}} takes no argument")
+            ops.append((_ORIGIN if kind == 'origin' else _DESTINATION, None))
+            length += 2
+        elif kind == 'base36':
+            width = _width(kind, arg)
+            ops.append((_BASE36, width))
+            length += width
+            space *= 36 ** width
+        elif kind == 'digits':
+            width = _width(kind, arg)
+            ops.append((_DIGITS, (width, 10 ** width)))
+            length += width
+            space *= 10 ** width
+        elif kind == 'check':
+            if arg not in CHECK_DIGITS:
+                raise TemplateError(f"Unknown check digit scheme {arg!r}; use one of: {', '.join(CHECK_DIGITS)}")
+            if not ops or ops[-1][0] != _DIGITS:
+                raise TemplateError('{check:...} must directly follow a {digits:N} field')
+            ops.append((_CHECK, CHECK_DIGITS[arg]))
+            length += 1
+        else:
+            raise TemplateError(f"Unknown field {{{kind}}}")
+
+    # Stray or malformed braces end up here and fail the literal check
+    text = template[position:]
+    literal(text)
+    length += len(text)
+
+    if space == 1:
+        raise TemplateError('A template needs at least one {base36:N} or {digits:N} field')
+    if not 1 <= length <= MAX_LENGTH:
+        raise TemplateError(f"Template produces {length} characters; tracking numbers hold at most {MAX_LENGTH}")
+    return CompiledFormat(template, ops, length, space)
+
+
+def validate_template(template: str, expected_volume: int) -> CompiledFormat:
+    """
+    Check a template statically against the tracking number contract.
+
+    Besides fitting ^[A-Z0-9]{1,16}$, its random fields must span at least
+    FORMAT_MIN_SPACE_FACTOR times the customer's expected volume, so that a
+    new number collides with an issued one with probability below
+    1/FORMAT_MIN_SPACE_FACTOR even when the volume is reached. It must also
+    be unable to produce the layout reserved for leased numbers.
+    """
+    from .leases import LEASE_NUMBER_LENGTH
+
+    compiled = compile_template(template)
+    if compiled.length == LEASE_NUMBER_LENGTH:
+        positions = compiled.characters()
+        if '0' in positions[4] and all(set(chars) & set(LETTERS) for chars in positions[:4]):
+            raise TemplateError(
+                'Template can produce leased numbers (4 letters, a zero, then 11 characters); '
+                'fix the fifth character to something other than 0 or use fewer characters'
+            )
+    factor = getattr(settings, 'FORMAT_MIN_SPACE_FACTOR', 1000)
+    if compiled.space < expected_volume * factor:
+        raise TemplateError(
+            f"Template has {compiled.space:,} possible numbers; an expected volume of "
+            f"{expected_volume:,} needs at least {expected_volume * factor:,}"
+        )
+    return compiled
+
+
+_templates: Dict[str, Tuple[float, Optional[str]]] = {}
+_templates_lock = threading.Lock()
+
+
+def get_customer_template(customer_id) -> Optional[str]:
+    """
+    The customer's template, or None for the default layout.
+
+    Lookups, including misses, are cached in-process for FORMAT_CACHE_TTL
+    seconds; saving or deleting a format clears this process' entry at once.
+    """
+    key = str(customer_id)
+    entry = _templates.get(key)
+    now = time.monotonic()
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    from .models import TrackingNumberFormat
+
+    template = TrackingNumberFormat.objects.filter(customer_id=key).values_list('template', flat=True).first()
+    with _templates_lock:
+        if len(_templates) >= getattr(settings, 'FORMAT_CACHE_MAX_ENTRIES', 10000):
+            _templates.clear()
+        _templates[key] = (now + getattr(settings, 'FORMAT_CACHE_TTL', 60.0), template)
+    return template
+
+
+def invalidate_customer_template(customer_id=None):
+    """Forget one customer's cached template, or all of them."""
+    with _templates_lock:
+        if customer_id is None:
+            _templates.clear()
+        else:
+            _templates.pop(str(customer_id), None)
+
+
+def _format_changed(sender, instance, **kwargs):
+    invalidate_customer_template(instance.customer_id)
@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+HealthCheck = Callable[[], Dict[str, Any]]
+
+_checks: Dict[str, HealthCheck] = {}
+
+
+def register_check(name: str, check: HealthCheck):
+    """
+    Register a readiness check.
+
+    A check returns a dict of details when healthy and raises when not.
+    Components that own a dependency (write buffers, allocators, ...) register
+    their own check so the readiness probe picks it up automatically.
+    """
+    _checks[name] = check
+
+
+def unregister_check(name: str):
+    """Remove a previously registered readiness check."""
+    _checks.pop(name, None)
+
+
+def check_database() -> Dict[str, Any]:
+    """Verify the default database connection can run a trivial query."""
+    connection = connections['default']
+    connection.close_if_unusable_or_obsolete()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except Exception:
+        # Drop the broken connection so the next check reconnects
+        connection.close()
+        raise
+    return {'vendor': connection.vendor}
+
+
+register_check('database', check_database)
+
+
+class ReadinessMonitor:
+    """
+    Runs the registered readiness checks and caches the result.
+
+    Probes read the cached snapshot. A daemon thread refreshes it every
+    HEALTH_CHECK_REFRESH_INTERVAL seconds; without that thread a stale snapshot
+    is refreshed by at most one caller at a time while the others keep serving
+    the previous result, so bursts of probes never stampede the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._refreshed_at = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def ttl(self) -> float:
+        return getattr(settings, 'HEALTH_CHECK_CACHE_TTL', 2.0)
+
+    @property
+    def refresh_interval(self) -> float:
+        return getattr(settings, 'HEALTH_CHECK_REFRESH_INTERVAL', 1.0)
+
+    def run_checks(self) -> Dict[str, Any]:
+        """Run every registered check and build a readiness snapshot."""
+        results = {}
+        ready = True
+        for name, check in list(_checks.items()):
+            started = time.perf_counter()
+            try:
+                details = check() or {}
+                results[name] = {'status': 'ok', **details}
+            except Exception as e:
+                ready = False
+                results[name] = {'status': 'fail', 'error': str(e)}
+                logger.warning(f"Readiness check '{name}' failed: {str(e)}")
+            results[name]['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+        return {
+            'status': 'ready' if ready else 'not_ready',
+            'checks': results,
+            'checked_at': time.time(),
+        }
+
+    def refresh(self) -> Dict[str, Any]:
+        """Run the checks now and store the result as the current snapshot."""
+        snapshot = self.run_checks()
+        self._snapshot = snapshot
+        self._refreshed_at = time.monotonic()
+        return snapshot
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the cached readiness snapshot, refreshing it if needed."""
+        self._ensure_refresher()
+
+        age = time.monotonic() - self._refreshed_at
+        if self._snapshot is not None and age <= self.ttl:
+            return self._snapshot
+
+        if self._thread is not None and self._snapshot is not None:
+            # The refresher owns the checks; a snapshot this old means it is
+            # stuck on a dependency, which is itself a readiness failure.
+            if age > self.ttl + self.refresh_interval * 2:
+                return {
+                    **self._snapshot,
+                    'status': 'not_ready',
+                    'stale_seconds': round(age, 3),
+                }
+            return self._snapshot
+
+        if not self._lock.acquire(blocking=self._snapshot is None):
+            return self._snapshot
+        try:
+            if self._snapshot is None or time.monotonic() - self._refreshed_at > self.ttl:
+                self.refresh()
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def _ensure_refresher(self):
+        """Start the background refresher once per process."""
+        if self.refresh_interval <= 0:
+            return
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._thread = threading.Thread(
+                target=self._refresh_loop,
+                name='readiness-refresher',
+                daemon=True
+            )
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Readiness refresher error: {str(e)}")
+            time.sleep(self.refresh_interval)
+
+
+readiness_monitor = ReadinessMonitor()
@@ -0,0 +1,306 @@
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .bloom import record_issued
+from .models import FreeNumberRange, LeaseSequence, NumberLease, TrackingNumberRequest
+from .shards import shard_for
+
+logger = logging.getLogger(__name__)
+
+# Leased numbers are the lane followed by the value in base36, zero-padded to
+# 12 digits and always starting with a zero. Numbers from the default
+# generator are at most 14 characters and never have a zero after the lane,
+# so the two cannot meet (with DATABASE_SHARDS they are 15 characters), and
+# validate_template rejects customer templates that could produce the layout;
+# padding keeps string order equal to value order, so a lease is a range of
+# the tracking_number index. Reported rows live on the shard of the lease's
+# customer (or lane).
+LEASE_DIGITS = 12
+LEASE_NUMBER_LENGTH = 4 + LEASE_DIGITS
+MAX_LEASE_VALUE = 36 ** (LEASE_DIGITS - 1)
+
+BASE36 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+POLICY_VOID = 'void'
+POLICY_RETURN = 'return'
+EXPIRY_POLICIES = (POLICY_VOID, POLICY_RETURN)
+
+# Reported numbers checked against the table per query
+LOOKUP_CHUNK = 1000
+
+
+class LeaseClosed(Exception):
+    """Assignments were reported for a lease that has expired."""
+
+
+def grace() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'LEASE_GRACE_SECONDS', 300))
+
+
+def lease_number(origin: str, destination: str, value: int) -> str:
+    digits = ''
+    while value:
+        value, remainder = divmod(value, 36)
+        digits = BASE36[remainder] + digits
+    return f'{origin}{destination}{digits.rjust(LEASE_DIGITS, "0")}'
+
+
+def parse_lease_number(number: str) -> Optional[Tuple[str, str, int]]:
+    """(origin, destination, value) of a number in the lease layout, else None."""
+    if len(number) != LEASE_NUMBER_LENGTH or number[4] != '0':
+        return None
+    try:
+        return number[:2], number[2:4], int(number[4:], 36)
+    except ValueError:
+        return None
+
+
+def lease_range(lease: NumberLease) -> Tuple[str, str]:
+    """First and last tracking number of a lease."""
+    origin, destination = lease.origin_country_id, lease.destination_country_id
+    return lease_number(origin, destination, lease.first), lease_number(origin, destination, lease.first + lease.count - 1)
+
+
+def _take_free_range(origin: str, destination: str, count: int) -> Optional[int]:
+    """First value of `count` returned numbers of the lane, if one returned range holds them."""
+    free = (
+        FreeNumberRange.objects.select_for_update()
+        .filter(origin_country_id=origin, destination_country_id=destination, count__gte=count)
+        .order_by('first')
+        .first()
+    )
+    if free is None:
+        return None
+    first = free.first
+    if free.count == count:
+        free.delete()
+    else:
+        free.first += count
+        free.count -= count
+        free.save(update_fields=['first', 'count'])
+    return first
+
+
+def _advance_sequence(origin: str, destination: str, count: int) -> int:
+    """First value of `count` never-leased numbers of the lane."""
+    try:
+        with transaction.atomic():
+            sequence, _ = LeaseSequence.objects.select_for_update().get_or_create(
+                origin_country_id=origin, destination_country_id=destination
+            )
+    except IntegrityError:
+        # Another lease created the lane's sequence first
+        sequence = LeaseSequence.objects.select_for_update().get(
+            origin_country_id=origin, destination_country_id=destination
+        )
+    first = sequence.next_value
+    if first + count > MAX_LEASE_VALUE:
+        raise ValueError(f'Lane {origin}{destination} has no {count} numbers left to lease')
+    sequence.next_value = first + count
+    sequence.save(update_fields=['next_value'])
+    return first
+
+
+def create_lease(origin: str, destination: str, customer: Dict[str, str], count: int,
+                 ttl_seconds: float) -> NumberLease:
+    """
+    Reserve `count` consecutive numbers of a lane for a customer until the lease expires.
+
+    Returned numbers are handed out again first; otherwise the lane's
+    sequence moves on. Either way it is one row, however large the lease.
+    """
+    with transaction.atomic():
+        first = _take_free_range(origin, destination, count)
+        if first is None:
+            first = _advance_sequence(origin, destination, count)
+        left = _numbers_left(origin_country_id=origin, destination_country_id=destination).get((origin, destination))
+        if left is not None and left < _min_free() <= left + count:
+            logger.warning(f'Lane {origin}{destination} has {left} of {MAX_LEASE_VALUE} lease numbers left')
+        return NumberLease.objects.create(
+            origin_country_id=origin,
+            destination_country_id=destination,
+            customer_id=customer['customer_id'],
+            customer_name=customer['customer_name'],
+            customer_slug=customer['customer_slug'],
+            first=first,
+            count=count,
+            expires_at=timezone.now() + timedelta(seconds=ttl_seconds),
+        )
+
+
+def find_lease(tracking_number: str) -> Optional[NumberLease]:
+    """The active lease reserving a number that has not been reported yet, if any."""
+    parsed = parse_lease_number(tracking_number)
+    if parsed is None:
+        return None
+    origin, destination, value = parsed
+    lease = (
+        NumberLease.objects
+        .filter(origin_country_id=origin, destination_country_id=destination, first__lte=value,
+                status=NumberLease.STATUS_ACTIVE)
+        .order_by('-first')
+        .first()
+    )
+    if lease is None or value >= lease.first + lease.count:
+        return None
+    return lease
+
+
+def _shard(lease: NumberLease) -> str:
+    return shard_for(lease.customer_id, lease.origin_country_id, lease.destination_country_id)
+
+
+def lease_usage(lease: NumberLease) -> Tuple[int, Optional[int]]:
+    """Numbers of a lease reported so far, and the highest of them."""
+    first, last = lease_range(lease)
+    usage = (
+        TrackingNumberRequest.objects.using(_shard(lease))
+        .filter(tracking_number__gte=first, tracking_number__lte=last)
+        .annotate(length=Length('tracking_number'))
+        .filter(length=LEASE_NUMBER_LENGTH)
+        .aggregate(assigned=Count('id'), highest=Max('tracking_number'))
+    )
+    highest = usage['highest']
+    return usage['assigned'], parse_lease_number(highest)[2] if highest else None
+
+
+def reconcile(lease: NumberLease, assignments: List[Dict[str, Any]], correlation_id: str) -> Dict[str, Any]:
+    """
+    Queue audit rows for the numbers a client printed from a lease.
+
+    Numbers outside the lease are rejected by index; numbers reported
+    before (in this or an earlier report) are counted as duplicates, so
+    clients can safely resend a report. Rows are committed by the group
+    commit writer after this returns. Reports are accepted until
+    LEASE_GRACE_SECONDS after the lease expires.
+    """
+    from .writes import get_group_writer
+
+    if lease.status != NumberLease.STATUS_ACTIVE or timezone.now() >= lease.expires_at + grace():
+        raise LeaseClosed(f'Lease {lease.id} expired at {lease.expires_at.isoformat()}')
+
+    first, last = lease_range(lease)
+    rejected: Dict[int, str] = {}
+    accepted: Dict[str, Dict[str, Any]] = {}
+    duplicates = 0
+    for index, assignment in enumerate(assignments):
+        number = assignment['tracking_number']
+        if len(number) != LEASE_NUMBER_LENGTH or not first <= number <= last:
+            rejected[index] = 'Tracking number is not part of this lease'
+        elif number in accepted:
+            duplicates += 1
+        else:
+            accepted[number] = assignment
+
+    numbers = list(accepted)
+    for start in range(0, len(numbers), LOOKUP_CHUNK):
+        existing = TrackingNumberRequest.objects.using(_shard(lease)).filter(
+            tracking_number__in=numbers[start:start + LOOKUP_CHUNK]
+        ).values_list('tracking_number', flat=True)
+        for number in existing:
+            del accepted[number]
+            duplicates += 1
+
+    rows = [
+        TrackingNumberRequest(
+            tracking_number=number,
+            origin_country_id=lease.origin_country_id,
+            destination_country_id=lease.destination_country_id,
+            weight=assignment['weight'],
+            customer_id=lease.customer_id,
+            customer_name=lease.customer_name,
+            customer_slug=lease.customer_slug,
+            request_timestamp=assignment['assigned_at'],
+            correlation_id=correlation_id
+        )
+        for number, assignment in accepted.items()
+    ]
+    get_group_writer().submit(rows)
+    record_issued(*accepted)
+    return {'accepted': len(rows), 'duplicates': duplicates, 'rejected': rejected}
+
+
+def expire_leases(policy: Optional[str] = None, now=None) -> Dict[str, int]:
+    """
+    Close leases past their expiry plus LEASE_GRACE_SECONDS.
+
+    With the "return" policy the unused numbers above the highest one
+    reported go back to the lane for later leases; unused numbers below it
+    (and all unused numbers with the default "void" policy) are never issued.
+    """
+    policy = policy or getattr(settings, 'LEASE_EXPIRY_POLICY', POLICY_VOID)
+    if policy not in EXPIRY_POLICIES:
+        raise ValueError(f"policy must be one of: {', '.join(EXPIRY_POLICIES)}")
+    cutoff = (now or timezone.now()) - grace()
+
+    stats = {'leases': 0, 'assigned': 0, 'returned': 0, 'voided': 0}
+    expired = NumberLease.objects.filter(status=NumberLease.STATUS_ACTIVE, expires_at__lt=cutoff)
+    for lease_id in list(expired.values_list('id', flat=True)):
+        with transaction.atomic():
+            lease = NumberLease.objects.select_for_update().get(id=lease_id)
+            if lease.status != NumberLease.STATUS_ACTIVE:
+                continue
+            assigned, highest = lease_usage(lease)
+            returned = 0
+            if policy == POLICY_RETURN:
+                tail = lease.first if highest is None else highest + 1
+                returned = lease.first + lease.count - tail
+                if returned:
+                    FreeNumberRange.objects.create(
+                        origin_country_id=lease.origin_country_id,
+                        destination_country_id=lease.destination_country_id,
+                        first=tail,
+                        count=returned
+                    )
+            lease.status = NumberLease.STATUS_EXPIRED
+            lease.assigned = assigned
+            lease.returned = returned
+            lease.save(update_fields=['status', 'assigned', 'returned'])
+
+        stats['leases'] += 1
+        stats['assigned'] += assigned
+        stats['returned'] += returned
+        stats['voided'] += lease.count - assigned - returned
+        logger.info(
+            f"Expired lease {lease.id}: {assigned} assigned, {returned} returned, "
+            f"{lease.count - assigned - returned} voided"
+        )
+    return stats
+
+
+def _numbers_left(**lane) -> Dict[Tuple[str, str], int]:
+    """Lease numbers each lane has left, counting returned ones (filtered by `lane`)."""
+    returned = {
+        (row['origin_country_id'], row['destination_country_id']): row['total']
+        for row in FreeNumberRange.objects.filter(**lane).values('origin_country_id', 'destination_country_id')
+        .annotate(total=Sum('count'))
+    }
+    return {
+        (origin, destination): MAX_LEASE_VALUE - next_value + returned.get((origin, destination), 0)
+        for origin, destination, next_value in LeaseSequence.objects.filter(**lane).values_list(
+            'origin_country_id', 'destination_country_id', 'next_value'
+        )
+    }
+
+
+def _min_free() -> float:
+    return getattr(settings, 'LEASE_MIN_FREE_RATIO', 0.01) * MAX_LEASE_VALUE
+
+
+def lease_capacity() -> Dict[str, Any]:
+    """The fullest lane and the lanes with less than LEASE_MIN_FREE_RATIO of their lease numbers left."""
+    lanes = _numbers_left()
+    if not lanes:
+        return {'lanes': 0, 'low_lanes': []}
+    (origin, destination), left = min(lanes.items(), key=lambda item: item[1])
+    return {
+        'lanes': len(lanes), 'fullest_lane': f'{origin}{destination}', 'free_ratio': round(left / MAX_LEASE_VALUE, 6),
+        'low_lanes': sorted(f'{o}{d}' for (o, d), lane_left in lanes.items() if lane_left < _min_free()),
+    }
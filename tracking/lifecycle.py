@@ -0,0 +1,95 @@
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ShutdownHook = Callable[[float], None]
+
+_shutdown_hooks: Dict[str, ShutdownHook] = {}
+
+
+def register_shutdown_hook(name: str, hook: ShutdownHook):
+    """
+    Register a callable that drains an in-process buffer before a worker exits.
+
+    Hooks receive the seconds left in the drain budget and run in
+    registration order.
+    """
+    _shutdown_hooks[name] = hook
+
+
+def unregister_shutdown_hook(name: str):
+    _shutdown_hooks.pop(name, None)
+
+
+def run_shutdown_hooks(timeout: float) -> Dict[str, str]:
+    """Run every shutdown hook within a shared time budget; returns each hook's outcome."""
+    deadline = time.monotonic() + timeout
+    results = {}
+    for name, hook in list(_shutdown_hooks.items()):
+        remaining = max(0.0, deadline - time.monotonic())
+        try:
+            hook(remaining)
+            results[name] = 'ok'
+        except Exception as e:
+            logger.error(f"Shutdown hook '{name}' failed: {str(e)}")
+            results[name] = f'failed: {str(e)}'
+    return results
+
+
+def close_connections():
+    """Close this process' database connections and the pools it owns."""
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        close_pool = getattr(connection, 'close_pool', None)
+        if close_pool is not None:
+            close_pool()
+
+
+def discard_inherited_connections():
+    """
+    Forget database connections inherited across fork() without closing them.
+
+    Closing would end the parent's session on the shared socket; psycopg and
+    sqlite3 both skip the teardown for handles dropped in a child process.
+    Pools and background threads are per-pid and rebuild themselves lazily.
+    """
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None:
+            connection.connection = None
+
+
+def memory_usage() -> Dict[str, Optional[int]]:
+    """
+    Return this process' resident and proportional set size in bytes.
+
+    PSS splits pages shared with other processes (e.g. code preloaded by
+    the gunicorn master) between them, so it shows what preload saves; it
+    is only available on Linux.
+    """
+    usage: Dict[str, Optional[int]] = {'rss': None, 'pss': None}
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            for line in smaps:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    usage[key.lower()] = int(value.split()[0]) * 1024
+    except OSError:
+        import resource
+
+        # ru_maxrss is peak RSS, in KiB on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['rss'] = maxrss if os.uname().sysname == 'Darwin' else maxrss * 1024
+    return usage
+
+
+def format_memory(usage: Dict[str, Optional[int]]) -> str:
+    return ' '.join(
+        f'{key}={value / 1048576:.1f}MiB' for key, value in usage.items() if value is not None
+    )
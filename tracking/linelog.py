@@ -0,0 +1,69 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLineWriter:
+    """
+    Append items to a file, one line each, from a background thread.
+
+    The caller only pays for a queue put; items are encoded and written in
+    batches. When the queue is full new items are dropped and counted
+    rather than blocking the request.
+    """
+
+    def __init__(self, path: str, encode: Callable[[Any], str], name: str = 'line-writer',
+                 max_queue: int = 10000):
+        self.path = path
+        self.encode = encode
+        self._queue: 'queue.Queue[Any]' = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted item has been written."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def stop(self, timeout: Optional[float] = None):
+        self.flush(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            items = [item for item in batch if item is not None]
+            try:
+                if items:
+                    with open(self.path, 'a', encoding='utf-8') as output:
+                        for item in items:
+                            output.write(self.encode(item) + '\n')
+            except Exception as e:
+                logger.warning(f"Failed to write {len(items)} lines to {self.path}: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stopping:
+                return
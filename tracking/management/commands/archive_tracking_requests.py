@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from tracking.archive import archive_before
+
+
+class Command(BaseCommand):
+    help = (
+        'Move tracking requests created before a cutoff out of tracking_requests into compressed '
+        'archive files (one per day and lane) under ARCHIVE_DIR. Rows the daily rollups have not '
+        'processed yet are left in place.'
+    )
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group(required=True)
+        cutoff.add_argument('--older-than-days', type=int, help='Archive rows older than this many days')
+        cutoff.add_argument('--before', help='Archive rows created before this RFC 3339 timestamp')
+        parser.add_argument('--directory', help='Archive directory (default ARCHIVE_DIR)')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per round trip')
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be archived')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            cutoff = parse_datetime(options['before'])
+            if cutoff is None or timezone.is_naive(cutoff):
+                raise CommandError('--before must be an RFC 3339 timestamp with a UTC offset')
+        else:
+            if options['older_than_days'] < 1:
+                raise CommandError('--older-than-days must be at least 1')
+            cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+
+        try:
+            stats = archive_before(
+                cutoff,
+                directory=options['directory'],
+                chunk_size=options['chunk_size'],
+                dry_run=options['dry_run']
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(f"{verb} {stats['rows']} tracking requests from {stats['days']} days into {stats['files']} files")
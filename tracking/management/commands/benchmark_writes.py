@@ -0,0 +1,153 @@
+import shutil
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tracking import segments, writes
+from tracking.models import TrackingNumberRequest, APIMetrics
+from tracking.shards import get_shards
+
+BENCHMARK_SLUG = 'benchmark-writes'
+BENCHMARK_ENDPOINT = '/benchmark-writes'
+
+# Transactions committed per simulated request in the synchronous modes
+COMMITS_PER_REQUEST = {
+    writes.WRITE_MODE_DIRECT: 2,
+    writes.WRITE_MODE_REQUEST: 1,
+}
+
+# Audit row appended to segment files, metrics row through the group writer
+MODE_SEGMENTS = 'segments'
+MODES = (writes.WRITE_MODE_DIRECT, writes.WRITE_MODE_REQUEST, writes.WRITE_MODE_GROUP, MODE_SEGMENTS)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare commits and latency per request for the direct, request and group '
+        'write modes and the segment audit store (commits there are group commits plus '
+        'segment fsyncs). Inserts (and afterwards deletes) benchmark rows in the configured '
+        'database and AUDIT_SEGMENT_DIR, so point it at a non-production setup.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--modes', default='direct,request,group',
+            help='Comma-separated write modes to measure (direct, request, group, segments)'
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Keep the benchmark rows (and segments, written to AUDIT_SEGMENT_DIR)'
+        )
+
+    def handle(self, *args, **options):
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        for mode in modes:
+            if mode not in MODES:
+                raise CommandError(f'Unknown write mode: {mode}')
+
+        self.segment_directory = settings.AUDIT_SEGMENT_DIR if options['keep'] else tempfile.mkdtemp()
+        self.stdout.write(
+            f"{'mode':<8} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'commits':>8} {'commits/req':>12}"
+        )
+        try:
+            for mode in modes:
+                result = self._run(mode, options['requests'])
+                self.stdout.write(
+                    f"{mode:<8} {result['throughput']:>10.0f} {result['p50_ms']:>8.3f} "
+                    f"{result['p99_ms']:>8.3f} {result['commits']:>8} {result['commits_per_request']:>12.3f}"
+                )
+        finally:
+            if not options['keep']:
+                for alias in get_shards():
+                    TrackingNumberRequest.objects.using(alias).filter(customer_slug=BENCHMARK_SLUG).delete()
+                APIMetrics.objects.filter(endpoint=BENCHMARK_ENDPOINT).delete()
+            if not options['keep']:
+                shutil.rmtree(self.segment_directory, ignore_errors=True)
+
+    def _rows(self):
+        correlation_id = str(uuid.uuid4())
+        audit = TrackingNumberRequest(
+            tracking_number=uuid.uuid4().hex[:16].upper(),
+            origin_country_id='MY',
+            destination_country_id='ID',
+            weight=Decimal('1.234'),
+            customer_id=uuid.uuid4(),
+            customer_name='Benchmark',
+            customer_slug=BENCHMARK_SLUG,
+            request_timestamp=timezone.now(),
+            correlation_id=correlation_id
+        )
+        metrics = APIMetrics(
+            endpoint=BENCHMARK_ENDPOINT,
+            method='GET',
+            status_code=200,
+            response_time_ms=1,
+            correlation_id=correlation_id
+        )
+        return audit, metrics
+
+    def _run(self, mode, count):
+        writer = writes.get_group_writer() if mode in (writes.WRITE_MODE_GROUP, MODE_SEGMENTS) else None
+        segment_writer = None
+        if mode == MODE_SEGMENTS:
+            segment_writer = segments.SegmentWriter(
+                self.segment_directory, settings.AUDIT_SEGMENT_MAX_BYTES, settings.AUDIT_SEGMENT_FSYNC_MS
+            )
+        commits_before = writer.stats['commits'] if writer else 0
+        fsyncs_before = segment_writer.stats['fsyncs'] if segment_writer else 0
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(count):
+            audit, metrics = self._rows()
+            request_started = time.perf_counter()
+            if mode == writes.WRITE_MODE_DIRECT:
+                audit.save(force_insert=True)
+                metrics.save(force_insert=True)
+            elif mode == writes.WRITE_MODE_REQUEST:
+                writes.write_rows([audit, metrics])
+            elif mode == MODE_SEGMENTS:
+                segment_writer.append({
+                    field.attname: getattr(audit, field.attname)
+                    for field in TrackingNumberRequest._meta.concrete_fields
+                })
+                writer.submit([metrics])
+            else:
+                writer.submit([audit, metrics])
+            latencies.append((time.perf_counter() - request_started) * 1000)
+        if writer:
+            writer.flush()
+        if segment_writer:
+            segment_writer.sync()
+        elapsed = time.perf_counter() - started
+        if segment_writer:
+            segment_writer.stop()
+
+        commits = (
+            writer.stats['commits'] - commits_before if writer
+            else COMMITS_PER_REQUEST[mode] * count
+        )
+        if segment_writer:
+            commits += segment_writer.stats['fsyncs'] - fsyncs_before
+        latencies.sort()
+        return {
+            'throughput': count / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50),
+            'p99_ms': percentile(latencies, 99),
+            'commits': commits,
+            'commits_per_request': commits / count if count else 0.0,
+        }
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from tracking.timeseries import compact_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold api_metrics rows into 1-minute rollups and complete hours into 1-hour '
+        'rollups, then drop data past METRICS_*_RETENTION. Safe to run concurrently '
+        'and on a schedule.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop folding raw rows after this many batches')
+
+    def handle(self, *args, **options):
+        stats = compact_metrics(batch_size=options['batch_size'], max_batches=options['max_batches'])
+        deleted = stats['deleted']
+        self.stdout.write(
+            f"Compacted {stats['rows']} API calls into minutes and {stats['hours']} hours; "
+            f"expired {deleted['raw']} raw rows, {deleted['1m']} minutes and {deleted['1h']} hours"
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from .replay_traffic import load_result, report_comparison
+
+
+class Command(BaseCommand):
+    help = 'Compare per-endpoint latency and error rates of two replay_traffic --output files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline', help='Results JSON of the reference run')
+        parser.add_argument('candidate', help='Results JSON of the run under test')
+        parser.add_argument(
+            '--fail-over-pct', type=float,
+            help='Exit non-zero if any endpoint p95 is this much slower than the baseline, or errors more'
+        )
+
+    def handle(self, *args, **options):
+        report_comparison(
+            self, load_result(options['baseline']), load_result(options['candidate']), options['fail_over_pct']
+        )
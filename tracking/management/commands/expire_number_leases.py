@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.leases import EXPIRY_POLICIES, expire_leases, lease_capacity
+
+
+class Command(BaseCommand):
+    help = (
+        'Close number leases past their expiry plus LEASE_GRACE_SECONDS, voiding their '
+        'unused numbers or returning them to the lane. Safe to run on a schedule.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', choices=EXPIRY_POLICIES, help='Override LEASE_EXPIRY_POLICY')
+
+    def handle(self, *args, **options):
+        try:
+            stats = expire_leases(policy=options['policy'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Expired {stats['leases']} leases: {stats['assigned']} numbers assigned, "
+            f"{stats['returned']} returned, {stats['voided']} voided"
+        )
+        for lane in lease_capacity()['low_lanes']:
+            self.stderr.write(f'Lane {lane} has less than LEASE_MIN_FREE_RATIO of its lease numbers left')
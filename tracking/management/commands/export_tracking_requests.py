@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.exports import EXPORT_FORMATS, iter_export
+from tracking.filters import TrackingRequestFilterSerializer
+from tracking.replicas import read_database
+
+
+class Command(BaseCommand):
+    help = 'Stream logged tracking requests as CSV or NDJSON with constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--customer-id')
+        parser.add_argument('--lane', help='Origin and destination codes, e.g. MY-ID')
+        parser.add_argument('--since', help='RFC 3339 lower bound on created_at (inclusive)')
+        parser.add_argument('--until', help='RFC 3339 upper bound on created_at (exclusive)')
+        parser.add_argument('--output', help='File to write to (defaults to stdout)')
+        parser.add_argument('--database', help='Database to read from (defaults to a replica, if one is usable)')
+
+    def handle(self, *args, **options):
+        data = {
+            key: options[key]
+            for key in ('customer_id', 'lane', 'since', 'until')
+            if options[key]
+        }
+        serializer = TrackingRequestFilterSerializer(data=data)
+        if not serializer.is_valid():
+            raise CommandError(f'Invalid filters: {serializer.errors}')
+
+        using = options['database'] or read_database()
+        chunks = iter_export(options['export_format'], serializer.validated_data, using=using)
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.segments import load_segments
+
+
+class Command(BaseCommand):
+    help = (
+        'Import sealed audit segments (AUDIT_STORE=segments) into tracking_requests, sealing '
+        'segments left behind by crashed workers first. Safe to rerun and to run on a schedule.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help='Segment directory (default AUDIT_SEGMENT_DIR)')
+        parser.add_argument('--chunk-size', type=int, help='Rows per transaction')
+        parser.add_argument('--keep', action='store_true', help='Rename loaded segments to *.loaded instead of deleting them')
+
+    def handle(self, *args, **options):
+        try:
+            stats = load_segments(
+                directory=options['directory'],
+                chunk_size=options['chunk_size'],
+                keep=options['keep']
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Loaded {stats['loaded']} of {stats['records']} records from {stats['segments']} segments "
+            f"({stats['skipped']} already in the table, {stats['orphans']} orphaned segments sealed)"
+        )
+        if stats['duplicates']:
+            self.stderr.write(self.style.ERROR(
+                f"{stats['duplicates']} records carry a tracking number that was issued twice and were not "
+                f"loaded; their details are in the error log"
+            ))
@@ -0,0 +1,75 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.shards import BUCKETS, balanced_map, get_shards, relocate_rows, save_shard_map, shard_map
+
+
+class Command(BaseCommand):
+    help = (
+        'Assign shard buckets to databases and move tracking requests to their new shard. '
+        'Rows the daily rollups have counted on one shard only are left for a later run '
+        '(after update_rollups); running again moves the rest.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--assign', action='append', default=[], metavar='BUCKET=SHARD',
+            help='Move a bucket to a shard, e.g. 7=shard2 (repeatable)'
+        )
+        parser.add_argument('--balance', action='store_true', help='Spread buckets evenly over all shards')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows moved per transaction')
+        parser.add_argument(
+            '--settle-seconds', type=float,
+            help='Wait after changing the map so every worker reloads it (default SHARD_MAP_CACHE_TTL)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report the moves without changing anything')
+
+    def handle(self, *args, **options):
+        if len(get_shards()) < 2:
+            raise CommandError('Sharding is off: set DATABASE_SHARD_URLS')
+
+        current = shard_map()
+        assignments = balanced_map(current) if options['balance'] else {}
+        for assignment in options['assign']:
+            bucket, _, alias = assignment.partition('=')
+            try:
+                assignments[int(bucket)] = alias
+            except ValueError:
+                raise CommandError(f'Expected BUCKET=SHARD, got {assignment}')
+        for bucket, alias in assignments.items():
+            if not 0 <= bucket < BUCKETS or alias not in get_shards():
+                raise CommandError(f'Cannot assign bucket {bucket} to {alias}')
+        assignments = {bucket: alias for bucket, alias in assignments.items() if current[bucket] != alias}
+
+        mapping = list(current)
+        for bucket, alias in sorted(assignments.items()):
+            self.stdout.write(f'Bucket {bucket}: {current[bucket]} -> {alias}')
+            mapping[bucket] = alias
+
+        if options['dry_run']:
+            stats = relocate_rows(tuple(mapping), dry_run=True)
+            self.stdout.write(f"{stats['remaining']} tracking requests would move")
+            return
+
+        if assignments:
+            save_shard_map(assignments)
+            settle = options['settle_seconds']
+            if settle is None:
+                settle = getattr(settings, 'SHARD_MAP_CACHE_TTL', 30.0)
+            if settle > 0:
+                self.stdout.write(f'Waiting {settle:g}s for workers to reload the shard map')
+                time.sleep(settle)
+
+        stats = relocate_rows(batch_size=options['batch_size'])
+        self.stdout.write(f"Moved {stats['moved']} tracking requests")
+        if stats['remaining']:
+            self.stdout.write(
+                f"{stats['remaining']} tracking requests wait for update_rollups; run this command again afterwards"
+            )
+        if stats['conflicts']:
+            raise CommandError(
+                f"{stats['conflicts']} tracking requests were not moved: their tracking number is on the target "
+                f"shard already (see the error log)"
+            )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.bloom import rebuild_filter
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the issued tracking number filter (BLOOM_PATH) from tracking_requests, '
+        'streaming the table in chunks, and swap it in for running workers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Filter file (default BLOOM_PATH)')
+        parser.add_argument('--capacity', type=int, help='Numbers to size the filter for (default BLOOM_CAPACITY)')
+        parser.add_argument('--error-rate', type=float, help='Target false positive rate (default BLOOM_ERROR_RATE)')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per round trip')
+
+    def handle(self, *args, **options):
+        try:
+            stats = rebuild_filter(
+                path=options['path'],
+                capacity=options['capacity'],
+                error_rate=options['error_rate'],
+                chunk_size=options['chunk_size']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Wrote {stats['numbers']} numbers to {stats['path']} "
+            f"({stats['bytes']} bytes, {stats['hashes']} hashes, {stats['fill_ratio']:.2%} of bits set"
+            + (', merged with the previous filter)' if stats['merged'] else ')')
+        )
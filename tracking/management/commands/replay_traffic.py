@@ -0,0 +1,98 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.capture import read_capture
+from tracking.replay import (
+    HTTPSender, InProcessSender, ReplayResult, compare, format_comparison, format_result, regressions, replay
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay traffic captured with CAPTURE_PATH against a local instance, keeping the '
+        'original order and spacing, and report per-endpoint latency and errors. Writes '
+        'whatever the captured requests write, so point it at a non-production instance.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture', help='NDJSON capture file')
+        parser.add_argument('--target', default='http://127.0.0.1:8000', help='Base URL of the instance')
+        parser.add_argument(
+            '--in-process', action='store_true',
+            help="Send requests through Django's test client instead of HTTP"
+        )
+        parser.add_argument(
+            '--speed', type=float, default=1.0,
+            help='Time scale: 1 = as captured, 10 = ten times faster, 0 = as fast as possible'
+        )
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at most')
+        parser.add_argument('--limit', type=int, help='Replay only the first N captured requests')
+        parser.add_argument('--label', default='', help='Name of this run, e.g. a commit id')
+        parser.add_argument('--output', help='Save the results as JSON for compare_replays')
+        parser.add_argument('--compare', help='Results JSON of an earlier run to compare against')
+        parser.add_argument(
+            '--compare-capture', action='store_true',
+            help='Compare against the latencies recorded when the traffic was captured'
+        )
+        parser.add_argument(
+            '--fail-over-pct', type=float,
+            help='Exit non-zero if any endpoint p95 is this much slower than the baseline, or errors more'
+        )
+
+    def handle(self, *args, **options):
+        if options['speed'] < 0 or options['concurrency'] < 1:
+            raise CommandError('--speed must be >= 0 and --concurrency >= 1')
+        try:
+            with open(options['capture'], encoding='utf-8') as source:
+                records = list(read_capture(source))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {options['capture']}: {e}")
+        if options['limit'] is not None:
+            records = records[:options['limit']]
+
+        baseline = None
+        if options['compare']:
+            baseline = load_result(options['compare'])
+        elif options['compare_capture']:
+            baseline = ReplayResult.from_capture(records)
+
+        try:
+            send = InProcessSender() if options['in_process'] else HTTPSender(options['target'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        result = replay(
+            records, send, speed=options['speed'], concurrency=options['concurrency'], label=options['label']
+        )
+
+        for line in format_result(result):
+            self.stdout.write(line)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(result.to_dict(), output)
+
+        if baseline is not None:
+            report_comparison(self, baseline, result, options['fail_over_pct'])
+
+
+def load_result(path: str) -> ReplayResult:
+    try:
+        with open(path, encoding='utf-8') as source:
+            return ReplayResult.from_dict(json.load(source))
+    except (OSError, ValueError, KeyError) as e:
+        raise CommandError(f'Cannot read results {path}: {e}')
+
+
+def report_comparison(command, baseline, candidate, fail_over_pct=None):
+    """Print baseline/candidate rows and fail on regressions if asked to."""
+    rows = compare(baseline, candidate)
+    command.stdout.write('')
+    command.stdout.write(
+        command.style.MIGRATE_HEADING(f"{baseline.label or 'baseline'} / {candidate.label or 'candidate'}")
+    )
+    for line in format_comparison(rows):
+        command.stdout.write(line)
+    if fail_over_pct is not None:
+        failing = regressions(rows, fail_over_pct)
+        if failing:
+            raise CommandError(f"Regressed: {', '.join(failing)}")
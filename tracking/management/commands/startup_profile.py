@@ -0,0 +1,138 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.startup import group_import_times, parse_importtime
+
+# Runs in a fresh interpreter: boot the WSGI app the way gunicorn does, then
+# serve two requests. Timings go to stdout, -X importtime output to stderr.
+PROBE = r'''
+import io, json, sys, time
+started = time.perf_counter()
+import tracking_api.wsgi as wsgi
+booted = time.perf_counter()
+
+def call(path):
+    statuses = []
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+        'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+    }
+    b''.join(wsgi.application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+    return statuses[0]
+
+status = call(sys.argv[1])
+first = time.perf_counter()
+call(sys.argv[1])
+second = time.perf_counter()
+print('STARTUP ' + json.dumps({
+    'boot': booted - started, 'first_request': first - booted,
+    'second_request': second - first, 'status': status,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure cold start: boot the WSGI app in fresh interpreters under '
+        '-X importtime, time the first request, and break import time down by module.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles', default=None,
+            help='Comma-separated STARTUP_PROFILE values to compare (default: the current one)'
+        )
+        parser.add_argument('--no-prewarm', action='store_true', help='Boot with STARTUP_PREWARM=False')
+        parser.add_argument('--runs', type=int, default=3, help='Boots per profile; the median is reported')
+        parser.add_argument('--path', default='/health/live', help='Path of the first request')
+        parser.add_argument('--top', type=int, default=15, help='Packages and modules to list')
+        parser.add_argument('--depth', type=int, default=2, help='Dotted components to group packages by')
+        parser.add_argument(
+            '--fail-over-ms', type=float,
+            help='Exit non-zero if boot plus first request exceeds this many milliseconds'
+        )
+        parser.add_argument('--json', action='store_true', help='Print the raw results as JSON')
+
+    def handle(self, *args, **options):
+        profiles = (options['profiles'] or settings.STARTUP_PROFILE).split(',')
+        results = {profile.strip(): self._measure(profile.strip(), options) for profile in profiles}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for profile, result in results.items():
+                self._report(profile, result, options)
+
+        if options['fail_over_ms'] is not None:
+            slow = [p for p, r in results.items() if r['time_to_first_response_ms'] > options['fail_over_ms']]
+            if slow:
+                raise CommandError(
+                    f"Startup over {options['fail_over_ms']:.0f}ms for profile(s): {', '.join(slow)}"
+                )
+
+    def _measure(self, profile, options):
+        env = {
+            **os.environ,
+            'STARTUP_PROFILE': profile,
+            'STARTUP_PREWARM': 'False' if options['no_prewarm'] else 'True',
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'tracking_api.settings'),
+            'PYTHONPATH': os.pathsep.join(filter(None, [str(settings.BASE_DIR), os.environ.get('PYTHONPATH')])),
+        }
+        runs = []
+        for _ in range(max(1, options['runs'])):
+            proc = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', PROBE, options['path']],
+                env=env, capture_output=True, text=True, cwd=settings.BASE_DIR
+            )
+            marker = [line for line in proc.stdout.splitlines() if line.startswith('STARTUP ')]
+            if proc.returncode != 0 or not marker:
+                raise CommandError(f"Profile '{profile}' failed to boot:\n{proc.stderr[-2000:]}")
+            timings = parse_importtime(proc.stderr.splitlines())
+            runs.append({**json.loads(marker[0][len('STARTUP '):]), 'timings': timings})
+
+        # Report the median boot; its import breakdown is the one listed
+        runs.sort(key=lambda run: run['boot'] + run['first_request'])
+        median = runs[len(runs) // 2]
+        timings = median.pop('timings')
+        packages = sorted(group_import_times(timings, options['depth']).items(), key=lambda kv: -kv[1])
+        modules = sorted(timings, key=lambda t: -t.self_us)
+        return {
+            'boot_ms': median['boot'] * 1000,
+            'first_request_ms': median['first_request'] * 1000,
+            'second_request_ms': median['second_request'] * 1000,
+            'time_to_first_response_ms': (median['boot'] + median['first_request']) * 1000,
+            'spread_ms': statistics.pstdev([(r['boot'] + r['first_request']) * 1000 for r in runs]),
+            'status': median['status'],
+            'modules_imported': len(timings),
+            'import_self_ms': sum(t.self_us for t in timings) / 1000,
+            'packages': [{'package': p, 'self_ms': us / 1000} for p, us in packages[:options['top']]],
+            'modules': [
+                {'module': t.module, 'self_ms': t.self_us / 1000, 'cumulative_ms': t.cumulative_us / 1000}
+                for t in modules[:options['top']]
+            ],
+        }
+
+    def _report(self, profile, result, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Profile '{profile}'"))
+        self.stdout.write(
+            f"  boot {result['boot_ms']:.0f}ms + first request {result['first_request_ms']:.0f}ms "
+            f"({options['path']} -> {result['status']}) = {result['time_to_first_response_ms']:.0f}ms "
+            f"(±{result['spread_ms']:.0f}ms over {options['runs']} runs); "
+            f"second request {result['second_request_ms']:.1f}ms"
+        )
+        self.stdout.write(
+            f"  {result['modules_imported']} modules imported, {result['import_self_ms']:.0f}ms in module bodies"
+        )
+        self.stdout.write(f"  {'package':<40} {'self ms':>8}")
+        for row in result['packages']:
+            self.stdout.write(f"  {row['package']:<40} {row['self_ms']:>8.1f}")
+        self.stdout.write(f"  {'module':<40} {'self ms':>8} {'cum ms':>8}")
+        for row in result['modules']:
+            self.stdout.write(f"  {row['module']:<40} {row['self_ms']:>8.1f} {row['cumulative_ms']:>8.1f}")
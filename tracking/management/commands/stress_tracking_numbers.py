@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking import writes
+from tracking.stress import PATHS, UniquenessError, cleanup, format_result, run_stress
+
+
+class Command(BaseCommand):
+    help = (
+        'Issue tracking numbers from many processes and threads at once against the '
+        'configured database, then check that no number was returned twice and every '
+        'issued number has an audit row. Reports throughput, latency, collision retries '
+        'and lock errors. Inserts (and afterwards deletes) rows with customer slug '
+        '"stress-test", so point it at a non-production database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Forked worker processes')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per process')
+        parser.add_argument('--calls', type=int, default=250, help='Numbers issued per thread')
+        parser.add_argument(
+            '--path', choices=PATHS, default=writes.WRITE_MODE_DIRECT,
+            help='Write audit rows directly, at the end of a simulated request, or via the group writer'
+        )
+        parser.add_argument(
+            '--number-space', type=int,
+            help='Squeeze numbers into this many values to force collisions'
+        )
+        parser.add_argument('--keep', action='store_true', help='Keep the audit rows afterwards')
+
+    def handle(self, *args, **options):
+        if options['number_space'] is not None and options['number_space'] < 1:
+            raise CommandError('--number-space must be at least 1')
+        error = None
+        try:
+            result = run_stress(
+                path=options['path'], processes=options['processes'], threads=options['threads'],
+                calls=options['calls'], number_space=options['number_space']
+            )
+        except UniquenessError as e:
+            result, error = e.result, e
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if not options['keep']:
+                cleanup()
+
+        self.stdout.write(
+            f"{options['processes']} processes x {options['threads']} threads x "
+            f"{options['calls']} calls, {options['path']} path"
+        )
+        for line in format_result(result):
+            self.stdout.write(line)
+        if error is not None:
+            raise CommandError(str(error))
@@ -0,0 +1,45 @@
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.tracing import read_otlp_durations, summarize_sketch
+
+
+class Command(BaseCommand):
+    help = 'Summarize per-stage latency from an OTLP/JSON trace file written by TRACING_EXPORT_PATH.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Trace file (one OTLP/JSON export request per line)')
+        parser.add_argument('--histogram', action='store_true', help='Also print power-of-two millisecond buckets')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8') as source:
+                sketches, traces = read_otlp_durations(source)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+
+        self.stdout.write(f'{traces} traces')
+        self.stdout.write(f"{'stage':<20} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, sketch in sorted(sketches.items()):
+            row = summarize_sketch(sketch)
+            self.stdout.write(
+                f"{name:<20} {row['count']:>8} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} "
+                f"{row['p99_ms']:>9.3f} {row['max_ms']:>9.3f}"
+            )
+            if options['histogram']:
+                self._histogram(sketch)
+
+    def _histogram(self, sketch):
+        buckets = {}
+        if sketch.zero_count:
+            buckets[None] = sketch.zero_count
+        for index, count in sketch.bins.items():
+            value = sketch.gamma ** index
+            bucket = math.ceil(math.log2(value)) if value > 0 else None
+            buckets[bucket] = buckets.get(bucket, 0) + count
+        widest = max(buckets.values())
+        for bucket in sorted(buckets, key=lambda b: -math.inf if b is None else b):
+            label = '0' if bucket is None else f'<= {2.0 ** bucket:g}'
+            bar = '#' * max(1, round(40 * buckets[bucket] / widest))
+            self.stdout.write(f"    {label:>12} ms {buckets[bucket]:>8} {bar}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from tracking.rollups import update_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold tracking requests created since the last run into the per-customer and '
+        'per-lane daily rollup tables. Safe to run concurrently and on a schedule.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        processed = update_rollups(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches']
+        )
+        self.stdout.write(f'Rolled up {processed} tracking requests')
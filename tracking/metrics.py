@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.utils import timezone
+
+from .replicas import replica_reads
+from .shards import read_alias, scatter
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = {
+    '1h': timedelta(hours=1),
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+}
+DEFAULT_WINDOW = '24h'
+
+
+@replica_reads()
+def compute_metrics(window: str) -> Dict[str, Any]:
+    """
+    Run the request and API call aggregates over the last `window`, on a replica if there is one.
+
+    With DATABASE_SHARDS the request count is gathered from every shard in parallel.
+    """
+    from django.db.models import Count
+
+    from .models import TrackingNumberRequest
+    from .timeseries import summarize
+
+    since = timezone.now() - WINDOWS[window]
+
+    def count_requests(alias: str) -> int:
+        return TrackingNumberRequest.objects.using(read_alias(alias)).filter(
+            created_at__gte=since
+        ).aggregate(
+            total_requests=Count('id')
+        )['total_requests'] or 0
+
+    total_requests = sum(scatter(count_requests))
+    # API calls come from the downsampled tiers, so they outlive api_metrics retention
+    api_stats = summarize(since)
+    calls = api_stats['requests']
+    return {
+        'period': window,
+        'tracking_requests': total_requests,
+        'api_calls': calls,
+        'avg_response_time_ms': api_stats['avg_response_time_ms'],
+        'response_time_p95_ms': api_stats['response_time_p95_ms'],
+        'response_time_p99_ms': api_stats['response_time_p99_ms'],
+        'success_rate_percent': round((calls - api_stats['errors']) * 100.0 / calls, 2) if calls else 0,
+    }
+
+
+class _Flight:
+    """One recomputation in progress, awaited by every caller that needs it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class MetricsCache:
+    """
+    Stale-while-revalidate cache of compute_metrics, one entry per window.
+
+    Entries live in the METRICS_CACHE_ALIAS cache, so workers that share a
+    backend (Redis, Memcached, database) share them. An entry younger than
+    METRICS_CACHE_TTL is served as is; for METRICS_CACHE_STALE_SECONDS after
+    that it is still served while a background thread recomputes it. Only
+    a missing entry makes callers wait.
+
+    Recomputation is single-flight: concurrent callers in a process wait
+    on one computation, and across processes a short add() lock in the
+    cache lets one worker compute while the others poll for its result.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, compute: Callable[[str], Dict[str, Any]] = compute_metrics):
+        self.compute = compute
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+
+    @property
+    def ttl(self) -> float:
+        return getattr(settings, 'METRICS_CACHE_TTL', 10.0)
+
+    @property
+    def stale_seconds(self) -> float:
+        return getattr(settings, 'METRICS_CACHE_STALE_SECONDS', 300.0)
+
+    @property
+    def lock_seconds(self) -> float:
+        return getattr(settings, 'METRICS_CACHE_LOCK_SECONDS', 30.0)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'METRICS_CACHE_ALIAS', 'default')]
+
+    def get(self, window: str) -> Tuple[Dict[str, Any], float, bool]:
+        """Return (metrics, age in seconds, stale) for a window."""
+        if self.ttl <= 0:
+            return self.compute(window), 0.0, False
+
+        entry = self.cache.get(self._key(window))
+        if entry is not None:
+            age = max(time.time() - entry['computed_at'], 0.0)
+            if age <= self.ttl:
+                return entry['data'], age, False
+            if age <= self.ttl + self.stale_seconds:
+                self._refresh(window, wait=False)
+                return entry['data'], age, True
+
+        return self._refresh(window, wait=True), 0.0, False
+
+    def _key(self, window: str) -> str:
+        return f'tracking:metrics:{window}'
+
+    def _refresh(self, window: str, wait: bool) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            flight = self._flights.get(window)
+            leader = flight is None
+            if leader:
+                flight = self._flights[window] = _Flight()
+
+        if leader:
+            if wait:
+                self._run(window, flight, background=False)
+            else:
+                threading.Thread(
+                    target=self._run, args=(window, flight, True),
+                    name=f'metrics-refresh-{window}', daemon=True
+                ).start()
+        if not wait:
+            return None
+
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        if flight.result is None:
+            # Joined a background refresh that left the work to another worker
+            return self._wait_for_peer(window)
+        return flight.result
+
+    def _run(self, window: str, flight: _Flight, background: bool):
+        lock_key = self._key(window) + ':lock'
+        try:
+            if self.cache.add(lock_key, os.getpid(), timeout=self.lock_seconds):
+                try:
+                    flight.result = self._compute_and_store(window)
+                finally:
+                    self.cache.delete(lock_key)
+            elif not background:
+                flight.result = self._wait_for_peer(window)
+            # A background refresh another worker is already doing is simply skipped
+        except Exception as e:
+            flight.error = e
+            logger.error(f"Error refreshing metrics for {window}: {str(e)}")
+        finally:
+            with self._lock:
+                self._flights.pop(window, None)
+            flight.done.set()
+            if background:
+                connections.close_all()
+
+    def _compute_and_store(self, window: str) -> Dict[str, Any]:
+        data = self.compute(window)
+        self.cache.set(
+            self._key(window), {'data': data, 'computed_at': time.time()},
+            timeout=self.ttl + self.stale_seconds
+        )
+        return data
+
+    def _wait_for_peer(self, window: str) -> Dict[str, Any]:
+        """Poll for the entry another worker is computing; compute it here if it never shows up."""
+        started = time.time()
+        deadline = time.monotonic() + self.lock_seconds
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            entry = self.cache.get(self._key(window))
+            if entry is not None and entry['computed_at'] >= started:
+                return entry['data']
+        return self._compute_and_store(window)
+
+
+metrics_cache = MetricsCache()
@@ -1,8 +1,10 @@
 import time
-import uuid
 import logging
+from django.conf import settings
+from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
 from .models import APIMetrics
+from . import capture, correlation, profiling, tracing, writes
 
 logger = logging.getLogger(__name__)
 
@@ -12,11 +14,32 @@ class RequestLoggingMiddleware(MiddlewareMixin):
     
     def process_request(self, request):
         """Process incoming request."""
+        # Probes are hit every few seconds; keep them out of logs and metrics
+        if request.path in getattr(settings, 'REQUEST_LOGGING_EXCLUDED_PATHS', ()):
+            return None
+        
         request.start_time = time.time()
         
-        # Add correlation ID if not present
-        if not hasattr(request, 'correlation_id'):
-            request.correlation_id = str(uuid.uuid4())
+        # Sampled requests are recorded for manage.py replay_traffic
+        request.capture = capture.start_capture(request)
+        
+        # Collect this request's inserts so they commit together
+        if writes.get_write_mode() != writes.WRITE_MODE_DIRECT:
+            request.unit_of_work_token = writes.begin_unit_of_work()
+        
+        # One correlation ID per request, reused by the view, service and log records
+        header = 'HTTP_' + getattr(settings, 'CORRELATION_ID_HEADER', 'X-Correlation-ID').upper().replace('-', '_')
+        request.correlation_id = correlation.resolve_correlation_id(request.META.get(header))
+        request.correlation_token = correlation.set_correlation_id(request.correlation_id)
+        
+        # Sampled requests get a root span covering the whole middleware chain
+        request.trace_token = tracing.start_trace(request.correlation_id, request.META.get('HTTP_TRACEPARENT'))
+        if request.trace_token is not None:
+            request.trace_span = tracing.span(
+                'http.request', kind=tracing.SPAN_KIND_SERVER,
+                method=request.method, path=request.path
+            ).start()
+            request.profile = profiling.start_request_profile(request)
         
         # Log incoming request
         logger.info(
@@ -32,8 +55,55 @@ class RequestLoggingMiddleware(MiddlewareMixin):
     
     def process_response(self, request, response):
         """Process outgoing response."""
+        profile = getattr(request, 'profile', None)
+        if profile is not None:
+            try:
+                path = profile.stop()
+                response['X-Profile-Id'] = profile.name
+                logger.info(
+                    f"Request profile saved to {path}",
+                    extra={'correlation_id': request.correlation_id}
+                )
+            except Exception as e:
+                logger.warning(f"Failed to save request profile: {str(e)}")
+        
         if hasattr(request, 'start_time'):
-            response_time = int((time.time() - request.start_time) * 1000)
+            elapsed = time.time() - request.start_time
+            response_time = int(elapsed * 1000)
+            
+            metrics = APIMetrics(
+                endpoint=request.path,
+                method=request.method,
+                status_code=response.status_code,
+                response_time_ms=response_time,
+                correlation_id=getattr(request, 'correlation_id', 'unknown')
+            )
+            
+            # Store metrics together with the request's other writes
+            try:
+                token = getattr(request, 'unit_of_work_token', None)
+                if token is not None:
+                    writes.record(metrics)
+                    with tracing.span('db_commit', write_mode=writes.get_write_mode()):
+                        writes.end_unit_of_work(token)
+                else:
+                    with tracing.span('metrics_insert'):
+                        metrics.save(force_insert=True)
+            except writes.CommitFailed as e:
+                # The response may name rows that were never stored; it must not go out
+                logger.error(
+                    f"Failed to commit request writes: {str(e)}",
+                    extra={'correlation_id': getattr(request, 'correlation_id', 'unknown')}
+                )
+                response = JsonResponse(
+                    {'error': 'Internal server error', 'correlation_id': getattr(request, 'correlation_id', None)},
+                    status=500
+                )
+            except Exception as e:
+                logger.warning(f"Failed to store metrics: {str(e)}")
+            
+            if request.capture is not None:
+                capture.finish_capture(request.capture, response.status_code, elapsed * 1000)
             
             # Log response
             logger.info(
@@ -46,18 +116,17 @@ class RequestLoggingMiddleware(MiddlewareMixin):
                     'path': request.path
                 }
             )
-            
-            # Store metrics (async in production)
-            try:
-                APIMetrics.objects.create(
-                    endpoint=request.path,
-                    method=request.method,
-                    status_code=response.status_code,
-                    response_time_ms=response_time,
-                    correlation_id=getattr(request, 'correlation_id', 'unknown')
-                )
-            except Exception as e:
-                logger.warning(f"Failed to store metrics: {str(e)}")
+        
+        trace_token = getattr(request, 'trace_token', None)
+        if trace_token is not None:
+            request.trace_span.set_attribute('status_code', response.status_code)
+            request.trace_span.end()
+            tracing.finish_trace(trace_token)
+        
+        correlation_token = getattr(request, 'correlation_token', None)
+        if correlation_token is not None:
+            response[getattr(settings, 'CORRELATION_ID_HEADER', 'X-Correlation-ID')] = request.correlation_id
+            correlation.reset_correlation_id(correlation_token)
         
         return response
     
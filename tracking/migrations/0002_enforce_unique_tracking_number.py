@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-18 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameIndex(
+            model_name='apimetrics',
+            new_name='api_metrics_endpoin_4f889d_idx',
+            old_name='api_metrics_endpoin_b9b7c6_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='apimetrics',
+            new_name='api_metrics_status__48e310_idx',
+            old_name='api_metrics_status__7b8b8e_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='trackingnumberrequest',
+            new_name='tracking_re_trackin_a3da8d_idx',
+            old_name='tracking_re_trackin_e8b5e4_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='trackingnumberrequest',
+            new_name='tracking_re_correla_7ada0b_idx',
+            old_name='tracking_re_correla_a8b9c2_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='trackingnumberrequest',
+            new_name='tracking_re_created_5819b2_idx',
+            old_name='tracking_re_created_d4e5f6_idx',
+        ),
+        migrations.AlterField(
+            model_name='trackingnumberrequest',
+            name='tracking_number',
+            field=models.CharField(db_index=True, max_length=16, unique=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.1 on 2026-10-18 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0002_enforce_unique_tracking_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_id', models.UUIDField()),
+                ('day', models.DateField()),
+                ('request_count', models.BigIntegerField(default=0)),
+                ('total_weight', models.DecimalField(decimal_places=3, default=0, max_digits=20)),
+                ('weight_sketch', models.JSONField(default=dict)),
+            ],
+            options={
+                'db_table': 'rollup_customer_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='LaneDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin_country_id', models.CharField(max_length=2)),
+                ('destination_country_id', models.CharField(max_length=2)),
+                ('day', models.DateField()),
+                ('request_count', models.BigIntegerField(default=0)),
+                ('total_weight', models.DecimalField(decimal_places=3, default=0, max_digits=20)),
+                ('weight_sketch', models.JSONField(default=dict)),
+            ],
+            options={
+                'db_table': 'rollup_lane_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('last_created_at', models.DateTimeField(null=True)),
+                ('last_id', models.CharField(blank=True, default='', max_length=36)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'rollup_watermarks',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='customerdailyrollup',
+            constraint=models.UniqueConstraint(fields=('customer_id', 'day'), name='rollup_customer_daily_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='lanedailyrollup',
+            constraint=models.UniqueConstraint(fields=('origin_country_id', 'destination_country_id', 'day'), name='rollup_lane_daily_key'),
+        ),
+    ]
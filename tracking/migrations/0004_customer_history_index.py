@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0003_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trackingnumberrequest',
+            index=models.Index(fields=['customer_id', 'created_at', 'id'], name='tracking_req_customer_hist'),
+        ),
+    ]
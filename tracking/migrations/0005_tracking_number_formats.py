@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-18 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0004_customer_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackingNumberFormat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_id', models.UUIDField(unique=True)),
+                ('template', models.CharField(help_text='e.g. "RBX{digits:9}{check:mod11}"; fields: {origin}, {destination}, {base36:N}, {digits:N}, {check:luhn}, {check:mod11}', max_length=200)),
+                ('expected_volume', models.BigIntegerField(default=10000000, help_text='Tracking numbers the customer is expected to need with this template')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'tracking_number_formats',
+            },
+        ),
+    ]
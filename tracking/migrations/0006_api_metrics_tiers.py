@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-18 23:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0005_tracking_number_formats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIMetricsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(max_length=2)),
+                ('bucket', models.DateTimeField()),
+                ('endpoint', models.CharField(max_length=255)),
+                ('method', models.CharField(max_length=10)),
+                ('request_count', models.BigIntegerField(default=0)),
+                ('error_count', models.BigIntegerField(default=0)),
+                ('total_response_time_ms', models.BigIntegerField(default=0)),
+                ('latency_sketch', models.JSONField(default=dict)),
+            ],
+            options={
+                'db_table': 'rollup_api_metrics',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='apimetrics',
+            index=models.Index(fields=['timestamp', 'id'], name='api_metrics_timesta_325cd7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apimetricsrollup',
+            index=models.Index(fields=['resolution', 'bucket'], name='rollup_api__resolut_9e6617_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='apimetricsrollup',
+            constraint=models.UniqueConstraint(fields=('resolution', 'endpoint', 'method', 'bucket'), name='rollup_api_metrics_key'),
+        ),
+    ]
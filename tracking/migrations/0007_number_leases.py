@@ -0,0 +1,73 @@
+# Generated by Django 5.0.1 on 2026-10-18 23:39
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0006_api_metrics_tiers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaseSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin_country_id', models.CharField(max_length=2)),
+                ('destination_country_id', models.CharField(max_length=2)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'lease_sequences',
+            },
+        ),
+        migrations.CreateModel(
+            name='NumberLease',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('origin_country_id', models.CharField(max_length=2)),
+                ('destination_country_id', models.CharField(max_length=2)),
+                ('customer_id', models.UUIDField()),
+                ('customer_name', models.CharField(max_length=255)),
+                ('customer_slug', models.CharField(max_length=255)),
+                ('first', models.BigIntegerField()),
+                ('count', models.BigIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('status', models.CharField(default='active', max_length=10)),
+                ('assigned', models.BigIntegerField(help_text='Numbers reported as used, counted at expiry', null=True)),
+                ('returned', models.BigIntegerField(default=0, help_text='Unused numbers given back to the lane at expiry')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'number_leases',
+            },
+        ),
+        migrations.CreateModel(
+            name='FreeNumberRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin_country_id', models.CharField(max_length=2)),
+                ('destination_country_id', models.CharField(max_length=2)),
+                ('first', models.BigIntegerField()),
+                ('count', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'lease_free_ranges',
+                'indexes': [models.Index(fields=['origin_country_id', 'destination_country_id', 'first'], name='lease_free__origin__23d985_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='leasesequence',
+            constraint=models.UniqueConstraint(fields=('origin_country_id', 'destination_country_id'), name='lease_sequence_lane'),
+        ),
+        migrations.AddIndex(
+            model_name='numberlease',
+            index=models.Index(fields=['origin_country_id', 'destination_country_id', 'first'], name='number_leas_origin__80229a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='numberlease',
+            index=models.Index(fields=['status', 'expires_at'], name='number_leas_status_35f99e_idx'),
+        ),
+    ]
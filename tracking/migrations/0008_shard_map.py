@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-18 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0007_number_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardMapEntry',
+            fields=[
+                ('bucket', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('database', models.CharField(help_text='Alias in DATABASE_SHARDS', max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'shard_map',
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.1 on 2026-10-19 00:20
+
+from django.db import migrations, models
+
+import tracking.models
+
+
+def backfill_inserted_at(apps, schema_editor):
+    # Existing rows keep their place behind the rollup watermarks
+    TrackingNumberRequest = apps.get_model('tracking', 'TrackingNumberRequest')
+    TrackingNumberRequest.objects.using(schema_editor.connection.alias).update(inserted_at=models.F('created_at'))
+
+
+def move_rollup_positions(apps, schema_editor):
+    # The tracking_requests rollups tracked created_at, which the rows now carry as inserted_at
+    RollupWatermark = apps.get_model('tracking', 'RollupWatermark')
+    watermarks = RollupWatermark.objects.using(schema_editor.connection.alias).filter(
+        models.Q(name='tracking_requests_daily') | models.Q(name__startswith='tracking_requests_daily:')
+    )
+    watermarks.update(last_inserted_at=models.F('last_created_at'), last_created_at=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0008_shard_map'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackingnumberrequest',
+            name='inserted_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_inserted_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='trackingnumberrequest',
+            name='inserted_at',
+            field=models.DateTimeField(db_default=tracking.models.InsertTime(), editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='trackingnumberrequest',
+            index=models.Index(fields=['inserted_at', 'id'], name='tracking_req_inserted'),
+        ),
+        migrations.AddField(
+            model_name='rollupwatermark',
+            name='last_inserted_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(move_rollup_positions, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,27 @@
 from django.db import models
+from django.db.models.functions import Now
 import uuid
 
 
+class InsertTime(Now):
+    """
+    Now() for database defaults, stored on SQLite in the text format Django
+    gives datetimes (microseconds, none when zero) so comparisons with Python
+    values hold; SQLite's own clock only counts milliseconds.
+    """
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template=(
+                "CASE WHEN STRFTIME('%%%%f', 'NOW') LIKE '%%%%.000' "
+                "THEN STRFTIME('%%%%Y-%%%%m-%%%%d %%%%H:%%%%M:%%%%S', 'NOW') "
+                "ELSE STRFTIME('%%%%Y-%%%%m-%%%%d %%%%H:%%%%M:%%%%f', 'NOW') || '000' END"
+            ),
+            **extra_context
+        )
+
+
 class TrackingNumberRequest(models.Model):
     """Model to log tracking number generation requests for monitoring."""
     
@@ -15,6 +35,8 @@ class TrackingNumberRequest(models.Model):
     customer_slug = models.CharField(max_length=255)
     request_timestamp = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the database on INSERT; incremental jobs (rollups) read rows in this order
+    inserted_at = models.DateTimeField(db_default=InsertTime(), editable=False)
     correlation_id = models.CharField(max_length=36, db_index=True)
     
     class Meta:
@@ -23,6 +45,8 @@ class TrackingNumberRequest(models.Model):
             models.Index(fields=['tracking_number']),
             models.Index(fields=['correlation_id']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['customer_id', 'created_at', 'id'], name='tracking_req_customer_hist'),
+            models.Index(fields=['inserted_at', 'id'], name='tracking_req_inserted'),
         ]
     
     def __str__(self):
@@ -44,4 +68,189 @@ class APIMetrics(models.Model):
         indexes = [
             models.Index(fields=['endpoint', 'timestamp']),
             models.Index(fields=['status_code']),
+            models.Index(fields=['timestamp', 'id']),
+        ]
+
+
+class APIMetricsRollup(models.Model):
+    """Per-route API call totals for one minute or one hour (see tracking.timeseries)."""
+    
+    resolution = models.CharField(max_length=2)
+    bucket = models.DateTimeField()
+    endpoint = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    request_count = models.BigIntegerField(default=0)
+    error_count = models.BigIntegerField(default=0)
+    total_response_time_ms = models.BigIntegerField(default=0)
+    latency_sketch = models.JSONField(default=dict)
+    
+    class Meta:
+        db_table = 'rollup_api_metrics'
+        indexes = [
+            models.Index(fields=['resolution', 'bucket']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['resolution', 'endpoint', 'method', 'bucket'],
+                name='rollup_api_metrics_key'
+            ),
+        ]
+
+
+class CustomerDailyRollup(models.Model):
+    """Per-customer daily totals of logged tracking requests."""
+    
+    customer_id = models.UUIDField()
+    day = models.DateField()
+    request_count = models.BigIntegerField(default=0)
+    total_weight = models.DecimalField(max_digits=20, decimal_places=3, default=0)
+    weight_sketch = models.JSONField(default=dict)
+    
+    class Meta:
+        db_table = 'rollup_customer_daily'
+        constraints = [
+            models.UniqueConstraint(fields=['customer_id', 'day'], name='rollup_customer_daily_key'),
+        ]
+
+
+class LaneDailyRollup(models.Model):
+    """Per-lane (origin, destination) daily totals of logged tracking requests."""
+    
+    origin_country_id = models.CharField(max_length=2)
+    destination_country_id = models.CharField(max_length=2)
+    day = models.DateField()
+    request_count = models.BigIntegerField(default=0)
+    total_weight = models.DecimalField(max_digits=20, decimal_places=3, default=0)
+    weight_sketch = models.JSONField(default=dict)
+    
+    class Meta:
+        db_table = 'rollup_lane_daily'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['origin_country_id', 'destination_country_id', 'day'],
+                name='rollup_lane_daily_key'
+            ),
         ]
+
+
+class RollupWatermark(models.Model):
+    """Position up to which an incremental job has processed its source table."""
+    
+    name = models.CharField(max_length=100, primary_key=True)
+    last_created_at = models.DateTimeField(null=True)
+    # Jobs over tracking_requests track inserted_at instead (see tracking.rollups)
+    last_inserted_at = models.DateTimeField(null=True)
+    last_id = models.CharField(max_length=36, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'rollup_watermarks'
+
+
+class TrackingNumberFormat(models.Model):
+    """Tracking number layout for one customer (see tracking.formats)."""
+    
+    customer_id = models.UUIDField(unique=True)
+    template = models.CharField(
+        max_length=200,
+        help_text='e.g. "RBX{digits:9}{check:mod11}"; fields: {origin}, {destination}, '
+                  '{base36:N}, {digits:N}, {check:luhn}, {check:mod11}'
+    )
+    expected_volume = models.BigIntegerField(
+        default=10000000,
+        help_text='Tracking numbers the customer is expected to need with this template'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'tracking_number_formats'
+    
+    def clean(self):
+        """Reject templates that cannot serve the customer's volume."""
+        from django.core.exceptions import ValidationError
+        from .formats import TemplateError, validate_template
+        
+        try:
+            validate_template(self.template, self.expected_volume)
+        except TemplateError as e:
+            raise ValidationError({'template': str(e)})
+    
+    def __str__(self):
+        return f"{self.customer_id}: {self.template}"
+
+
+class NumberLease(models.Model):
+    """A block of tracking numbers reserved for a client to assign offline (see tracking.leases)."""
+    
+    STATUS_ACTIVE = 'active'
+    STATUS_EXPIRED = 'expired'
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    origin_country_id = models.CharField(max_length=2)
+    destination_country_id = models.CharField(max_length=2)
+    customer_id = models.UUIDField()
+    customer_name = models.CharField(max_length=255)
+    customer_slug = models.CharField(max_length=255)
+    first = models.BigIntegerField()
+    count = models.BigIntegerField()
+    expires_at = models.DateTimeField()
+    status = models.CharField(max_length=10, default=STATUS_ACTIVE)
+    assigned = models.BigIntegerField(null=True, help_text='Numbers reported as used, counted at expiry')
+    returned = models.BigIntegerField(default=0, help_text='Unused numbers given back to the lane at expiry')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'number_leases'
+        indexes = [
+            models.Index(fields=['origin_country_id', 'destination_country_id', 'first']),
+            models.Index(fields=['status', 'expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"Lease {self.id}: {self.count} {self.origin_country_id}{self.destination_country_id} numbers"
+
+
+class LeaseSequence(models.Model):
+    """Next never-leased value of one lane."""
+    
+    origin_country_id = models.CharField(max_length=2)
+    destination_country_id = models.CharField(max_length=2)
+    next_value = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'lease_sequences'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['origin_country_id', 'destination_country_id'], name='lease_sequence_lane'
+            ),
+        ]
+
+
+class FreeNumberRange(models.Model):
+    """Leased values given back at expiry, handed out again before the sequence moves on."""
+    
+    origin_country_id = models.CharField(max_length=2)
+    destination_country_id = models.CharField(max_length=2)
+    first = models.BigIntegerField()
+    count = models.BigIntegerField()
+    
+    class Meta:
+        db_table = 'lease_free_ranges'
+        indexes = [
+            models.Index(fields=['origin_country_id', 'destination_country_id', 'first']),
+        ]
+
+
+class ShardMapEntry(models.Model):
+    """Shard of one bucket of tracking_requests, overriding the round-robin default."""
+    
+    bucket = models.PositiveSmallIntegerField(primary_key=True)
+    database = models.CharField(max_length=64, help_text='Alias in DATABASE_SHARDS')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'shard_map'
+    
+    def __str__(self):
+        return f"Bucket {self.bucket} -> {self.database}"
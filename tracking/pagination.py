@@ -0,0 +1,122 @@
+import base64
+import heapq
+import json
+import uuid
+from typing import Any, Iterable, List, Optional, Tuple
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(created_at, pk) -> str:
+    """Encode a (created_at, id) position as an opaque URL-safe token."""
+    raw = json.dumps([created_at.isoformat(), str(pk)], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[Any, uuid.UUID]:
+    """Decode a token produced by encode_cursor."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at_raw, pk_raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(created_at_raw)
+        if created_at is None:
+            raise ValueError('bad timestamp')
+        return created_at, uuid.UUID(pk_raw)
+    except (ValueError, TypeError, json.JSONDecodeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {token}') from e
+
+
+def after_cursor(queryset, token: Optional[str]):
+    """
+    Restrict a queryset ordered by (-created_at, -id) to rows after the cursor.
+
+    The outer created_at <= bound is a plain range on the created_at index,
+    so the database seeks straight to the position and walks the index in
+    order; the OR only breaks ties within one timestamp. Every page costs the
+    same regardless of how deep it is.
+    """
+    if not token:
+        return queryset
+    created_at, pk = decode_cursor(token)
+    return queryset.filter(
+        Q(created_at__lte=created_at),
+        Q(created_at__lt=created_at) | Q(id__lt=pk)
+    )
+
+
+def keyset_page(queryset, token: Optional[str], page_size: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    Fetch one page of a (-created_at, -id) ordered queryset.
+
+    Rows must expose created_at and id either as attributes or as the first
+    two items of a tuple. Returns the rows and the cursor of the next page
+    (None on the last page).
+    """
+    return _page(list(after_cursor(queryset, token)[:page_size + 1]), page_size)
+
+
+def merge_keyset_pages(pages: Iterable[List[Any]], page_size: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    Combine pages of the same query fetched from several databases into one page.
+
+    Each page must hold the page_size + 1 rows after the cursor, as
+    after_cursor(queryset, token)[:page_size + 1] returns them.
+    """
+    def position(row):
+        return (row[0], row[1]) if isinstance(row, tuple) else (row.created_at, row.pk)
+
+    return _page(list(heapq.merge(*pages, key=position, reverse=True))[:page_size + 1], page_size)
+
+
+def _page(rows: List[Any], page_size: int) -> Tuple[List[Any], Optional[str]]:
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = None
+    if has_next:
+        last = rows[-1]
+        if isinstance(last, tuple):
+            next_cursor = encode_cursor(last[0], last[1])
+        else:
+            next_cursor = encode_cursor(last.created_at, last.pk)
+    return rows, next_cursor
+
+
+def estimated_count(queryset, cap: int = 10000) -> Tuple[int, bool]:
+    """
+    Count rows cheaply. Returns (count, is_estimate).
+
+    On PostgreSQL an unfiltered table uses pg_class.reltuples and a filtered
+    queryset uses the planner's row estimate, neither of which scans the
+    table. Small results, and other databases, get an exact count bounded by
+    `cap` rows.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+                estimate = row[0] if row else -1
+            else:
+                sql, params = queryset.order_by().query.sql_with_params()
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate >= cap:
+            return estimate, True
+
+    capped = queryset.order_by()[:cap + 1].count()
+    if capped > cap:
+        return cap, True
+    return capped, False
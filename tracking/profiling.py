@@ -0,0 +1,243 @@
+import cProfile
+import logging
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Names of stored profiles; anything else is rejected before touching the filesystem
+PROFILE_NAME = re.compile(r'^(cpu-\d+-\d{8}T\d{6}\.collapsed|request-[0-9A-Za-z-]{1,64}\.prof)$')
+
+
+class ProfilerBusy(Exception):
+    """Raised when a sampling profile is already running in this process."""
+
+
+def get_profile_dir() -> str:
+    path = str(getattr(settings, 'PROFILER_DIR', 'profiles'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, thread_name: str) -> str:
+    """Render a frame and its callers as one collapsed-stack line, root first."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for every thread of this process.
+
+    A background thread snapshots all Python stacks every `interval` seconds
+    and counts identical stacks. Nothing is hooked into the profiled code,
+    so it can run in a live worker; the result is written in the collapsed
+    format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, seconds: float, interval: float):
+        self.seconds = seconds
+        self.interval = interval
+        self.pid = os.getpid()
+        self.name = f"cpu-{self.pid}-{time.strftime('%Y%m%dT%H%M%S')}.collapsed"
+        self.path = os.path.join(get_profile_dir(), self.name)
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self) -> 'SamplingProfiler':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                frames = sys._current_frames()
+                for thread_id, frame in frames.items():
+                    if thread_id != own:
+                        self.stacks[collapse_stack(frame, names.get(thread_id, str(thread_id)))] += 1
+                # Don't keep the sampled frames alive until the next sample
+                frames = frame = None
+                self.samples += 1
+                self._stop.wait(self.interval)
+            self._write()
+            logger.info(f"Sampling profile written to {self.path} ({self.samples} samples)")
+        except Exception as e:
+            logger.error(f"Sampling profiler failed: {str(e)}")
+        finally:
+            _release(self)
+
+    def _write(self):
+        with open(self.path, 'w', encoding='utf-8') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+        prune_profiles()
+
+
+_active: Optional[SamplingProfiler] = None
+_active_lock = threading.Lock()
+
+
+def _release(profiler: SamplingProfiler):
+    global _active
+    with _active_lock:
+        if _active is profiler:
+            _active = None
+
+
+def start_sampling(seconds: Optional[float] = None, interval_ms: Optional[float] = None) -> SamplingProfiler:
+    """Start profiling this process in the background; raises ProfilerBusy if one is running."""
+    global _active
+    seconds = seconds or getattr(settings, 'PROFILER_DEFAULT_SECONDS', 30)
+    interval_ms = interval_ms or getattr(settings, 'PROFILER_SAMPLE_INTERVAL_MS', 5)
+    with _active_lock:
+        if _active is not None and _active.pid == os.getpid() and _active.running:
+            raise ProfilerBusy(f"Profile {_active.name} is still running")
+        _active = SamplingProfiler(seconds, interval_ms / 1000).start()
+        return _active
+
+
+def active_profiler() -> Optional[SamplingProfiler]:
+    profiler = _active
+    if profiler is not None and profiler.pid == os.getpid() and profiler.running:
+        return profiler
+    return None
+
+
+_signal_received = threading.Event()
+_watcher_pid: Optional[int] = None
+
+
+def _handle_signal(signum, frame):
+    # Runs in the main thread between bytecodes, maybe while it holds the logging
+    # or _active_lock locks, so it only wakes the watcher thread
+    _signal_received.set()
+
+
+def _watch_signal(signum: int):
+    while True:
+        _signal_received.wait()
+        _signal_received.clear()
+        try:
+            profiler = start_sampling()
+            logger.info(f"Signal {signum} received, profiling for {profiler.seconds:.0f}s into {profiler.name}")
+        except ProfilerBusy as e:
+            logger.warning(str(e))
+        except Exception as e:
+            logger.error(f"Sampling profiler failed to start: {str(e)}")
+
+
+def install_signal_handler() -> Optional[int]:
+    """
+    Start a sampling profile when PROFILER_SIGNAL is delivered to this process.
+
+    Meant for gunicorn workers (`kill -PROF <worker pid>`); returns the
+    signal number, or None when PROFILER_SIGNAL is empty. The handler only
+    flags the signal; a watcher thread starts the profile and logs.
+    """
+    global _watcher_pid
+    name = getattr(settings, 'PROFILER_SIGNAL', 'SIGPROF')
+    if not name:
+        return None
+    signum = getattr(signal, name)
+    if _watcher_pid != os.getpid():
+        threading.Thread(target=_watch_signal, args=(signum,), name='profiler-signal', daemon=True).start()
+        _watcher_pid = os.getpid()
+    signal.signal(signum, _handle_signal)
+    return signum
+
+
+class RequestProfile:
+    """cProfile run covering one request, saved under its correlation id."""
+
+    def __init__(self, correlation_id: str):
+        self.correlation_id = correlation_id
+        self.name = f'request-{correlation_id}.prof'
+        self._profile = cProfile.Profile()
+
+    def start(self) -> 'RequestProfile':
+        self._profile.enable()
+        return self
+
+    def stop(self) -> str:
+        self._profile.disable()
+        path = os.path.join(get_profile_dir(), self.name)
+        self._profile.dump_stats(path)
+        prune_profiles()
+        return path
+
+
+def start_request_profile(request) -> Optional[RequestProfile]:
+    """Profile this request if it asked to be and is traced; returns None otherwise."""
+    header = getattr(settings, 'PROFILER_REQUEST_HEADER', 'HTTP_X_PROFILE')
+    if not getattr(settings, 'PROFILER_REQUEST_ENABLED', False) or request.META.get(header) != '1':
+        return None
+    if getattr(request, 'trace_token', None) is None:
+        return None
+    if not PROFILE_NAME.match(f'request-{request.correlation_id}.prof'):
+        return None
+    try:
+        return RequestProfile(request.correlation_id).start()
+    except ValueError:
+        # Another profiler is already attached to this thread
+        return None
+
+
+def list_profiles() -> List[Dict[str, object]]:
+    """Stored profiles, newest first."""
+    directory = get_profile_dir()
+    profiles = []
+    for name in os.listdir(directory):
+        if PROFILE_NAME.match(name):
+            stat = os.stat(os.path.join(directory, name))
+            profiles.append({'name': name, 'size': stat.st_size, 'modified': stat.st_mtime})
+    return sorted(profiles, key=lambda profile: profile['modified'], reverse=True)
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a stored profile, or None if the name is not one this module writes."""
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(get_profile_dir(), name)
+    return path if os.path.isfile(path) else None
+
+
+def prune_profiles():
+    """Delete the oldest profiles beyond PROFILER_MAX_FILES."""
+    keep = getattr(settings, 'PROFILER_MAX_FILES', 200)
+    for profile in list_profiles()[keep:]:
+        try:
+            os.unlink(os.path.join(get_profile_dir(), profile['name']))
+        except OSError:
+            pass
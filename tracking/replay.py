@@ -0,0 +1,311 @@
+import http.client
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from .sketches import DDSketch
+
+# Sends one captured request and returns the response status (0 = no response)
+Sender = Callable[[Dict[str, Any]], int]
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def endpoint_key(method: str, path: str) -> str:
+    """Group requests by route, so /customers/<id>/... paths share a row."""
+    from django.urls import Resolver404, resolve
+
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return f'{method} {path}'
+    return f'{method} /{match.route}'
+
+
+class EndpointStats:
+    """Latency sketch (ms) and status counts of one endpoint."""
+
+    def __init__(self):
+        self.sketch = DDSketch()
+        self.statuses: Dict[str, int] = {}
+
+    @property
+    def count(self) -> int:
+        return sum(self.statuses.values())
+
+    @property
+    def errors(self) -> int:
+        """Server errors and requests that got no response at all."""
+        return sum(count for status, count in self.statuses.items() if int(status) == 0 or int(status) >= 500)
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.count if self.count else 0.0
+
+    def add(self, status: int, ms: float):
+        self.sketch.add(ms)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'statuses': self.statuses, 'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'EndpointStats':
+        stats = cls()
+        stats.statuses = dict(data['statuses'])
+        stats.sketch = DDSketch.from_dict(data['sketch'])
+        return stats
+
+
+class ReplayResult:
+    """
+    Latency distributions and error counts of one run, per endpoint.
+
+    Saved as JSON (sketches included), so runs of two builds can be compared
+    at any quantile later.
+    """
+
+    def __init__(self, label: str = ''):
+        self.label = label
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.duration = 0.0
+        self.skipped = 0
+        self.late = 0
+        self.max_lag_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, key: str, status: int, ms: float):
+        with self._lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = EndpointStats()
+            stats.add(status, ms)
+
+    @property
+    def count(self) -> int:
+        return sum(stats.count for stats in self.endpoints.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'label': self.label,
+            'duration': self.duration,
+            'skipped': self.skipped,
+            'late': self.late,
+            'max_lag_ms': self.max_lag_ms,
+            'endpoints': {key: stats.to_dict() for key, stats in sorted(self.endpoints.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ReplayResult':
+        result = cls(data.get('label', ''))
+        result.duration = data.get('duration', 0.0)
+        result.skipped = data.get('skipped', 0)
+        result.late = data.get('late', 0)
+        result.max_lag_ms = data.get('max_lag_ms', 0.0)
+        result.endpoints = {key: EndpointStats.from_dict(value) for key, value in data['endpoints'].items()}
+        return result
+
+    @classmethod
+    def from_capture(cls, records: Iterable[Dict[str, Any]]) -> 'ReplayResult':
+        """The latencies and statuses the captured requests had when they were served."""
+        result = cls('capture')
+        for record in records:
+            result.record(endpoint_key(record['method'], record['path']), record['status'], record['ms'])
+        return result
+
+
+class HTTPSender:
+    """Send captured requests to a running instance, one keep-alive connection per thread."""
+
+    def __init__(self, target: str, timeout: float = 30.0):
+        parts = urlsplit(target)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f'Not an http(s) URL: {target}')
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self, record: Dict[str, Any]) -> int:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+        url = self.prefix + record['path'] + (f"?{record['query']}" if record['query'] else '')
+        headers = {'User-Agent': 'tracking-replay'}
+        body = record.get('body')
+        if body is not None:
+            body = body.encode('utf-8')
+            headers['Content-Type'] = record.get('content_type') or 'application/json'
+        try:
+            connection.request(record['method'], url, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            return 0
+
+
+class InProcessSender:
+    """Send captured requests through Django's test client, without a server."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, record: Dict[str, Any]) -> int:
+        from django.test import Client
+
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(raise_request_exception=False)
+        url = record['path'] + (f"?{record['query']}" if record['query'] else '')
+        response = client.generic(
+            record['method'], url, data=record.get('body') or '',
+            content_type=record.get('content_type') or 'application/octet-stream',
+            HTTP_USER_AGENT='tracking-replay'
+        )
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+
+def replay(
+    records: Iterable[Dict[str, Any]], send: Sender, speed: float = 1.0,
+    concurrency: int = 8, label: str = ''
+) -> ReplayResult:
+    """
+    Re-issue captured requests in their original order and spacing.
+
+    `speed` scales the gaps between requests (2.0 replays twice as fast);
+    0 sends as fast as `concurrency` workers allow. When every worker is
+    busy the schedule slips: those requests are counted as `late` and the
+    worst slip is kept, so a run that could not keep up is visible.
+    Requests whose body was too large to capture are skipped.
+    """
+    records = sorted(records, key=lambda record: record['ts'])
+    result = ReplayResult(label)
+    if not records:
+        return result
+
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def send_one(record):
+        try:
+            started = time.perf_counter()
+            try:
+                status = send(record)
+            except Exception:
+                status = 0
+            result.record(
+                endpoint_key(record['method'], record['path']), status, (time.perf_counter() - started) * 1000
+            )
+        finally:
+            slots.release()
+
+    first_ts = records[0]['ts']
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='replay') as pool:
+        for record in records:
+            if record.get('body_omitted'):
+                result.skipped += 1
+                continue
+            if speed > 0:
+                due = started + (record['ts'] - first_ts) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            slots.acquire()
+            if speed > 0:
+                lag_ms = (time.perf_counter() - due) * 1000
+                if lag_ms > 10:
+                    result.late += 1
+                result.max_lag_ms = max(result.max_lag_ms, lag_ms)
+            pool.submit(send_one, record)
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def _quantile(stats: Optional[EndpointStats], q: float) -> Optional[float]:
+    return stats.sketch.quantile(q) if stats is not None and stats.count else None
+
+
+def compare(baseline: ReplayResult, candidate: ReplayResult) -> List[Dict[str, Any]]:
+    """One row per endpoint with both runs' quantiles, error rates and the change."""
+    rows = []
+    for key in sorted(set(baseline.endpoints) | set(candidate.endpoints)):
+        before, after = baseline.endpoints.get(key), candidate.endpoints.get(key)
+        row: Dict[str, Any] = {
+            'endpoint': key,
+            'baseline_count': before.count if before else 0,
+            'candidate_count': after.count if after else 0,
+            'baseline_error_rate': before.error_rate if before else None,
+            'candidate_error_rate': after.error_rate if after else None,
+        }
+        for q in QUANTILES:
+            name = f'p{int(q * 100)}'
+            old, new = _quantile(before, q), _quantile(after, q)
+            row[f'baseline_{name}_ms'] = old
+            row[f'candidate_{name}_ms'] = new
+            row[f'{name}_change_pct'] = (new - old) / old * 100 if old and new is not None else None
+        rows.append(row)
+    return rows
+
+
+def regressions(rows: List[Dict[str, Any]], max_change_pct: float, max_error_increase: float = 0.01) -> List[str]:
+    """Endpoints whose p95 grew by more than max_change_pct or whose error rate rose."""
+    failing = []
+    for row in rows:
+        slower = row['p95_change_pct'] is not None and row['p95_change_pct'] > max_change_pct
+        before, after = row['baseline_error_rate'], row['candidate_error_rate']
+        erroring = before is not None and after is not None and after - before > max_error_increase
+        if slower or erroring:
+            failing.append(row['endpoint'])
+    return failing
+
+
+def format_comparison(rows: List[Dict[str, Any]]) -> List[str]:
+    def ms(value):
+        return f'{value:.2f}' if value is not None else '-'
+
+    def pct(value):
+        return f'{value:+.1f}%' if value is not None else '-'
+
+    def rate(value):
+        return f'{value * 100:.2f}%' if value is not None else '-'
+
+    lines = [
+        f"{'endpoint':<48} {'count':>13} {'p50 ms':>15} {'p95 ms':>15} {'p99 ms':>15} "
+        f"{'p95 change':>10} {'errors':>15}"
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['endpoint']:<48} "
+            f"{row['baseline_count']:>6}/{row['candidate_count']:<6} "
+            f"{ms(row['baseline_p50_ms']):>7}/{ms(row['candidate_p50_ms']):<7} "
+            f"{ms(row['baseline_p95_ms']):>7}/{ms(row['candidate_p95_ms']):<7} "
+            f"{ms(row['baseline_p99_ms']):>7}/{ms(row['candidate_p99_ms']):<7} "
+            f"{pct(row['p95_change_pct']):>10} "
+            f"{rate(row['baseline_error_rate']):>7}/{rate(row['candidate_error_rate']):<7}"
+        )
+    return lines
+
+
+def format_result(result: ReplayResult) -> List[str]:
+    lines = [
+        f"{result.count} requests in {result.duration:.1f}s"
+        + (f", {result.skipped} skipped (body not captured)" if result.skipped else '')
+        + (f", {result.late} sent late (max {result.max_lag_ms:.0f}ms behind)" if result.late else ''),
+        f"{'endpoint':<48} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}",
+    ]
+    for key, stats in sorted(result.endpoints.items()):
+        p50, p95, p99 = (stats.sketch.quantile(q) for q in QUANTILES)
+        lines.append(
+            f"{key:<48} {stats.count:>7} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} {stats.errors:>7}"
+        )
+    return lines
@@ -0,0 +1,173 @@
+import contextlib
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .correlation import get_correlation_id
+from .health import register_check
+
+logger = logging.getLogger(__name__)
+
+# Seconds since the last replayed transaction; 0 when the standby has replayed
+# everything it received, NULL on a server that is not a standby
+POSTGRES_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+# Writes that never make a client's next read stale
+UNSTICKY_MODELS = ('tracking.apimetrics',)
+
+STICKY_KEY_PREFIX = 'replica-sticky:'
+
+# Database that ORM reads of the current block go to (None = the primary)
+_read_alias: ContextVar[Optional[str]] = ContextVar('tracking_read_alias', default=None)
+
+# alias -> (time.monotonic() of the check, lag in seconds or None if unreachable)
+_lag: Dict[str, Tuple[float, Optional[float]]] = {}
+
+
+def get_replicas() -> Tuple[str, ...]:
+    return tuple(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def measure_lag(alias: str) -> Optional[float]:
+    """
+    Replication lag of a replica in seconds, None if it cannot be queried.
+
+    Lag is only measured on PostgreSQL; other engines are assumed current.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    try:
+        connection.close_if_unusable_or_obsolete()
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL)
+            lag = cursor.fetchone()[0]
+        return float(lag or 0)
+    except Exception as e:
+        logger.warning(f"Replica {alias} is unusable: {str(e)}")
+        connection.close()
+        return None
+
+
+def replica_lag(alias: str) -> Optional[float]:
+    """Lag of a replica, measured at most every REPLICA_LAG_CHECK_SECONDS per process."""
+    checked = _lag.get(alias)
+    now = time.monotonic()
+    if checked is None or now - checked[0] >= getattr(settings, 'REPLICA_LAG_CHECK_SECONDS', 5.0):
+        checked = (now, measure_lag(alias))
+        _lag[alias] = checked
+    return checked[1]
+
+
+def _sticky_cache():
+    return caches[getattr(settings, 'REPLICA_STICKY_CACHE_ALIAS', 'default')]
+
+
+def note_write(correlation_id: Optional[str]):
+    """Send reads of `correlation_id` to the primary for the next REPLICA_STICKY_SECONDS."""
+    sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 5.0)
+    if correlation_id and get_replicas() and sticky_seconds > 0:
+        _sticky_cache().set(STICKY_KEY_PREFIX + correlation_id, 1, timeout=sticky_seconds)
+
+
+def note_writes(instances: Iterable[Any]):
+    """note_write() for the correlation ids of rows about to be written."""
+    if not get_replicas():
+        return
+    correlation_ids = {
+        getattr(instance, 'correlation_id', None)
+        for instance in instances
+        if instance._meta.label_lower not in UNSTICKY_MODELS
+    }
+    for correlation_id in correlation_ids:
+        note_write(correlation_id)
+
+
+def choose_replica() -> Optional[str]:
+    """
+    A replica to read from, or None to read from the primary.
+
+    The primary is used when no replica is within REPLICA_MAX_LAG_SECONDS
+    (or none is configured), inside a transaction on the primary, and for a
+    correlation id that wrote recently (read-your-writes).
+    """
+    replicas = get_replicas()
+    if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    correlation_id = get_correlation_id()
+    if correlation_id and _sticky_cache().get(STICKY_KEY_PREFIX + correlation_id) is not None:
+        return None
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5.0)
+    usable = [alias for alias in replicas if (lag := replica_lag(alias)) is not None and lag <= max_lag]
+    return random.choice(usable) if usable else None
+
+
+def read_database() -> str:
+    """Alias to pass to .using() for a read that may go to a replica."""
+    return choose_replica() or DEFAULT_DB_ALIAS
+
+
+def current_read_database() -> str:
+    """Alias that ORM reads of the current block go to: the replica chosen by replica_reads(), else the primary."""
+    return _read_alias.get() or DEFAULT_DB_ALIAS
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """
+    Send ORM reads inside the block to a replica chosen by choose_replica().
+
+    Usable as a decorator; the replica is chosen on every call. Writes
+    still go to the primary.
+    """
+    token = _read_alias.set(choose_replica())
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Database router for DATABASE_REPLICAS.
+
+    Reads go to the primary unless they run inside replica_reads(); writes
+    always go to the primary and mark their correlation id sticky.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        if get_replicas() and model._meta.label_lower not in UNSTICKY_MODELS:
+            note_write(get_correlation_id())
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in get_replicas() else None
+
+
+def check_replicas() -> Dict[str, Any]:
+    """Report replica lag; an unusable replica only sends reads back to the primary."""
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5.0)
+    details = {}
+    for alias in get_replicas():
+        lag = replica_lag(alias)
+        details[alias] = {'lag_seconds': lag, 'usable': lag is not None and lag <= max_lag}
+    return details
+
+
+register_check('replicas', check_replicas)
@@ -0,0 +1,197 @@
+import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    TrackingNumberRequest, CustomerDailyRollup, LaneDailyRollup, RollupWatermark
+)
+from .shards import get_shards
+from .sketches import DDSketch
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'tracking_requests_daily'
+
+
+class _Accumulator:
+    """In-memory totals for one rollup key within a batch."""
+
+    __slots__ = ('count', 'total_weight', 'sketch')
+
+    def __init__(self):
+        self.count = 0
+        self.total_weight = Decimal('0')
+        self.sketch = DDSketch()
+
+    def add(self, weight: Decimal):
+        self.count += 1
+        self.total_weight += weight
+        self.sketch.add(float(weight))
+
+
+def _apply(model, key_fields: Tuple[str, ...], accumulators: Dict[tuple, _Accumulator]):
+    """Merge batch totals into existing rollup rows, creating missing ones."""
+    lookups = {
+        f'{field}__in': {key[i] for key in accumulators}
+        for i, field in enumerate(key_fields)
+    }
+    existing = {
+        tuple(getattr(row, f) for f in key_fields): row
+        for row in model.objects.select_for_update().filter(**lookups)
+    }
+
+    to_create, to_update = [], []
+    for key, acc in accumulators.items():
+        row = existing.get(key)
+        if row is None:
+            row = model(**dict(zip(key_fields, key)))
+            row.request_count = 0
+            row.total_weight = Decimal('0')
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        sketch = DDSketch.from_dict(row.weight_sketch)
+        sketch.merge(acc.sketch)
+        row.request_count += acc.count
+        row.total_weight += acc.total_weight
+        row.weight_sketch = sketch.to_dict()
+
+    model.objects.bulk_create(to_create)
+    model.objects.bulk_update(to_update, ['request_count', 'total_weight', 'weight_sketch'])
+
+
+def watermark_name(alias: str) -> str:
+    """Watermark of one shard; the default database keeps the original name."""
+    return WATERMARK_NAME if alias == DEFAULT_DB_ALIAS else f'{WATERMARK_NAME}:{alias}'
+
+
+def rolled_up(watermark) -> Q:
+    """Filter for the rows a tracking_requests watermark has passed (none if it never moved)."""
+    position = watermark.last_inserted_at
+    if position is None:
+        return Q(pk__in=[])
+    if not watermark.last_id:
+        return Q(inserted_at__lte=position)
+    return Q(inserted_at__lt=position) | Q(inserted_at=position, id__lte=uuid.UUID(watermark.last_id))
+
+
+def rollup_watermark():
+    """inserted_at up to which every shard is rolled up, None if rollups never ran."""
+    names = [watermark_name(alias) for alias in get_shards()]
+    marks = RollupWatermark.objects.filter(name__in=names).values_list('last_inserted_at', flat=True)
+    marks = [mark for mark in marks if mark is not None]
+    return min(marks) if marks else None
+
+
+def update_rollups(batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> int:
+    """
+    Fold tracking requests inserted since the watermark into the daily rollups.
+
+    Rows are read in (inserted_at, id) order, one batch per transaction, and
+    the watermark advances in the same transaction as the rollup rows, so an
+    interrupted run never double counts. inserted_at is the database's clock
+    at INSERT, so rows that carry an older created_at (group commit retries,
+    lease reports, loaded audit segments) are still picked up; each is
+    counted on the day of its created_at. Rows inserted less than
+    ROLLUP_SAFETY_LAG_SECONDS ago, or in the current millisecond, are left
+    for the next run, since their transaction may not have committed yet. With DATABASE_SHARDS each shard
+    has its own watermark and the rollups are kept in the default database.
+    Returns the number of rows processed.
+    """
+    batch_size = batch_size or getattr(settings, 'ROLLUP_BATCH_SIZE', 5000)
+    horizon = timezone.now() - timedelta(seconds=getattr(settings, 'ROLLUP_SAFETY_LAG_SECONDS', 60))
+    # Rows inserted later can still get the database clock's current tick (SQLite
+    # counts milliseconds), so the watermark never enters it
+    horizon = horizon.replace(microsecond=horizon.microsecond // 1000 * 1000)
+    processed = 0
+    batches = 0
+
+    for alias in get_shards():
+        shard_batches = 0
+        while max_batches is None or shard_batches < max_batches:
+            with transaction.atomic():
+                watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=watermark_name(alias))
+
+                queryset = TrackingNumberRequest.objects.using(alias).filter(
+                    ~rolled_up(watermark), inserted_at__lt=horizon
+                )
+                rows = list(
+                    queryset.order_by('inserted_at', 'id').values_list(
+                        'id', 'inserted_at', 'created_at', 'customer_id', 'origin_country_id',
+                        'destination_country_id', 'weight'
+                    )[:batch_size]
+                )
+                if not rows:
+                    break
+
+                by_customer: Dict[tuple, _Accumulator] = defaultdict(_Accumulator)
+                by_lane: Dict[tuple, _Accumulator] = defaultdict(_Accumulator)
+                for _, _, created_at, customer_id, origin, destination, weight in rows:
+                    day = created_at.astimezone(dt_timezone.utc).date()
+                    by_customer[(customer_id, day)].add(weight)
+                    by_lane[(origin, destination, day)].add(weight)
+
+                _apply(CustomerDailyRollup, ('customer_id', 'day'), by_customer)
+                _apply(LaneDailyRollup, ('origin_country_id', 'destination_country_id', 'day'), by_lane)
+
+                last_id, last_inserted_at = rows[-1][0], rows[-1][1]
+                watermark.last_inserted_at = last_inserted_at
+                watermark.last_id = str(last_id)
+                watermark.save()
+
+            processed += len(rows)
+            batches += 1
+            shard_batches += 1
+            if len(rows) < batch_size:
+                break
+
+    if processed:
+        logger.info(f"Rolled up {processed} tracking requests in {batches} batches")
+    return processed
+
+
+def summarize_daily(queryset, days: int) -> Dict[str, Any]:
+    """Build the per-day series and window totals for a rollup queryset."""
+    since = timezone.now().date() - timedelta(days=days - 1)
+    series: List[Dict[str, Any]] = []
+    window_sketch = DDSketch()
+    total_count = 0
+    total_weight = Decimal('0')
+
+    for row in queryset.filter(day__gte=since).order_by('day'):
+        sketch = DDSketch.from_dict(row.weight_sketch)
+        window_sketch.merge(sketch)
+        total_count += row.request_count
+        total_weight += row.total_weight
+        series.append({
+            'day': row.day.isoformat(),
+            'requests': row.request_count,
+            'total_weight_kg': str(row.total_weight),
+            'weight_p50_kg': _round(sketch.quantile(0.5)),
+            'weight_p95_kg': _round(sketch.quantile(0.95)),
+        })
+
+    watermark = rollup_watermark()
+    return {
+        'since': since.isoformat(),
+        'days': days,
+        'requests': total_count,
+        'total_weight_kg': str(total_weight),
+        'weight_p50_kg': _round(window_sketch.quantile(0.5)),
+        'weight_p95_kg': _round(window_sketch.quantile(0.95)),
+        'weight_p99_kg': _round(window_sketch.quantile(0.99)),
+        'series': series,
+        'up_to': watermark.isoformat() if watermark else None,
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
@@ -0,0 +1,612 @@
+import fcntl
+import itertools
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.utils import timezone
+
+from .lifecycle import register_shutdown_hook
+
+logger = logging.getLogger(__name__)
+
+AUDIT_STORE_DATABASE = 'database'
+AUDIT_STORE_SEGMENTS = 'segments'
+
+MAGIC = b'TNSEG001'
+INDEX_MAGIC = b'TNIDX001'
+SEGMENT_HEADER = struct.Struct('<8sI')  # magic, record size
+INDEX_HEADER = struct.Struct('<8sQ')  # magic, entries
+INDEX_ENTRY = struct.Struct('<16sQ')  # tracking number, record offset
+
+# CRC-32 of the rest, tracking number, origin, destination, weight in grams,
+# request_timestamp and logged_at in microseconds since the epoch (UTC),
+# customer id, correlation id, customer name, customer slug
+RECORD = struct.Struct('<I16s2s2sqqq16s36s255s255s')
+_CRC = struct.Struct('<I')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+
+# Process-wide, so no two writers of one process pick the same segment name
+_segment_sequence = itertools.count(1)
+
+
+def get_audit_store() -> str:
+    """Where TrackingService logs its audit rows: database or segments."""
+    return getattr(settings, 'AUDIT_STORE', AUDIT_STORE_DATABASE)
+
+
+def _text(value: str, size: int) -> bytes:
+    data = value.encode('utf-8')
+    if len(data) > size:
+        raise ValueError(f'{data[:20]!r}... does not fit in {size} bytes')
+    return data
+
+
+def encode_record(fields: Dict[str, Any], logged_at: datetime) -> bytes:
+    """Pack an audit row; raises ValueError if a field does not fit the layout."""
+    grams = Decimal(fields['weight']) * 1000
+    if grams != grams.to_integral_value():
+        raise ValueError(f"weight {fields['weight']} has more than 3 decimal places")
+    requested = fields['request_timestamp']
+    if timezone.is_naive(requested):
+        # The database path reads naive timestamps in the default time zone too
+        requested = timezone.make_aware(requested)
+    body = RECORD.pack(
+        0,
+        _text(fields['tracking_number'], 16),
+        _text(fields['origin_country_id'], 2),
+        _text(fields['destination_country_id'], 2),
+        int(grams),
+        (requested - EPOCH) // ONE_MICROSECOND,
+        (logged_at - EPOCH) // ONE_MICROSECOND,
+        uuid.UUID(str(fields['customer_id'])).bytes,
+        _text(fields['correlation_id'], 36),
+        _text(fields['customer_name'], 255),
+        _text(fields['customer_slug'], 255),
+    )
+    return _CRC.pack(zlib.crc32(memoryview(body)[4:])) + body[4:]
+
+
+def decode_record(record: bytes) -> Optional[Dict[str, Any]]:
+    """Unpack a record, or None if its checksum does not match."""
+    if _CRC.unpack_from(record)[0] != zlib.crc32(memoryview(record)[4:]):
+        return None
+    (_, number, origin, destination, grams, requested_us, logged_us, customer_id,
+     correlation_id, customer_name, customer_slug) = RECORD.unpack(record)
+    return {
+        'tracking_number': number.rstrip(b'\0').decode(),
+        'origin_country_id': origin.decode(),
+        'destination_country_id': destination.decode(),
+        'weight': Decimal(grams) / 1000,
+        'request_timestamp': EPOCH + timedelta(microseconds=requested_us),
+        'logged_at': EPOCH + timedelta(microseconds=logged_us),
+        'customer_id': uuid.UUID(bytes=customer_id),
+        'correlation_id': correlation_id.rstrip(b'\0').decode(),
+        'customer_name': customer_name.rstrip(b'\0').decode('utf-8'),
+        'customer_slug': customer_slug.rstrip(b'\0').decode('utf-8'),
+    }
+
+
+def _key(number: str) -> bytes:
+    return number.encode().ljust(16, b'\0')
+
+
+def read_segment(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yield (offset, fields) for every intact record of a segment.
+
+    A partial record at the end (a write cut short by a crash) is ignored;
+    records with a bad checksum are skipped and logged.
+    """
+    with open(path, 'rb') as segment:
+        header = segment.read(SEGMENT_HEADER.size)
+        if len(header) < SEGMENT_HEADER.size:
+            return
+        magic, record_size = SEGMENT_HEADER.unpack(header)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f'{path} is not an audit segment of this version')
+        offset = SEGMENT_HEADER.size
+        while True:
+            record = segment.read(RECORD.size)
+            if len(record) < RECORD.size:
+                return
+            fields = decode_record(record)
+            if fields is None:
+                logger.error(f"Skipping corrupt record at offset {offset} of {path}")
+            else:
+                yield offset, fields
+            offset += RECORD.size
+
+
+def write_index(segment_path: str, offsets: Dict[str, int]):
+    """Write the sorted tracking number index that marks a segment as sealed."""
+    index_path = segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'wb') as index:
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, len(offsets)))
+        index.write(b''.join(INDEX_ENTRY.pack(_key(number), offset) for number, offset in sorted(offsets.items())))
+        index.flush()
+        os.fsync(index.fileno())
+    os.replace(temp_path, index_path)
+
+
+class SegmentIndex:
+    """Memory-mapped sorted index of a sealed segment, searched by bisection."""
+
+    def __init__(self, index_path: str):
+        self.path = index_path
+        self.segment_path = index_path[:-len(INDEX_SUFFIX)] + SEGMENT_SUFFIX
+        with open(index_path, 'rb') as index:
+            self._map = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = INDEX_HEADER.unpack_from(self._map)
+        if magic != INDEX_MAGIC:
+            self._map.close()
+            raise ValueError(f'{index_path} is not a segment index')
+
+    def find(self, number: str) -> Optional[int]:
+        """Offset of the number's record in the segment, or None."""
+        key = _key(number)
+        data = self._map
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            position = INDEX_HEADER.size + middle * INDEX_ENTRY.size
+            if data[position:position + 16] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            entry_key, offset = INDEX_ENTRY.unpack_from(data, INDEX_HEADER.size + low * INDEX_ENTRY.size)
+            if entry_key == key:
+                return offset
+        return None
+
+    def close(self):
+        self._map.close()
+
+
+class SegmentWriter:
+    """
+    Appends audit records to this process' active segment file.
+
+    Each append is one write() under a lock, so records are visible to
+    lookups and the loader at once; fsync is grouped, done by a background
+    thread every AUDIT_SEGMENT_FSYNC_MS, so a power loss can cost at most
+    that much of the log. A segment is sealed (fsync'ed, its index written)
+    when it reaches AUDIT_SEGMENT_MAX_BYTES and at shutdown. The active
+    file stays flock'ed, which is how the loader tells it from the
+    leftovers of a crashed worker.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, fsync_ms: float):
+        self.directory = directory
+        self.max_bytes = max(max_bytes, SEGMENT_HEADER.size + RECORD.size)
+        self.fsync_interval = fsync_ms / 1000.0
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._path: Optional[str] = None
+        self._size = 0
+        self._offsets: Dict[str, int] = {}
+        self._dirty = False
+        self.stats = {'records': 0, 'fsyncs': 0, 'segments': 0}
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='audit-segment-fsync', daemon=True)
+        self._thread.start()
+
+    def append(self, fields: Dict[str, Any]):
+        """
+        Append one audit row; raises ValueError if it does not fit the record
+        layout and IntegrityError if its number is in the active segment already.
+        """
+        record = encode_record(fields, timezone.now())
+        with self._lock:
+            if fields['tracking_number'] in self._offsets:
+                raise IntegrityError(f"Tracking number {fields['tracking_number']} is in the active segment")
+            if self._fd is None or self._size + RECORD.size > self.max_bytes:
+                self._rotate()
+            os.write(self._fd, record)
+            self._offsets[fields['tracking_number']] = self._size
+            self._size += RECORD.size
+            self._dirty = True
+            self.stats['records'] += 1
+
+    def find(self, number: str) -> Optional[Dict[str, Any]]:
+        """Look a number up in the active segment."""
+        with self._lock:
+            offset = self._offsets.get(number)
+            if offset is None:
+                return None
+            return decode_record(os.pread(self._fd, RECORD.size, offset))
+
+    def sync(self):
+        """fsync the active segment if anything was appended since the last sync."""
+        with self._lock:
+            if self._dirty:
+                os.fsync(self._fd)
+                self._dirty = False
+                self.stats['fsyncs'] += 1
+
+    def stop(self, timeout: Optional[float] = None):
+        """Seal the active segment and stop the fsync thread."""
+        self._stopping.set()
+        self._thread.join(timeout=timeout)
+        with self._lock:
+            self._seal()
+
+    def _run(self):
+        while not self._stopping.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except OSError as e:
+                logger.error(f"Audit segment fsync failed: {str(e)}")
+
+    def _rotate(self):
+        self._seal()
+        name = f'seg-{time.time_ns() // 1_000_000:013d}-{os.getpid()}-{next(_segment_sequence):06d}'
+        path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        # Locked under a temporary name, so the loader never sees it unlocked
+        temp_path = path + '.tmp'
+        fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, SEGMENT_HEADER.pack(MAGIC, RECORD.size))
+        os.replace(temp_path, path)
+        self._fd, self._path = fd, path
+        self._size = SEGMENT_HEADER.size
+        self._offsets = {}
+        self.stats['segments'] += 1
+
+    def _seal(self):
+        if self._fd is None:
+            return
+        os.fsync(self._fd)
+        self._dirty = False
+        write_index(self._path, self._offsets)
+        os.close(self._fd)
+        self._fd = None
+        logger.info(f"Sealed audit segment {self._path} with {len(self._offsets)} records")
+
+
+_writer: Optional[SegmentWriter] = None
+_writer_pid: Optional[int] = None
+_writer_lock = threading.Lock()
+
+
+def get_segment_writer() -> SegmentWriter:
+    """Return this process' segment writer, starting it on first use."""
+    global _writer, _writer_pid
+    pid = os.getpid()
+    if _writer is not None and _writer_pid == pid:
+        return _writer
+    with _writer_lock:
+        if _writer is None or _writer_pid != pid:
+            _writer = SegmentWriter(
+                directory=settings.AUDIT_SEGMENT_DIR,
+                max_bytes=getattr(settings, 'AUDIT_SEGMENT_MAX_BYTES', 64 * 1024 * 1024),
+                fsync_ms=getattr(settings, 'AUDIT_SEGMENT_FSYNC_MS', 20),
+            )
+            _writer_pid = pid
+    return _writer
+
+
+def shutdown_segment_writer(timeout: Optional[float] = None):
+    """Seal the active segment if this process started a writer."""
+    global _writer
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.stop(timeout=timeout)
+        _writer = None
+
+
+def append_audit_row(fields: Dict[str, Any]) -> bool:
+    """
+    Log an audit row to the segment store.
+
+    Raises IntegrityError if the number was issued before, i.e. it is in the
+    table or in a segment that is not loaded yet; a definite miss in the
+    bloom filter skips those lookups. Two workers appending the same new
+    number at the same moment both get through; the loader reports them.
+    Returns False for a row the fixed layout cannot hold (e.g. a customer
+    name over 255 bytes of UTF-8); the caller writes that one to the database.
+    """
+    if _already_issued(fields['tracking_number']):
+        raise IntegrityError(f"Tracking number {fields['tracking_number']} was already issued")
+    try:
+        get_segment_writer().append(fields)
+    except ValueError as e:
+        logger.warning(
+            f"Audit row does not fit a segment record, using the database: {str(e)}",
+            extra={'correlation_id': fields.get('correlation_id')}
+        )
+        return False
+    return True
+
+
+def _already_issued(number: str) -> bool:
+    from .bloom import might_be_issued
+    from .shards import existing_numbers
+
+    if might_be_issued(number) is False and getattr(settings, 'BLOOM_TRUST_NEGATIVE', True):
+        return False
+    return find_record(number) is not None or bool(existing_numbers([number]))
+
+
+def _segments(directory: str) -> List[str]:
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.join(directory, name) for name in names if name.endswith(SEGMENT_SUFFIX))
+
+
+def _is_sealed(segment_path: str) -> bool:
+    return os.path.exists(segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+
+
+_indexes: Dict[str, SegmentIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _open_index(segment_path: str) -> Optional[SegmentIndex]:
+    index_path = segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    with _indexes_lock:
+        index = _indexes.get(index_path)
+        if index is None:
+            try:
+                index = _indexes[index_path] = SegmentIndex(index_path)
+            except (OSError, ValueError):
+                return None
+        return index
+
+
+def _forget_indexes(segment_paths: List[str]):
+    """Unmap the indexes of segments the loader has removed."""
+    current = {path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX for path in segment_paths}
+    with _indexes_lock:
+        for index_path in [path for path in _indexes if path not in current]:
+            _indexes.pop(index_path).close()
+
+
+def find_record(number: str, directory: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Find an audit row that has not been loaded into the database yet.
+
+    Checks this process' active segment, then sealed segments newest first
+    through their indexes, then the active segments of other workers by a
+    scan for the number at record boundaries.
+    """
+    directory = directory or settings.AUDIT_SEGMENT_DIR
+    if _writer is not None and _writer_pid == os.getpid() and _writer.directory == directory:
+        fields = _writer.find(number)
+        if fields is not None:
+            return fields
+
+    segment_paths = _segments(directory)
+    _forget_indexes(segment_paths)
+    unsealed = []
+    for segment_path in reversed(segment_paths):
+        if not _is_sealed(segment_path):
+            unsealed.append(segment_path)
+            continue
+        index = _open_index(segment_path)
+        offset = index.find(number) if index is not None else None
+        if offset is not None:
+            try:
+                with open(segment_path, 'rb') as segment:
+                    return decode_record(os.pread(segment.fileno(), RECORD.size, offset))
+            except FileNotFoundError:
+                continue  # loaded and removed meanwhile
+    for segment_path in unsealed:
+        fields = _scan(segment_path, number)
+        if fields is not None:
+            return fields
+    return None
+
+
+def _scan(segment_path: str, number: str) -> Optional[Dict[str, Any]]:
+    try:
+        segment = open(segment_path, 'rb')
+    except FileNotFoundError:
+        return None
+    with segment:
+        size = os.fstat(segment.fileno()).st_size
+        if size <= SEGMENT_HEADER.size:
+            return None
+        with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            key = _key(number)
+            position = data.find(key, SEGMENT_HEADER.size)
+            while position != -1:
+                start = position - _CRC.size
+                if (start - SEGMENT_HEADER.size) % RECORD.size == 0 and start + RECORD.size <= size:
+                    return decode_record(data[start:start + RECORD.size])
+                position = data.find(key, position + 1)
+    return None
+
+
+def segment_tracking_numbers(directory: Optional[str] = None) -> Iterator[str]:
+    """Every tracking number in segments not loaded yet, sealed or open."""
+    for segment_path in _segments(directory or settings.AUDIT_SEGMENT_DIR):
+        try:
+            for _, fields in read_segment(segment_path):
+                yield fields['tracking_number']
+        except FileNotFoundError:
+            continue  # loaded and removed meanwhile
+
+
+def seal_orphans(directory: str) -> int:
+    """
+    Seal segments left open by workers that died without shutting down.
+
+    A segment whose flock can be taken has no live writer. A torn record
+    at its end is cut off before the index is written.
+    """
+    sealed = 0
+    for segment_path in _segments(directory):
+        if _is_sealed(segment_path):
+            continue
+        with open(segment_path, 'r+b') as segment:
+            try:
+                fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            if _is_sealed(segment_path):
+                continue
+            size = os.fstat(segment.fileno()).st_size
+            intact = SEGMENT_HEADER.size + max(size - SEGMENT_HEADER.size, 0) // RECORD.size * RECORD.size
+            if intact != size:
+                logger.warning(f"Truncating {size - intact} bytes of a torn record from {segment_path}")
+                segment.truncate(intact)
+            offsets = {fields['tracking_number']: offset for offset, fields in read_segment(segment_path)}
+            os.fsync(segment.fileno())
+            write_index(segment_path, offsets)
+            sealed += 1
+    return sealed
+
+
+def load_segments(
+    directory: Optional[str] = None, chunk_size: Optional[int] = None, keep: bool = False
+) -> Dict[str, int]:
+    """
+    Import sealed segments into tracking_requests and remove them.
+
+    Safe to rerun after a crash: records already in the table under the same
+    correlation id are skipped. A number in the table (or earlier in the
+    segments) under another correlation id was issued twice; such records
+    are counted as duplicates, logged and not loaded. Loaded rows keep the
+    issue time as created_at. Only one loader runs per directory at a time.
+    With keep=True segments are renamed to *.loaded instead of deleted.
+    """
+    from .models import TrackingNumberRequest
+    from .writes import write_rows
+
+    directory = directory or settings.AUDIT_SEGMENT_DIR
+    chunk_size = chunk_size or getattr(settings, 'WRITE_BUFFER_MAX_BATCH', 500)
+    os.makedirs(directory, exist_ok=True)
+    stats = {'segments': 0, 'records': 0, 'loaded': 0, 'skipped': 0, 'duplicates': 0, 'orphans': 0}
+
+    with open(os.path.join(directory, 'load.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f'Another loader is running on {directory}')
+
+        stats['orphans'] = seal_orphans(directory)
+        for segment_path in _segments(directory):
+            if not _is_sealed(segment_path):
+                continue
+            chunk: List[Dict[str, Any]] = []
+            for _, fields in read_segment(segment_path):
+                chunk.append(fields)
+                if len(chunk) >= chunk_size:
+                    _load_chunk(chunk, stats, TrackingNumberRequest, write_rows)
+                    chunk = []
+            _load_chunk(chunk, stats, TrackingNumberRequest, write_rows)
+            _retire(segment_path, keep)
+            stats['segments'] += 1
+    return stats
+
+
+def _load_chunk(chunk, stats, model, write_rows):
+    if not chunk:
+        return
+    issued = _issued_to([fields['tracking_number'] for fields in chunk])
+    rows, records, logged_at = [], {}, {}
+    for fields in chunk:
+        number = fields['tracking_number']
+        if number not in issued:
+            issued[number] = fields['correlation_id']
+            records[number], logged_at[number] = fields, fields['logged_at']
+            rows.append(model(**{name: value for name, value in fields.items() if name != 'logged_at'}))
+        elif number in logged_at or issued[number] != fields['correlation_id']:
+            _report_duplicate(fields, issued[number], stats)
+        else:
+            # Loaded by a run that crashed before retiring the segment
+            logged_at[number] = fields['logged_at']
+            stats['skipped'] += 1
+    dropped: List[Any] = []
+    stats['records'] += len(chunk)
+    stats['loaded'] += write_rows(rows, dropped)
+    for row in dropped:
+        # Inserted through the database since the lookup above
+        del logged_at[row.tracking_number]
+        _report_duplicate(records[row.tracking_number], None, stats)
+    _backdate(logged_at)
+
+
+def _issued_to(numbers: List[str]) -> Dict[str, str]:
+    """Correlation id of each of `numbers` in tracking_requests, read from the primaries."""
+    from .models import TrackingNumberRequest
+    from .shards import scatter
+
+    def lookup(alias: str) -> Dict[str, str]:
+        return dict(
+            TrackingNumberRequest.objects.using(alias)
+            .filter(tracking_number__in=numbers).values_list('tracking_number', 'correlation_id')
+        )
+
+    issued: Dict[str, str] = {}
+    for found in scatter(lookup):
+        issued.update(found)
+    return issued
+
+
+def _report_duplicate(fields: Dict[str, Any], issued_to: Optional[str], stats: Dict[str, int]):
+    stats['duplicates'] += 1
+    logger.error(
+        f"Tracking number {fields['tracking_number']} was issued twice, not loading the record of "
+        f"customer {fields['customer_id']} logged at {fields['logged_at']} (already issued to "
+        f"correlation id {issued_to or 'unknown'})",
+        extra={'correlation_id': fields['correlation_id']}
+    )
+
+
+def _backdate(logged_at: Dict[str, datetime]):
+    """Set created_at of loaded rows to their issue time; bulk_create stamped the load time (auto_now_add)."""
+    if not logged_at:
+        return
+    from django.db import transaction
+    from django.db.models import Case, DateTimeField, Value, When
+
+    from .models import TrackingNumberRequest
+    from .shards import get_shards
+    from .sqlite import writer_lock
+
+    created_at = Case(
+        *[When(tracking_number=number, then=Value(logged)) for number, logged in logged_at.items()],
+        output_field=DateTimeField()
+    )
+    for alias in get_shards():
+        with writer_lock(connections[alias]), transaction.atomic(using=alias):
+            TrackingNumberRequest.objects.using(alias).filter(
+                tracking_number__in=list(logged_at)
+            ).update(created_at=created_at)
+
+
+def _retire(segment_path: str, keep: bool):
+    index_path = segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    with _indexes_lock:
+        index = _indexes.pop(index_path, None)
+        if index is not None:
+            index.close()
+    if keep:
+        os.replace(segment_path, segment_path + '.loaded')
+        os.replace(index_path, index_path + '.loaded')
+    else:
+        os.remove(segment_path)
+        os.remove(index_path)
+
+
+register_shutdown_hook('audit_segments', shutdown_segment_writer)
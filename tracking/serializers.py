@@ -70,3 +70,113 @@ class TrackingNumberResponseSerializer(serializers.Serializer):
     created_at = serializers.DateTimeField()
     correlation_id = serializers.CharField(max_length=36)
     request_metadata = serializers.DictField(read_only=True)
+
+
+class TrackingNumberBatchSerializer(serializers.Serializer):
+    """
+    Serializer for the envelope of a batch generation request.
+    
+    Only the shared customer fields are validated here; each parcel is
+    validated with TrackingNumberRequestSerializer by the bulk workers.
+    """
+    
+    customer_id = serializers.CharField()
+    customer_name = serializers.CharField(max_length=255, min_length=1)
+    customer_slug = serializers.CharField(max_length=255, min_length=1)
+    parcels = serializers.ListField(allow_empty=False)
+    
+    validate_customer_id = TrackingNumberRequestSerializer.validate_customer_id
+    validate_customer_slug = TrackingNumberRequestSerializer.validate_customer_slug
+    
+    def validate_parcels(self, value):
+        """Validate the batch is within BULK_MAX_BATCH parcels."""
+        from django.conf import settings
+        
+        max_batch = getattr(settings, 'BULK_MAX_BATCH', 100000)
+        if len(value) > max_batch:
+            raise serializers.ValidationError(f"A batch may contain at most {max_batch} parcels")
+        return value
+
+
+class ProfileRequestSerializer(serializers.Serializer):
+    """Serializer for starting a sampling profile of a worker."""
+    
+    seconds = serializers.FloatField(required=False, min_value=1)
+    interval_ms = serializers.FloatField(required=False, min_value=1, max_value=1000)
+    
+    def validate_seconds(self, value):
+        """Validate the profile is no longer than PROFILER_MAX_SECONDS."""
+        from django.conf import settings
+        
+        max_seconds = getattr(settings, 'PROFILER_MAX_SECONDS', 300)
+        if value > max_seconds:
+            raise serializers.ValidationError(f"A profile may run for at most {max_seconds:.0f} seconds")
+        return value
+
+
+class NumberLeaseRequestSerializer(serializers.Serializer):
+    """Serializer for leasing a block of tracking numbers."""
+    
+    origin_country_id = serializers.CharField(max_length=2, min_length=2)
+    destination_country_id = serializers.CharField(max_length=2, min_length=2)
+    customer_id = serializers.CharField()
+    customer_name = serializers.CharField(max_length=255, min_length=1)
+    customer_slug = serializers.CharField(max_length=255, min_length=1)
+    count = serializers.IntegerField(min_value=1)
+    ttl_seconds = serializers.IntegerField(required=False, min_value=60)
+    
+    validate_origin_country_id = TrackingNumberRequestSerializer.validate_origin_country_id
+    validate_destination_country_id = TrackingNumberRequestSerializer.validate_destination_country_id
+    validate_customer_id = TrackingNumberRequestSerializer.validate_customer_id
+    validate_customer_slug = TrackingNumberRequestSerializer.validate_customer_slug
+    
+    def validate_count(self, value):
+        """Validate the lease is within LEASE_MAX_NUMBERS numbers."""
+        from django.conf import settings
+        
+        max_numbers = getattr(settings, 'LEASE_MAX_NUMBERS', 1000000)
+        if value > max_numbers:
+            raise serializers.ValidationError(f"A lease may contain at most {max_numbers} numbers")
+        return value
+    
+    def validate_ttl_seconds(self, value):
+        """Validate the lease lasts at most LEASE_MAX_TTL_SECONDS."""
+        from django.conf import settings
+        
+        max_ttl = getattr(settings, 'LEASE_MAX_TTL_SECONDS', 604800)
+        if value > max_ttl:
+            raise serializers.ValidationError(f"A lease may last at most {max_ttl} seconds")
+        return value
+
+
+class LeaseAssignmentSerializer(serializers.Serializer):
+    """Serializer for one leased number a client has printed on a label."""
+    
+    tracking_number = serializers.RegexField(r'^[A-Z0-9]{1,16}$')
+    weight = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0.001)
+    assigned_at = serializers.CharField()
+    
+    def validate_assigned_at(self, value):
+        """Validate assigned_at is RFC 3339 timestamp format."""
+        try:
+            parsed_datetime = parse_datetime(value)
+            if parsed_datetime is None:
+                raise ValueError("Invalid datetime format")
+            return parsed_datetime
+        except (ValueError, TypeError):
+            raise serializers.ValidationError(
+                "assigned_at must be RFC 3339 timestamp format (e.g., '2018-11-20T19:29:32+08:00')"
+            )
+
+
+class LeaseAssignmentReportSerializer(serializers.Serializer):
+    """Serializer for a client's report of the numbers it used from a lease."""
+    
+    assignments = LeaseAssignmentSerializer(many=True, allow_empty=False)
+    
+    def __init__(self, *args, **kwargs):
+        from django.conf import settings
+        
+        super().__init__(*args, **kwargs)
+        # Checked before any assignment is validated
+        self.fields['assignments'].max_length = getattr(settings, 'LEASE_MAX_ASSIGNMENTS', 10000)
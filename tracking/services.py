@@ -1,10 +1,15 @@
 import hashlib
 import time
-import uuid
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 import logging
-from django.db import IntegrityError
+from django.db import IntegrityError, connections, transaction
+
+from . import shards, tracing, writes
+from .bloom import record_issued
+from .correlation import unique_salt
+from .formats import compile_template, get_customer_template
+from .sqlite import writer_lock
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +26,8 @@ class TrackingNumberGenerator:
         customer_id: str,
         customer_name: str,
         customer_slug: str,
-        correlation_id: str
+        correlation_id: str,
+        salt: Optional[str] = None
     ) -> str:
         """
         Generate a unique tracking number based on input parameters.
@@ -31,32 +37,15 @@ class TrackingNumberGenerator:
         2. Add timestamp component for uniqueness
         3. Add random component for additional uniqueness
         4. Encode to alphanumeric format matching regex ^[A-Z0-9]{1,16}$
+        
+        The salt defaults to the correlation ID.
         """
         try:
-            # Create deterministic hash from input parameters
-            input_string = f"{origin_country_id}{destination_country_id}{weight}{customer_id}{customer_slug}"
-            hash_object = hashlib.sha256(input_string.encode())
-            hash_hex = hash_object.hexdigest()
-            
-            # Add timestamp component (microseconds for uniqueness)
-            timestamp_component = str(int(created_at.timestamp() * 1000000))
-            
-            # Add correlation ID for additional uniqueness
-            unique_string = f"{hash_hex}{timestamp_component}{correlation_id.replace('-', '')}"
-            
-            # Create final hash
-            final_hash = hashlib.sha256(unique_string.encode()).hexdigest()
-            
-            # Convert to base36 (0-9, A-Z) and take first 12 characters
-            # Add country codes for context
-            base_number = int(final_hash[:12], 16)
-            tracking_base = TrackingNumberGenerator._to_base36(base_number)[:10]
-            
-            # Combine with country codes for final tracking number
-            tracking_number = f"{origin_country_id}{destination_country_id}{tracking_base}"
-            
-            # Ensure it fits the regex and length requirements
-            tracking_number = tracking_number[:16].upper()
+            tracking_number = TrackingNumberGenerator.compute_tracking_number(
+                origin_country_id, destination_country_id, weight, created_at,
+                customer_id, customer_slug, salt or correlation_id,
+                template=get_customer_template(customer_id)
+            )
             
             logger.info(
                 f"Generated tracking number: {tracking_number}",
@@ -77,6 +66,55 @@ class TrackingNumberGenerator:
             )
             raise
     
+    @staticmethod
+    def compute_tracking_number(
+        origin_country_id: str,
+        destination_country_id: str,
+        weight: float,
+        created_at: datetime,
+        customer_id: str,
+        customer_slug: str,
+        salt: str,
+        template: Optional[str] = None
+    ) -> str:
+        """
+        Derive a tracking number from the parcel fields and a unique salt, without logging.
+        
+        With a customer template (see tracking.formats) the final hash fills
+        the template's fields; otherwise the default layout is used.
+        """
+        # Create deterministic hash from input parameters
+        input_string = f"{origin_country_id}{destination_country_id}{weight}{customer_id}{customer_slug}"
+        hash_hex = hashlib.sha256(input_string.encode()).hexdigest()
+        
+        # Add timestamp component (microseconds for uniqueness)
+        timestamp_component = str(int(created_at.timestamp() * 1000000))
+        
+        # Add the salt (normally the correlation ID) for additional uniqueness
+        unique_string = f"{hash_hex}{timestamp_component}{salt.replace('-', '')}"
+        
+        # Create final hash
+        final_hash = hashlib.sha256(unique_string.encode()).hexdigest()
+        
+        if template:
+            return compile_template(template).format(
+                origin_country_id, destination_country_id, int(final_hash, 16)
+            )
+        
+        # Convert to base36 (0-9, A-Z) and take first 12 characters
+        # Add country codes for context
+        base_number = int(final_hash[:12], 16)
+        tracking_base = TrackingNumberGenerator._to_base36(base_number)[:10]
+        
+        if shards.is_sharded():
+            # The shard bucket follows the lane, so a lookup goes straight to the right shard
+            marker = shards.number_marker(customer_id, origin_country_id, destination_country_id)
+            tracking_base = marker + tracking_base.rjust(shards.HASH_DIGITS, '0')
+        
+        # Combine with country codes and ensure it fits the regex and length requirements
+        tracking_number = f"{origin_country_id}{destination_country_id}{tracking_base}"
+        return tracking_number[:16].upper()
+    
     @staticmethod
     def _to_base36(number: int) -> str:
         """Convert number to base36 (0-9, A-Z)."""
@@ -105,21 +143,26 @@ class TrackingService:
         Retries up to 3 times if a tracking number collision occurs.
         """
         max_retries = 3
+        salt = unique_salt(correlation_id)
         for attempt in range(max_retries):
             try:
                 # Generate tracking number
-                tracking_number = self.generator.generate_tracking_number(
-                    origin_country_id=validated_data['origin_country_id'],
-                    destination_country_id=validated_data['destination_country_id'],
-                    weight=float(validated_data['weight']),
-                    created_at=validated_data['created_at'],
-                    customer_id=validated_data['customer_id'],
-                    customer_name=validated_data['customer_name'],
-                    customer_slug=validated_data['customer_slug'],
-                    correlation_id=correlation_id
-                )
+                with tracing.span('generate', attempt=attempt):
+                    tracking_number = self.generator.generate_tracking_number(
+                        origin_country_id=validated_data['origin_country_id'],
+                        destination_country_id=validated_data['destination_country_id'],
+                        weight=float(validated_data['weight']),
+                        created_at=validated_data['created_at'],
+                        customer_id=validated_data['customer_id'],
+                        customer_name=validated_data['customer_name'],
+                        customer_slug=validated_data['customer_slug'],
+                        correlation_id=correlation_id,
+                        salt=f'{salt}r{attempt}' if attempt else salt
+                    )
                 # Log the request (async in production)
-                self._log_tracking_request(validated_data, tracking_number, correlation_id)
+                with tracing.span('audit_insert'):
+                    self._log_tracking_request(validated_data, tracking_number, correlation_id)
+                record_issued(tracking_number)
                 # Prepare response
                 response_data = {
                     'tracking_number': tracking_number,
@@ -146,8 +189,7 @@ class TrackingService:
                     f"Tracking number collision detected, retrying... (attempt {attempt+1})",
                     extra={'correlation_id': correlation_id}
                 )
-                # Generate a new correlation_id for the next attempt
-                correlation_id = str(uuid.uuid4())
+                # The next attempt re-salts; the correlation ID stays the same
                 continue
             except Exception as e:
                 logger.error(
@@ -166,8 +208,9 @@ class TrackingService:
         """Log tracking request to database for monitoring."""
         try:
             from .models import TrackingNumberRequest
+            from . import segments
             
-            TrackingNumberRequest.objects.create(  # type: ignore
+            fields = dict(
                 tracking_number=tracking_number,
                 origin_country_id=validated_data['origin_country_id'],
                 destination_country_id=validated_data['destination_country_id'],
@@ -178,9 +221,76 @@ class TrackingService:
                 request_timestamp=validated_data['created_at'],
                 correlation_id=correlation_id
             )
+            
+            # High-volume deployments may keep the audit trail in segment files
+            if segments.get_audit_store() == segments.AUDIT_STORE_SEGMENTS and segments.append_audit_row(fields):
+                return
+            
+            # Customer formats carry no shard marker and the unique constraint only covers
+            # one shard, so the number must not be on any other
+            if shards.is_sharded() and get_customer_template(fields['customer_id']):
+                if shards.existing_numbers([tracking_number], primary=True):
+                    raise IntegrityError(f'Tracking number {tracking_number} is on another shard')
+            
+            # Inside a request the row commits with the request's other writes, but
+            # a collision still raises here, while create_tracking_number can retry
+            if writes.insert(TrackingNumberRequest(**fields)):
+                return
+            
+            # Queued behind the other SQLite writers like every write path; savepoint,
+            # so a collision leaves an enclosing transaction usable for the retry
+            using = shards.shard_for(
+                fields['customer_id'], fields['origin_country_id'], fields['destination_country_id']
+            )
+            with writer_lock(connections[using]), transaction.atomic(using=using):
+                TrackingNumberRequest.objects.create(**fields)  # type: ignore
+        except IntegrityError:
+            # Duplicate tracking number: create_tracking_number retries with a new salt
+            raise
+        except writes.WriteTimeout:
+            # Not known to be unique, so the number must not be returned
+            raise
         except Exception as e:
             # Don't fail the request if logging fails
             logger.warning(
                 f"Failed to log tracking request: {str(e)}",
                 extra={'correlation_id': correlation_id}
             )
+
+
+# Fields returned by find_tracking_request
+RECORD_FIELDS = (
+    'tracking_number', 'origin_country_id', 'destination_country_id', 'weight', 'customer_id',
+    'customer_name', 'customer_slug', 'request_timestamp', 'created_at', 'correlation_id'
+)
+
+
+def find_tracking_request(tracking_number: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Find the audit row of a tracking number wherever it is kept.
+    
+    Looks in tracking_requests (on the number's own shard first), then (with
+    AUDIT_STORE=segments) in segments not loaded yet, then in the cold
+    archive. Returns the row, or None, and where it was found: "index",
+    "segments" or "archive" ("index" if nowhere).
+    """
+    from .archive import find_archived
+    from .segments import AUDIT_STORE_SEGMENTS, find_record, get_audit_store
+    
+    with tracing.span('index_lookup'):
+        row = shards.find_by_number(tracking_number, RECORD_FIELDS)
+    if row is not None:
+        return row, 'index'
+    
+    if get_audit_store() == AUDIT_STORE_SEGMENTS:
+        with tracing.span('segment_lookup'):
+            fields = find_record(tracking_number)
+        if fields is not None:
+            fields['created_at'] = fields.pop('logged_at')
+            return {name: fields[name] for name in RECORD_FIELDS}, 'segments'
+    
+    with tracing.span('archive_lookup'):
+        fields = find_archived(tracking_number)
+    if fields is not None:
+        return {name: fields[name] for name in RECORD_FIELDS}, 'archive'
+    return None, 'index'
@@ -0,0 +1,412 @@
+import contextvars
+import logging
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .health import register_check
+from .replicas import current_read_database
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+SHARD_KEY_CUSTOMER = 'customer'
+SHARD_KEY_LANE = 'lane'
+SHARD_KEYS = (SHARD_KEY_CUSTOMER, SHARD_KEY_LANE)
+
+# Rows are spread over a fixed number of buckets and the shard map assigns
+# buckets to databases, so adding a shard moves whole buckets instead of
+# rehashing every row. One bucket per base36 digit, so a tracking number can
+# carry its bucket in a single character.
+BASE36 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+BUCKETS = len(BASE36)
+
+# Default-layout numbers issued while sharding is on are the lane, the bucket
+# digit and ten base36 hash digits. Unsharded numbers are at most 14
+# characters and leased numbers 16, so the length alone tells them apart.
+MARKED_NUMBER_LENGTH = 15
+HASH_DIGITS = 10
+
+SHARDED_MODELS = ('tracking.trackingnumberrequest',)
+
+# (time.monotonic() of the load, alias of every bucket)
+_map: Optional[Tuple[float, Tuple[str, ...]]] = None
+_map_lock = threading.Lock()
+
+
+def get_shards() -> Tuple[str, ...]:
+    return tuple(getattr(settings, 'DATABASE_SHARDS', None) or (DEFAULT_DB_ALIAS,))
+
+
+def is_sharded() -> bool:
+    return len(get_shards()) > 1
+
+
+def get_shard_key() -> str:
+    return getattr(settings, 'SHARD_KEY', SHARD_KEY_CUSTOMER)
+
+
+def bucket_for(customer_id: Any, origin: str, destination: str) -> int:
+    """Bucket of a row, from its customer or its lane depending on SHARD_KEY."""
+    if get_shard_key() == SHARD_KEY_LANE:
+        key = f'{origin}{destination}'.upper()
+    else:
+        # Canonical form, so "DE61..." and UUID('de61...') land together
+        key = str(uuid.UUID(str(customer_id)))
+    return zlib.crc32(key.encode()) % BUCKETS
+
+
+def default_map(shards: Optional[Tuple[str, ...]] = None) -> Tuple[str, ...]:
+    """Buckets dealt round-robin over the shards, before any rebalancing."""
+    shards = shards or get_shards()
+    return tuple(shards[bucket % len(shards)] for bucket in range(BUCKETS))
+
+
+def load_shard_map() -> Tuple[str, ...]:
+    """The default map overridden by the shard_map table, which lives on the default database."""
+    from .models import ShardMapEntry
+
+    shards = get_shards()
+    buckets = list(default_map(shards))
+    for bucket, alias in ShardMapEntry.objects.using(DEFAULT_DB_ALIAS).values_list('bucket', 'database'):
+        if alias not in shards or bucket >= BUCKETS:
+            logger.warning(f"Ignoring shard map entry {bucket} -> {alias}: not a configured shard")
+            continue
+        buckets[bucket] = alias
+    return tuple(buckets)
+
+
+def shard_map() -> Tuple[str, ...]:
+    """
+    Alias of every bucket, reloaded at most every SHARD_MAP_CACHE_TTL seconds per process.
+
+    If the table cannot be read the previous map is kept; the map only
+    changes when rebalance_shards runs.
+    """
+    global _map
+    cached = _map
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < getattr(settings, 'SHARD_MAP_CACHE_TTL', 30.0):
+        return cached[1]
+    with _map_lock:
+        if _map is not None and _map is not cached:
+            return _map[1]
+        try:
+            _map = (now, load_shard_map())
+        except Exception as e:
+            if _map is None:
+                raise
+            logger.warning(f"Keeping the cached shard map, reload failed: {str(e)}")
+            _map = (now, _map[1])
+        return _map[1]
+
+
+def invalidate_shard_map():
+    """Drop this process' cached map so the next lookup reloads it."""
+    global _map
+    with _map_lock:
+        _map = None
+
+
+def shard_for(customer_id: Any, origin: str, destination: str) -> str:
+    """Database holding the rows of a customer (or lane)."""
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    return shard_map()[bucket_for(customer_id, origin, destination)]
+
+
+def database_for(instance) -> str:
+    """Database a model instance is written to."""
+    if instance._meta.label_lower not in SHARDED_MODELS or not is_sharded():
+        return DEFAULT_DB_ALIAS
+    return shard_for(instance.customer_id, instance.origin_country_id, instance.destination_country_id)
+
+
+def number_marker(customer_id: Any, origin: str, destination: str) -> str:
+    """Character placed after the lane in numbers of this customer (or lane)."""
+    return BASE36[bucket_for(customer_id, origin, destination)]
+
+
+def shards_for_number(tracking_number: str) -> List[str]:
+    """
+    Shards to search for a tracking number, most likely first.
+
+    A number issued while sharding is on names its bucket, so its shard is
+    tried first without a directory query. The rest follow for numbers that
+    carry no marker (customer templates, leases, numbers issued before
+    sharding) or rows not moved yet by a rebalance.
+    """
+    shards = list(get_shards())
+    if len(shards) == 1:
+        return shards
+    if len(tracking_number) == MARKED_NUMBER_LENGTH and tracking_number[4] in BASE36:
+        first = shard_map()[BASE36.index(tracking_number[4])]
+        shards.remove(first)
+        shards.insert(0, first)
+    return shards
+
+
+def read_alias(alias: str) -> str:
+    """Alias to read a shard through: the default shard honours replica_reads()."""
+    if alias == DEFAULT_DB_ALIAS:
+        return current_read_database()
+    return alias
+
+
+def scatter(fn: Callable[[str], T], shards: Optional[Iterable[str]] = None) -> List[T]:
+    """
+    Call fn(alias) for every shard concurrently and return the results in shard order.
+
+    Each call runs on its own thread (with its own connection) in a copy of
+    the caller's context, so replica_reads() and the correlation id carry
+    over. With a single shard fn runs inline.
+    """
+    shards = list(shards or get_shards())
+    if len(shards) == 1:
+        return [fn(shards[0])]
+
+    def call(context: contextvars.Context, alias: str) -> T:
+        try:
+            return context.run(fn, alias)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='shard-scatter') as pool:
+        futures = [pool.submit(call, contextvars.copy_context(), alias) for alias in shards]
+        return [future.result() for future in futures]
+
+
+def find_by_number(tracking_number: str, fields: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    """The row of a tracking number as a dict of `fields`, searching its marked shard first."""
+    from .models import TrackingNumberRequest
+
+    for alias in shards_for_number(tracking_number):
+        row = (
+            TrackingNumberRequest.objects.using(read_alias(alias))
+            .filter(tracking_number=tracking_number).values(*fields).first()
+        )
+        if row is not None:
+            return row
+    return None
+
+
+def existing_numbers(numbers: List[str], chunk_size: int = 1000, primary: bool = False) -> Set[str]:
+    """Which of `numbers` are in tracking_requests on any shard (read from the primaries if `primary`)."""
+    from .models import TrackingNumberRequest
+
+    def lookup(alias: str) -> Set[str]:
+        found = set()
+        for start in range(0, len(numbers), chunk_size):
+            found.update(
+                TrackingNumberRequest.objects.using(alias if primary else read_alias(alias))
+                .filter(tracking_number__in=numbers[start:start + chunk_size])
+                .values_list('tracking_number', flat=True)
+            )
+        return found
+
+    return set().union(*scatter(lookup)) if numbers else set()
+
+
+def save_shard_map(assignments: Dict[int, str]):
+    """Assign buckets to shards in the shard_map table and reload this process' map."""
+    from .models import ShardMapEntry
+
+    shards = get_shards()
+    for bucket, alias in assignments.items():
+        if not 0 <= bucket < BUCKETS:
+            raise ValueError(f'Bucket must be between 0 and {BUCKETS - 1}, got {bucket}')
+        if alias not in shards:
+            raise ValueError(f"Unknown shard {alias}; configured shards: {', '.join(shards)}")
+    for bucket, alias in assignments.items():
+        ShardMapEntry.objects.using(DEFAULT_DB_ALIAS).update_or_create(bucket=bucket, defaults={'database': alias})
+    invalidate_shard_map()
+
+
+def balanced_map(current: Tuple[str, ...], shards: Optional[Tuple[str, ...]] = None) -> Dict[int, str]:
+    """
+    Bucket moves that leave every shard with an equal share, moving as few buckets as possible.
+
+    Returns only the buckets that change shard.
+    """
+    shards = shards or get_shards()
+    quota = {alias: BUCKETS // len(shards) + (1 if i < BUCKETS % len(shards) else 0) for i, alias in enumerate(shards)}
+    kept: Dict[str, int] = {alias: 0 for alias in shards}
+    homeless = []
+    for bucket, alias in enumerate(current):
+        if alias in kept and kept[alias] < quota[alias]:
+            kept[alias] += 1
+        else:
+            homeless.append(bucket)
+    moves = {}
+    for alias in shards:
+        while kept[alias] < quota[alias]:
+            moves[homeless.pop(0)] = alias
+            kept[alias] += 1
+    return moves
+
+
+def _movable(source: str, target: str):
+    """
+    Filter for rows whose move leaves the daily rollups unchanged.
+
+    Those are rows both shards' watermarks have passed (counted once, at the
+    source) and rows neither has reached (counted once, at the target). A
+    target with nothing of its own to roll up before the source's watermark
+    (typically a new, empty shard) first starts its watermark there. Locks
+    both watermarks, so call it inside a transaction.
+    """
+    from django.db.models import Q
+
+    from .models import RollupWatermark, TrackingNumberRequest
+    from .rollups import rolled_up, watermark_name
+
+    marks = {}
+    for alias in sorted({source, target}):
+        marks[alias], _ = RollupWatermark.objects.select_for_update().get_or_create(name=watermark_name(alias))
+    src, tgt = marks[source], marks[target]
+
+    # Watermarks hold inserted_at positions; moved rows keep their inserted_at
+    if src.last_inserted_at is not None and (tgt.last_inserted_at is None or tgt.last_inserted_at < src.last_inserted_at):
+        behind = TrackingNumberRequest.objects.using(target).filter(inserted_at__lte=src.last_inserted_at)
+        if tgt.last_inserted_at is not None:
+            behind = behind.filter(inserted_at__gte=tgt.last_inserted_at)
+        if not behind.exists():
+            tgt.last_inserted_at, tgt.last_id = src.last_inserted_at, src.last_id
+            tgt.save()
+
+    if src.last_inserted_at is None and tgt.last_inserted_at is None:
+        return Q()
+    return (rolled_up(src) & rolled_up(tgt)) | (~rolled_up(src) & ~rolled_up(tgt))
+
+
+def _copy(rows: List[Any], target: str) -> Set[Any]:
+    """Copy rows to `target`; returns the ids now on the target (rows whose number it holds are not copied)."""
+    from django.db import transaction
+    from django.db.models import Case, DateTimeField, Value, When
+
+    from .models import TrackingNumberRequest
+
+    created = {row.id: row.created_at for row in rows}
+    table = TrackingNumberRequest.objects.using(target)
+    with transaction.atomic(using=target):
+        table.bulk_create(rows, ignore_conflicts=True)
+        copied = set(table.filter(id__in=list(created)).values_list('id', flat=True))
+        # created_at is auto_now_add, so bulk_create stamped the copies with the current time
+        table.filter(id__in=list(copied)).update(created_at=Case(
+            *[When(id=pk, then=Value(created[pk])) for pk in copied],
+            output_field=DateTimeField()
+        ))
+    return copied
+
+
+def relocate_rows(mapping: Optional[Tuple[str, ...]] = None, batch_size: int = 1000,
+                  dry_run: bool = False) -> Dict[str, int]:
+    """
+    Move rows that are not on the shard `mapping` (default: the shard map) assigns them to.
+
+    Rows are copied in batches and deleted from the old shard once the copy
+    has committed, so an interrupted run leaves duplicates that the next run
+    removes. Rows the daily rollups of only one of the two shards have
+    counted stay put; they are reported as remaining and move on a later
+    run, after update_rollups. A row whose tracking number the target holds
+    under another id was issued twice; it stays on its shard, is logged and
+    counted as a conflict. A dry run only counts the misplaced rows.
+    Returns the numbers of rows moved, remaining and in conflict.
+    """
+    from django.db import transaction
+
+    from .models import TrackingNumberRequest
+
+    mapping = mapping or shard_map()
+    if get_shard_key() == SHARD_KEY_LANE:
+        key_fields: Tuple[str, ...] = ('origin_country_id', 'destination_country_id')
+    else:
+        key_fields = ('customer_id',)
+    stats = {'moved': 0, 'remaining': 0, 'conflicts': 0}
+    for source in get_shards():
+        table = TrackingNumberRequest.objects.using(source)
+        for key in list(table.values_list(*key_fields).distinct()):
+            values = dict(zip(key_fields, key))
+            target = mapping[bucket_for(
+                values.get('customer_id'), values.get('origin_country_id', ''), values.get('destination_country_id', '')
+            )]
+            if target == source:
+                continue
+            rows = table.filter(**values)
+            conflicts: Set[Any] = set()
+            while not dry_run:
+                with transaction.atomic():
+                    batch = list(
+                        rows.filter(_movable(source, target)).exclude(id__in=list(conflicts)).order_by('id')[:batch_size]
+                    )
+                    copied = _copy(batch, target) if batch else set()
+                if not batch:
+                    break
+                for row in batch:
+                    if row.id not in copied:
+                        conflicts.add(row.id)
+                        logger.error(
+                            f"Tracking number {row.tracking_number} is on both {source} and {target}; "
+                            f"row {row.id} stays on {source}",
+                            extra={'correlation_id': row.correlation_id}
+                        )
+                if copied:
+                    rows.filter(id__in=list(copied)).delete()
+                    stats['moved'] += len(copied)
+                    logger.info(f"Moved {len(copied)} tracking requests from {source} to {target}")
+            stats['conflicts'] += len(conflicts)
+            stats['remaining'] += rows.exclude(id__in=list(conflicts)).count()
+    return stats
+
+
+def check_shards() -> Dict[str, Any]:
+    """Verify every shard besides the default database (checked on its own) answers a query."""
+    details = {}
+    for alias in get_shards():
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        connection = connections[alias]
+        connection.close_if_unusable_or_obsolete()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        except Exception:
+            connection.close()
+            raise
+        details[alias] = {'buckets': shard_map().count(alias)}
+    return details
+
+
+class ShardRouter:
+    """
+    Database router for DATABASE_SHARDS.
+
+    Sends reads and writes of a TrackingNumberRequest instance to the shard
+    of its customer (or lane). Querysets carry no instance, so queries by
+    filter use the helpers above; rows routed to the default database fall
+    through to ReplicaRouter.
+    """
+
+    def _route(self, model, hints) -> Optional[str]:
+        instance = hints.get('instance')
+        if instance is None or model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        alias = database_for(instance)
+        return None if alias == DEFAULT_DB_ALIAS else alias
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+
+register_check('shards', check_shards)
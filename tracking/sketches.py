@@ -0,0 +1,72 @@
+import math
+from typing import Any, Dict, Optional
+
+
+class DDSketch:
+    """
+    Mergeable quantile sketch with bounded relative error (DDSketch).
+
+    Positive values fall into logarithmic buckets of ratio gamma, so any
+    quantile is returned within +/- relative_accuracy of the true value.
+    Two sketches with the same accuracy merge by adding bucket counts, which
+    is what lets daily and per-minute rollups be combined into any window
+    without keeping raw values.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        """Record a value (non-positive values share a single zero bucket)."""
+        if value <= 0:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+
+    def merge(self, other: 'DDSketch'):
+        """Add another sketch's counts into this one."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different relative accuracy')
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the approximate q-quantile (0 <= q <= 1), None if empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a JSON-compatible dict."""
+        return {
+            'a': self.relative_accuracy,
+            'z': self.zero_count,
+            'b': {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], relative_accuracy: float = 0.01) -> 'DDSketch':
+        """Rebuild a sketch from to_dict() output; an empty dict gives an empty sketch."""
+        sketch = cls(data.get('a', relative_accuracy) if data else relative_accuracy)
+        if data:
+            sketch.zero_count = data.get('z', 0)
+            sketch.bins = {int(index): count for index, count in data.get('b', {}).items()}
+            sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
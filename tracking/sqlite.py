@@ -0,0 +1,70 @@
+import contextlib
+import logging
+import os
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def is_tuned(connection) -> bool:
+    """True when SQLite tuned mode applies to this connection."""
+    return connection.vendor == 'sqlite' and getattr(settings, 'SQLITE_TUNED', False)
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    connection_created receiver applying the tuned-mode PRAGMAs.
+
+    WAL lets readers run alongside the writer, synchronous=NORMAL fsyncs at
+    checkpoints instead of on every commit, busy_timeout makes a blocked
+    writer wait instead of failing with "database is locked", and mmap_size
+    serves reads from the page cache without read() calls.
+    """
+    if not is_tuned(connection):
+        return
+
+    synchronous = settings.SQLITE_SYNCHRONOUS.upper()
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f'SQLITE_SYNCHRONOUS must be one of {", ".join(SYNCHRONOUS_LEVELS)}')
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}')
+        cursor.execute(f'PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}')
+
+
+@contextlib.contextmanager
+def writer_lock(connection):
+    """
+    Serialize write transactions of all workers sharing one SQLite file.
+
+    SQLite allows a single writer; without coordination concurrent workers
+    spin in the busy handler and throughput becomes erratic. An exclusive
+    flock() on a sidecar file queues them in the kernel instead. No-op for
+    other databases, when tuned mode is off, or where fcntl is unavailable.
+    """
+    if not is_tuned(connection):
+        yield
+        return
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    lock_path = f"{connection.settings_dict['NAME']}.writer.lock"
+    if str(connection.settings_dict['NAME']).startswith(('file:', ':memory:')):
+        yield
+        return
+
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
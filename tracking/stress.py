@@ -0,0 +1,343 @@
+import contextlib
+import hashlib
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from django.db import connection
+from django.utils import timezone
+
+from . import segments, writes
+from .correlation import new_correlation_id
+from .lifecycle import close_connections, discard_inherited_connections
+from .models import TrackingNumberRequest
+from .services import TrackingNumberGenerator, TrackingService
+from .shards import get_shards
+from .sketches import DDSketch
+
+STRESS_SLUG = 'stress-test'
+STRESS_CUSTOMER_ID = uuid.UUID('5e55e55e-0000-4000-8000-000000000000')
+
+# How issued numbers reach the audit table: straight from the service, at the
+# end of a simulated request, or through the group commit writer
+PATHS = (writes.WRITE_MODE_DIRECT, writes.WRITE_MODE_REQUEST, writes.WRITE_MODE_GROUP)
+
+LANES = (('MY', 'ID'), ('ID', 'MY'), ('SG', 'MY'), ('MY', 'SG'))
+
+# Substrings of SQLite and PostgreSQL errors caused by waiting on a lock
+LOCK_ERRORS = (
+    'database is locked', 'database table is locked', 'deadlock detected',
+    'could not serialize', 'lock timeout', 'could not obtain lock',
+)
+
+# Seconds workers wait for each other at the start line
+START_TIMEOUT = 60.0
+
+
+def is_lock_error(message: str) -> bool:
+    return any(fragment in message for fragment in LOCK_ERRORS)
+
+
+class StressResult:
+    """Numbers issued, errors and latencies of one run, merged across workers."""
+
+    def __init__(self):
+        self.numbers: List[str] = []
+        self.failures: Dict[str, int] = {}
+        self.retries = 0
+        self.lock_errors = 0
+        self.log_failures = 0
+        self.dropped = 0
+        self.sketch = DDSketch()
+        self.elapsed = 0.0
+        # Filled in by verify()
+        self.duplicates: Dict[str, int] = {}
+        self.stored = 0
+        self.lost: List[str] = []
+
+    @property
+    def calls(self) -> int:
+        return len(self.numbers) + sum(self.failures.values())
+
+    @property
+    def throughput(self) -> float:
+        return len(self.numbers) / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.duplicates and not self.lost
+
+    def fail(self, error: BaseException):
+        name = type(error).__name__
+        self.failures[name] = self.failures.get(name, 0) + 1
+        if is_lock_error(str(error)):
+            self.lock_errors += 1
+
+    def merge(self, other: 'StressResult'):
+        self.numbers.extend(other.numbers)
+        for name, count in other.failures.items():
+            self.failures[name] = self.failures.get(name, 0) + count
+        self.retries += other.retries
+        self.lock_errors += other.lock_errors
+        self.log_failures += other.log_failures
+        self.dropped += other.dropped
+        self.sketch.merge(other.sketch)
+
+
+class UniquenessError(Exception):
+    """A stress run returned a number twice or issued one without an audit row."""
+
+    def __init__(self, result: StressResult):
+        super().__init__(
+            f'Uniqueness check failed: {len(result.duplicates)} numbers returned more than once, '
+            f'{len(result.lost)} issued numbers without an audit row'
+        )
+        self.result = result
+
+
+class _LogCounter(logging.Handler):
+    """Count the warnings the service and writers log instead of raising."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.counts = Counter()
+
+    def emit(self, record: logging.LogRecord):
+        # Handler.handle() holds self.lock around emit()
+        message = record.getMessage()
+        if message.startswith('Tracking number collision'):
+            self.counts['retries'] += 1
+        elif message.startswith('Failed to log tracking request'):
+            self.counts['log_failures'] += 1
+        elif message.startswith('Dropped TrackingNumberRequest row'):
+            self.counts['dropped'] += 1
+        if is_lock_error(message):
+            self.counts['lock_errors'] += 1
+
+    def add_to(self, result: StressResult):
+        with self.lock:
+            result.retries += self.counts['retries']
+            result.log_failures += self.counts['log_failures']
+            result.dropped += self.counts['dropped']
+            result.lock_errors += self.counts['lock_errors']
+
+
+@contextlib.contextmanager
+def narrowed_number_space(space: int):
+    """
+    Map every generated number onto `space` values, so collisions actually happen.
+
+    Real numbers carry ~50 bits of hash and never collide in a test run; this
+    is how the unique constraint and the retry path get exercised. Forked
+    workers inherit the patch.
+    """
+    original = TrackingNumberGenerator.compute_tracking_number
+
+    def compute(*args, **kwargs):
+        number = original(*args, **kwargs)
+        slot = int(hashlib.sha256(number.encode()).hexdigest(), 16) % space
+        return f'{number[:4]}{slot:010d}'
+
+    TrackingNumberGenerator.compute_tracking_number = staticmethod(compute)
+    try:
+        yield
+    finally:
+        TrackingNumberGenerator.compute_tracking_number = staticmethod(original)
+
+
+def _parcel(index: int) -> Dict[str, Any]:
+    origin, destination = LANES[index % len(LANES)]
+    return {
+        'origin_country_id': origin,
+        'destination_country_id': destination,
+        'weight': Decimal(index % 5000 + 1) / 100,
+        'created_at': timezone.now(),
+        'customer_id': STRESS_CUSTOMER_ID,
+        'customer_name': 'Stress Test',
+        'customer_slug': STRESS_SLUG,
+    }
+
+
+def _issue(service: TrackingService, path: str, data: Dict[str, Any]) -> str:
+    """Issue one number the way a request on `path` would."""
+    correlation_id = new_correlation_id()
+    if path == writes.WRITE_MODE_DIRECT:
+        return service.create_tracking_number(data, correlation_id)['tracking_number']
+
+    token = writes.begin_unit_of_work(path)
+    try:
+        return service.create_tracking_number(data, correlation_id)['tracking_number']
+    finally:
+        writes.end_unit_of_work(token)
+
+
+def _thread(service: TrackingService, path: str, calls: int, start, result: StressResult, lock: threading.Lock):
+    local = StressResult()
+    try:
+        start.wait(START_TIMEOUT)
+        for index in range(calls):
+            started = time.perf_counter()
+            try:
+                local.numbers.append(_issue(service, path, _parcel(index)))
+            except Exception as e:
+                local.fail(e)
+            local.sketch.add((time.perf_counter() - started) * 1000)
+    except threading.BrokenBarrierError as e:
+        local.fail(e)
+    finally:
+        connection.close()
+        with lock:
+            result.merge(local)
+
+
+def _run_workers(path: str, threads: int, calls: int, start) -> StressResult:
+    """Run `threads` issuing threads in this process and wait for their rows to be written."""
+    result = StressResult()
+    counter = _LogCounter()
+    loggers = [logging.getLogger('tracking.services'), logging.getLogger('tracking.writes')]
+    for logger in loggers:
+        logger.addHandler(counter)
+    try:
+        service = TrackingService()
+        lock = threading.Lock()
+        workers = [
+            threading.Thread(target=_thread, args=(service, path, calls, start, result, lock), name=f'stress-{i}')
+            for i in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if path == writes.WRITE_MODE_GROUP:
+            writes.get_group_writer().flush()
+        segments.shutdown_segment_writer()
+    finally:
+        for logger in loggers:
+            logger.removeHandler(counter)
+    counter.add_to(result)
+    return result
+
+
+def _process(results, path: str, threads: int, calls: int, start):
+    discard_inherited_connections()
+    try:
+        result = _run_workers(path, threads, calls, start)
+        writes.shutdown_group_writer()
+    except Exception as e:
+        result = StressResult()
+        result.fail(e)
+    finally:
+        close_connections()
+    results.put(result)
+
+
+def run_stress(path: str = writes.WRITE_MODE_DIRECT, processes: int = 1, threads: int = 8,
+               calls: int = 100, number_space: Optional[int] = None) -> StressResult:
+    """
+    Issue numbers from `processes` x `threads` workers at once, `calls` each, then verify().
+
+    Raises UniquenessError if any number was returned twice or has no audit
+    row, whatever the path. Workers wait at a common start line so their
+    calls overlap. Processes are forked, so they use the same database
+    settings as this one; a SQLite in-memory database cannot be shared with
+    them.
+    """
+    if path not in PATHS:
+        raise ValueError(f"path must be one of: {', '.join(PATHS)}")
+    if processes < 1 or threads < 1 or calls < 1:
+        raise ValueError('processes, threads and calls must be at least 1')
+    if processes > 1:
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise ValueError('Several processes need the fork start method')
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise ValueError('Several processes cannot share an in-memory SQLite database')
+
+    space = narrowed_number_space(number_space) if number_space else contextlib.nullcontext()
+    with space:
+        started = time.perf_counter()
+        if processes == 1:
+            result = _run_workers(path, threads, calls, threading.Barrier(threads))
+        else:
+            result = _run_processes(path, processes, threads, calls)
+        result.elapsed = time.perf_counter() - started
+    verify(result)
+    if not result.ok:
+        raise UniquenessError(result)
+    return result
+
+
+def _run_processes(path: str, processes: int, threads: int, calls: int) -> StressResult:
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    start = context.Barrier(processes * threads)
+    # Children must not share this process' database sockets
+    close_connections()
+    children = [
+        context.Process(target=_process, args=(results, path, threads, calls, start), name=f'stress-{i}')
+        for i in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    result = StressResult()
+    received = 0
+    while received < processes:
+        try:
+            result.merge(results.get(timeout=1.0))
+            received += 1
+        except queue.Empty:
+            if all(not child.is_alive() for child in children) and results.empty():
+                # A child died without reporting (killed, crashed interpreter)
+                result.failures['WorkerDied'] = processes - received
+                break
+    for child in children:
+        child.join()
+    return result
+
+
+def verify(result: StressResult):
+    """Find numbers returned more than once and issued numbers without an audit row."""
+    issued = Counter(result.numbers)
+    result.duplicates = {number: count for number, count in issued.items() if count > 1}
+
+    stored = set()
+    for alias in get_shards():
+        stored.update(
+            TrackingNumberRequest.objects.using(alias).filter(
+                customer_slug=STRESS_SLUG
+            ).values_list('tracking_number', flat=True).iterator()
+        )
+    if segments.get_audit_store() == segments.AUDIT_STORE_SEGMENTS:
+        stored.update(number for number in segments.segment_tracking_numbers() if number in issued)
+    result.stored = sum(1 for number in issued if number in stored)
+    result.lost = sorted(number for number in issued if number not in stored)
+
+
+def cleanup() -> int:
+    """Delete the audit rows stress runs left in the table."""
+    return sum(
+        TrackingNumberRequest.objects.using(alias).filter(customer_slug=STRESS_SLUG).delete()[0]
+        for alias in get_shards()
+    )
+
+
+def format_result(result: StressResult) -> List[str]:
+    failures = ', '.join(f'{name} {count}' for name, count in sorted(result.failures.items())) or '0'
+    return [
+        f"{'calls':<18} {result.calls}",
+        f"{'numbers/s':<18} {result.throughput:.0f}",
+        f"{'latency ms':<18} p50 {result.sketch.quantile(0.5) or 0:.2f}  "
+        f"p95 {result.sketch.quantile(0.95) or 0:.2f}  p99 {result.sketch.quantile(0.99) or 0:.2f}",
+        f"{'collision retries':<18} {result.retries}",
+        f"{'lock errors':<18} {result.lock_errors}",
+        f"{'failures':<18} {failures}",
+        f"{'audit rows':<18} {result.stored} stored, {len(result.lost)} lost "
+        f"({result.log_failures} not logged, {result.dropped} dropped at commit)",
+        f"{'duplicates':<18} {len(result.duplicates)}",
+    ]
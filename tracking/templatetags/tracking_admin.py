@@ -0,0 +1,100 @@
+import calendar
+import datetime
+
+from django import template
+from django.contrib.admin.templatetags.base import InclusionAdminNode
+from django.db import models
+from django.utils import formats, timezone
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+register = template.Library()
+
+
+def calendar_date_hierarchy(cl):
+    """
+    Date drill-down whose choices come from the calendar, not the data.
+
+    Django's date_hierarchy lists the years, months or days that actually
+    contain rows with SELECT DISTINCT over the (filtered) table. Here only the
+    overall bounds are read (MIN/MAX, answered from the ends of the date
+    index); months and days are listed from the calendar. Selecting a choice
+    still filters with a created_at range on the index.
+    """
+    field_name = cl.date_hierarchy
+    year_field = f'{field_name}__year'
+    month_field = f'{field_name}__month'
+    day_field = f'{field_name}__day'
+    field_generic = f'{field_name}__'
+    year_lookup = cl.params.get(year_field)
+    month_lookup = cl.params.get(month_field)
+    day_lookup = cl.params.get(day_field)
+
+    def link(filters):
+        return cl.get_query_string(filters, [field_generic])
+
+    if year_lookup and month_lookup and day_lookup:
+        day = datetime.date(int(year_lookup), int(month_lookup), int(day_lookup))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year_lookup, month_field: month_lookup}),
+                'title': capfirst(formats.date_format(day, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))}],
+        }
+
+    if year_lookup and month_lookup:
+        year, month = int(year_lookup), int(month_lookup)
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year_lookup}), 'title': str(year_lookup)},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month_lookup, day_field: day}),
+                    'title': capfirst(formats.date_format(datetime.date(year, month, day), 'MONTH_DAY_FORMAT')),
+                }
+                for day in range(1, calendar.monthrange(year, month)[1] + 1)
+            ],
+        }
+
+    if year_lookup:
+        year = int(year_lookup)
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month}),
+                    'title': capfirst(formats.date_format(datetime.date(year, month, 1), 'YEAR_MONTH_FORMAT')),
+                }
+                for month in range(1, 13)
+            ],
+        }
+
+    bounds = cl.queryset.order_by().aggregate(
+        first=models.Min(field_name), last=models.Max(field_name)
+    )
+    if not (bounds['first'] and bounds['last']):
+        return {'show': True, 'back': None, 'choices': []}
+    first_year = timezone.localtime(bounds['first']).year
+    last_year = timezone.localtime(bounds['last']).year
+    return {
+        'show': True,
+        'back': None,
+        'choices': [
+            {'link': link({year_field: str(year)}), 'title': str(year)}
+            for year in range(first_year, last_year + 1)
+        ],
+    }
+
+
+@register.tag(name='calendar_date_hierarchy')
+def calendar_date_hierarchy_tag(parser, token):
+    return InclusionAdminNode(
+        parser,
+        token,
+        func=calendar_date_hierarchy,
+        template_name='date_hierarchy.html',
+        takes_context=False,
+    )
@@ -0,0 +1,204 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking.archive import ArchiveReader, archive_before, read_archive, read_footer, write_archive
+from tracking.bloom import BloomFilter, rebuild_filter
+from tracking.models import RollupWatermark, TrackingNumberRequest
+from tracking.rollups import WATERMARK_NAME
+
+CUSTOMER_ID = 'de619854-b59b-425e-9db4-943979e1bd49'
+DAY = datetime(2021, 3, 4, tzinfo=timezone.utc)
+
+
+class ArchiveTestCase(TestCase):
+    """Base class archiving into a temporary directory."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        settings_override = override_settings(ARCHIVE_DIR=self.directory, ARCHIVE_BLOCK_ROWS=4)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _log(self, number, created_at, origin='MY', destination='ID'):
+        row = TrackingNumberRequest.objects.create(
+            tracking_number=number, origin_country_id=origin, destination_country_id=destination,
+            weight=Decimal('1.234'), customer_id=CUSTOMER_ID, customer_name='RedBox Logistics',
+            customer_slug='redbox-logistics', request_timestamp=created_at, correlation_id=f'cid-{number}'
+        )
+        # created_at is auto_now_add, so backdate it (and the insert) afterwards
+        TrackingNumberRequest.objects.filter(pk=row.pk).update(created_at=created_at, inserted_at=created_at)
+
+
+class ArchiveFileTest(ArchiveTestCase):
+    """Test cases for the archive file layout."""
+
+    def test_round_trip(self):
+        """Test that rows come back sorted, with a footer describing every block."""
+        rows = [
+            {column: f'{column}-{i}' for column in ('id', 'origin_country_id', 'destination_country_id', 'weight',
+                                                     'customer_id', 'customer_name', 'customer_slug',
+                                                     'request_timestamp', 'correlation_id')}
+            | {'tracking_number': f'MYID{i:010d}', 'created_at': f'2021-03-04T00:00:{i:02d}+00:00'}
+            for i in range(9, -1, -1)
+        ]
+        path = os.path.join(self.directory, 'test.tna')
+        footer = write_archive(path, rows, date(2021, 3, 4), ('MY', 'ID'))
+
+        self.assertEqual(footer, read_footer(path))
+        self.assertEqual(footer['rows'], 10)
+        self.assertEqual(footer['min_tracking_number'], 'MYID0000000000')
+        self.assertEqual(footer['max_tracking_number'], 'MYID0000000009')
+        self.assertEqual(footer['max_created_at'], '2021-03-04T00:00:09+00:00')
+        self.assertEqual([block[0] for block in footer['blocks']], ['MYID0000000000', 'MYID0000000004', 'MYID0000000008'])
+        self.assertEqual([row['tracking_number'] for row in read_archive(path)], sorted(row['tracking_number'] for row in rows))
+
+
+class ArchiveBeforeTest(ArchiveTestCase):
+    """Test cases for moving rows into the archive."""
+
+    def setUp(self):
+        super().setUp()
+        for i in range(6):
+            self._log(f'MYID{i:010d}', DAY + timedelta(hours=i))
+        self._log('IDMY0000000001', DAY + timedelta(hours=1), origin='ID', destination='MY')
+        self._log('MYID0000000100', DAY + timedelta(days=1))
+        self._log('MYID0000000200', DAY + timedelta(days=30))
+
+    def test_archive(self):
+        """Test that old rows move into one file per day and lane, and newer rows stay."""
+        stats = archive_before(DAY + timedelta(days=2))
+
+        self.assertEqual(stats, {'days': 2, 'files': 3, 'rows': 8})
+        self.assertEqual(list(TrackingNumberRequest.objects.values_list('tracking_number', flat=True)), ['MYID0000000200'])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, '2021', '03', '04', 'MYID.tna')))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, '2021', '03', '04', 'IDMY.tna')))
+        with open(os.path.join(self.directory, 'manifest.json')) as manifest:
+            files = json.load(manifest)['files']
+        self.assertEqual(files[os.path.join('2021', '03', '05', 'MYID.tna')]['rows'], 1)
+
+    def test_lookup_reads_one_block(self):
+        """Test that a lookup prunes files by min/max and decompresses a single block."""
+        archive_before(DAY + timedelta(days=2))
+        reader = ArchiveReader()
+
+        row = reader.find('MYID0000000005')
+        self.assertEqual(row['correlation_id'], 'cid-MYID0000000005')
+        self.assertEqual(row['weight'], Decimal('1.234'))
+        self.assertEqual(row['created_at'], DAY + timedelta(hours=5))
+        self.assertEqual(reader.stats['files_searched'], 1)
+        self.assertEqual(reader.stats['blocks_read'], 1)
+
+        self.assertIsNone(reader.find('MYID0000000050'))
+        self.assertIsNone(reader.find('ZZZZ0000000000'))
+        self.assertEqual(reader.stats['lookups'], 3)
+        self.assertEqual(reader.stats['files_searched'], 1)
+
+    def test_rollup_watermark_is_respected(self):
+        """Test that rows the rollups have not processed are not archived."""
+        RollupWatermark.objects.create(name=WATERMARK_NAME, last_inserted_at=DAY + timedelta(hours=2, minutes=30))
+        stats = archive_before(DAY + timedelta(days=2))
+
+        self.assertEqual(stats['rows'], 4)
+        self.assertTrue(TrackingNumberRequest.objects.filter(tracking_number='MYID0000000003').exists())
+
+    def test_watermark_is_an_insert_position(self):
+        """Test that the watermark is compared with inserted_at, not created_at."""
+        RollupWatermark.objects.create(name=WATERMARK_NAME, last_inserted_at=DAY + timedelta(days=40))
+        # Loaded late with an old created_at, after the rollups last ran
+        TrackingNumberRequest.objects.filter(tracking_number='MYID0000000001').update(inserted_at=DAY + timedelta(days=41))
+        stats = archive_before(DAY + timedelta(days=2))
+
+        self.assertEqual(stats['rows'], 7)
+        self.assertEqual(
+            set(TrackingNumberRequest.objects.values_list('tracking_number', flat=True)),
+            {'MYID0000000001', 'MYID0000000200'}
+        )
+
+    def test_rerun_merges_into_existing_files(self):
+        """Test that archiving a day twice keeps the rows of both runs."""
+        archive_before(DAY + timedelta(hours=2))
+        archive_before(DAY + timedelta(days=1))
+
+        numbers = [row['tracking_number'] for row in read_archive(os.path.join(self.directory, '2021', '03', '04', 'MYID.tna'))]
+        self.assertEqual(numbers, [f'MYID{i:010d}' for i in range(6)])
+
+    def test_dry_run(self):
+        """Test that a dry run counts without moving anything."""
+        out = StringIO()
+        call_command('archive_tracking_requests', '--before', '2021-03-06T00:00:00Z', '--dry-run', stdout=out)
+
+        self.assertIn('Would archive 8 tracking requests from 2 days into 3 files', out.getvalue())
+        self.assertEqual(TrackingNumberRequest.objects.count(), 9)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'manifest.json')))
+
+    def test_command_requires_aware_cutoff(self):
+        """Test that a cutoff without a UTC offset is refused."""
+        with self.assertRaises(CommandError):
+            call_command('archive_tracking_requests', '--before', '2021-03-06T00:00:00', stdout=StringIO())
+
+    def test_filter_rebuild_keeps_archived_numbers(self):
+        """Test that archived numbers stay in the issued-number filter after a rebuild."""
+        archive_before(DAY + timedelta(days=2))
+        path = os.path.join(self.directory, 'issued.bloom')
+        with override_settings(BLOOM_PATH=path):
+            rebuild_filter(capacity=1000)
+        bloom = BloomFilter(path, writable=False)
+        self.addCleanup(bloom.close)
+        self.assertIn('MYID0000000004', bloom)
+        self.assertIn('MYID0000000200', bloom)
+
+
+class ArchiveLookupViewTest(ArchiveTestCase):
+    """Test cases for looking records up across the table and the archive."""
+
+    def setUp(self):
+        super().setUp()
+        self._log('MYID0000000001', DAY)
+        self._log('MYID0000000002', datetime.now(timezone.utc))
+        archive_before(DAY + timedelta(days=1))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('ops', password='secret', is_staff=True))
+
+    def test_archived_record(self):
+        """Test that an archived record is returned in full."""
+        response = self.client.get(reverse('tracking-request-lookup', args=['MYID0000000001']))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['source'], 'archive')
+        self.assertEqual(response.data['customer_id'], CUSTOMER_ID)
+        self.assertEqual(response.data['weight'], '1.234')
+        self.assertEqual(response.data['created_at'], DAY.isoformat())
+
+    def test_table_record(self):
+        """Test that a record still in the table comes from the index."""
+        response = self.client.get(reverse('tracking-request-lookup', args=['MYID0000000002']))
+        self.assertEqual(response.data['source'], 'index')
+
+    def test_unknown_and_invalid(self):
+        """Test 404 for unknown numbers and 400 for malformed ones."""
+        self.assertEqual(self.client.get(reverse('tracking-request-lookup', args=['MYID0000000404'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('tracking-request-lookup', args=['myid'])).status_code, 400)
+
+    def test_staff_only(self):
+        """Test that the full record is not exposed to anonymous callers."""
+        response = APIClient().get(reverse('tracking-request-lookup', args=['MYID0000000001']))
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_verify_searches_archive(self):
+        """Test that the verify endpoint finds archived numbers."""
+        response = APIClient().get(reverse('tracking-number-verify', args=['MYID0000000001']))
+        self.assertTrue(response.data['issued'])
+        self.assertEqual(response.data['source'], 'archive')
@@ -0,0 +1,221 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking.bloom import BloomFilter, IssuedNumbers, optimal_size, rebuild_filter
+from tracking.bulk import issue_batch
+from tracking.models import TrackingNumberRequest
+
+VALID_PARAMS = {
+    'origin_country_id': 'MY',
+    'destination_country_id': 'ID',
+    'weight': '1.234',
+    'created_at': '2018-11-20T19:29:32+08:00',
+    'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics'
+}
+CUSTOMER = {key: VALID_PARAMS[key] for key in ('customer_id', 'customer_name', 'customer_slug')}
+
+
+def _numbers(prefix, count):
+    return [f'{prefix}{i:010d}' for i in range(count)]
+
+
+class FilterTestCase(TestCase):
+    """Base class with a filter path in a temporary directory."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.path = os.path.join(self.directory, 'issued.bloom')
+        settings_override = override_settings(BLOOM_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _log(self, *numbers):
+        for number in numbers:
+            TrackingNumberRequest.objects.create(
+                tracking_number=number, origin_country_id='MY', destination_country_id='ID', weight='1.234',
+                customer_id=CUSTOMER['customer_id'], customer_name=CUSTOMER['customer_name'],
+                customer_slug=CUSTOMER['customer_slug'], request_timestamp='2018-11-20T19:29:32+08:00',
+                correlation_id='bloom-test'
+            )
+
+
+class BloomFilterTest(FilterTestCase):
+    """Test cases for the mmap-backed filter."""
+
+    def test_sizing(self):
+        """Test that the filter is sized for the capacity and error rate."""
+        bits, hashes = optimal_size(1_000_000, 0.001)
+        self.assertEqual(hashes, 10)
+        self.assertAlmostEqual(bits / 1_000_000, 14.38, places=1)
+        self.assertEqual(bits % 8, 0)
+
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        """Test that every added number is found and few others are."""
+        bloom = BloomFilter.create(self.path, 2000, 0.01)
+        self.addCleanup(bloom.close)
+        issued = _numbers('MYID', 2000)
+        bloom.add_many(issued)
+
+        self.assertTrue(all(number in bloom for number in issued))
+        false_positives = sum(number in bloom for number in _numbers('IDMY', 10000))
+        self.assertLess(false_positives, 300)
+        self.assertEqual(bloom.count, 2000)
+
+    def test_processes_share_bits(self):
+        """Test that a second mapping of the file sees bits set through the first."""
+        writer = BloomFilter.create(self.path, 1000, 0.01)
+        reader = BloomFilter(self.path, writable=False)
+        self.addCleanup(writer.close)
+        self.addCleanup(reader.close)
+
+        self.assertNotIn('MYID0000000001', reader)
+        writer.add('MYID0000000001')
+        self.assertIn('MYID0000000001', reader)
+
+    def test_rejects_other_files(self):
+        """Test that a file without the filter header is refused."""
+        with open(self.path, 'wb') as output:
+            output.write(b'not a filter at all')
+        with self.assertRaises(ValueError):
+            BloomFilter(self.path)
+
+    def test_merge(self):
+        """Test that merging ORs bits only between filters of the same size."""
+        first = BloomFilter.create(self.path, 1000, 0.01)
+        second = BloomFilter.create(self.path + '2', 1000, 0.01)
+        other = BloomFilter.create(self.path + '3', 5000, 0.01)
+        for bloom in (first, second, other):
+            self.addCleanup(bloom.close)
+        second.add('MYID0000000002')
+
+        self.assertTrue(first.merge(second))
+        self.assertIn('MYID0000000002', first)
+        self.assertFalse(first.merge(other))
+
+
+class IssuedNumbersTest(FilterTestCase):
+    """Test cases for the per-process view of the filter file."""
+
+    def test_without_file(self):
+        """Test that nothing is known, and nothing fails, before the filter is built."""
+        issued = IssuedNumbers(self.path)
+        self.assertIsNone(issued.might_contain('MYID0000000001'))
+        issued.add(['MYID0000000001'])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_picks_up_rebuilt_file(self):
+        """Test that a filter swapped in by a rebuild is used on the next call."""
+        issued = IssuedNumbers(self.path)
+        BloomFilter.create(self.path, 1000, 0.001).close()
+        issued.add(['MYID0000000001'])
+        self.assertTrue(issued.might_contain('MYID0000000001'))
+
+        self._log('MYID0000000002')
+        rebuild_filter(capacity=1000)
+        self.assertTrue(issued.might_contain('MYID0000000002'))
+        # Merged from the old file, although it is not in the table
+        self.assertTrue(issued.might_contain('MYID0000000001'))
+
+
+class RebuildTest(FilterTestCase):
+    """Test cases for rebuild_issued_filter."""
+
+    def test_rebuild_from_table(self):
+        """Test that the rebuilt filter holds every issued number."""
+        numbers = _numbers('MYID', 50)
+        self._log(*numbers)
+        out = StringIO()
+        call_command('rebuild_issued_filter', '--chunk-size', '7', '--capacity', '1000', stdout=out)
+
+        self.assertIn('Wrote 50 numbers', out.getvalue())
+        bloom = BloomFilter(self.path, writable=False)
+        self.addCleanup(bloom.close)
+        self.assertTrue(all(number in bloom for number in numbers))
+        self.assertEqual(os.listdir(self.directory), ['issued.bloom'])
+
+    def test_resized_filter_is_not_merged(self):
+        """Test that a filter of another size is replaced rather than merged."""
+        BloomFilter.create(self.path, 1000, 0.01).close()
+        stats = rebuild_filter(capacity=5000)
+        self.assertFalse(stats['merged'])
+        self.assertEqual(stats['capacity'], 5000)
+
+    def test_requires_path(self):
+        """Test that the command refuses to run without BLOOM_PATH."""
+        from django.core.management.base import CommandError
+
+        with override_settings(BLOOM_PATH=''), self.assertRaises(CommandError):
+            call_command('rebuild_issued_filter', stdout=StringIO())
+
+
+class VerifyViewTest(FilterTestCase):
+    """Test cases for GET /tracking-numbers/<n>/verify."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        rebuild_filter(capacity=1000)
+
+    def _verify(self, number):
+        return self.client.get(reverse('tracking-number-verify', args=[number]))
+
+    def test_never_issued_is_answered_by_filter(self):
+        """Test that an unknown number is rejected without querying tracking_requests."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self._verify('MYID0000000404')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'tracking_number': 'MYID0000000404', 'issued': False, 'source': 'filter'})
+        self.assertFalse([query for query in queries if 'tracking_requests' in query['sql']])
+
+    def test_issued_number(self):
+        """Test that a number issued after the rebuild is recorded and then found in the index."""
+        tracking_number = self.client.get(reverse('next-tracking-number'), VALID_PARAMS).data['tracking_number']
+        response = self._verify(tracking_number)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['issued'])
+        self.assertEqual(response.data['source'], 'index')
+        self.assertEqual(response.data['origin_country_id'], 'MY')
+        self.assertIn('issued_at', response.data)
+
+    def test_batch_numbers_are_recorded(self):
+        """Test that numbers issued in bulk are added to the filter."""
+        parcels = [{**VALID_PARAMS, 'weight': f'{i + 1}.000'} for i in range(20)]
+        result = issue_batch(parcels, CUSTOMER, 'bloom-batch')
+        bloom = BloomFilter(self.path, writable=False)
+        self.addCleanup(bloom.close)
+        self.assertTrue(all(number in bloom for number in result.tracking_numbers))
+
+    def test_untrusted_negative_uses_index(self):
+        """Test that BLOOM_TRUST_NEGATIVE=False sends every check to the index."""
+        with override_settings(BLOOM_TRUST_NEGATIVE=False):
+            response = self._verify('MYID0000000404')
+        self.assertEqual(response.data['source'], 'index')
+        self.assertFalse(response.data['issued'])
+
+    def test_without_filter(self):
+        """Test that the endpoint still answers from the index when no filter exists."""
+        os.remove(self.path)
+        self._log('MYID0000000001')
+        response = self._verify('MYID0000000001')
+        self.assertTrue(response.data['issued'])
+        self.assertEqual(response.data['source'], 'index')
+
+    def test_invalid_number(self):
+        """Test that malformed numbers are rejected."""
+        response = self._verify('myid-123')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tracking_number', response.data['details'])
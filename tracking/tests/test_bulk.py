@@ -0,0 +1,171 @@
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from tracking import bulk
+from tracking.models import TrackingNumberRequest
+from tracking.services import TrackingNumberGenerator
+
+CUSTOMER = {
+    'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics',
+}
+
+
+def make_parcels(n):
+    return [
+        {
+            'origin_country_id': 'my',
+            'destination_country_id': 'ID',
+            'weight': f'{1 + i / 1000:.3f}',
+            'created_at': '2018-11-20T19:29:32+08:00',
+        }
+        for i in range(n)
+    ]
+
+
+class ColumnPackingTest(TestCase):
+    """Test cases for the shared-memory column encoding."""
+
+    def test_round_trip(self):
+        """Test parcels survive packing, including missing fields and non-ASCII text."""
+        parcels = make_parcels(3)
+        parcels[1] = {'origin_country_id': 'MY', 'weight': 2.5, 'created_at': 'héllo'}
+        parcels[2] = 'not a dict'
+        packed, layout = bulk._pack_columns(parcels)
+
+        rows = bulk._unpack_rows(memoryview(packed), layout, 0, 3)
+
+        self.assertEqual(rows[0], parcels[0])
+        self.assertEqual(rows[1], {'origin_country_id': 'MY', 'weight': '2.5', 'created_at': 'héllo'})
+        self.assertEqual(rows[2], {})
+        self.assertEqual(bulk._unpack_rows(memoryview(packed), layout, 1, 2), rows[1:2])
+
+
+class GenerateBatchTest(TestCase):
+    """Test cases for bulk.generate_batch."""
+
+    @classmethod
+    def tearDownClass(cls):
+        bulk.shutdown_pool()
+        super().tearDownClass()
+
+    def test_inline_batch(self):
+        """Test small batches are numbered in process with per-parcel errors."""
+        parcels = make_parcels(4)
+        parcels[2]['weight'] = '-1'
+
+        result = bulk.generate_batch(parcels, CUSTOMER, 'salt')
+
+        self.assertEqual(list(result.errors), [2])
+        self.assertIn('weight', result.errors[2])
+        self.assertIsNone(result.tracking_numbers[2])
+        self.assertRegex(result.tracking_numbers[0], r'^MYID[A-Z0-9]{1,12}$')
+        self.assertEqual(len(set(result.tracking_numbers)), 4)
+        self.assertEqual(result.rows[3], ('MY', 'ID', 1003, 1542713372000000))
+
+    @override_settings(BULK_PARALLEL_THRESHOLD=1, BULK_WORKERS=2)
+    def test_parallel_matches_inline(self):
+        """Test the process pool produces exactly the inline results."""
+        parcels = make_parcels(2500)
+        parcels[1700]['created_at'] = 'yesterday'
+
+        parallel = bulk.generate_batch(parcels, CUSTOMER, 'salt')
+        with override_settings(BULK_PARALLEL_THRESHOLD=10 ** 9):
+            inline = bulk.generate_batch(parcels, CUSTOMER, 'salt')
+
+        self.assertEqual(parallel.tracking_numbers, inline.tracking_numbers)
+        self.assertEqual(parallel.rows, inline.rows)
+        self.assertEqual(list(parallel.errors), [1700])
+
+    def test_persist_renumbers_collisions(self):
+        """Test numbers already issued are regenerated before logging."""
+        result = bulk.generate_batch(make_parcels(3), CUSTOMER, 'salt')
+        taken = result.tracking_numbers[1]
+        TrackingNumberRequest.objects.create(
+            tracking_number=taken, origin_country_id='MY', destination_country_id='ID',
+            weight=Decimal('1'), request_timestamp='2018-11-20T11:29:32Z',
+            correlation_id=str(uuid.uuid4()), **CUSTOMER
+        )
+
+        written = bulk.persist_batch(result, CUSTOMER, 'batch-correlation')
+
+        self.assertEqual(written, 3)
+        self.assertNotEqual(result.tracking_numbers[1], taken)
+        logged = TrackingNumberRequest.objects.filter(correlation_id='batch-correlation')
+        self.assertEqual(set(logged.values_list('tracking_number', flat=True)), set(result.tracking_numbers))
+        self.assertEqual(logged.get(tracking_number=result.tracking_numbers[2]).weight, Decimal('1.002'))
+
+    def _take(self, number):
+        TrackingNumberRequest.objects.create(
+            tracking_number=number, origin_country_id='MY', destination_country_id='ID',
+            weight=Decimal('1'), request_timestamp='2018-11-20T11:29:32Z',
+            correlation_id=str(uuid.uuid4()), **CUSTOMER
+        )
+
+    def test_persist_rechecks_last_renumbering(self):
+        """Test a number that still collides after the last renumbering fails the batch."""
+        result = bulk.generate_batch(make_parcels(3), CUSTOMER, 'salt')
+        self._take('MYIDTAKEN')
+        with patch.object(TrackingNumberGenerator, 'compute_tracking_number', return_value='MYIDTAKEN'):
+            result.tracking_numbers[1] = 'MYIDTAKEN'
+            with self.assertRaises(IntegrityError):
+                bulk.persist_batch(result, CUSTOMER, 'batch-correlation')
+
+        self.assertFalse(TrackingNumberRequest.objects.filter(correlation_id='batch-correlation').exists())
+
+    def test_persist_is_all_or_nothing(self):
+        """Test a collision the check missed writes none of the batch."""
+        result = bulk.generate_batch(make_parcels(3), CUSTOMER, 'salt')
+        self._take(result.tracking_numbers[2])
+        with patch('tracking.bulk._clashes', return_value=set()), self.assertRaises(IntegrityError):
+            bulk.persist_batch(result, CUSTOMER, 'batch-correlation')
+
+        self.assertEqual(result.written, 0)
+        self.assertFalse(TrackingNumberRequest.objects.filter(correlation_id='batch-correlation').exists())
+
+
+class TrackingNumberBatchViewTest(TestCase):
+    """Test cases for TrackingNumberBatchView."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('tracking-numbers-batch')
+
+    def test_batch_issues_numbers_in_order(self):
+        """Test a valid batch returns and logs one number per parcel."""
+        response = self.client.post(self.url, {**CUSTOMER, 'parcels': make_parcels(5)}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(
+            list(TrackingNumberRequest.objects.order_by('weight').values_list('tracking_number', flat=True)),
+            data['tracking_numbers']
+        )
+
+    def test_invalid_parcel_rejects_batch(self):
+        """Test one invalid parcel rejects the batch and issues nothing."""
+        parcels = make_parcels(3)
+        del parcels[1]['destination_country_id']
+
+        response = self.client.post(self.url, {**CUSTOMER, 'parcels': parcels}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('destination_country_id', response.json()['details']['parcels']['1'])
+        self.assertFalse(TrackingNumberRequest.objects.exists())
+
+    @override_settings(BULK_MAX_BATCH=2)
+    def test_batch_size_limit(self):
+        """Test batches above BULK_MAX_BATCH are rejected."""
+        response = self.client.post(self.url, {**CUSTOMER, 'parcels': make_parcels(3)}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('parcels', response.json()['details'])
@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase, override_settings
+
+from tracking.checks import check_connection_pool_sizing, check_replica_stickiness, check_shard_key
+
+POOLED_DATABASES = {
+    'default': {
+        'ENGINE': 'tracking.db_backends.postgresql_pool',
+        'NAME': 'tracking_api',
+    }
+}
+
+
+class ConnectionPoolSizingCheckTest(SimpleTestCase):
+    """Test cases for the connection pool sizing system check."""
+
+    @override_settings(DB_POOL_ENABLED=False)
+    def test_no_warnings_without_pool(self):
+        """Test the check is silent when pooling is disabled."""
+        self.assertEqual(check_connection_pool_sizing(None), [])
+
+    @override_settings(DB_POOL_ENABLED=True)
+    def test_pool_requires_postgresql(self):
+        """Test enabling the pool on SQLite warns."""
+        ids = [w.id for w in check_connection_pool_sizing(None)]
+        self.assertEqual(ids, ['tracking.W001'])
+
+    @override_settings(
+        DB_POOL_ENABLED=True, DATABASES=POOLED_DATABASES, WEB_CONCURRENCY=20,
+        GUNICORN_THREADS=4, DB_POOL_MAX_SIZE=6, DB_MAX_CONNECTIONS=100
+    )
+    def test_total_connections_above_server_limit(self):
+        """Test workers x pool size above max_connections warns."""
+        ids = [w.id for w in check_connection_pool_sizing(None)]
+        self.assertEqual(ids, ['tracking.W002'])
+
+    @override_settings(
+        DB_POOL_ENABLED=True, DATABASES=POOLED_DATABASES, WEB_CONCURRENCY=3,
+        GUNICORN_THREADS=8, DB_POOL_MAX_SIZE=4, DB_MAX_CONNECTIONS=100
+    )
+    def test_pool_smaller_than_thread_count(self):
+        """Test a pool smaller than the request thread count warns."""
+        ids = [w.id for w in check_connection_pool_sizing(None)]
+        self.assertEqual(ids, ['tracking.W003'])
+
+
+
+class ReplicaStickinessCheckTest(SimpleTestCase):
+    """Test cases for the replica stickiness system check."""
+
+    def test_no_warnings_without_replicas(self):
+        """Test the check is silent without replicas."""
+        self.assertEqual(check_replica_stickiness(None), [])
+
+    @override_settings(DATABASE_REPLICAS=['replica1'], WEB_CONCURRENCY=4)
+    def test_per_process_cache(self):
+        """Test a per-process sticky cache warns when several workers use replicas."""
+        ids = [w.id for w in check_replica_stickiness(None)]
+        self.assertEqual(ids, ['tracking.W004'])
+        with override_settings(WEB_CONCURRENCY=1):
+            self.assertEqual(check_replica_stickiness(None), [])
+
+
+class ShardKeyCheckTest(SimpleTestCase):
+    """Test cases for the shard key system check."""
+
+    def test_unknown_shard_key(self):
+        """Test an unknown SHARD_KEY warns and the known ones do not."""
+        with override_settings(SHARD_KEY='region'):
+            self.assertEqual([w.id for w in check_shard_key(None)], ['tracking.W005'])
+        for shard_key in ('customer', 'lane'):
+            with override_settings(SHARD_KEY=shard_key):
+                self.assertEqual(check_shard_key(None), [])
@@ -0,0 +1,135 @@
+import logging
+import uuid
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking.correlation import (
+    CorrelationIdFilter, new_correlation_id, reset_correlation_id, resolve_correlation_id,
+    set_correlation_id, unique_salt
+)
+from tracking.models import APIMetrics, TrackingNumberRequest
+from tracking.services import TrackingNumberGenerator, TrackingService
+
+VALID_PARAMS = {
+    'origin_country_id': 'MY',
+    'destination_country_id': 'ID',
+    'weight': '1.234',
+    'created_at': '2018-11-20T19:29:32+08:00',
+    'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics'
+}
+
+
+class CorrelationIdTest(TestCase):
+    """Test cases for correlation id generation and the logging filter."""
+
+    def test_new_correlation_id_is_uuid4(self):
+        """Test generated ids are distinct version 4 UUIDs."""
+        ids = {new_correlation_id() for _ in range(1000)}
+        self.assertEqual(len(ids), 1000)
+        for value in list(ids)[:10]:
+            parsed = uuid.UUID(value)
+            self.assertEqual(parsed.version, 4)
+            self.assertEqual(parsed.variant, uuid.RFC_4122)
+            self.assertEqual(str(parsed), value)
+
+    def test_resolve_inbound(self):
+        """Test well-formed inbound ids are reused and others replaced."""
+        self.assertEqual(resolve_correlation_id('order-42:retry.1'), 'order-42:retry.1')
+        for inbound in (None, '', 'x' * 37, 'bad id', 'abc\nforged log line', '-leading'):
+            self.assertRegex(resolve_correlation_id(inbound), r'^[0-9a-f-]{36}$')
+
+    def test_unique_salt(self):
+        """Test the same correlation id never yields the same salt twice."""
+        self.assertNotEqual(unique_salt('abc'), unique_salt('abc'))
+        self.assertTrue(unique_salt('abc').startswith('abc'))
+
+    def test_logging_filter(self):
+        """Test log records pick up the current correlation id unless given one."""
+        log_filter = CorrelationIdFilter()
+        record = logging.LogRecord('tracking', logging.INFO, __file__, 1, 'message', (), None)
+        log_filter.filter(record)
+        self.assertEqual(record.correlation_id, '-')
+
+        token = set_correlation_id('abc')
+        try:
+            record = logging.LogRecord('tracking', logging.INFO, __file__, 1, 'message', (), None)
+            log_filter.filter(record)
+            self.assertEqual(record.correlation_id, 'abc')
+
+            record = logging.LogRecord('tracking', logging.INFO, __file__, 1, 'message', (), None)
+            record.correlation_id = 'explicit'
+            log_filter.filter(record)
+            self.assertEqual(record.correlation_id, 'explicit')
+        finally:
+            reset_correlation_id(token)
+
+
+@override_settings(TRACKING_WRITE_MODE='direct')
+class CorrelationPropagationTest(TestCase):
+    """Test cases for one correlation id per request."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_one_id_per_request(self):
+        """Test the response, header, audit row and metrics row share one id."""
+        response = self.client.get(reverse('next-tracking-number'), VALID_PARAMS)
+
+        correlation_id = response.data['correlation_id']
+        self.assertEqual(response['X-Correlation-ID'], correlation_id)
+        self.assertEqual(TrackingNumberRequest.objects.get().correlation_id, correlation_id)
+        self.assertEqual(APIMetrics.objects.get().correlation_id, correlation_id)
+
+    def test_inbound_header_is_honoured(self):
+        """Test a caller-supplied X-Correlation-ID is reused."""
+        response = self.client.get(
+            reverse('next-tracking-number'), VALID_PARAMS, HTTP_X_CORRELATION_ID='checkout-7f3a'
+        )
+
+        self.assertEqual(response.data['correlation_id'], 'checkout-7f3a')
+        self.assertEqual(response['X-Correlation-ID'], 'checkout-7f3a')
+        self.assertEqual(APIMetrics.objects.get().correlation_id, 'checkout-7f3a')
+
+    def test_repeated_inbound_id_gets_new_number(self):
+        """Test a client retry with the same id and parameters is not a collision."""
+        first = self.client.get(reverse('next-tracking-number'), VALID_PARAMS, HTTP_X_CORRELATION_ID='retry')
+        second = self.client.get(reverse('next-tracking-number'), VALID_PARAMS, HTTP_X_CORRELATION_ID='retry')
+
+        self.assertNotEqual(first.data['tracking_number'], second.data['tracking_number'])
+        self.assertEqual(TrackingNumberRequest.objects.filter(correlation_id='retry').count(), 2)
+
+    def test_validation_error_carries_id(self):
+        """Test error responses report the request's correlation id."""
+        response = self.client.get(reverse('next-tracking-number'), {}, HTTP_X_CORRELATION_ID='bad-request')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['correlation_id'], 'bad-request')
+        self.assertEqual(response['X-Correlation-ID'], 'bad-request')
+
+
+class CollisionRetryTest(TestCase):
+    """Test cases for collision retries."""
+
+    @patch('tracking.services.TrackingService._log_tracking_request')
+    def test_retry_keeps_correlation_id(self, mock_log):
+        """Test a collision retry re-salts but keeps the correlation id."""
+        mock_log.side_effect = [IntegrityError('duplicate'), None]
+        validated_data = {**VALID_PARAMS, 'created_at': datetime(2018, 11, 20, tzinfo=timezone.utc)}
+
+        with patch.object(
+            TrackingNumberGenerator, 'generate_tracking_number', wraps=TrackingNumberGenerator.generate_tracking_number
+        ) as generate:
+            result = TrackingService().create_tracking_number(validated_data, 'abc')
+
+        self.assertEqual(result['correlation_id'], 'abc')
+        first, second = [call.kwargs for call in generate.call_args_list]
+        self.assertEqual(first['correlation_id'], second['correlation_id'])
+        self.assertNotEqual(first['salt'], second['salt'])
+        self.assertEqual(mock_log.call_args_list[1].args[2], 'abc')
@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from tracking.models import TrackingNumberRequest
+
+CUSTOMER_ID = 'de619854-b59b-425e-9db4-943979e1bd49'
+
+
+def create_request(tracking_number, origin='MY', destination='ID', customer_id=CUSTOMER_ID):
+    return TrackingNumberRequest.objects.create(
+        tracking_number=tracking_number,
+        origin_country_id=origin,
+        destination_country_id=destination,
+        weight=Decimal('1.234'),
+        customer_id=customer_id,
+        customer_name='RedBox Logistics',
+        customer_slug='redbox-logistics',
+        request_timestamp=datetime(2023, 11, 20, 19, 29, 32, tzinfo=timezone.utc),
+        correlation_id=str(uuid.uuid4())
+    )
+
+
+class TrackingRequestExportViewTest(TestCase):
+    """Test cases for TrackingRequestExportView."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('export-tracking-requests')
+        self.staff = User.objects.create_user('ops', password='secret', is_staff=True)
+        create_request('MYID000000001')
+        create_request('MYSG000000002', destination='SG')
+        create_request('MYID000000003', customer_id=str(uuid.uuid4()))
+
+    def get_content(self, params):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_requires_staff(self):
+        """Test anonymous and non-staff users cannot export."""
+        self.assertIn(self.client.get(self.url).status_code, (401, 403))
+
+        self.client.force_authenticate(User.objects.create_user('customer'))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_csv_export(self):
+        """Test CSV export contains a header and every row."""
+        response, content = self.get_content({})
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['weight'], '1.234')
+
+    def test_ndjson_export_with_filters(self):
+        """Test NDJSON export honors customer and lane filters."""
+        response, content = self.get_content({
+            'export_format': 'ndjson', 'customer_id': CUSTOMER_ID, 'lane': 'MY-ID'
+        })
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([r['tracking_number'] for r in rows], ['MYID000000001'])
+        self.assertEqual(rows[0]['customer_id'], CUSTOMER_ID)
+
+    def test_invalid_filters(self):
+        """Test invalid format or lane returns 400."""
+        self.client.force_authenticate(self.staff)
+
+        self.assertEqual(
+            self.client.get(self.url, {'export_format': 'xml'}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.get(self.url, {'lane': 'MYID'}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+
+class ExportCommandTest(TestCase):
+    """Test cases for the export_tracking_requests command."""
+
+    def test_export_to_file(self):
+        """Test the command writes filtered rows to a file."""
+        create_request('MYID000000001')
+        create_request('MYSG000000002', destination='SG')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'export.ndjson')
+            call_command('export_tracking_requests', format='ndjson', lane='MY-SG', output=path)
+            with open(path) as f:
+                rows = [json.loads(line) for line in f]
+
+        self.assertEqual([r['tracking_number'] for r in rows], ['MYSG000000002'])
@@ -0,0 +1,211 @@
+import re
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking.bulk import issue_batch
+from tracking.formats import (
+    TemplateError, compile_template, get_customer_template, invalidate_customer_template,
+    luhn_digit, mod11_digit, validate_template
+)
+from tracking.models import TrackingNumberFormat
+from tracking.services import TrackingNumberGenerator
+
+CUSTOMER_ID = 'de619854-b59b-425e-9db4-943979e1bd49'
+VALID_PARAMS = {
+    'origin_country_id': 'MY',
+    'destination_country_id': 'ID',
+    'weight': '1.234',
+    'created_at': '2018-11-20T19:29:32+08:00',
+    'customer_id': CUSTOMER_ID,
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics'
+}
+TRACKING_NUMBER = re.compile(r'^[A-Z0-9]{1,16}$')
+
+
+class CheckDigitTest(TestCase):
+    """Test cases for check digit schemes."""
+
+    def test_luhn(self):
+        """Test Luhn digits against published examples."""
+        self.assertEqual(luhn_digit('7992739871'), '3')
+        self.assertEqual(luhn_digit('4539578763621486'[:-1]), '6')
+
+        def is_valid(number):
+            digits = [int(char) for char in reversed(number)]
+            doubled = [sum(divmod(2 * digit, 10)) for digit in digits[1::2]]
+            return (sum(digits[::2]) + sum(doubled)) % 10 == 0
+
+        for body in ('0', '1', '59', '12345678901234', '000000000000007'):
+            self.assertTrue(is_valid(body + luhn_digit(body)))
+
+    def test_mod11(self):
+        """Test mod-11 digits with the UPU S10 weights, including the 10 and 11 cases."""
+        self.assertEqual(mod11_digit('47312482'), '9')
+        self.assertEqual(mod11_digit('00000000'), '5')
+        self.assertEqual(mod11_digit('00000001'), '4')
+        self.assertEqual(mod11_digit('10000000'), '3')
+        self.assertEqual(mod11_digit('00000008'), '0')
+
+
+class CompileTemplateTest(TestCase):
+    """Test cases for parsing and validating templates."""
+
+    def test_compiled_layout(self):
+        """Test fields, literals and check digits land where the template says."""
+        compiled = compile_template('RBX{origin}{digits:8}{check:mod11}')
+        self.assertEqual(compiled.length, 14)
+        self.assertEqual(compiled.space, 10 ** 8)
+
+        number = compiled.format('MY', 'ID', 47312482)
+        self.assertEqual(number, 'RBXMY473124829')
+
+        compiled = compile_template('{base36:4}{destination}')
+        self.assertEqual(compiled.format('MY', 'ID', 35 + 36 * 10), 'ZA00ID')
+
+    def test_compiled_once(self):
+        """Test the same template string returns the same formatter."""
+        self.assertIs(compile_template('{digits:12}'), compile_template('{digits:12}'))
+
+    def test_invalid_templates(self):
+        """Test templates that break the tracking number contract are rejected."""
+        for template, message in [
+            ('RBX', 'at least one'),
+            ('{origin}{destination}{base36:13}', 'at most 16'),
+            ('rbx{digits:10}', 'A-Z and 0-9'),
+            ('{digits:10', 'A-Z and 0-9'),
+            ('{digits:10}\n', 'A-Z and 0-9'),
+            ('{serial:4}', 'Unknown field'),
+            ('{digits:0}', 'width'),
+            ('{base36:4}{check:luhn}', 'directly follow'),
+            ('{digits:9}{check:crc}', 'Unknown check digit'),
+        ]:
+            with self.subTest(template=template):
+                with self.assertRaisesRegex(TemplateError, message):
+                    compile_template(template)
+
+    @override_settings(FORMAT_MIN_SPACE_FACTOR=1000)
+    def test_space_for_volume(self):
+        """Test the random fields must span 1000x the expected volume."""
+        validate_template('RBX{digits:9}{check:mod11}', 1000000)
+        with self.assertRaisesRegex(TemplateError, 'needs at least'):
+            validate_template('RBX{digits:8}{check:mod11}', 1000000)
+
+    def test_lease_layout_is_reserved(self):
+        """Test templates that could produce a leased number are rejected."""
+        with self.assertRaisesRegex(TemplateError, 'leased numbers'):
+            validate_template('{origin}{destination}{digits:12}', 1)
+        with self.assertRaisesRegex(TemplateError, 'leased numbers'):
+            validate_template('RBXY{base36:12}', 1)
+        for template in ('{origin}{destination}1{base36:11}', 'RB{digits:14}', '{origin}{destination}{digits:11}'):
+            with self.subTest(template=template):
+                validate_template(template, 1)
+
+    def test_generated_numbers(self):
+        """Test generated numbers follow the template and pass their check digit."""
+        compiled = compile_template('RB{digits:11}{check:luhn}')
+        created_at = datetime(2018, 11, 20, tzinfo=timezone.utc)
+        numbers = {
+            TrackingNumberGenerator.compute_tracking_number(
+                'MY', 'ID', 1.234, created_at, CUSTOMER_ID, 'redbox-logistics', f'salt{i}', template=compiled.template
+            )
+            for i in range(500)
+        }
+        self.assertEqual(len(numbers), 500)
+        for number in numbers:
+            self.assertRegex(number, TRACKING_NUMBER)
+            self.assertRegex(number, r'^RB\d{12}$')
+            self.assertEqual(luhn_digit(number[2:-1]), number[-1])
+
+
+class CustomerFormatTest(TestCase):
+    """Test cases for per-customer templates."""
+
+    def setUp(self):
+        invalidate_customer_template()
+
+    def test_model_validation(self):
+        """Test full_clean rejects templates too small for the expected volume."""
+        fmt = TrackingNumberFormat(customer_id=CUSTOMER_ID, template='{digits:6}', expected_volume=10000)
+        with self.assertRaises(ValidationError) as raised:
+            fmt.full_clean()
+        self.assertIn('template', raised.exception.message_dict)
+
+        fmt.template = '{digits:12}'
+        fmt.full_clean()
+
+    def test_lookup_is_cached_and_invalidated(self):
+        """Test one query per customer until the format changes."""
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_customer_template(CUSTOMER_ID))
+            self.assertIsNone(get_customer_template(CUSTOMER_ID))
+
+        fmt = TrackingNumberFormat.objects.create(customer_id=CUSTOMER_ID, template='RBX{digits:12}')
+        self.assertEqual(get_customer_template(CUSTOMER_ID), 'RBX{digits:12}')
+
+        fmt.delete()
+        self.assertIsNone(get_customer_template(CUSTOMER_ID))
+
+    @override_settings(FORMAT_CACHE_TTL=0)
+    def test_ttl_expiry(self):
+        """Test changes made elsewhere are picked up once the TTL passes."""
+        get_customer_template(CUSTOMER_ID)
+        with patch('tracking.formats._format_changed'):
+            TrackingNumberFormat.objects.create(customer_id=CUSTOMER_ID, template='RBX{digits:12}')
+        self.assertEqual(get_customer_template(CUSTOMER_ID), 'RBX{digits:12}')
+
+    def test_api_uses_customer_template(self):
+        """Test the API and the batch path issue numbers in the customer's format."""
+        TrackingNumberFormat.objects.create(customer_id=CUSTOMER_ID, template='RBX{digits:10}{check:mod11}')
+
+        response = APIClient().get(reverse('next-tracking-number'), VALID_PARAMS)
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.data['tracking_number'], r'^RBX\d{11}$')
+
+        parcel = {key: VALID_PARAMS[key] for key in ('origin_country_id', 'destination_country_id', 'weight', 'created_at')}
+        customer = {key: VALID_PARAMS[key] for key in ('customer_id', 'customer_name', 'customer_slug')}
+        result = issue_batch([parcel] * 3, customer, 'batch-correlation', persist=False)
+        for number in result.tracking_numbers:
+            self.assertRegex(number, r'^RBX\d{11}$')
+            self.assertEqual(mod11_digit(number[3:-1]), number[-1])
+
+    def test_other_customers_keep_default_layout(self):
+        """Test customers without a template keep the origin/destination layout."""
+        TrackingNumberFormat.objects.create(customer_id='00000000-0000-4000-8000-000000000000', template='{digits:12}')
+
+        response = APIClient().get(reverse('next-tracking-number'), VALID_PARAMS)
+        self.assertTrue(response.data['tracking_number'].startswith('MYID'))
+
+
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class TrackingNumberFormatAdminTest(TestCase):
+    """Test cases for editing formats in the admin."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+
+    def test_admin_rejects_invalid_template(self):
+        """Test the add form reports template errors."""
+        url = reverse('admin:tracking_trackingnumberformat_add')
+        response = self.client.post(url, {
+            'customer_id': CUSTOMER_ID, 'template': '{origin}{base36:20}', 'expected_volume': 1000
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'width between 1 and 16')
+        self.assertFalse(TrackingNumberFormat.objects.exists())
+
+        response = self.client.post(url, {
+            'customer_id': CUSTOMER_ID, 'template': 'RBX{digits:10}{check:mod11}', 'expected_volume': 1000
+        })
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get(reverse('admin:tracking_trackingnumberformat_changelist'))
+        self.assertContains(response, 'RBX{digits:10}{check:mod11}')
@@ -0,0 +1,97 @@
+from unittest.mock import patch, MagicMock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from tracking import health
+from tracking.health import ReadinessMonitor
+
+
+@override_settings(HEALTH_CHECK_REFRESH_INTERVAL=0, HEALTH_CHECK_CACHE_TTL=60)
+class ReadinessMonitorTest(TestCase):
+    """Test cases for ReadinessMonitor."""
+
+    def setUp(self):
+        self.monitor = ReadinessMonitor()
+
+    def test_database_check_passes(self):
+        """Test the default checks report ready against the test database."""
+        snapshot = self.monitor.snapshot()
+
+        self.assertEqual(snapshot['status'], 'ready')
+        self.assertEqual(snapshot['checks']['database']['status'], 'ok')
+
+    def test_failing_check_reports_not_ready(self):
+        """Test a failing check marks the snapshot not ready."""
+        failing = MagicMock(side_effect=RuntimeError('connection refused'))
+        with patch.dict(health._checks, {'broken': failing}):
+            snapshot = self.monitor.snapshot()
+
+        self.assertEqual(snapshot['status'], 'not_ready')
+        self.assertEqual(snapshot['checks']['broken']['status'], 'fail')
+        self.assertIn('connection refused', snapshot['checks']['broken']['error'])
+
+    def test_snapshot_is_cached_within_ttl(self):
+        """Test checks run once while the snapshot is fresh."""
+        check = MagicMock(return_value={})
+        with patch.dict(health._checks, {'counted': check}, clear=True):
+            self.monitor.snapshot()
+            self.monitor.snapshot()
+            self.monitor.snapshot()
+
+        check.assert_called_once()
+
+    @override_settings(HEALTH_CHECK_CACHE_TTL=0)
+    def test_snapshot_refreshes_after_ttl(self):
+        """Test an expired snapshot triggers a new round of checks."""
+        check = MagicMock(return_value={})
+        with patch.dict(health._checks, {'counted': check}, clear=True):
+            self.monitor.snapshot()
+            self.monitor.snapshot()
+
+        self.assertEqual(check.call_count, 2)
+
+
+class ProbeViewsTest(TestCase):
+    """Test cases for the liveness and readiness endpoints."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_liveness(self):
+        """Test liveness probe always reports alive."""
+        response = self.client.get(reverse('health-live'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['status'], 'alive')
+
+    @patch('tracking.views.readiness_monitor')
+    def test_readiness_ready(self, mock_monitor):
+        """Test readiness probe returns 200 when all checks pass."""
+        mock_monitor.snapshot.return_value = {'status': 'ready', 'checks': {}}
+
+        response = self.client.get(reverse('health-ready'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @patch('tracking.views.readiness_monitor')
+    def test_readiness_not_ready(self, mock_monitor):
+        """Test readiness probe returns 503 when a check fails."""
+        mock_monitor.snapshot.return_value = {
+            'status': 'not_ready',
+            'checks': {'database': {'status': 'fail', 'error': 'down'}}
+        }
+
+        response = self.client.get(reverse('health-ready'))
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.json()['checks']['database']['status'], 'fail')
+
+    @patch('tracking.middleware.APIMetrics.objects.create')
+    def test_probes_do_not_record_metrics(self, mock_create):
+        """Test probe requests are excluded from APIMetrics."""
+        self.client.get(reverse('health-live'))
+
+        mock_create.assert_not_called()
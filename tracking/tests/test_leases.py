@@ -0,0 +1,301 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracking import health, writes
+from tracking.leases import (
+    MAX_LEASE_VALUE, POLICY_RETURN, LeaseClosed, create_lease, expire_leases, find_lease, lease_capacity,
+    lease_number, lease_range, lease_usage, parse_lease_number, reconcile
+)
+from tracking.models import FreeNumberRange, LeaseSequence, NumberLease, TrackingNumberRequest
+
+CUSTOMER = {
+    'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics',
+}
+
+
+def _assignment(number, weight='1.234'):
+    return {'tracking_number': number, 'weight': Decimal(weight), 'assigned_at': timezone.now()}
+
+
+def _report(lease, *values):
+    """Write audit rows for leased numbers, as a committed report would."""
+    for value in values:
+        TrackingNumberRequest.objects.create(
+            tracking_number=lease_number(lease.origin_country_id, lease.destination_country_id, value),
+            origin_country_id=lease.origin_country_id, destination_country_id=lease.destination_country_id,
+            weight=Decimal('1.000'), request_timestamp=timezone.now(), correlation_id='lease-test', **CUSTOMER
+        )
+
+
+class LeaseNumberTest(TestCase):
+    """Test cases for the lease number layout."""
+
+    def test_layout(self):
+        """Test that numbers are fixed width, ordered like their values and parse back."""
+        self.assertEqual(lease_number('MY', 'ID', 0), 'MYID000000000000')
+        self.assertEqual(lease_number('MY', 'ID', 36), 'MYID000000000010')
+        self.assertLess(lease_number('MY', 'ID', 35), lease_number('MY', 'ID', 36))
+        self.assertEqual(parse_lease_number(lease_number('SG', 'MY', 123456789)), ('SG', 'MY', 123456789))
+
+    def test_other_numbers_are_not_leased(self):
+        """Test that numbers of the default layout never parse as leased."""
+        for number in ('MYID1A2B3C4D5E', 'MYID1A2B3C4D5E6F', 'MYID0000'):
+            self.assertIsNone(parse_lease_number(number))
+
+
+class CreateLeaseTest(TestCase):
+    """Test cases for reserving blocks."""
+
+    def test_blocks_do_not_overlap(self):
+        """Test that leases of a lane take consecutive ranges and lanes are independent."""
+        first = create_lease('MY', 'ID', CUSTOMER, 1000000, 3600)
+        second = create_lease('MY', 'ID', CUSTOMER, 10, 3600)
+        other = create_lease('ID', 'MY', CUSTOMER, 10, 3600)
+
+        self.assertEqual((first.first, first.count), (0, 1000000))
+        self.assertEqual(second.first, 1000000)
+        self.assertEqual(other.first, 0)
+        self.assertEqual(NumberLease.objects.count(), 3)
+
+    def test_returned_numbers_are_reused(self):
+        """Test that a returned range is handed out before the sequence moves on."""
+        FreeNumberRange.objects.create(origin_country_id='MY', destination_country_id='ID', first=500, count=100)
+        create_lease('MY', 'ID', CUSTOMER, 1000, 3600)
+
+        lease = create_lease('MY', 'ID', CUSTOMER, 60, 3600)
+        self.assertEqual(lease.first, 500)
+        self.assertEqual(FreeNumberRange.objects.get().first, 560)
+        self.assertEqual(create_lease('MY', 'ID', CUSTOMER, 40, 3600).first, 560)
+        self.assertFalse(FreeNumberRange.objects.exists())
+
+    def test_find_lease(self):
+        """Test that only numbers inside an active lease are found."""
+        create_lease('MY', 'ID', CUSTOMER, 10, 3600)
+        lease = create_lease('MY', 'ID', CUSTOMER, 10, 3600)
+
+        self.assertEqual(find_lease(lease_number('MY', 'ID', 15)), lease)
+        self.assertIsNone(find_lease(lease_number('MY', 'ID', 20)))
+        self.assertIsNone(find_lease(lease_number('ID', 'MY', 15)))
+        lease.status = NumberLease.STATUS_EXPIRED
+        lease.save()
+        self.assertIsNone(find_lease(lease_number('MY', 'ID', 15)))
+
+
+class LeaseCapacityTest(TestCase):
+    """Test cases for reporting lanes low on lease numbers."""
+
+    def test_capacity(self):
+        """Test that a nearly exhausted lane is reported unless returned numbers refill it."""
+        self.assertEqual(lease_capacity(), {'lanes': 0, 'low_lanes': []})
+        create_lease('SG', 'MY', CUSTOMER, 100, 3600)
+        LeaseSequence.objects.create(origin_country_id='MY', destination_country_id='ID', next_value=MAX_LEASE_VALUE - 10)
+
+        capacity = lease_capacity()
+        self.assertEqual(capacity['fullest_lane'], 'MYID')
+        self.assertEqual(capacity['low_lanes'], ['MYID'])
+
+        FreeNumberRange.objects.create(
+            origin_country_id='MY', destination_country_id='ID', first=0, count=MAX_LEASE_VALUE // 2
+        )
+        capacity = lease_capacity()
+        self.assertEqual(capacity['fullest_lane'], 'MYID')
+        self.assertEqual(capacity['lanes'], 2)
+        self.assertEqual(capacity['low_lanes'], [])
+
+    def test_lease_crossing_the_line_logs_warning(self):
+        """Test that the lease taking a lane below LEASE_MIN_FREE_RATIO logs a warning, once."""
+        LeaseSequence.objects.create(
+            origin_country_id='MY', destination_country_id='ID', next_value=MAX_LEASE_VALUE * 99 // 100 - 50
+        )
+        with self.assertLogs('tracking.leases', level='WARNING') as logs:
+            create_lease('MY', 'ID', CUSTOMER, 100, 3600)
+        self.assertIn('Lane MYID has', logs.output[0])
+
+        with self.assertNoLogs('tracking.leases', level='WARNING'):
+            create_lease('MY', 'ID', CUSTOMER, 100, 3600)
+
+    def test_low_lane_does_not_fail_readiness(self):
+        """Test that a low lane is reported by expire_number_leases, not by /health/ready."""
+        LeaseSequence.objects.create(origin_country_id='MY', destination_country_id='ID', next_value=MAX_LEASE_VALUE - 10)
+
+        self.assertNotIn('lease_capacity', health._checks)
+
+        err = StringIO()
+        call_command('expire_number_leases', stdout=StringIO(), stderr=err)
+        self.assertIn('Lane MYID has less than LEASE_MIN_FREE_RATIO', err.getvalue())
+
+
+class ExpireLeasesTest(TestCase):
+    """Test cases for closing expired leases."""
+
+    def setUp(self):
+        self.lease = create_lease('MY', 'ID', CUSTOMER, 100, 3600)
+        _report(self.lease, 3, 10)
+        # A default-layout number sorting inside the lease range must not count
+        TrackingNumberRequest.objects.create(
+            tracking_number='MYID000000000', origin_country_id='MY', destination_country_id='ID',
+            weight=Decimal('1.000'), request_timestamp=timezone.now(), correlation_id='lease-test', **CUSTOMER
+        )
+        self.later = timezone.now() + timedelta(hours=2)
+
+    def test_usage(self):
+        """Test that usage counts reported numbers of the lease only."""
+        self.assertEqual(lease_usage(self.lease), (2, 10))
+
+    def test_void(self):
+        """Test that unused numbers are voided by default."""
+        self.assertEqual(expire_leases(now=timezone.now())['leases'], 0)
+
+        stats = expire_leases(now=self.later)
+
+        self.assertEqual(stats, {'leases': 1, 'assigned': 2, 'returned': 0, 'voided': 98})
+        self.lease.refresh_from_db()
+        self.assertEqual((self.lease.status, self.lease.assigned), (NumberLease.STATUS_EXPIRED, 2))
+        self.assertFalse(FreeNumberRange.objects.exists())
+        self.assertEqual(expire_leases(now=self.later)['leases'], 0)
+
+    def test_return(self):
+        """Test that numbers above the highest reported one go back to the lane."""
+        stats = expire_leases(policy=POLICY_RETURN, now=self.later)
+
+        self.assertEqual(stats['returned'], 89)
+        self.assertEqual(stats['voided'], 9)
+        free = FreeNumberRange.objects.get()
+        self.assertEqual((free.first, free.count), (11, 89))
+
+    def test_reports_refused_after_grace(self):
+        """Test that a lease past its grace period takes no more reports."""
+        self.lease.expires_at = timezone.now() - timedelta(hours=1)
+        self.lease.save()
+        with self.assertRaises(LeaseClosed):
+            reconcile(self.lease, [_assignment(lease_number('MY', 'ID', 4))], 'lease-test')
+
+    def test_command(self):
+        """Test the expire_number_leases command output."""
+        NumberLease.objects.update(expires_at=timezone.now() - timedelta(hours=1))
+        out = StringIO()
+        call_command('expire_number_leases', '--policy', 'return', stdout=out)
+        self.assertIn('Expired 1 leases: 2 numbers assigned, 89 returned, 9 voided', out.getvalue())
+
+
+class ReconcileTest(TransactionTestCase):
+    """Test cases for reports committed through the group commit writer."""
+
+    def setUp(self):
+        self.addCleanup(writes.shutdown_group_writer)
+        self.lease = create_lease('MY', 'ID', CUSTOMER, 100, 3600)
+        self.first, self.last = lease_range(self.lease)
+
+    def test_reconcile(self):
+        """Test that numbers are written once, and outsiders are rejected by index."""
+        report = [
+            _assignment(self.first),
+            _assignment(self.last, '2.5'),
+            _assignment(self.first),
+            _assignment(lease_number('MY', 'ID', 100)),
+            _assignment('MYID1A2B3C4D5E'),
+        ]
+        result = reconcile(self.lease, report, 'lease-test')
+        self.assertTrue(writes.get_group_writer().flush(timeout=10))
+
+        self.assertEqual(result, {
+            'accepted': 2, 'duplicates': 1,
+            'rejected': {3: 'Tracking number is not part of this lease', 4: 'Tracking number is not part of this lease'},
+        })
+        row = TrackingNumberRequest.objects.get(tracking_number=self.last)
+        self.assertEqual((row.weight, row.customer_slug), (Decimal('2.500'), 'redbox-logistics'))
+
+        # Resending the report is harmless
+        result = reconcile(self.lease, report[:2], 'lease-test')
+        self.assertEqual((result['accepted'], result['duplicates']), (0, 2))
+
+
+class NumberLeaseViewTest(TransactionTestCase):
+    """Test cases for the lease endpoints."""
+
+    def setUp(self):
+        self.addCleanup(writes.shutdown_group_writer)
+        self.client = APIClient()
+
+    def _lease(self, **overrides):
+        body = {'origin_country_id': 'my', 'destination_country_id': 'id', 'count': 1000, **CUSTOMER, **overrides}
+        return self.client.post(reverse('number-leases'), body, format='json')
+
+    def test_lease_and_report(self):
+        """Test leasing a block, reporting numbers and reading the lease back."""
+        response = self._lease(ttl_seconds=600)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['first_tracking_number'], 'MYID000000000000')
+        self.assertEqual(response.data['last_tracking_number'], lease_number('MY', 'ID', 999))
+        lease_id = response.data['lease_id']
+
+        response = self.client.post(
+            reverse('number-lease-assignments', args=[lease_id]),
+            {'assignments': [
+                {'tracking_number': 'MYID000000000001', 'weight': '1.5', 'assigned_at': '2024-05-06T07:08:09+08:00'},
+                {'tracking_number': 'SGMY000000000001', 'weight': '1.5', 'assigned_at': '2024-05-06T07:08:09+08:00'},
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data['accepted'], response.data['rejected_count']), (1, 1))
+        self.assertIn(1, response.data['rejected'])
+
+        writes.get_group_writer().flush(timeout=10)
+        response = self.client.get(reverse('number-lease-detail', args=[lease_id]))
+        self.assertEqual((response.data['assigned'], response.data['status']), (1, NumberLease.STATUS_ACTIVE))
+
+    @override_settings(LEASE_MAX_NUMBERS=100, LEASE_MAX_ASSIGNMENTS=1)
+    def test_invalid_requests(self):
+        """Test 400 responses for oversized leases and reports."""
+        self.assertIn('count', self._lease().data['details'])
+        self.assertIn('ttl_seconds', self._lease(count=10, ttl_seconds=10 ** 9).data['details'])
+
+        lease_id = self._lease(count=10).data['lease_id']
+        assignment = {'tracking_number': 'MYID000000000001', 'weight': '1', 'assigned_at': 'yesterday'}
+        response = self.client.post(
+            reverse('number-lease-assignments', args=[lease_id]), {'assignments': [assignment] * 2}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            reverse('number-lease-assignments', args=[lease_id]), {'assignments': [assignment]}, format='json'
+        )
+        self.assertIn('assigned_at', response.data['details']['assignments'][0])
+        # Well-formed but out of range: parse_datetime raises instead of returning None
+        response = self.client.post(
+            reverse('number-lease-assignments', args=[lease_id]),
+            {'assignments': [{**assignment, 'assigned_at': '2018-13-45T10:00:00Z'}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('assigned_at', response.data['details']['assignments'][0])
+
+    def test_expired_and_unknown_leases(self):
+        """Test 409 for reports to an expired lease and 404 for unknown ones."""
+        lease_id = self._lease(count=10).data['lease_id']
+        NumberLease.objects.update(status=NumberLease.STATUS_EXPIRED)
+        assignment = {'tracking_number': 'MYID000000000001', 'weight': '1', 'assigned_at': '2024-05-06T07:08:09Z'}
+
+        response = self.client.post(
+            reverse('number-lease-assignments', args=[lease_id]), {'assignments': [assignment]}, format='json'
+        )
+        self.assertEqual(response.status_code, 409)
+        response = self.client.get(reverse('number-lease-detail', args=['00000000-0000-4000-8000-000000000000']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_verify_leased_number(self):
+        """Test that an unreported leased number verifies as issued while its lease is active."""
+        self._lease(count=10)
+        response = self.client.get(reverse('tracking-number-verify', args=['MYID000000000005']))
+        self.assertEqual((response.data['issued'], response.data['source']), (True, 'lease'))
+
+        response = self.client.get(reverse('tracking-number-verify', args=['MYID00000000000A']))
+        self.assertFalse(response.data['issued'])
@@ -0,0 +1,56 @@
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+from django.test import TestCase
+
+from tracking import lifecycle
+
+
+class ShutdownHooksTest(TestCase):
+    """Test cases for worker shutdown hooks."""
+
+    def test_hooks_run_with_budget(self):
+        """Test every hook runs and receives the remaining drain budget."""
+        first, second = MagicMock(), MagicMock()
+        with patch.dict(lifecycle._shutdown_hooks, {'first': first, 'second': second}, clear=True):
+            results = lifecycle.run_shutdown_hooks(5)
+
+        self.assertEqual(results, {'first': 'ok', 'second': 'ok'})
+        self.assertLessEqual(first.call_args[0][0], 5)
+        second.assert_called_once()
+
+    def test_failing_hook_does_not_stop_others(self):
+        """Test a failing hook is reported and later hooks still run."""
+        after = MagicMock()
+        hooks = {'broken': MagicMock(side_effect=RuntimeError('disk full')), 'after': after}
+        with patch.dict(lifecycle._shutdown_hooks, hooks, clear=True):
+            results = lifecycle.run_shutdown_hooks(1)
+
+        self.assertIn('disk full', results['broken'])
+        after.assert_called_once()
+
+    def test_writer_registers_drain(self):
+        """Test the group commit writer drains on worker exit."""
+        from tracking import writes
+
+        self.assertIs(lifecycle._shutdown_hooks['group_commit_writer'], writes.shutdown_group_writer)
+
+
+class ForkSafetyTest(TestCase):
+    """Test cases for post-fork connection handling."""
+
+    def test_discard_keeps_parent_handle_open(self):
+        """Test inherited connections are dropped without being closed."""
+        connection.ensure_connection()
+        handle = connection.connection
+        try:
+            lifecycle.discard_inherited_connections()
+
+            self.assertIsNone(connection.connection)
+            handle.execute('SELECT 1')
+        finally:
+            connection.connection = handle
+
+    def test_memory_usage(self):
+        """Test memory usage reports a resident set size."""
+        self.assertGreater(lifecycle.memory_usage()['rss'], 0)
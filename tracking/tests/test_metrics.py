@@ -0,0 +1,178 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking.metrics import MetricsCache
+
+
+class SlowCompute:
+    """Stand-in for compute_metrics that counts calls and can be held open."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, window):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.delay)
+        return {'period': window, 'call': call}
+
+
+@override_settings(METRICS_CACHE_TTL=10.0, METRICS_CACHE_STALE_SECONDS=300.0)
+class MetricsCacheTest(TestCase):
+    """Test cases for the stale-while-revalidate metrics cache."""
+
+    def setUp(self):
+        cache.clear()
+
+    def _age(self, window, seconds):
+        entry = cache.get(f'tracking:metrics:{window}')
+        entry['computed_at'] -= seconds
+        cache.set(f'tracking:metrics:{window}', entry)
+
+    def test_fresh_entry_is_reused(self):
+        """Test that a fresh entry is served without recomputing."""
+        compute = SlowCompute()
+        metrics = MetricsCache(compute)
+
+        first, _, stale = metrics.get('24h')
+        second, age, _ = metrics.get('24h')
+
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(first, second)
+        self.assertFalse(stale)
+        self.assertLess(age, 10)
+
+    def test_windows_have_own_entries(self):
+        """Test that each window is cached separately."""
+        compute = SlowCompute()
+        metrics = MetricsCache(compute)
+
+        self.assertEqual(metrics.get('1h')[0]['period'], '1h')
+        self.assertEqual(metrics.get('7d')[0]['period'], '7d')
+        self.assertEqual(compute.calls, 2)
+
+    def test_concurrent_misses_compute_once(self):
+        """Test that callers arriving during a computation wait for it instead of repeating it."""
+        compute = SlowCompute(delay=0.2)
+        metrics = MetricsCache(compute)
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(metrics.get('24h')[0])) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_stale_entry_served_while_revalidating(self):
+        """Test that an expired entry is returned at once and refreshed in the background."""
+        compute = SlowCompute(delay=0.1)
+        metrics = MetricsCache(compute)
+        metrics.get('24h')
+        self._age('24h', 60)
+
+        with patch('tracking.metrics.connections'):
+            data, age, stale = metrics.get('24h')
+            self.assertTrue(stale)
+            self.assertEqual(data['call'], 1)
+            self.assertGreaterEqual(age, 60)
+            # A second caller neither waits nor starts another refresh
+            self.assertTrue(metrics.get('24h')[2])
+
+            deadline = time.monotonic() + 5
+            while compute.calls < 2 or cache.get('tracking:metrics:24h:lock') is not None:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+
+        data, _, stale = metrics.get('24h')
+        self.assertFalse(stale)
+        self.assertEqual(data['call'], 2)
+        self.assertEqual(compute.calls, 2)
+
+    def test_too_stale_entry_is_recomputed(self):
+        """Test that an entry past the stale window makes the caller wait for fresh data."""
+        compute = SlowCompute()
+        metrics = MetricsCache(compute)
+        metrics.get('24h')
+        self._age('24h', 1000)
+
+        data, _, stale = metrics.get('24h')
+        self.assertFalse(stale)
+        self.assertEqual(data['call'], 2)
+
+    def test_waits_for_other_worker(self):
+        """Test that a miss while another worker holds the lock takes that worker's result."""
+        compute = SlowCompute()
+        metrics = MetricsCache(compute)
+        cache.add('tracking:metrics:24h:lock', 1)
+
+        def peer():
+            time.sleep(0.1)
+            cache.set('tracking:metrics:24h', {'data': {'period': '24h', 'call': 'peer'}, 'computed_at': time.time()})
+
+        thread = threading.Thread(target=peer)
+        thread.start()
+        data, _, _ = metrics.get('24h')
+        thread.join()
+
+        self.assertEqual(data['call'], 'peer')
+        self.assertEqual(compute.calls, 0)
+
+    def test_error_reaches_waiting_callers(self):
+        """Test that a failed computation raises and is not cached."""
+        def fail(window):
+            raise RuntimeError('database unavailable')
+
+        metrics = MetricsCache(fail)
+        with self.assertRaises(RuntimeError):
+            metrics.get('24h')
+        self.assertIsNone(cache.get('tracking:metrics:24h'))
+        self.assertIsNone(cache.get('tracking:metrics:24h:lock'))
+
+    @override_settings(METRICS_CACHE_TTL=0)
+    def test_disabled(self):
+        """Test that a zero TTL computes on every call."""
+        compute = SlowCompute()
+        metrics = MetricsCache(compute)
+        metrics.get('24h')
+        metrics.get('24h')
+        self.assertEqual(compute.calls, 2)
+
+
+class MetricsWindowTest(TestCase):
+    """Test cases for the window parameter of /metrics."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_windows(self):
+        """Test that each window is reported with its cache state."""
+        for window in ('1h', '24h', '7d'):
+            response = self.client.get(reverse('metrics'), {'window': window})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['period'], window)
+            self.assertFalse(response.data['stale'])
+            self.assertIn('cache_age_seconds', response.data)
+
+    def test_default_window(self):
+        """Test that the window defaults to 24h."""
+        self.assertEqual(self.client.get(reverse('metrics')).data['period'], '24h')
+
+    def test_invalid_window(self):
+        """Test that unknown windows are rejected."""
+        response = self.client.get(reverse('metrics'), {'window': '30d'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('window', response.data['details'])
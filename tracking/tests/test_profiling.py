@@ -0,0 +1,182 @@
+import os
+import pstats
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking import profiling, tracing
+
+VALID_PARAMS = {
+    'origin_country_id': 'MY',
+    'destination_country_id': 'ID',
+    'weight': '1.234',
+    'created_at': '2018-11-20T19:29:32+08:00',
+    'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics'
+}
+
+
+def _busy(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class ProfilerTestCase(TestCase):
+    """Base class keeping profiles in a temporary directory."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(PROFILER_DIR=self.directory)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        profiler = profiling.active_profiler()
+        if profiler is not None:
+            profiler.stop()
+            profiler.join(5)
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+
+class SamplingProfilerTest(ProfilerTestCase):
+    """Test cases for the sampling profiler."""
+
+    def test_collapsed_stacks(self):
+        """Test samples of other threads are written as collapsed stacks."""
+        stop = threading.Event()
+        worker = threading.Thread(target=_busy, args=(stop,), name='busy-worker')
+        worker.start()
+        try:
+            profiler = profiling.start_sampling(seconds=0.2, interval_ms=2)
+            profiler.join(5)
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertGreater(profiler.samples, 10)
+        with open(profiler.path) as source:
+            lines = source.read().splitlines()
+        busy = [line for line in lines if line.startswith('busy-worker;')]
+        self.assertTrue(busy)
+        stack, count = busy[0].rsplit(' ', 1)
+        self.assertIn('_busy (test_profiling.py:', stack)
+        self.assertGreater(int(count), 0)
+        self.assertFalse(any(line.startswith('sampling-profiler;') for line in lines))
+
+    def test_one_profile_at_a_time(self):
+        """Test a second profile is refused while one runs."""
+        profiler = profiling.start_sampling(seconds=5)
+        with self.assertRaises(profiling.ProfilerBusy):
+            profiling.start_sampling(seconds=5)
+        profiler.stop()
+        profiler.join(5)
+        self.assertIsNone(profiling.active_profiler())
+        self.assertTrue(os.path.exists(profiler.path))
+
+    def test_signal_starts_profile(self):
+        """Test PROFILER_SIGNAL starts a profile in this process."""
+        previous = signal.getsignal(signal.SIGPROF)
+        try:
+            with override_settings(PROFILER_SIGNAL='SIGPROF', PROFILER_DEFAULT_SECONDS=5):
+                self.assertEqual(profiling.install_signal_handler(), signal.SIGPROF)
+                os.kill(os.getpid(), signal.SIGPROF)
+                # The watcher thread starts it, not the handler
+                for _ in range(100):
+                    if profiling.active_profiler() is not None:
+                        break
+                    time.sleep(0.01)
+            self.assertIsNotNone(profiling.active_profiler())
+        finally:
+            signal.signal(signal.SIGPROF, previous)
+
+    def test_prune_keeps_newest(self):
+        """Test only PROFILER_MAX_FILES profiles are kept."""
+        for index in range(3):
+            path = os.path.join(self.directory, f'request-{index}.prof')
+            open(path, 'w').close()
+            os.utime(path, (index, index))
+        with override_settings(PROFILER_MAX_FILES=2):
+            profiling.prune_profiles()
+        self.assertEqual(sorted(os.listdir(self.directory)), ['request-1.prof', 'request-2.prof'])
+
+
+class ProfilerViewTest(ProfilerTestCase):
+    """Test cases for the profiler endpoints."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('ops', is_staff=True))
+
+    def test_requires_staff(self):
+        """Test non-staff users cannot start or download profiles."""
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('customer'))
+        self.assertEqual(client.post(reverse('profiler'), {}, format='json').status_code, 403)
+        self.assertEqual(client.get(reverse('profile-list')).status_code, 403)
+
+    def test_start_list_and_download(self):
+        """Test a profile can be started, listed and downloaded."""
+        response = self.client.post(reverse('profiler'), {'seconds': 1, 'interval_ms': 10}, format='json')
+        self.assertEqual(response.status_code, 202)
+        name = response.data['profile']
+        self.assertEqual(response.data['pid'], os.getpid())
+
+        self.assertEqual(self.client.post(reverse('profiler'), {}, format='json').status_code, 409)
+        self.assertTrue(self.client.get(reverse('profiler')).data['running'])
+
+        profiling.active_profiler().join(5)
+        self.assertEqual(self.client.get(reverse('profile-list')).data['results'][0]['name'], name)
+        response = self.client.get(reverse('profile-download', args=[name]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_invalid_parameters(self):
+        """Test over-long profiles and unknown names are rejected."""
+        with override_settings(PROFILER_MAX_SECONDS=60):
+            response = self.client.post(reverse('profiler'), {'seconds': 61}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('seconds', response.data['details'])
+        self.assertEqual(self.client.get(reverse('profile-download', args=['settings.py'])).status_code, 404)
+
+
+class RequestProfileTest(ProfilerTestCase):
+    """Test cases for per-request cProfile runs."""
+
+    def setUp(self):
+        super().setUp()
+        tracing.stage_histograms.reset()
+
+    @override_settings(PROFILER_REQUEST_ENABLED=True, TRACING_SAMPLE_RATE=1.0)
+    def test_header_profiles_sampled_request(self):
+        """Test a sampled request with X-Profile is saved under its correlation id."""
+        response = APIClient().get(reverse('next-tracking-number'), VALID_PARAMS, HTTP_X_PROFILE='1')
+
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile-Id']
+        self.assertEqual(name, f"request-{response.data['correlation_id']}.prof")
+        stats = pstats.Stats(os.path.join(self.directory, name))
+        self.assertTrue(any(func[2] == 'generate_tracking_number' for func in stats.stats))
+
+    @override_settings(PROFILER_REQUEST_ENABLED=True, TRACING_SAMPLE_RATE=0.0)
+    def test_unsampled_request_not_profiled(self):
+        """Test the header is ignored for requests outside the trace sample."""
+        response = APIClient().get(reverse('next-tracking-number'), VALID_PARAMS, HTTP_X_PROFILE='1')
+
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    @override_settings(PROFILER_REQUEST_ENABLED=False, TRACING_SAMPLE_RATE=1.0)
+    def test_disabled(self):
+        """Test the header is ignored unless PROFILER_REQUEST_ENABLED."""
+        response = APIClient().get(reverse('next-tracking-number'), VALID_PARAMS, HTTP_X_PROFILE='1')
+
+        self.assertNotIn('X-Profile-Id', response)
@@ -0,0 +1,196 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import LiveServerTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking import capture
+from tracking.replay import HTTPSender, InProcessSender, ReplayResult, compare, regressions, replay
+
+VALID_PARAMS = {
+    'origin_country_id': 'MY',
+    'destination_country_id': 'ID',
+    'weight': '1.234',
+    'created_at': '2018-11-20T19:29:32+08:00',
+    'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics'
+}
+
+
+def _record(ts, path='/next-tracking-number', query='', method='GET', status=200, ms=1.0, **extra):
+    return {'v': 1, 'ts': ts, 'method': method, 'path': path, 'query': query, 'status': status, 'ms': ms, **extra}
+
+
+def _result(label, ms, statuses=(200,)):
+    result = ReplayResult(label)
+    for status in statuses:
+        for _ in range(100):
+            result.record('GET /next-tracking-number', status, ms)
+    return result
+
+
+class CaptureTestCase(TransactionTestCase):
+    """Base class capturing into a temporary file."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'capture.ndjson')
+
+    def tearDown(self):
+        capture.shutdown_writer(timeout=5)
+        shutil.rmtree(self.directory)
+
+    def read_capture(self):
+        capture.get_writer().flush(timeout=5)
+        with open(self.path) as source:
+            return list(capture.read_capture(source))
+
+
+class TrafficCaptureTest(CaptureTestCase):
+    """Test cases for capturing requests in RequestLoggingMiddleware."""
+
+    def test_requests_are_captured(self):
+        """Test sampled requests are appended with their query, body, status and latency."""
+        batch = {
+            'customer_id': VALID_PARAMS['customer_id'],
+            'customer_name': 'RedBox Logistics',
+            'customer_slug': 'redbox-logistics',
+            'parcels': [{key: VALID_PARAMS[key] for key in ('origin_country_id', 'destination_country_id', 'weight', 'created_at')}],
+        }
+        with override_settings(CAPTURE_SAMPLE_RATE=1.0, CAPTURE_PATH=self.path):
+            client = APIClient()
+            client.get(reverse('next-tracking-number'), VALID_PARAMS)
+            client.post(reverse('tracking-numbers-batch'), batch, format='json')
+            records = self.read_capture()
+
+        get, post = sorted(records, key=lambda record: record['method'])
+        self.assertEqual(get['path'], '/next-tracking-number')
+        self.assertIn('customer_slug=redbox-logistics', get['query'])
+        self.assertEqual(get['status'], 200)
+        self.assertGreater(get['ms'], 0)
+        self.assertEqual(post['status'], 200)
+        self.assertEqual(json.loads(post['body']), batch)
+        self.assertEqual(post['content_type'], 'application/json')
+
+    def test_large_body_omitted(self):
+        """Test bodies over CAPTURE_MAX_BODY_BYTES are left out and replay skips them."""
+        with override_settings(CAPTURE_SAMPLE_RATE=1.0, CAPTURE_PATH=self.path, CAPTURE_MAX_BODY_BYTES=10):
+            APIClient().post(reverse('tracking-numbers-batch'), {'parcels': []}, format='json')
+            records = self.read_capture()
+
+        self.assertTrue(records[0]['body_omitted'])
+        self.assertEqual(replay(records, lambda record: 200, speed=0).skipped, 1)
+
+    def test_not_sampled(self):
+        """Test nothing is captured when sampling is off."""
+        with override_settings(CAPTURE_SAMPLE_RATE=0.0, CAPTURE_PATH=self.path):
+            APIClient().get(reverse('next-tracking-number'), VALID_PARAMS)
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+class ReplayTest(TransactionTestCase):
+    """Test cases for replaying captured traffic (requests are sent from worker threads)."""
+
+    def test_in_process_replay(self):
+        """Test captured requests are replayed and grouped by route."""
+        query = '&'.join(f'{key}={value}' for key, value in VALID_PARAMS.items()).replace('+', '%2B')
+        records = [
+            _record(1.0, query=query),
+            _record(1.1, query='weight=abc', status=400),
+            _record(1.2, path=f"/customers/{VALID_PARAMS['customer_id']}/tracking-numbers"),
+        ]
+
+        result = replay(records, InProcessSender(), speed=0, concurrency=1)
+
+        self.assertEqual(result.endpoints['GET /next-tracking-number'].statuses, {'200': 1, '400': 1})
+        # Captures hold no credentials, so the staff-only history is refused
+        self.assertEqual(
+            result.endpoints['GET /customers/<uuid:customer_id>/tracking-numbers'].statuses, {'403': 1}
+        )
+
+    def test_speed_scales_gaps(self):
+        """Test the original spacing is kept, divided by the speed."""
+        sent = []
+        records = [_record(100.0), _record(100.4), _record(100.2)]
+
+        result = replay(records, lambda record: sent.append(record['ts']) or 200, speed=2, concurrency=1)
+
+        self.assertEqual(sent, [100.0, 100.2, 100.4])
+        self.assertGreaterEqual(result.duration, 0.2)
+        self.assertLess(result.duration, 1.0)
+
+    def test_failures_count_as_errors(self):
+        """Test senders that raise are recorded as requests without a response."""
+        def broken(record):
+            raise ConnectionError('refused')
+
+        result = replay([_record(1.0)], broken, speed=0)
+
+        self.assertEqual(result.endpoints['GET /next-tracking-number'].errors, 1)
+
+    def test_compare_and_regressions(self):
+        """Test slower p95 and higher error rates are reported as regressions."""
+        baseline = _result('before', 10.0)
+        self.assertEqual(regressions(compare(baseline, _result('after', 10.5)), 10), [])
+
+        rows = compare(baseline, _result('after', 20.0))
+        self.assertAlmostEqual(rows[0]['p95_change_pct'], 100, delta=3)
+        self.assertEqual(regressions(rows, 10), ['GET /next-tracking-number'])
+
+        erroring = _result('after', 10.0, statuses=(200, 500))
+        self.assertEqual(regressions(compare(baseline, erroring), 10), ['GET /next-tracking-number'])
+
+    def test_result_round_trip(self):
+        """Test saved results keep their distributions."""
+        result = _result('before', 10.0)
+        loaded = ReplayResult.from_dict(json.loads(json.dumps(result.to_dict())))
+
+        self.assertEqual(loaded.label, 'before')
+        self.assertEqual(compare(result, loaded)[0]['p95_change_pct'], 0)
+
+
+class ReplayCommandTest(CaptureTestCase):
+    """Test cases for the replay_traffic and compare_replays commands."""
+
+    def test_replay_and_compare(self):
+        """Test a replay run can be saved and compared against another."""
+        with open(self.path, 'w') as output:
+            output.write(json.dumps(_record(1.0, query='weight=abc', status=400, ms=0.001)) + '\n')
+        results = os.path.join(self.directory, 'run.json')
+
+        out = StringIO()
+        call_command(
+            'replay_traffic', self.path, in_process=True, speed=0, output=results,
+            compare_capture=True, stdout=out
+        )
+        self.assertIn('1 requests', out.getvalue())
+        self.assertIn('GET /next-tracking-number', out.getvalue())
+
+        faster = os.path.join(self.directory, 'faster.json')
+        with open(faster, 'w') as output:
+            json.dump(_result('fast', 0.0001, statuses=(400,)).to_dict(), output)
+        with self.assertRaises(CommandError):
+            call_command('compare_replays', faster, results, fail_over_pct=10, stdout=StringIO())
+        call_command('compare_replays', results, faster, fail_over_pct=10, stdout=StringIO())
+
+
+class HTTPReplayTest(LiveServerTestCase):
+    """Test cases for replaying over HTTP."""
+
+    def test_http_replay(self):
+        """Test requests are sent to a running server over keep-alive connections."""
+        records = [_record(1.0, query='weight=abc', status=400), _record(1.01, path='/missing')]
+
+        result = replay(records, HTTPSender(self.live_server_url), speed=0, concurrency=1)
+
+        self.assertEqual(result.endpoints['GET /next-tracking-number'].statuses, {'400': 1})
+        self.assertEqual(result.endpoints['GET /missing'].statuses, {'404': 1})
+        self.assertEqual(replay([_record(1.0)], HTTPSender('http://127.0.0.1:9'), speed=0).count, 1)
@@ -0,0 +1,138 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracking import replicas
+from tracking.correlation import reset_correlation_id, set_correlation_id
+from tracking.models import APIMetrics, TrackingNumberRequest
+from tracking.replicas import check_replicas, choose_replica, note_writes, replica_reads
+
+REPLICA = 'replica_test'
+
+
+class ReplicaTestCase(TransactionTestCase):
+    """
+    Base class with a replica that is a second connection to the test database.
+
+    TransactionTestCase, since reads inside a transaction on the primary are
+    never sent to a replica.
+    """
+
+    def setUp(self):
+        connections.settings[REPLICA] = dict(connections['default'].settings_dict)
+        settings_override = override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(connections.settings.pop, REPLICA)
+        self.addCleanup(replicas._lag.clear)
+        self.addCleanup(cache.clear)
+
+    def _log(self, number, correlation_id='replica-test'):
+        return TrackingNumberRequest.objects.create(
+            tracking_number=number, origin_country_id='MY', destination_country_id='ID',
+            weight=Decimal('1.234'), customer_id='de619854-b59b-425e-9db4-943979e1bd49',
+            customer_name='RedBox Logistics', customer_slug='redbox-logistics',
+            request_timestamp=timezone.now(), correlation_id=correlation_id
+        )
+
+    def _as_request(self, correlation_id):
+        token = set_correlation_id(correlation_id)
+        self.addCleanup(reset_correlation_id, token)
+
+
+class ReplicaRouterTest(ReplicaTestCase):
+    """Test cases for routing reads and writes."""
+
+    def test_routing(self):
+        """Test that only reads inside replica_reads() go to the replica."""
+        self.assertEqual(TrackingNumberRequest.objects.all().db, 'default')
+        with replica_reads():
+            self.assertEqual(TrackingNumberRequest.objects.all().db, REPLICA)
+            self.assertEqual(router.db_for_write(TrackingNumberRequest), 'default')
+        self.assertEqual(TrackingNumberRequest.objects.all().db, 'default')
+
+    def test_reads_use_replica_connection(self):
+        """Test that rows are read through the replica's connection."""
+        self._log('MYID0000000001')
+        with CaptureQueriesContext(connections[REPLICA]) as queries, replica_reads():
+            self.assertEqual(TrackingNumberRequest.objects.count(), 1)
+        self.assertEqual(len(queries), 1)
+
+    def test_no_replicas(self):
+        """Test that reads stay on the primary without replicas."""
+        with override_settings(DATABASE_REPLICAS=[]), replica_reads():
+            self.assertEqual(TrackingNumberRequest.objects.all().db, 'default')
+
+    def test_transaction_on_primary(self):
+        """Test that reads inside a transaction on the primary stay there."""
+        with transaction.atomic():
+            self.assertIsNone(choose_replica())
+
+    def test_replication_lag(self):
+        """Test that lagging or unreachable replicas are skipped, and lag is measured once per interval."""
+        with patch('tracking.replicas.measure_lag', return_value=30.0) as measure:
+            self.assertIsNone(choose_replica())
+            self.assertIsNone(choose_replica())
+        self.assertEqual(measure.call_count, 1)
+        self.assertEqual(check_replicas(), {REPLICA: {'lag_seconds': 30.0, 'usable': False}})
+
+        replicas._lag.clear()
+        with patch('tracking.replicas.measure_lag', return_value=None):
+            self.assertIsNone(choose_replica())
+        replicas._lag.clear()
+        with override_settings(REPLICA_MAX_LAG_SECONDS=60), patch('tracking.replicas.measure_lag', return_value=30.0):
+            self.assertEqual(choose_replica(), REPLICA)
+
+
+class ReadYourWritesTest(ReplicaTestCase):
+    """Test cases for correlation id stickiness."""
+
+    def test_writer_reads_from_primary(self):
+        """Test that a correlation id that wrote reads from the primary, and others do not."""
+        self._as_request('client-1')
+        self.assertEqual(choose_replica(), REPLICA)
+        self._log('MYID0000000001')
+        self.assertIsNone(choose_replica())
+
+        self._as_request('client-2')
+        self.assertEqual(choose_replica(), REPLICA)
+
+    def test_metrics_rows_do_not_stick(self):
+        """Test that API metrics rows written for a request leave its reads on the replica."""
+        self._as_request('client-1')
+        APIMetrics.objects.create(endpoint='/metrics', method='GET', status_code=200, response_time_ms=1)
+        self.assertEqual(choose_replica(), REPLICA)
+
+    def test_group_commit_rows(self):
+        """Test that rows handed to the group commit writer mark their correlation id."""
+        note_writes([TrackingNumberRequest(correlation_id='client-3'), APIMetrics(correlation_id='client-4')])
+
+        self._as_request('client-3')
+        self.assertIsNone(choose_replica())
+        self._as_request('client-4')
+        self.assertEqual(choose_replica(), REPLICA)
+
+    def test_verify_after_issue(self):
+        """Test that a client verifying the number it was just issued reads from the primary."""
+        client = APIClient()
+        headers = {'HTTP_X_CORRELATION_ID': 'client-1'}
+        response = client.get(reverse('next-tracking-number'), {
+            'origin_country_id': 'MY', 'destination_country_id': 'ID', 'weight': '1.234',
+            'created_at': '2018-11-20T19:29:32+08:00', 'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+            'customer_name': 'RedBox Logistics', 'customer_slug': 'redbox-logistics',
+        }, **headers)
+        url = reverse('tracking-number-verify', args=[response.data['tracking_number']])
+
+        with CaptureQueriesContext(connections[REPLICA]) as queries:
+            self.assertTrue(client.get(url, **headers).data['issued'])
+        self.assertEqual(len(queries), 0)
+        with CaptureQueriesContext(connections[REPLICA]) as queries:
+            self.assertTrue(client.get(url).data['issued'])
+        self.assertGreater(len(queries), 0)
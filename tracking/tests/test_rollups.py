@@ -0,0 +1,167 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from tracking.models import TrackingNumberRequest, CustomerDailyRollup, LaneDailyRollup
+from tracking.rollups import update_rollups
+from tracking.sketches import DDSketch
+
+CUSTOMER_ID = uuid.UUID('de619854-b59b-425e-9db4-943979e1bd49')
+
+
+class DDSketchTest(SimpleTestCase):
+    """Test cases for DDSketch."""
+
+    def test_quantiles_within_relative_accuracy(self):
+        """Test quantiles stay within the configured relative error."""
+        rng = random.Random(7)
+        values = sorted(rng.lognormvariate(0, 1) for _ in range(10000))
+        sketch = DDSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        for q in (0.5, 0.95, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / exact, 1.0, delta=0.011)
+
+    def test_merge_matches_single_sketch(self):
+        """Test merging two sketches equals sketching the union."""
+        left, right, union = DDSketch(), DDSketch(), DDSketch()
+        for value in range(1, 500):
+            (left if value % 2 else right).add(value)
+            union.add(value)
+
+        left.merge(right)
+
+        self.assertEqual(left.count, union.count)
+        self.assertEqual(left.quantile(0.9), union.quantile(0.9))
+
+    def test_round_trip(self):
+        """Test to_dict/from_dict preserve the sketch."""
+        sketch = DDSketch()
+        for value in (0, 0.5, 1.234, 20):
+            sketch.add(value)
+
+        restored = DDSketch.from_dict(sketch.to_dict())
+
+        self.assertEqual(restored.count, 4)
+        self.assertEqual(restored.quantile(0.5), sketch.quantile(0.5))
+        self.assertIsNone(DDSketch.from_dict({}).quantile(0.5))
+
+
+@override_settings(ROLLUP_SAFETY_LAG_SECONDS=0)
+class UpdateRollupsTest(TestCase):
+    """Test cases for the incremental rollup job."""
+
+    def create_requests(self, count, weight='1.000', destination='ID', days_ago=0):
+        numbers = []
+        for _ in range(count):
+            row = TrackingNumberRequest.objects.create(
+                tracking_number=uuid.uuid4().hex[:16].upper(),
+                origin_country_id='MY',
+                destination_country_id=destination,
+                weight=Decimal(weight),
+                customer_id=CUSTOMER_ID,
+                customer_name='RedBox Logistics',
+                customer_slug='redbox-logistics',
+                request_timestamp=timezone.now(),
+                correlation_id=str(uuid.uuid4())
+            )
+            numbers.append(row.tracking_number)
+        TrackingNumberRequest.objects.filter(tracking_number__in=numbers).update(
+            created_at=timezone.now() - timedelta(days=days_ago, seconds=1)
+        )
+        # Rollups leave rows of the database clock's current millisecond for the next run
+        time.sleep(0.002)
+
+    def test_rollups_count_and_weigh_per_day(self):
+        """Test rows are grouped per customer and lane per day."""
+        self.create_requests(3, weight='2.000')
+        self.create_requests(2, weight='1.000', days_ago=1)
+        self.create_requests(1, destination='SG')
+
+        self.assertEqual(update_rollups(), 6)
+
+        today = LaneDailyRollup.objects.get(
+            origin_country_id='MY', destination_country_id='ID',
+            day=(timezone.now() - timedelta(seconds=1)).date()
+        )
+        self.assertEqual(today.request_count, 3)
+        self.assertEqual(today.total_weight, Decimal('6.000'))
+        self.assertEqual(LaneDailyRollup.objects.count(), 3)
+        self.assertEqual(
+            sum(CustomerDailyRollup.objects.values_list('request_count', flat=True)), 6
+        )
+
+    def test_only_new_rows_are_processed(self):
+        """Test reruns resume from the watermark without double counting."""
+        self.create_requests(4)
+        update_rollups(batch_size=3)
+        self.assertEqual(update_rollups(), 0)
+
+        self.create_requests(2)
+        self.assertEqual(update_rollups(), 2)
+
+        self.assertEqual(
+            sum(LaneDailyRollup.objects.values_list('request_count', flat=True)), 6
+        )
+
+    def test_late_rows_with_old_created_at(self):
+        """Test rows inserted after the watermark passed their created_at are still counted."""
+        self.create_requests(2)
+        update_rollups()
+
+        self.create_requests(1, days_ago=3)
+        self.assertEqual(update_rollups(), 1)
+
+        late = LaneDailyRollup.objects.get(day=(timezone.now() - timedelta(days=3, seconds=1)).date())
+        self.assertEqual(late.request_count, 1)
+
+
+@override_settings(ROLLUP_SAFETY_LAG_SECONDS=0)
+class DailyRollupViewTest(TestCase):
+    """Test cases for the rollup analytics endpoints."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('ops', is_staff=True))
+        UpdateRollupsTest.create_requests(self, 2, weight='1.500')
+        update_rollups()
+
+    def test_lane_daily(self):
+        """Test the lane endpoint returns totals and percentiles."""
+        response = self.client.get(reverse('lane-daily-rollup', args=['my-id']), {'days': 7})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['lane'], 'MY-ID')
+        self.assertEqual(data['requests'], 2)
+        self.assertAlmostEqual(data['weight_p50_kg'], 1.5, delta=0.02)
+        self.assertEqual(len(data['series']), 1)
+
+    def test_customer_daily(self):
+        """Test the customer endpoint returns the customer's totals."""
+        response = self.client.get(reverse('customer-daily-rollup', args=[CUSTOMER_ID]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['requests'], 2)
+
+    def test_invalid_parameters(self):
+        """Test invalid lane or window returns 400."""
+        self.assertEqual(
+            self.client.get(reverse('lane-daily-rollup', args=['MYID'])).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.get(reverse('lane-daily-rollup', args=['MY-ID']), {'days': 0}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
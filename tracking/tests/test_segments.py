@@ -0,0 +1,287 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking import segments
+from tracking.models import TrackingNumberRequest
+from tracking.segments import (
+    RECORD, SEGMENT_HEADER, SegmentIndex, SegmentWriter, append_audit_row, decode_record, encode_record,
+    find_record, load_segments, read_segment, seal_orphans
+)
+
+VALID_PARAMS = {
+    'origin_country_id': 'MY',
+    'destination_country_id': 'ID',
+    'weight': '1.234',
+    'created_at': '2018-11-20T19:29:32+08:00',
+    'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics'
+}
+
+
+def _fields(number, **overrides):
+    return {
+        'tracking_number': number,
+        'origin_country_id': 'MY',
+        'destination_country_id': 'ID',
+        'weight': Decimal('1.234'),
+        'customer_id': VALID_PARAMS['customer_id'],
+        'customer_name': 'RedBox Logistics',
+        'customer_slug': 'redbox-logistics',
+        'request_timestamp': datetime(2018, 11, 20, 11, 29, 32, tzinfo=timezone.utc),
+        'correlation_id': 'segment-test',
+        **overrides,
+    }
+
+
+class SegmentTestCase(TestCase):
+    """Base class writing segments into a temporary directory."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        settings_override = override_settings(AUDIT_SEGMENT_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(segments.shutdown_segment_writer)
+
+    def _writer(self, max_bytes=1024 * 1024):
+        writer = SegmentWriter(self.directory, max_bytes, fsync_ms=5)
+        self.addCleanup(writer.stop)
+        return writer
+
+    def _files(self, suffix):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(suffix))
+
+
+class RecordTest(TestCase):
+    """Test cases for the binary record layout."""
+
+    def test_round_trip(self):
+        """Test that every field survives encoding."""
+        logged_at = datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)
+        record = encode_record(_fields('MYID0000000001', customer_name='Rédbox'), logged_at)
+
+        self.assertEqual(len(record), RECORD.size)
+        fields = decode_record(record)
+        self.assertEqual(fields['tracking_number'], 'MYID0000000001')
+        self.assertEqual(fields['weight'], Decimal('1.234'))
+        self.assertEqual(str(fields['customer_id']), VALID_PARAMS['customer_id'])
+        self.assertEqual(fields['customer_name'], 'Rédbox')
+        self.assertEqual(fields['request_timestamp'], datetime(2018, 11, 20, 11, 29, 32, tzinfo=timezone.utc))
+        self.assertEqual(fields['logged_at'], logged_at)
+
+    @override_settings(TIME_ZONE='Asia/Kuala_Lumpur')
+    def test_naive_timestamp(self):
+        """Test that a timestamp without a time zone is read in the default one, as the database does."""
+        record = encode_record(
+            _fields('MYID0000000001', request_timestamp=datetime(2018, 11, 20, 19, 29, 32)), datetime.now(timezone.utc)
+        )
+        self.assertEqual(
+            decode_record(record)['request_timestamp'], datetime(2018, 11, 20, 11, 29, 32, tzinfo=timezone.utc)
+        )
+
+    def test_corruption_is_detected(self):
+        """Test that a flipped byte fails the checksum."""
+        record = bytearray(encode_record(_fields('MYID0000000001'), datetime.now(timezone.utc)))
+        record[30] ^= 0xff
+        self.assertIsNone(decode_record(bytes(record)))
+
+    def test_oversized_fields_are_refused(self):
+        """Test that rows the layout cannot hold raise ValueError."""
+        with self.assertRaises(ValueError):
+            encode_record(_fields('MYID0000000001', customer_name='é' * 200), datetime.now(timezone.utc))
+        with self.assertRaises(ValueError):
+            encode_record(_fields('MYID0000000001', weight=Decimal('1.2345')), datetime.now(timezone.utc))
+
+
+class SegmentWriterTest(SegmentTestCase):
+    """Test cases for appending, rotating and sealing segments."""
+
+    def test_rotation_seals_with_sorted_index(self):
+        """Test that full segments are sealed and their index finds every record."""
+        writer = self._writer(max_bytes=SEGMENT_HEADER.size + RECORD.size * 10)
+        numbers = [f'MYID{i:010d}' for i in range(25, 0, -1)]
+        for number in numbers:
+            writer.append(_fields(number))
+
+        self.assertEqual(len(self._files('.seg')), 3)
+        self.assertEqual(len(self._files('.idx')), 2)
+        index = SegmentIndex(os.path.join(self.directory, self._files('.idx')[0]))
+        self.addCleanup(index.close)
+        self.assertEqual(index.count, 10)
+        self.assertEqual(index.find('MYID0000000025'), SEGMENT_HEADER.size)
+        self.assertEqual(index.find('MYID0000000016'), SEGMENT_HEADER.size + RECORD.size * 9)
+        self.assertIsNone(index.find('MYID0000000001'))
+
+        writer.stop()
+        self.assertEqual(len(self._files('.idx')), 3)
+        stored = [fields['tracking_number'] for name in self._files('.seg')
+                  for _, fields in read_segment(os.path.join(self.directory, name))]
+        self.assertEqual(stored, numbers)
+
+    def test_group_fsync(self):
+        """Test that appends are fsync'ed in groups rather than one by one."""
+        writer = self._writer()
+        for i in range(100):
+            writer.append(_fields(f'MYID{i:010d}'))
+        writer.sync()
+        self.assertEqual(writer.stats['records'], 100)
+        self.assertLess(writer.stats['fsyncs'], 100)
+
+    def test_find_record(self):
+        """Test lookups in this process' segment, sealed segments and other workers' open segments."""
+        sealed = self._writer(max_bytes=SEGMENT_HEADER.size + RECORD.size * 2)
+        for i in range(3):
+            sealed.append(_fields(f'MYID000000000{i}'))
+        other = self._writer()
+        other.append(_fields('IDMY0000000001', destination_country_id='SG'))
+        segments.get_segment_writer().append(_fields('SGMY0000000001'))
+
+        self.assertEqual(find_record('MYID0000000000')['tracking_number'], 'MYID0000000000')
+        self.assertEqual(find_record('MYID0000000002')['tracking_number'], 'MYID0000000002')
+        self.assertEqual(find_record('IDMY0000000001')['destination_country_id'], 'SG')
+        self.assertEqual(find_record('SGMY0000000001')['tracking_number'], 'SGMY0000000001')
+        self.assertIsNone(find_record('MYID0000000404'))
+
+
+class LoaderTest(SegmentTestCase):
+    """Test cases for sealing orphans and loading segments into the table."""
+
+    def test_orphan_with_torn_tail(self):
+        """Test that a crashed worker's segment is truncated to whole records and sealed."""
+        writer = self._writer()
+        for i in range(3):
+            writer.append(_fields(f'MYID000000000{i}'))
+        path = writer._path
+        # Simulate a crash in the middle of a write: the flock goes with the process
+        os.write(writer._fd, b'\x01' * 100)
+        os.close(writer._fd)
+        writer._fd = None
+
+        self.assertEqual(seal_orphans(self.directory), 1)
+        self.assertEqual(os.path.getsize(path), SEGMENT_HEADER.size + RECORD.size * 3)
+        self.assertEqual(len(self._files('.idx')), 1)
+
+    def test_open_segments_are_left_alone(self):
+        """Test that segments still held by a live writer are neither sealed nor loaded."""
+        writer = self._writer()
+        writer.append(_fields('MYID0000000001'))
+
+        self.assertEqual(load_segments()['segments'], 0)
+        self.assertFalse(TrackingNumberRequest.objects.exists())
+
+    def test_load(self):
+        """Test that sealed segments are imported once and then removed."""
+        writer = self._writer(max_bytes=SEGMENT_HEADER.size + RECORD.size * 4)
+        for i in range(10):
+            writer.append(_fields(f'MYID{i:010d}'))
+        writer.stop()
+        TrackingNumberRequest.objects.create(**_fields('MYID0000000003'))
+
+        out = StringIO()
+        call_command('load_audit_segments', '--chunk-size', '3', stdout=out)
+
+        self.assertIn('Loaded 9 of 10 records from 3 segments (1 already in the table', out.getvalue())
+        self.assertEqual(TrackingNumberRequest.objects.count(), 10)
+        row = TrackingNumberRequest.objects.get(tracking_number='MYID0000000007')
+        self.assertEqual(row.weight, Decimal('1.234'))
+        self.assertEqual(row.correlation_id, 'segment-test')
+        self.assertEqual(self._files('.seg'), [])
+        self.assertEqual(self._files('.idx'), [])
+
+    def test_loaded_rows_keep_issue_time(self):
+        """Test that loaded rows get the time they were logged as created_at, not the load time."""
+        writer = self._writer()
+        writer.append(_fields('MYID0000000001'))
+        logged_at = writer.find('MYID0000000001')['logged_at']
+        writer.stop()
+
+        load_segments()
+        row = TrackingNumberRequest.objects.get(tracking_number='MYID0000000001')
+        self.assertEqual(row.created_at, logged_at)
+        self.assertGreaterEqual(row.inserted_at, logged_at)
+
+    def test_duplicates_are_reported(self):
+        """Test that a number issued twice is counted and reported rather than skipped as a reload."""
+        first, second = self._writer(), self._writer()
+        first.append(_fields('MYID0000000001', correlation_id='first'))
+        second.append(_fields('MYID0000000001', correlation_id='second'))
+        first.append(_fields('MYID0000000002'))
+        first.stop()
+        second.stop()
+        TrackingNumberRequest.objects.create(**_fields('MYID0000000002', correlation_id='database'))
+
+        out, err = StringIO(), StringIO()
+        with self.assertLogs('tracking.segments', 'ERROR') as logs:
+            call_command('load_audit_segments', stdout=out, stderr=err)
+
+        self.assertIn('Loaded 1 of 3 records from 2 segments (0 already in the table', out.getvalue())
+        self.assertIn('2 records carry a tracking number that was issued twice', err.getvalue())
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(TrackingNumberRequest.objects.get(tracking_number='MYID0000000001').correlation_id, 'first')
+
+    def test_keep(self):
+        """Test that --keep renames loaded segments instead of deleting them."""
+        writer = self._writer()
+        writer.append(_fields('MYID0000000001'))
+        writer.stop()
+
+        load_segments(keep=True)
+        self.assertEqual(len(self._files('.seg.loaded')), 1)
+        self.assertEqual(load_segments()['segments'], 0)
+
+
+@override_settings(AUDIT_STORE='segments')
+class SegmentAuditStoreTest(SegmentTestCase):
+    """Test cases for issuing numbers with the segment audit store."""
+
+    def test_issue_verify_and_load(self):
+        """Test that an issued number is logged to a segment, verifiable, and loaded later."""
+        client = APIClient()
+        tracking_number = client.get(reverse('next-tracking-number'), VALID_PARAMS).data['tracking_number']
+        self.assertFalse(TrackingNumberRequest.objects.filter(tracking_number=tracking_number).exists())
+
+        response = client.get(reverse('tracking-number-verify', args=[tracking_number]))
+        self.assertTrue(response.data['issued'])
+        self.assertEqual(response.data['source'], 'segments')
+
+        segments.shutdown_segment_writer()
+        load_segments()
+        self.assertTrue(TrackingNumberRequest.objects.filter(tracking_number=tracking_number).exists())
+        response = client.get(reverse('tracking-number-verify', args=[tracking_number]))
+        self.assertEqual(response.data['source'], 'index')
+
+    def test_issued_numbers_are_rejected(self):
+        """Test that appending a number in a segment or in the table raises IntegrityError."""
+        append_audit_row(_fields('MYID0000000001'))
+        TrackingNumberRequest.objects.create(**_fields('MYID0000000002'))
+
+        for number in ('MYID0000000001', 'MYID0000000002'):
+            with self.assertRaises(IntegrityError):
+                append_audit_row(_fields(number, correlation_id='other'))
+        self.assertTrue(append_audit_row(_fields('MYID0000000003')))
+
+    def test_naive_created_at(self):
+        """Test that a created_at without a time zone is still logged to a segment."""
+        params = {**VALID_PARAMS, 'created_at': '2018-11-20T10:00:00'}
+        tracking_number = APIClient().get(reverse('next-tracking-number'), params).data['tracking_number']
+        self.assertEqual(
+            find_record(tracking_number)['request_timestamp'], datetime(2018, 11, 20, 10, tzinfo=timezone.utc)
+        )
+
+    def test_rows_that_do_not_fit_go_to_database(self):
+        """Test that a row the layout cannot hold is still logged, in the database."""
+        params = {**VALID_PARAMS, 'customer_name': 'é' * 200}
+        tracking_number = APIClient().get(reverse('next-tracking-number'), params).data['tracking_number']
+        self.assertTrue(TrackingNumberRequest.objects.filter(tracking_number=tracking_number).exists())
@@ -4,7 +4,9 @@ from datetime import datetime
 from decimal import Decimal
 import uuid
 
+from django.db import connections
 from django.test import TestCase
+from tracking.models import TrackingNumberRequest
 from tracking.services import TrackingNumberGenerator, TrackingService
 
 
@@ -141,3 +143,15 @@ class TrackingServiceTest(TestCase):
         self.assertEqual(call_args['origin_country_id'], 'MY')
         self.assertEqual(call_args['destination_country_id'], 'ID')
         self.assertEqual(call_args['correlation_id'], self.correlation_id)
+    
+    @patch('tracking.services.writer_lock')
+    def test_log_tracking_request_takes_writer_lock(self, mock_lock):
+        """Test that the direct insert queues behind the other SQLite writers."""
+        self.service._log_tracking_request(
+            validated_data=self.validated_data,
+            tracking_number='MYID123456789',
+            correlation_id=self.correlation_id
+        )
+        
+        mock_lock.assert_called_once_with(connections['default'])
+        self.assertTrue(TrackingNumberRequest.objects.filter(tracking_number='MYID123456789').exists())
@@ -0,0 +1,303 @@
+import time
+import uuid
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connections, router
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracking import shards, writes
+from tracking.exports import export_rows
+from tracking.formats import invalidate_customer_template
+from tracking.metrics import compute_metrics
+from tracking.models import CustomerDailyRollup, ShardMapEntry, TrackingNumberFormat, TrackingNumberRequest
+from tracking.rollups import update_rollups
+from tracking.services import TrackingNumberGenerator, TrackingService, find_tracking_request
+from tracking.shards import (
+    BASE36, BUCKETS, balanced_map, bucket_for, default_map, existing_numbers, save_shard_map, shard_for,
+    shard_map, shards_for_number
+)
+
+SHARD = 'shard_test'
+
+
+def _customer_on(alias, skip=0):
+    """A customer id whose rows the default shard map sends to `alias`."""
+    for i in range(1000):
+        customer_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f'customer-{i}'))
+        if default_map()[bucket_for(customer_id, 'MY', 'ID')] == alias:
+            if not skip:
+                return customer_id
+            skip -= 1
+
+
+class ShardTestCase(TransactionTestCase):
+    """
+    Base class with a second shard in its own in-memory database.
+
+    TransactionTestCase, since scatter-gather reads every shard on its own thread.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings[SHARD] = {
+            **connections['default'].settings_dict, 'NAME': f'file:{SHARD}?mode=memory&cache=shared'
+        }
+        call_command('migrate', database=SHARD, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections.settings.pop(SHARD)
+        super().tearDownClass()
+
+    def setUp(self):
+        settings_override = override_settings(DATABASE_SHARDS=['default', SHARD], ROLLUP_SAFETY_LAG_SECONDS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shards.invalidate_shard_map)
+        self.addCleanup(TrackingNumberRequest.objects.using(SHARD).all().delete)
+        shards.invalidate_shard_map()
+
+    def _log(self, number, customer_id, origin='MY', destination='ID'):
+        row = TrackingNumberRequest(
+            tracking_number=number, origin_country_id=origin, destination_country_id=destination,
+            weight=Decimal('1.234'), customer_id=customer_id, customer_name='RedBox Logistics',
+            customer_slug='redbox-logistics', request_timestamp=timezone.now(), correlation_id='shard-test'
+        )
+        row.save()
+        # A tick of its own, so the rollups see the rows in the order they were logged
+        time.sleep(0.002)
+        return row
+
+    def _count(self, alias):
+        return TrackingNumberRequest.objects.using(alias).count()
+
+
+class ShardRoutingTest(ShardTestCase):
+    """Test cases for sending rows to their shard."""
+
+    def test_rows_follow_their_customer(self):
+        """Test that saved rows land on the shard of their customer."""
+        row = self._log('MYID0000000001', _customer_on(SHARD))
+        self._log('MYID0000000002', _customer_on('default'))
+
+        self.assertEqual((self._count('default'), self._count(SHARD)), (1, 1))
+        self.assertEqual(router.db_for_write(TrackingNumberRequest, instance=row), SHARD)
+        with override_settings(DATABASE_SHARDS=['default']):
+            self.assertEqual(shard_for(row.customer_id, 'MY', 'ID'), 'default')
+
+    def test_write_rows_splits_by_shard(self):
+        """Test that a batch is written to every shard it touches."""
+        rows = [
+            TrackingNumberRequest(
+                tracking_number=f'MYID000000000{i}', origin_country_id='MY', destination_country_id='ID',
+                weight=Decimal('1.000'), customer_id=customer_id, customer_name='RedBox Logistics',
+                customer_slug='redbox-logistics', request_timestamp=timezone.now(), correlation_id='shard-test'
+            )
+            for i, customer_id in enumerate([_customer_on(SHARD), _customer_on('default'), _customer_on(SHARD, 1)])
+        ]
+        self.assertEqual(writes.write_rows(rows), 3)
+        self.assertEqual((self._count('default'), self._count(SHARD)), (1, 2))
+
+    @override_settings(SHARD_KEY='lane')
+    def test_lane_key(self):
+        """Test that with the lane key a lane's rows share a shard whatever the customer."""
+        self.assertEqual(bucket_for(_customer_on(SHARD), 'MY', 'ID'), bucket_for(_customer_on('default'), 'my', 'id'))
+
+    def test_shard_map(self):
+        """Test that map entries override the round-robin default once the cached map is reloaded."""
+        customer_id = _customer_on(SHARD)
+        bucket = bucket_for(customer_id, 'MY', 'ID')
+        self.assertEqual(shard_map(), default_map())
+
+        ShardMapEntry.objects.create(bucket=bucket, database='default')
+        self.assertEqual(shard_for(customer_id, 'MY', 'ID'), SHARD)
+        shards.invalidate_shard_map()
+        self.assertEqual(shard_for(customer_id, 'MY', 'ID'), 'default')
+
+        save_shard_map({bucket: SHARD})
+        self.assertEqual(shard_for(customer_id, 'MY', 'ID'), SHARD)
+        with self.assertRaises(ValueError):
+            save_shard_map({bucket: 'replica1'})
+
+    def test_balanced_map(self):
+        """Test that balancing gives every shard an equal share and keeps buckets that can stay."""
+        moves = balanced_map(('default',) * BUCKETS)
+        self.assertEqual(len(moves), BUCKETS // 2)
+        self.assertEqual(set(moves.values()), {SHARD})
+        self.assertEqual(balanced_map(default_map()), {})
+
+
+class ShardedNumberTest(ShardTestCase):
+    """Test cases for tracking numbers that name their shard."""
+
+    def test_number_names_its_shard(self):
+        """Test that numbers carry the bucket after the lane and lookups try its shard first."""
+        customer_id = _customer_on(SHARD)
+        number = TrackingNumberGenerator.compute_tracking_number(
+            'MY', 'ID', 1.234, timezone.now(), customer_id, 'redbox-logistics', 'salt'
+        )
+        self.assertEqual(len(number), shards.MARKED_NUMBER_LENGTH)
+        self.assertEqual(number[4], BASE36[bucket_for(customer_id, 'MY', 'ID')])
+        self.assertEqual(shards_for_number(number), [SHARD, 'default'])
+        self.assertEqual(shards_for_number('MYID1A2B3C4D5E'), ['default', SHARD])
+
+    def test_lookup_goes_to_one_shard(self):
+        """Test that an issued number is found on its shard without touching the default database."""
+        customer_id = _customer_on(SHARD)
+        response = APIClient().get(reverse('next-tracking-number'), {
+            'origin_country_id': 'MY', 'destination_country_id': 'ID', 'weight': '1.234',
+            'created_at': '2018-11-20T19:29:32+08:00', 'customer_id': customer_id,
+            'customer_name': 'RedBox Logistics', 'customer_slug': 'redbox-logistics',
+        })
+        number = response.data['tracking_number']
+        self.assertEqual(self._count(SHARD), 1)
+
+        with CaptureQueriesContext(connections['default']) as queries:
+            row, source = find_tracking_request(number)
+        self.assertEqual((row['tracking_number'], source), (number, 'index'))
+        self.assertEqual(len(queries), 0)
+
+    def test_unmarked_numbers_are_found(self):
+        """Test that numbers without a marker (templates, leases) are found on any shard."""
+        self._log('RB-000123', _customer_on(SHARD))
+        self.assertEqual(find_tracking_request('RB-000123')[0]['tracking_number'], 'RB-000123')
+        self.assertEqual(existing_numbers(['RB-000123', 'RB-000124']), {'RB-000123'})
+
+
+class TemplatedNumberTest(ShardTestCase):
+    """Test cases for customer-format numbers, which carry no shard marker."""
+
+    def test_number_on_another_shard_collides(self):
+        """Test that a templated number already stored on another shard is retried, not stored twice."""
+        customer_id = _customer_on('default')
+        TrackingNumberFormat.objects.create(customer_id=customer_id, template='RB-{digits:6}')
+        self.addCleanup(invalidate_customer_template)
+        self._log('RB-000123', _customer_on(SHARD))
+        validated_data = {
+            'origin_country_id': 'MY', 'destination_country_id': 'ID', 'weight': Decimal('1.234'),
+            'created_at': timezone.now(), 'customer_id': customer_id, 'customer_name': 'RedBox Logistics',
+            'customer_slug': 'redbox-logistics',
+        }
+
+        with self.assertRaises(IntegrityError):
+            TrackingService()._log_tracking_request(validated_data, 'RB-000123', 'shard-test')
+        TrackingService()._log_tracking_request(validated_data, 'RB-000124', 'shard-test')
+        self.assertEqual(existing_numbers(['RB-000123', 'RB-000124'], primary=True), {'RB-000123', 'RB-000124'})
+        self.assertEqual(self._count('default'), 1)
+
+
+class ScatterGatherTest(ShardTestCase):
+    """Test cases for reads that span every shard."""
+
+    def test_metrics(self):
+        """Test that the request count adds up every shard."""
+        self._log('MYID0000000001', _customer_on(SHARD))
+        self._log('MYID0000000002', _customer_on('default'))
+        self.assertEqual(compute_metrics('24h')['tracking_requests'], 2)
+
+    @override_settings(SHARD_KEY='lane')
+    def test_customer_history(self):
+        """Test that a customer's history pages through rows of lanes on different shards in order."""
+        lanes = [('MY', 'ID'), ('ID', 'MY'), ('SG', 'MY'), ('MY', 'SG'), ('TH', 'MY'), ('MY', 'TH')]
+        by_shard = {shard_for(None, *lane): lane for lane in lanes}
+        self.assertEqual(set(by_shard), {'default', SHARD})
+        customer_id = _customer_on('default')
+        for i, alias in enumerate(['default', SHARD, 'default', SHARD, SHARD]):
+            self._log(f'NUMBER{i}', customer_id, *by_shard[alias])
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('ops', is_staff=True))
+        url = reverse('customer-tracking-numbers', args=[customer_id])
+        first = client.get(url, {'limit': 3}).data
+        second = client.get(url, {'limit': 3, 'cursor': first['next_cursor']}).data
+
+        numbers = [row['tracking_number'] for row in first['results'] + second['results']]
+        self.assertEqual(numbers, [f'NUMBER{i}' for i in range(4, -1, -1)])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_export(self):
+        """Test that exports merge the shards in created_at order."""
+        for i, customer_id in enumerate([_customer_on(SHARD), _customer_on('default'), _customer_on(SHARD)]):
+            self._log(f'MYID000000000{i}', customer_id)
+        numbers = [row[0] for row in export_rows({})]
+        self.assertEqual(numbers, ['MYID0000000000', 'MYID0000000001', 'MYID0000000002'])
+
+
+class RebalanceTest(ShardTestCase):
+    """Test cases for moving buckets between shards."""
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = _customer_on('default')
+        self.bucket = bucket_for(self.customer_id, 'MY', 'ID')
+
+    def _rebalance(self, *args):
+        out = StringIO()
+        call_command('rebalance_shards', *args, '--settle-seconds', '0', stdout=out)
+        return out.getvalue()
+
+    def test_move_bucket(self):
+        """Test that a reassigned bucket's rows move with their created_at, and rollups count them once."""
+        rows = [self._log(f'MYID000000000{i}', self.customer_id) for i in range(3)]
+        update_rollups()
+
+        output = self._rebalance('--assign', f'{self.bucket}={SHARD}')
+
+        self.assertIn(f'Bucket {self.bucket}: default -> {SHARD}', output)
+        self.assertIn('Moved 3 tracking requests', output)
+        self.assertEqual((self._count('default'), self._count(SHARD)), (0, 3))
+        moved = TrackingNumberRequest.objects.using(SHARD).get(tracking_number=rows[0].tracking_number)
+        self.assertEqual(moved.created_at, rows[0].created_at)
+        self.assertEqual(shard_for(self.customer_id, 'MY', 'ID'), SHARD)
+
+        update_rollups()
+        self.assertEqual(CustomerDailyRollup.objects.get(customer_id=self.customer_id).request_count, 3)
+
+    def test_rows_wait_for_rollups(self):
+        """Test that rows only the target's rollups have passed stay until the source catches up."""
+        self._log('MYID0000000001', self.customer_id)
+        self._log('MYID0000000002', self.customer_id)
+        self._log('MYID0000000003', _customer_on(SHARD))
+        update_rollups(batch_size=1, max_batches=1)
+
+        output = self._rebalance('--assign', f'{self.bucket}={SHARD}')
+        self.assertIn('Moved 1 tracking requests', output)
+        self.assertIn('1 tracking requests wait for update_rollups', output)
+
+        update_rollups()
+        self.assertIn('Moved 1 tracking requests', self._rebalance())
+        self.assertEqual(self._count('default'), 0)
+        self.assertEqual(CustomerDailyRollup.objects.get(customer_id=self.customer_id).request_count, 2)
+
+    def test_conflicting_number_stays(self):
+        """Test that a row whose number the target holds already is reported and kept, not deleted."""
+        self._log('MYID0000000001', self.customer_id)
+        self._log('MYID0000000002', self.customer_id)
+        self._log('MYID0000000001', _customer_on(SHARD))
+
+        with self.assertLogs('tracking.shards', 'ERROR'):
+            with self.assertRaisesRegex(CommandError, '1 tracking requests were not moved'):
+                self._rebalance('--assign', f'{self.bucket}={SHARD}')
+
+        self.assertEqual((self._count('default'), self._count(SHARD)), (1, 2))
+        self.assertTrue(
+            TrackingNumberRequest.objects.filter(tracking_number='MYID0000000001', customer_id=self.customer_id).exists()
+        )
+        self.assertEqual(shards.relocate_rows()['conflicts'], 1)
+
+    def test_dry_run(self):
+        """Test that a dry run reports the rows to move and changes nothing."""
+        self._log('MYID0000000001', self.customer_id)
+        output = self._rebalance('--assign', f'{self.bucket}={SHARD}', '--dry-run')
+        self.assertIn('1 tracking requests would move', output)
+        self.assertFalse(ShardMapEntry.objects.exists())
+        self.assertEqual(self._count('default'), 1)
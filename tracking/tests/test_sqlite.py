@@ -0,0 +1,48 @@
+import os
+import tempfile
+
+from django.db import connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, override_settings
+
+from tracking.sqlite import writer_lock
+
+
+@override_settings(
+    SQLITE_TUNED=True, SQLITE_SYNCHRONOUS='NORMAL',
+    SQLITE_BUSY_TIMEOUT_MS=1234, SQLITE_MMAP_SIZE=1048576
+)
+class SQLiteTunedModeTest(SimpleTestCase):
+    """Test cases for SQLite tuned mode."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'tuned.sqlite3')
+        settings_dict = {**connections['default'].settings_dict, 'NAME': self.path}
+        self.connection = DatabaseWrapper(settings_dict, alias='tuned')
+
+    def tearDown(self):
+        self.connection.close()
+        self.tmpdir.cleanup()
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        """Test WAL, synchronous, busy timeout and mmap are set on new connections."""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+        self.assertEqual(self.pragma('mmap_size'), 1048576)
+
+    @override_settings(SQLITE_TUNED=False)
+    def test_pragmas_untouched_when_disabled(self):
+        """Test connections keep SQLite defaults outside tuned mode."""
+        self.assertEqual(self.pragma('journal_mode'), 'delete')
+
+    def test_writer_lock_uses_sidecar_file(self):
+        """Test the cross-process writer lock is taken on a sidecar file."""
+        with writer_lock(self.connection):
+            self.assertTrue(os.path.exists(f'{self.path}.writer.lock'))
@@ -0,0 +1,62 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from tracking.startup import group_import_times, parse_importtime, prewarm
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     rest_framework.status
+import time:       300 |        300 |       django.urls.base
+import time:       200 |        500 |     django.urls
+import time:      1000 |       1620 |   tracking.views
+"""
+
+
+class ImportTimeParsingTest(TestCase):
+    """Test cases for -X importtime parsing."""
+
+    def test_parse(self):
+        """Test each module line becomes a timing with its nesting depth."""
+        timings = parse_importtime(IMPORTTIME.splitlines())
+
+        self.assertEqual([t.module for t in timings], [
+            'rest_framework.status', 'django.urls.base', 'django.urls', 'tracking.views'
+        ])
+        self.assertEqual(timings[1].self_us, 300)
+        self.assertEqual(timings[3].cumulative_us, 1620)
+        self.assertEqual([t.depth for t in timings], [2, 3, 2, 1])
+
+    def test_group(self):
+        """Test self time is summed per package prefix."""
+        totals = group_import_times(parse_importtime(IMPORTTIME.splitlines()), depth=1)
+
+        self.assertEqual(totals, {'rest_framework': 120, 'django': 500, 'tracking': 1000})
+
+
+class PrewarmTest(TestCase):
+    """Test cases for startup prewarming."""
+
+    def test_prewarm_does_not_touch_database(self):
+        """Test prewarm is safe to run in a preloading master."""
+        with self.assertNumQueries(0):
+            elapsed = prewarm()
+
+        self.assertGreaterEqual(elapsed, 0)
+
+
+class StartupProfileCommandTest(TestCase):
+    """Test cases for the startup_profile command."""
+
+    def test_reports_boot_and_imports(self):
+        """Test a profiled boot reports timings and an import breakdown."""
+        out = StringIO()
+        call_command('startup_profile', runs=1, top=5, json=True, stdout=out)
+
+        result = json.loads(out.getvalue())['full']
+        self.assertEqual(result['status'], '200 OK')
+        self.assertGreater(result['boot_ms'], 0)
+        self.assertGreater(result['modules_imported'], 100)
+        self.assertEqual(len(result['packages']), 5)
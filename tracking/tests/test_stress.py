@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TransactionTestCase
+
+from tracking import writes
+from tracking.models import TrackingNumberRequest
+from tracking.services import TrackingService
+from tracking.stress import STRESS_SLUG, UniquenessError, run_stress
+
+
+class StressTest(TransactionTestCase):
+    """
+    Test cases issuing numbers from concurrent workers against the test database.
+
+    SQLite's shared-cache in-memory test database fails on table locks
+    instead of waiting and cannot be shared with forked workers, so on SQLite
+    the tests run against a migrated temporary file. Run the suite with a
+    PostgreSQL DATABASE_URL to stress PostgreSQL.
+    """
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self._use_file_database()
+        self.addCleanup(writes.shutdown_group_writer)
+
+    def _use_file_database(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        # Threads and forked workers build their connections from the shared
+        # settings dict; this thread gets a new wrapper, since closing the
+        # in-memory one would drop the test database
+        memory = connections[DEFAULT_DB_ALIAS]
+        name = memory.settings_dict['NAME']
+        memory.settings_dict['NAME'] = os.path.join(directory, 'stress.sqlite3')
+        connections[DEFAULT_DB_ALIAS] = memory.copy()
+
+        def restore():
+            connections[DEFAULT_DB_ALIAS].close()
+            connections[DEFAULT_DB_ALIAS] = memory
+            memory.settings_dict['NAME'] = name
+
+        self.addCleanup(restore)
+        call_command('migrate', verbosity=0)
+
+    def test_threads(self):
+        """Test that concurrent threads get unique numbers, each with an audit row."""
+        result = run_stress(threads=8, calls=25)
+
+        self.assertEqual(result.calls, 200)
+        self.assertEqual(result.failures, {})
+        self.assertEqual(result.duplicates, {})
+        self.assertEqual(result.lost, [])
+        self.assertEqual(TrackingNumberRequest.objects.filter(customer_slug=STRESS_SLUG).count(), 200)
+
+    def test_group_path(self):
+        """Test the group commit path under concurrency."""
+        result = run_stress(path=writes.WRITE_MODE_GROUP, threads=8, calls=25)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.stored, 200)
+
+    def test_collisions_are_retried(self):
+        """Test that forced collisions are retried rather than returned twice."""
+        result = run_stress(threads=4, calls=25, number_space=300)
+
+        self.assertGreater(result.retries, 0)
+        self.assertEqual(result.duplicates, {})
+        self.assertEqual(result.lost, [])
+        self.assertEqual(result.stored, len(result.numbers))
+
+    def test_deferred_paths_retry_collisions(self):
+        """Test that the request and group paths retry collisions before returning a number."""
+        for path in (writes.WRITE_MODE_REQUEST, writes.WRITE_MODE_GROUP):
+            with self.subTest(path=path):
+                TrackingNumberRequest.objects.all().delete()
+                result = run_stress(path=path, threads=4, calls=25, number_space=100)
+
+                self.assertGreater(result.retries, 0)
+                self.assertEqual(result.duplicates, {})
+                self.assertEqual(result.lost, [])
+                self.assertEqual(result.stored, len(result.numbers))
+
+    def test_duplicates_fail_the_run(self):
+        """Test that a number returned twice fails the run on every path."""
+        for path in (writes.WRITE_MODE_DIRECT, writes.WRITE_MODE_REQUEST, writes.WRITE_MODE_GROUP):
+            with self.subTest(path=path):
+                # Without audit rows nothing stops a colliding number from being returned
+                with patch.object(TrackingService, '_log_tracking_request'):
+                    with self.assertRaises(UniquenessError) as raised:
+                        run_stress(path=path, threads=2, calls=10, number_space=2)
+                self.assertTrue(raised.exception.result.duplicates)
+
+    def test_processes(self):
+        """Test that forked processes get unique numbers, each with an audit row."""
+        result = run_stress(processes=3, threads=4, calls=10)
+
+        self.assertEqual(result.calls, 120)
+        self.assertTrue(result.ok)
+
+    def test_command(self):
+        """Test the command report, cleanup and failure exit."""
+        out = StringIO()
+        call_command('stress_tracking_numbers', '--processes', '1', '--threads', '2', '--calls', '5', stdout=out)
+
+        self.assertIn('duplicates         0', out.getvalue())
+        self.assertFalse(TrackingNumberRequest.objects.filter(customer_slug=STRESS_SLUG).exists())
+        with patch.object(TrackingService, '_log_tracking_request'), self.assertRaises(CommandError):
+            call_command(
+                'stress_tracking_numbers', '--processes', '1', '--threads', '2', '--calls', '5', stdout=StringIO()
+            )
+        with self.assertRaises(CommandError):
+            call_command('stress_tracking_numbers', '--path', 'batch', stdout=StringIO())
@@ -0,0 +1,217 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone as django_timezone
+from rest_framework.test import APIClient
+
+from tracking.models import APIMetrics, APIMetricsRollup, RollupWatermark
+from tracking.sketches import DDSketch
+from tracking.timeseries import (
+    HOUR, HOUR_WATERMARK, MINUTE, choose_tier, compact_hours, compact_metrics, compact_minutes,
+    endpoint_route, floor_time, parse_duration, series, summarize
+)
+
+VERIFY_ROUTE = '/tracking-numbers/<str:tracking_number>/verify'
+
+
+class TimeseriesTestCase(TestCase):
+    """Base class writing api_metrics rows at chosen times."""
+
+    def setUp(self):
+        self.hour = floor_time(django_timezone.now(), 3600) - timedelta(hours=3)
+
+    def _call(self, at, response_time_ms=10, status_code=200, endpoint='/next-tracking-number'):
+        row = APIMetrics.objects.create(
+            endpoint=endpoint, method='GET', status_code=status_code,
+            response_time_ms=response_time_ms, correlation_id='timeseries-test'
+        )
+        # timestamp is auto_now_add, so backdate it afterwards
+        APIMetrics.objects.filter(pk=row.pk).update(timestamp=at)
+
+    def _minutes(self):
+        return APIMetricsRollup.objects.filter(resolution=MINUTE).order_by('bucket', 'endpoint')
+
+
+class HelpersTest(TestCase):
+    """Test cases for durations, bucket alignment, routes and tier choice."""
+
+    def test_parse_duration(self):
+        """Test that minutes, hours and days parse and anything else is refused."""
+        self.assertEqual(parse_duration('90m'), timedelta(minutes=90))
+        self.assertEqual(parse_duration('365d'), timedelta(days=365))
+        for value in ('', '0h', '1w', '1.5h', '24'):
+            with self.assertRaises(ValueError):
+                parse_duration(value)
+
+    def test_floor_time(self):
+        """Test that buckets are epoch-aligned in UTC."""
+        value = datetime(2024, 5, 6, 7, 8, 9, 123, tzinfo=timezone.utc)
+        self.assertEqual(floor_time(value, 60), datetime(2024, 5, 6, 7, 8, tzinfo=timezone.utc))
+        self.assertEqual(floor_time(value, 86400), datetime(2024, 5, 6, tzinfo=timezone.utc))
+
+    def test_endpoint_route(self):
+        """Test that paths collapse to their URL pattern."""
+        self.assertEqual(endpoint_route('/tracking-numbers/MYID0000000001/verify'), VERIFY_ROUTE)
+        self.assertEqual(endpoint_route('/next-tracking-number'), '/next-tracking-number')
+        self.assertEqual(endpoint_route('/wp-login.php'), '<unmatched>')
+
+    def test_choose_tier(self):
+        """Test that the coarsest tier fitting both resolution and window is chosen."""
+        now = django_timezone.now()
+        self.assertEqual(choose_tier(now - timedelta(days=1), 3600, now), HOUR)
+        self.assertEqual(choose_tier(now - timedelta(days=1), 300, now), MINUTE)
+        self.assertEqual(choose_tier(now - timedelta(days=365), 86400, now), HOUR)
+        self.assertIsNone(choose_tier(now - timedelta(days=90), 300, now))
+
+
+class CompactionTest(TimeseriesTestCase):
+    """Test cases for building the 1m and 1h tiers."""
+
+    def test_minutes(self):
+        """Test that calls fold into per-minute, per-route rows exactly once."""
+        self._call(self.hour + timedelta(seconds=5), 10, endpoint='/tracking-numbers/MYID0000000001/verify')
+        self._call(self.hour + timedelta(seconds=50), 30, 404, endpoint='/tracking-numbers/MYID0000000002/verify')
+        self._call(self.hour + timedelta(minutes=1), 20)
+
+        self.assertEqual(compact_minutes(batch_size=2), 3)
+        self.assertEqual(compact_minutes(batch_size=2), 0)
+
+        rows = list(self._minutes())
+        self.assertEqual(len(rows), 2)
+        self.assertEqual((rows[0].endpoint, rows[0].request_count, rows[0].error_count), (VERIFY_ROUTE, 2, 1))
+        self.assertEqual(rows[0].total_response_time_ms, 40)
+        self.assertEqual(rows[1].bucket, self.hour + timedelta(minutes=1))
+
+        self._call(self.hour + timedelta(seconds=90), 50)
+        compact_minutes(batch_size=10)
+        self.assertEqual(self._minutes().get(bucket=self.hour + timedelta(minutes=1)).request_count, 2)
+
+    def test_recent_calls_wait(self):
+        """Test that calls inside the safety lag are left for the next run."""
+        self._call(django_timezone.now())
+        self.assertEqual(compact_minutes(batch_size=10), 0)
+
+    def test_hours(self):
+        """Test that only hours the 1m tier has moved past are compacted."""
+        for minute in range(0, 120, 10):
+            self._call(self.hour + timedelta(minutes=minute), response_time_ms=minute + 1)
+        compact_minutes(batch_size=100)
+
+        self.assertEqual(compact_hours(), 1)
+        self.assertEqual(compact_hours(), 0)
+        hour = APIMetricsRollup.objects.get(resolution=HOUR)
+        self.assertEqual((hour.bucket, hour.request_count), (self.hour, 6))
+        self.assertEqual(DDSketch.from_dict(hour.latency_sketch).count, 6)
+        self.assertEqual(
+            RollupWatermark.objects.get(name=HOUR_WATERMARK).last_created_at, self.hour + timedelta(hours=1)
+        )
+
+    @override_settings(METRICS_RAW_RETENTION_HOURS=1, METRICS_MINUTE_RETENTION_DAYS=0, METRICS_HOUR_RETENTION_DAYS=365)
+    def test_retention(self):
+        """Test that each level is dropped after its retention, but only once the next level holds it."""
+        self._call(self.hour)
+        self._call(self.hour + timedelta(hours=1))
+        self._call(django_timezone.now() - timedelta(days=400))
+
+        stats = compact_metrics()
+
+        self.assertEqual(stats['rows'], 3)
+        # The newest call is still the 1m watermark, so it stays until a later call moves past it
+        self.assertEqual(stats['deleted'], {'raw': 2, '1m': 2, '1h': 1})
+        self.assertEqual(APIMetrics.objects.count(), 1)
+        self.assertEqual(list(self._minutes().values_list('bucket', flat=True)), [self.hour + timedelta(hours=1)])
+        self.assertEqual(list(APIMetricsRollup.objects.filter(resolution=HOUR).values_list('bucket', flat=True)), [self.hour])
+
+    def test_command(self):
+        """Test the compact_metrics command output."""
+        self._call(self.hour)
+        out = StringIO()
+        call_command('compact_metrics', stdout=out)
+        self.assertIn('Compacted 1 API calls into minutes and 0 hours', out.getvalue())
+
+
+class QueryTest(TimeseriesTestCase):
+    """Test cases for reading across tiers."""
+
+    def setUp(self):
+        super().setUp()
+        # Hour 0 ends up in the 1h tier, hour 1 in the 1m tier, the rest stays raw
+        self.latencies = []
+        for minute in range(0, 150, 5):
+            latency = 10 + minute * 3
+            self.latencies.append(latency)
+            self._call(self.hour + timedelta(minutes=minute), latency, 500 if minute == 60 else 200)
+        compact_minutes(batch_size=100)
+        compact_hours()
+        for minute in range(150, 170, 5):
+            self.latencies.append(minute)
+            self._call(self.hour + timedelta(minutes=minute), minute)
+
+    def test_series_reads_each_call_once(self):
+        """Test that 1h rows, 1m rows and raw calls add up without double counting."""
+        data = series(timedelta(hours=4), 3600)
+
+        self.assertEqual(data['tier'], HOUR)
+        self.assertEqual(data['requests'], len(self.latencies))
+        self.assertEqual(data['errors'], 1)
+        self.assertEqual([point['requests'] for point in data['series']], [12, 12, 10])
+        self.assertEqual(data['series'][1]['start'], (self.hour + timedelta(hours=1)).isoformat())
+
+    def test_percentiles_survive_downsampling(self):
+        """Test that percentiles from merged sketches stay within 1% of the exact value."""
+        data = series(timedelta(hours=4), 3600)
+        exact = sorted(self.latencies)[int(0.95 * (len(self.latencies) - 1))]
+        self.assertAlmostEqual(data['response_time_p95_ms'], exact, delta=exact * 0.011)
+
+        fine = series(timedelta(hours=4), 300)
+        self.assertEqual(fine['tier'], MINUTE)
+        self.assertEqual(fine['requests'], data['requests'])
+
+    def test_endpoint_filter(self):
+        """Test that a route filter applies to every tier."""
+        self._call(django_timezone.now() - timedelta(minutes=1), endpoint='/tracking-numbers/MYID0000000001/verify')
+        self.assertEqual(series(timedelta(hours=4), 3600, VERIFY_ROUTE)['requests'], 1)
+        self.assertEqual(series(timedelta(hours=4), 3600, '/next-tracking-number')['requests'], len(self.latencies))
+
+    def test_summarize(self):
+        """Test window totals used by /metrics."""
+        summary = summarize(self.hour)
+        self.assertEqual(summary['tier'], MINUTE)
+        self.assertEqual(summary['requests'], len(self.latencies))
+        self.assertEqual(summary['avg_response_time_ms'], round(sum(self.latencies) / len(self.latencies), 2))
+
+
+class MetricsSeriesViewTest(TimeseriesTestCase):
+    """Test cases for MetricsSeriesView."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.url = reverse('metrics-series')
+
+    def test_series(self):
+        """Test a valid query."""
+        self._call(self.hour)
+        response = self.client.get(self.url, {'window': '7d', 'resolution': '1h'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['tier'], HOUR)
+        self.assertEqual(response.data['requests'], 1)
+        self.assertEqual(response.data['series'][0]['start'], self.hour.isoformat())
+
+    def test_invalid_parameters(self):
+        """Test 400 responses for bad windows and resolutions."""
+        cases = [
+            ({'window': '1w'}, 'window'),
+            ({'resolution': '2m'}, 'resolution'),
+            ({'window': '30d', 'resolution': '1m'}, 'resolution'),
+            ({'window': '90d', 'resolution': '15m'}, 'resolution'),
+            ({'window': '1000d', 'resolution': '1d'}, 'resolution'),
+        ]
+        for params, field in cases:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(field, response.data['details'])
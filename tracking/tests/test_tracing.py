@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking import tracing
+
+VALID_PARAMS = {
+    'origin_country_id': 'MY',
+    'destination_country_id': 'ID',
+    'weight': '1.234',
+    'created_at': '2018-11-20T19:29:32+08:00',
+    'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics'
+}
+
+
+class SpanTest(TestCase):
+    """Test cases for span recording."""
+
+    def setUp(self):
+        tracing.stage_histograms.reset()
+
+    def test_unsampled_span_is_noop(self):
+        """Test spans outside a sampled request cost next to nothing."""
+        self.assertIs(tracing.span('validate'), tracing.NOOP_SPAN)
+
+        started = time.perf_counter_ns()
+        for _ in range(100000):
+            with tracing.span('validate'):
+                pass
+        per_span_us = (time.perf_counter_ns() - started) / 100000 / 1000
+        self.assertLess(per_span_us, 5)
+
+    @override_settings(TRACING_SAMPLE_RATE=0.0)
+    def test_sampling_off(self):
+        """Test no trace is started when sampling is off."""
+        self.assertIsNone(tracing.start_trace('abc'))
+
+    def test_traceparent_decides_sampling(self):
+        """Test an inbound traceparent keeps the caller's trace id and sampled flag."""
+        header = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-{}'
+        self.assertIsNone(tracing.start_trace('abc', header.format('00')))
+
+        token = tracing.start_trace('abc', header.format('01'))
+        with tracing.span('validate'):
+            pass
+        trace = tracing.finish_trace(token)
+
+        self.assertEqual(trace.trace_id, '0af7651916cd43dd8448eb211c80319c')
+        self.assertEqual(trace.spans[0].parent_id, 'b7ad6b7169203331')
+
+    @override_settings(TRACING_SAMPLE_RATE=1.0)
+    def test_nested_spans_and_histograms(self):
+        """Test spans nest, carry the correlation id and feed stage histograms."""
+        correlation_id = 'de619854-b59b-425e-9db4-943979e1bd49'
+        token = tracing.start_trace(correlation_id)
+        with tracing.span('http.request') as root:
+            with tracing.span('generate', attempt=0):
+                pass
+        trace = tracing.finish_trace(token)
+
+        generate, request = trace.spans
+        self.assertEqual(generate.parent_id, root.span_id)
+        self.assertEqual(trace.trace_id, correlation_id.replace('-', ''))
+        otlp = trace.to_otlp()['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+        self.assertIn({'key': 'correlation_id', 'value': {'stringValue': correlation_id}}, otlp['attributes'])
+        self.assertIn({'key': 'attempt', 'value': {'intValue': '0'}}, otlp['attributes'])
+        self.assertEqual(tracing.stage_histograms.summary()['generate']['count'], 1)
+
+
+class RequestTracingTest(TestCase):
+    """Test cases for end-to-end request tracing."""
+
+    def setUp(self):
+        tracing.stage_histograms.reset()
+        handle, self.path = tempfile.mkstemp(suffix='.ndjson')
+        os.close(handle)
+
+    def tearDown(self):
+        tracing.shutdown_exporter(timeout=5)
+        os.unlink(self.path)
+
+    def test_request_stages_are_exported(self):
+        """Test a sampled request exports every stage as OTLP/JSON."""
+        with override_settings(TRACING_SAMPLE_RATE=1.0, TRACING_EXPORT_PATH=self.path):
+            response = APIClient().get(reverse('next-tracking-number'), VALID_PARAMS)
+            tracing.get_exporter().flush(timeout=5)
+
+        self.assertEqual(response.status_code, 200)
+        with open(self.path) as source:
+            lines = source.readlines()
+        self.assertEqual(len(lines), 1)
+        spans = json.loads(lines[0])['resourceSpans'][0]['scopeSpans'][0]['spans']
+        names = {span['name'] for span in spans}
+        self.assertTrue({'http.request', 'validate', 'generate', 'audit_insert', 'serialize_response'} <= names)
+        self.assertTrue({'db_commit', 'metrics_insert'} & names)
+        self.assertEqual(len({span['traceId'] for span in spans}), 1)
+
+        out = StringIO()
+        call_command('trace_report', self.path, histogram=True, stdout=out)
+        self.assertIn('1 traces', out.getvalue())
+        self.assertIn('validate', out.getvalue())
+
+    def test_unsampled_request_exports_nothing(self):
+        """Test requests outside the sample leave no trace."""
+        with override_settings(TRACING_SAMPLE_RATE=0.0, TRACING_EXPORT_PATH=self.path):
+            APIClient().get(reverse('next-tracking-number'), VALID_PARAMS)
+
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.assertEqual(tracing.stage_histograms.summary(), {})
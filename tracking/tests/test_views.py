@@ -1,9 +1,11 @@
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from unittest.mock import patch, MagicMock
 import json
+from tracking.models import APIMetrics
 
 
 class NextTrackingNumberViewTest(TestCase):
@@ -151,20 +153,17 @@ class MetricsViewTest(TestCase):
     """Test cases for MetricsView."""
     
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.url = reverse('metrics')
     
-    @patch('tracking.models.TrackingNumberRequest.objects.filter')
-    @patch('tracking.models.APIMetrics.objects.filter')
-    def test_metrics_success(self, mock_api_metrics, mock_tracking_requests):
+    def test_metrics_success(self):
         """Test metrics endpoint returns data."""
-        # Mock database queries
-        mock_tracking_requests.return_value.aggregate.return_value = {'total_requests': 10}
-        mock_api_metrics.return_value.aggregate.return_value = {
-            'total_api_calls': 20,
-            'avg_response_time': 150.5,
-            'success_rate': 95.0
-        }
+        for status_code, response_time_ms in ((200, 100), (200, 150), (500, 200)):
+            APIMetrics.objects.create(
+                endpoint='/next-tracking-number', method='GET', status_code=status_code,
+                response_time_ms=response_time_ms, correlation_id='metrics-test'
+            )
         
         response = self.client.get(self.url)
         
@@ -172,6 +171,89 @@ class MetricsViewTest(TestCase):
         data = response.json()
         
         self.assertIn('tracking_requests', data)
-        self.assertIn('api_calls', data)
-        self.assertIn('avg_response_time_ms', data)
-        self.assertIn('success_rate_percent', data)
+        self.assertEqual(data['api_calls'], 3)
+        self.assertEqual(data['avg_response_time_ms'], 150.0)
+        self.assertEqual(data['success_rate_percent'], 66.67)
+        self.assertIn('response_time_p99_ms', data)
+
+
+class CustomerTrackingNumbersViewTest(TestCase):
+    """Test cases for CustomerTrackingNumbersView."""
+    
+    def setUp(self):
+        from datetime import datetime, timedelta, timezone
+        from decimal import Decimal
+        import uuid
+        from django.contrib.auth.models import User
+        from tracking.models import TrackingNumberRequest
+        
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('ops', is_staff=True))
+        self.customer_id = 'de619854-b59b-425e-9db4-943979e1bd49'
+        self.url = reverse('customer-tracking-numbers', args=[self.customer_id])
+        start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+        for i in range(7):
+            row = TrackingNumberRequest.objects.create(
+                tracking_number=f'MYID{i:09d}',
+                origin_country_id='MY',
+                destination_country_id='ID' if i % 2 == 0 else 'SG',
+                weight=Decimal('1.234'),
+                customer_id=self.customer_id if i < 6 else uuid.uuid4(),
+                customer_name='RedBox Logistics',
+                customer_slug='redbox-logistics',
+                request_timestamp=start,
+                correlation_id=str(uuid.uuid4())
+            )
+            # Rows 2 and 3 share a timestamp to exercise the id tie-breaker
+            TrackingNumberRequest.objects.filter(pk=row.pk).update(
+                created_at=start + timedelta(minutes=min(i, 2) if i < 4 else i)
+            )
+    
+    def collect(self, params):
+        numbers, cursor = [], None
+        while True:
+            response = self.client.get(self.url, {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.json()
+            numbers.extend(row['tracking_number'] for row in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                return numbers
+    
+    def test_pages_cover_history_newest_first(self):
+        """Test following cursors lists every number of the customer once."""
+        numbers = self.collect({'limit': 2})
+        
+        self.assertEqual(len(numbers), 6)
+        self.assertEqual(len(set(numbers)), 6)
+        self.assertEqual(numbers[:2], ['MYID000000005', 'MYID000000004'])
+        self.assertNotIn('MYID000000006', numbers)
+    
+    def test_lane_and_time_filters(self):
+        """Test lane and since/until narrow the history."""
+        self.assertEqual(
+            set(self.collect({'lane': 'MY-ID'})),
+            {'MYID000000000', 'MYID000000002', 'MYID000000004'}
+        )
+        self.assertEqual(
+            set(self.collect({'since': '2024-03-01T00:04:00Z'})),
+            {'MYID000000004', 'MYID000000005'}
+        )
+    
+    def test_requires_staff(self):
+        """Test anonymous and non-staff users cannot list a customer's history."""
+        from django.contrib.auth.models import User
+        
+        client = APIClient()
+        self.assertIn(client.get(self.url).status_code, (401, 403))
+        client.force_authenticate(User.objects.create_user('customer'))
+        self.assertEqual(client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_invalid_parameters(self):
+        """Test bad cursors and limits are rejected."""
+        response = self.client.get(self.url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cursor', response.json()['details'])
+        
+        response = self.client.get(self.url, {'limit': 1000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
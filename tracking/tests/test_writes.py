@@ -0,0 +1,209 @@
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import IntegrityError, OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from tracking import writes
+from tracking.models import TrackingNumberRequest, APIMetrics
+from tracking.services import TrackingNumberGenerator
+from tracking.writes import GroupCommitWriter
+
+
+REQUEST_PARAMS = {
+    'origin_country_id': 'MY',
+    'destination_country_id': 'ID',
+    'weight': '1.234',
+    'created_at': '2018-11-20T19:29:32+08:00',
+    'customer_id': 'de619854-b59b-425e-9db4-943979e1bd49',
+    'customer_name': 'RedBox Logistics',
+    'customer_slug': 'redbox-logistics'
+}
+
+
+def make_audit_row(tracking_number):
+    return TrackingNumberRequest(
+        tracking_number=tracking_number,
+        origin_country_id='MY',
+        destination_country_id='ID',
+        weight=Decimal('1.234'),
+        customer_id=uuid.uuid4(),
+        customer_name='RedBox Logistics',
+        customer_slug='redbox-logistics',
+        request_timestamp=datetime(2023, 11, 20, 19, 29, 32, tzinfo=timezone.utc),
+        correlation_id=str(uuid.uuid4())
+    )
+
+
+def make_metrics_row():
+    return APIMetrics(
+        endpoint='/next-tracking-number',
+        method='GET',
+        status_code=200,
+        response_time_ms=3,
+        correlation_id=str(uuid.uuid4())
+    )
+
+
+class UnitOfWorkTest(TestCase):
+    """Test cases for the request-scoped unit of work."""
+
+    def test_record_without_unit_of_work(self):
+        """Test record() declines when no unit of work is active."""
+        self.assertFalse(writes.record(make_metrics_row()))
+
+    def test_record_collects_rows(self):
+        """Test rows recorded inside a unit of work are written at the end."""
+        token = writes.begin_unit_of_work()
+        self.assertTrue(writes.record(make_metrics_row()))
+        self.assertFalse(APIMetrics.objects.exists())
+        writes.end_unit_of_work(token)
+
+        self.assertEqual(APIMetrics.objects.count(), 1)
+        self.assertFalse(writes.record(make_metrics_row()))
+
+    def test_insert_raises_on_duplicate(self):
+        """Test insert() reports a duplicate at once and the request's other rows still commit."""
+        writes.write_rows([make_audit_row('MYID000000001')])
+        token = writes.begin_unit_of_work(writes.WRITE_MODE_REQUEST)
+        try:
+            self.assertTrue(writes.insert(make_audit_row('MYID000000002')))
+            with self.assertRaises(IntegrityError):
+                writes.insert(make_audit_row('MYID000000001'))
+            writes.record(make_metrics_row())
+        finally:
+            writes.end_unit_of_work(token)
+
+        self.assertEqual(TrackingNumberRequest.objects.count(), 2)
+        self.assertEqual(APIMetrics.objects.count(), 1)
+
+    def test_write_rows_inserts_all_models(self):
+        """Test write_rows persists rows of several models."""
+        written = writes.write_rows([make_audit_row('MYID000000001'), make_metrics_row()])
+
+        self.assertEqual(written, 2)
+        self.assertEqual(TrackingNumberRequest.objects.count(), 1)
+        self.assertEqual(APIMetrics.objects.count(), 1)
+
+    def test_write_rows_isolates_duplicates(self):
+        """Test a duplicate row does not discard the rest of the batch."""
+        writes.write_rows([make_audit_row('MYID000000001')])
+
+        written = writes.write_rows([
+            make_audit_row('MYID000000001'),
+            make_audit_row('MYID000000002'),
+            make_metrics_row(),
+        ])
+
+        self.assertEqual(written, 2)
+        self.assertEqual(TrackingNumberRequest.objects.count(), 2)
+        self.assertEqual(APIMetrics.objects.count(), 1)
+
+    @override_settings(TRACKING_WRITE_MODE='request')
+    def test_request_commits_audit_and_metrics_together(self):
+        """Test one request writes its audit and metrics rows in one transaction."""
+        with patch('tracking.writes.write_rows', wraps=writes.write_rows) as mock_write:
+            response = APIClient().get(reverse('next-tracking-number'), REQUEST_PARAMS)
+
+        self.assertEqual(response.status_code, 200)
+        # Both rows went into the transaction the audit insert opened
+        mock_write.assert_not_called()
+        self.assertEqual(TrackingNumberRequest.objects.count(), 1)
+        self.assertEqual(APIMetrics.objects.count(), 1)
+
+    @override_settings(TRACKING_WRITE_MODE='request')
+    def test_request_retries_collision(self):
+        """Test a number that collides inside a request is replaced before the response."""
+        taken = make_audit_row('MYID000000001')
+        taken.save()
+        with patch.object(TrackingNumberGenerator, 'generate_tracking_number', side_effect=[
+            'MYID000000001', 'MYID000000002'
+        ]):
+            response = APIClient().get(reverse('next-tracking-number'), REQUEST_PARAMS)
+
+        self.assertEqual(response.data['tracking_number'], 'MYID000000002')
+        self.assertEqual(TrackingNumberRequest.objects.count(), 2)
+
+
+    @override_settings(TRACKING_WRITE_MODE='request')
+    def test_failed_commit_withholds_number(self):
+        """Test a request whose audit row does not commit answers 500 instead of the number."""
+        begin = writes.UnitOfWork.begin
+
+        def fail_commit():
+            raise OperationalError('disk I/O error')
+
+        def begin_then_fail(unit, using):
+            begin(unit, using)
+            # Runs as the stack unwinds, so the transaction rolls back like a failed COMMIT
+            unit.stack.callback(fail_commit)
+
+        with patch.object(writes.UnitOfWork, 'begin', begin_then_fail):
+            with self.assertLogs('tracking.middleware', 'ERROR'):
+                response = APIClient().get(reverse('next-tracking-number'), REQUEST_PARAMS)
+
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn(b'tracking_number', response.content)
+        self.assertFalse(TrackingNumberRequest.objects.exists())
+
+
+class GroupCommitWriterTest(TransactionTestCase):
+    """Test cases for GroupCommitWriter."""
+
+    def test_rows_from_many_requests_share_commits(self):
+        """Test submitted rows are all written with fewer commits than requests."""
+        writer = GroupCommitWriter(max_batch=100, max_delay_ms=50, max_depth=1000)
+        try:
+            for i in range(50):
+                writer.submit([make_audit_row(f'MYID{i:09d}'), make_metrics_row()])
+            self.assertTrue(writer.flush(timeout=10))
+        finally:
+            writer.stop(timeout=10)
+
+        self.assertEqual(TrackingNumberRequest.objects.count(), 50)
+        self.assertEqual(APIMetrics.objects.count(), 50)
+        self.assertEqual(writer.stats['rows'], 100)
+        self.assertLess(writer.stats['commits'], 50)
+        self.assertEqual(writer.depth, 0)
+
+    def test_full_buffer_writes_synchronously(self):
+        """Test rows beyond max_depth are written by the caller, not dropped."""
+        writer = GroupCommitWriter(max_batch=100, max_delay_ms=50, max_depth=1)
+        try:
+            writer.submit([make_metrics_row(), make_metrics_row()])
+            self.assertEqual(writer.stats['overflows'], 1)
+        finally:
+            writer.stop(timeout=10)
+
+        self.assertEqual(APIMetrics.objects.count(), 2)
+
+    def test_ticket_reports_dropped_rows(self):
+        """Test the ticket of a submit() lists the rows the commit rejected."""
+        writes.write_rows([make_audit_row('MYID000000001')])
+        writer = GroupCommitWriter(max_batch=100, max_delay_ms=50, max_depth=1000)
+        try:
+            duplicate = make_audit_row('MYID000000001')
+            ticket = writer.submit([duplicate, make_audit_row('MYID000000002')])
+            self.assertTrue(ticket.wait(timeout=10))
+        finally:
+            writer.stop(timeout=10)
+
+        self.assertEqual(ticket.dropped, [duplicate])
+        self.assertEqual(TrackingNumberRequest.objects.count(), 2)
+
+    @override_settings(TRACKING_WRITE_MODE='group')
+    def test_group_mode_retries_collision(self):
+        """Test a number rejected by the group commit is replaced before the response."""
+        self.addCleanup(writes.shutdown_group_writer)
+        writes.write_rows([make_audit_row('MYID000000001')])
+        with patch.object(TrackingNumberGenerator, 'generate_tracking_number', side_effect=[
+            'MYID000000001', 'MYID000000002'
+        ]):
+            response = APIClient().get(reverse('next-tracking-number'), REQUEST_PARAMS)
+
+        self.assertEqual(response.data['tracking_number'], 'MYID000000002')
+        self.assertEqual(TrackingNumberRequest.objects.count(), 2)
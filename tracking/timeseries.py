@@ -0,0 +1,386 @@
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from .models import APIMetrics, APIMetricsRollup, RollupWatermark
+from .sketches import DDSketch
+
+logger = logging.getLogger(__name__)
+
+RAW = 'raw'
+MINUTE = '1m'
+HOUR = '1h'
+
+# Bucket width of each rollup tier in seconds, finest first
+TIERS = {MINUTE: 60, HOUR: 3600}
+
+MINUTE_WATERMARK = 'api_metrics_1m'
+# Position is the end of the last compacted hour, not a row's created_at
+HOUR_WATERMARK = 'api_metrics_1h'
+
+RESOLUTIONS = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600, '6h': 21600, '1d': 86400}
+MAX_POINTS = 2000
+UNMATCHED_ENDPOINT = '<unmatched>'
+
+DURATION = re.compile(r'([1-9][0-9]*)([mhd])')
+DURATION_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def parse_duration(value: str) -> timedelta:
+    """Parse "90m", "24h" or "30d"; raises ValueError otherwise."""
+    match = DURATION.fullmatch(value or '')
+    if not match:
+        raise ValueError(f'Invalid duration: {value!r}')
+    return timedelta(seconds=int(match.group(1)) * DURATION_UNITS[match.group(2)])
+
+
+def floor_time(value: datetime, seconds: int) -> datetime:
+    """Start of the epoch-aligned bucket of `seconds` containing value."""
+    elapsed = int((value - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=elapsed - elapsed % seconds)
+
+
+def retention() -> Dict[str, timedelta]:
+    """How far back each tier is kept."""
+    return {
+        RAW: timedelta(hours=getattr(settings, 'METRICS_RAW_RETENTION_HOURS', 24)),
+        MINUTE: timedelta(days=getattr(settings, 'METRICS_MINUTE_RETENTION_DAYS', 30)),
+        HOUR: timedelta(days=getattr(settings, 'METRICS_HOUR_RETENTION_DAYS', 730)),
+    }
+
+
+@lru_cache(maxsize=4096)
+def endpoint_route(path: str) -> str:
+    """
+    URL pattern a request path was served by, e.g. /tracking-numbers/<str:tracking_number>/verify.
+
+    Rollups are keyed by route rather than path so numbers and customer IDs
+    in the URL do not turn into one series each.
+    """
+    try:
+        return '/' + resolve(path).route
+    except Resolver404:
+        return UNMATCHED_ENDPOINT
+
+
+class _Bucket:
+    """Call count, error count, latency total and latency sketch of one bucket."""
+
+    __slots__ = ('count', 'errors', 'total_ms', 'sketch')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0
+        self.sketch = DDSketch()
+
+    def add(self, status_code: int, response_time_ms: int):
+        self.count += 1
+        self.errors += status_code >= 400
+        self.total_ms += response_time_ms
+        self.sketch.add(response_time_ms)
+
+    def merge(self, count: int, errors: int, total_ms: int, sketch: DDSketch):
+        self.count += count
+        self.errors += errors
+        self.total_ms += total_ms
+        self.sketch.merge(sketch)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'requests': self.count,
+            'errors': self.errors,
+            'avg_response_time_ms': round(self.total_ms / self.count, 2) if self.count else 0,
+            'response_time_p50_ms': _round(self.sketch.quantile(0.5)),
+            'response_time_p95_ms': _round(self.sketch.quantile(0.95)),
+            'response_time_p99_ms': _round(self.sketch.quantile(0.99)),
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+def _apply(resolution: str, buckets: Dict[Tuple[datetime, str, str], _Bucket]):
+    """Merge buckets into existing rollup rows of a tier, creating missing ones."""
+    existing = {
+        (row.bucket, row.endpoint, row.method): row
+        for row in APIMetricsRollup.objects.select_for_update().filter(
+            resolution=resolution,
+            bucket__in={key[0] for key in buckets},
+            endpoint__in={key[1] for key in buckets},
+            method__in={key[2] for key in buckets},
+        )
+    }
+
+    to_create, to_update = [], []
+    for key, bucket in buckets.items():
+        row = existing.get(key)
+        if row is None:
+            row = APIMetricsRollup(resolution=resolution, bucket=key[0], endpoint=key[1], method=key[2])
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        sketch = DDSketch.from_dict(row.latency_sketch)
+        sketch.merge(bucket.sketch)
+        row.request_count += bucket.count
+        row.error_count += bucket.errors
+        row.total_response_time_ms += bucket.total_ms
+        row.latency_sketch = sketch.to_dict()
+
+    APIMetricsRollup.objects.bulk_create(to_create)
+    APIMetricsRollup.objects.bulk_update(
+        to_update, ['request_count', 'error_count', 'total_response_time_ms', 'latency_sketch']
+    )
+
+
+def compact_minutes(batch_size: int, max_batches: Optional[int] = None) -> int:
+    """
+    Fold api_metrics rows written since the watermark into the 1m tier.
+
+    Same scheme as update_rollups: (timestamp, id) order, one batch per
+    transaction with the watermark, and rows younger than
+    ROLLUP_SAFETY_LAG_SECONDS left for the next run. Returns rows processed.
+    """
+    horizon = timezone.now() - timedelta(seconds=getattr(settings, 'ROLLUP_SAFETY_LAG_SECONDS', 60))
+    processed = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=MINUTE_WATERMARK)
+
+            queryset = APIMetrics.objects.filter(timestamp__lt=horizon)
+            if watermark.last_created_at is not None:
+                queryset = queryset.filter(
+                    Q(timestamp__gt=watermark.last_created_at) |
+                    Q(timestamp=watermark.last_created_at, id__gt=int(watermark.last_id))
+                )
+            rows = list(
+                queryset.order_by('timestamp', 'id').values_list(
+                    'id', 'timestamp', 'endpoint', 'method', 'status_code', 'response_time_ms'
+                )[:batch_size]
+            )
+            if not rows:
+                break
+
+            buckets: Dict[Tuple[datetime, str, str], _Bucket] = defaultdict(_Bucket)
+            for _, stamp, endpoint, method, status_code, response_time_ms in rows:
+                buckets[(floor_time(stamp, TIERS[MINUTE]), endpoint_route(endpoint), method)].add(
+                    status_code, response_time_ms
+                )
+            _apply(MINUTE, buckets)
+
+            watermark.last_created_at = rows[-1][1]
+            watermark.last_id = str(rows[-1][0])
+            watermark.save()
+
+        processed += len(rows)
+        batches += 1
+        if len(rows) < batch_size:
+            break
+    return processed
+
+
+def compact_hours(hours_per_batch: int = 24) -> int:
+    """
+    Merge complete hours of the 1m tier into the 1h tier.
+
+    An hour is complete once the 1m watermark has moved past it. Returns the
+    number of hours compacted.
+    """
+    compacted = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=HOUR_WATERMARK)
+            minutes = RollupWatermark.objects.filter(name=MINUTE_WATERMARK).first()
+            if minutes is None or minutes.last_created_at is None:
+                break
+
+            complete = floor_time(minutes.last_created_at, TIERS[HOUR])
+            start = watermark.last_created_at
+            if start is None:
+                first = APIMetricsRollup.objects.filter(resolution=MINUTE).aggregate(first=Min('bucket'))['first']
+                if first is None:
+                    break
+                start = floor_time(first, TIERS[HOUR])
+            end = min(complete, start + timedelta(hours=hours_per_batch))
+            if start >= end:
+                break
+
+            buckets: Dict[Tuple[datetime, str, str], _Bucket] = defaultdict(_Bucket)
+            for row in APIMetricsRollup.objects.filter(
+                resolution=MINUTE, bucket__gte=start, bucket__lt=end
+            ).iterator():
+                buckets[(floor_time(row.bucket, TIERS[HOUR]), row.endpoint, row.method)].merge(
+                    row.request_count, row.error_count, row.total_response_time_ms,
+                    DDSketch.from_dict(row.latency_sketch)
+                )
+            if buckets:
+                _apply(HOUR, buckets)
+
+            watermark.last_created_at = end
+            watermark.save()
+        compacted += int((end - start).total_seconds()) // TIERS[HOUR]
+    return compacted
+
+
+def _delete_in_chunks(queryset, chunk_size: int) -> int:
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(id__in=ids).delete()[0]
+
+
+def expire(batch_size: int) -> Dict[str, int]:
+    """
+    Drop data older than each tier's retention.
+
+    Raw rows and 1m rows are only dropped once they have been folded into
+    the next tier, so a stalled compaction never loses data.
+    """
+    now = timezone.now()
+    keep = retention()
+    marks = {mark.name: mark.last_created_at for mark in RollupWatermark.objects.filter(
+        name__in=[MINUTE_WATERMARK, HOUR_WATERMARK]
+    )}
+    deleted = {RAW: 0, MINUTE: 0, HOUR: 0}
+
+    if marks.get(MINUTE_WATERMARK):
+        deleted[RAW] = _delete_in_chunks(
+            APIMetrics.objects.filter(timestamp__lt=min(now - keep[RAW], marks[MINUTE_WATERMARK])),
+            batch_size
+        )
+    if marks.get(HOUR_WATERMARK):
+        deleted[MINUTE] = _delete_in_chunks(
+            APIMetricsRollup.objects.filter(
+                resolution=MINUTE, bucket__lt=min(now - keep[MINUTE], marks[HOUR_WATERMARK])
+            ),
+            batch_size
+        )
+    deleted[HOUR] = _delete_in_chunks(
+        APIMetricsRollup.objects.filter(resolution=HOUR, bucket__lt=now - keep[HOUR]),
+        batch_size
+    )
+    return deleted
+
+
+def compact_metrics(batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> Dict[str, Any]:
+    """Run one compaction pass: raw to 1m, 1m to 1h, then retention."""
+    batch_size = batch_size or getattr(settings, 'ROLLUP_BATCH_SIZE', 5000)
+    stats = {
+        'rows': compact_minutes(batch_size, max_batches),
+        'hours': compact_hours(),
+        'deleted': expire(batch_size),
+    }
+    if stats['rows'] or stats['hours'] or any(stats['deleted'].values()):
+        logger.info(
+            f"Compacted {stats['rows']} API calls into minutes and {stats['hours']} hours; "
+            f"expired {stats['deleted']}"
+        )
+    return stats
+
+
+def choose_tier(since: datetime, step: int, now: Optional[datetime] = None) -> Optional[str]:
+    """Coarsest tier whose buckets divide `step` and whose retention reaches back to `since`."""
+    now = now or timezone.now()
+    keep = retention()
+    for tier in (HOUR, MINUTE):
+        if step % TIERS[tier] == 0 and since >= now - keep[tier]:
+            return tier
+    return None
+
+
+def _collect(since: datetime, tier: str, key: Callable[[datetime], Hashable],
+             endpoint: Optional[str] = None) -> Dict[Hashable, _Bucket]:
+    """
+    Gather every call since `since` into buckets, reading each period from one source.
+
+    The chosen tier covers everything up to its watermark, the 1m tier the
+    hours after that, and api_metrics the rows not yet compacted. Those sets
+    do not overlap, so nothing is counted twice.
+    """
+    marks = {mark.name: mark for mark in RollupWatermark.objects.filter(
+        name__in=[MINUTE_WATERMARK, HOUR_WATERMARK]
+    )}
+    buckets: Dict[Hashable, _Bucket] = defaultdict(_Bucket)
+
+    rollups = APIMetricsRollup.objects.filter(bucket__gte=since)
+    if endpoint:
+        rollups = rollups.filter(endpoint=endpoint)
+    minutes = rollups.filter(resolution=MINUTE)
+    hour_mark = marks.get(HOUR_WATERMARK)
+    if tier == HOUR and hour_mark and hour_mark.last_created_at:
+        minutes = minutes.filter(bucket__gte=hour_mark.last_created_at)
+        sources = [rollups.filter(resolution=HOUR, bucket__lt=hour_mark.last_created_at), minutes]
+    else:
+        sources = [minutes]
+    for source in sources:
+        for bucket, count, errors, total_ms, sketch in source.values_list(
+            'bucket', 'request_count', 'error_count', 'total_response_time_ms', 'latency_sketch'
+        ).iterator():
+            buckets[key(bucket)].merge(count, errors, total_ms, DDSketch.from_dict(sketch))
+
+    raw = APIMetrics.objects.filter(timestamp__gte=since)
+    minute_mark = marks.get(MINUTE_WATERMARK)
+    if minute_mark and minute_mark.last_created_at:
+        raw = raw.filter(
+            Q(timestamp__gt=minute_mark.last_created_at) |
+            Q(timestamp=minute_mark.last_created_at, id__gt=int(minute_mark.last_id))
+        )
+    for stamp, path, status_code, response_time_ms in raw.values_list(
+        'timestamp', 'endpoint', 'status_code', 'response_time_ms'
+    ).iterator():
+        if endpoint and endpoint_route(path) != endpoint:
+            continue
+        buckets[key(stamp)].add(status_code, response_time_ms)
+    return buckets
+
+
+def series(window: timedelta, step: int, endpoint: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Per-bucket call counts, error counts and latency percentiles over a window.
+
+    Buckets are `step` seconds wide and epoch-aligned, so the first one may
+    start up to one step before the window; empty buckets are omitted.
+    Raises ValueError when no tier holds the window at that resolution.
+    """
+    now = timezone.now()
+    since = floor_time(now - window, step)
+    tier = choose_tier(since, step, now)
+    if tier is None:
+        raise ValueError(f'No tier keeps {step}s buckets for that long')
+
+    buckets = _collect(since, tier, lambda stamp: floor_time(stamp, step), endpoint)
+    total = _Bucket()
+    points = []
+    for start in sorted(buckets):
+        bucket = buckets[start]
+        total.merge(bucket.count, bucket.errors, bucket.total_ms, bucket.sketch)
+        points.append({'start': start.isoformat(), **bucket.summary()})
+    return {'since': since.isoformat(), 'tier': tier, **total.summary(), 'series': points}
+
+
+def summarize(since: datetime, endpoint: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Call totals and latency percentiles since a point in time.
+
+    Uses the coarsest tier whose buckets are at most 1% of the window, so
+    the window start is rounded down by at most that much.
+    """
+    window = (timezone.now() - since).total_seconds()
+    tier = HOUR if TIERS[HOUR] * 100 <= window else MINUTE
+    buckets = _collect(floor_time(since, TIERS[tier]), tier, lambda stamp: None, endpoint)
+    return {'tier': tier, **buckets[None].summary()}
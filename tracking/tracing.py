@@ -0,0 +1,319 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar, Token
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .lifecycle import register_shutdown_hook
+from .linelog import BackgroundLineWriter
+from .sketches import DDSketch
+
+logger = logging.getLogger(__name__)
+
+# W3C trace context: version-traceid-parentid-flags
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+
+class _NoopSpan:
+    """Stand-in returned by span() when the request is not sampled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """One timed stage of a sampled request."""
+
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'kind', 'attributes',
+                 'start_ns', 'end_ns', 'error', '_token')
+
+    def __init__(self, trace: 'Trace', name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = None
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def start(self) -> 'Span':
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else self.trace.parent_span_id
+        self._token = _current_span.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def end(self, error: Optional[BaseException] = None):
+        self.end_ns = time.perf_counter_ns()
+        if error is not None:
+            self.error = f'{type(error).__name__}: {error}'
+        _current_span.reset(self._token)
+        self.trace.spans.append(self)
+
+    @property
+    def duration_ns(self) -> int:
+        return self.end_ns - self.start_ns
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+        return False
+
+
+class Trace:
+    """The spans of one sampled request, anchored to wall-clock time."""
+
+    __slots__ = ('trace_id', 'parent_span_id', 'correlation_id', 'spans', 'wall_ns', 'perf_ns')
+
+    def __init__(self, correlation_id: str, trace_id: Optional[str] = None,
+                 parent_span_id: Optional[str] = None):
+        self.trace_id = trace_id or _trace_id_for(correlation_id)
+        self.parent_span_id = parent_span_id
+        self.correlation_id = correlation_id
+        self.spans: List[Span] = []
+        self.wall_ns = time.time_ns()
+        self.perf_ns = time.perf_counter_ns()
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Render as an OTLP/JSON ExportTraceServiceRequest."""
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': _otlp_attributes({
+                    'service.name': getattr(settings, 'TRACING_SERVICE_NAME', 'tracking-api'),
+                    'process.pid': os.getpid(),
+                })},
+                'scopeSpans': [{
+                    'scope': {'name': 'tracking'},
+                    'spans': [self._otlp_span(span) for span in self.spans],
+                }],
+            }]
+        }
+
+    def _otlp_span(self, span: Span) -> Dict[str, Any]:
+        offset = self.wall_ns - self.perf_ns
+        return {
+            'traceId': self.trace_id,
+            'spanId': span.span_id,
+            'parentSpanId': span.parent_id or '',
+            'name': span.name,
+            'kind': span.kind,
+            'startTimeUnixNano': str(span.start_ns + offset),
+            'endTimeUnixNano': str(span.end_ns + offset),
+            'attributes': _otlp_attributes({'correlation_id': self.correlation_id, **span.attributes}),
+            'status': {'code': 2, 'message': span.error} if span.error else {},
+        }
+
+
+def _trace_id_for(correlation_id: str) -> str:
+    """Use the correlation id as the trace id when it is a UUID, so the two join."""
+    candidate = correlation_id.replace('-', '').lower()
+    if len(candidate) == 32 and all(c in '0123456789abcdef' for c in candidate):
+        return candidate
+    return os.urandom(16).hex()
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {'boolValue': value}
+        elif isinstance(value, int):
+            typed = {'intValue': str(value)}
+        elif isinstance(value, float):
+            typed = {'doubleValue': value}
+        else:
+            typed = {'stringValue': str(value)}
+        converted.append({'key': key, 'value': typed})
+    return converted
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('tracking_trace', default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar('tracking_span', default=None)
+
+
+def span(name: str, **attributes):
+    """
+    Time a stage of the current request.
+
+    Use as a context manager. When the request is not sampled this returns
+    a shared no-op object, so an unsampled stage costs one contextvar read.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return NOOP_SPAN
+    return Span(trace, name, **attributes)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def start_trace(correlation_id: str, traceparent: Optional[str] = None) -> Optional[Token]:
+    """
+    Decide whether to sample this request and, if so, make it the current trace.
+
+    An inbound W3C traceparent header keeps the caller's trace id and
+    sampling decision; otherwise TRACING_SAMPLE_RATE applies. Returns a token
+    for finish_trace, or None when the request is not sampled.
+    """
+    trace_id = parent_span_id = None
+    if traceparent:
+        match = TRACEPARENT.match(traceparent.strip().lower())
+        if match:
+            trace_id, parent_span_id, flags = match.groups()
+            if not int(flags, 16) & 1:
+                return None
+    if trace_id is None:
+        rate = getattr(settings, 'TRACING_SAMPLE_RATE', 0.0)
+        if rate <= 0 or random.random() >= rate:
+            return None
+    return _current_trace.set(Trace(correlation_id, trace_id, parent_span_id))
+
+
+def finish_trace(token: Token) -> Optional[Trace]:
+    """Detach the current trace, record its stage timings and queue it for export."""
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    if trace is None:
+        return None
+    stage_histograms.record(trace)
+    exporter = get_exporter()
+    if exporter is not None:
+        exporter.submit(trace)
+    return trace
+
+
+class StageHistograms:
+    """Per-process duration sketches (milliseconds) keyed by span name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sketches: Dict[str, DDSketch] = {}
+
+    def record(self, trace: Trace):
+        with self._lock:
+            for finished in trace.spans:
+                sketch = self._sketches.get(finished.name)
+                if sketch is None:
+                    sketch = self._sketches[finished.name] = DDSketch()
+                sketch.add(finished.duration_ns / 1e6)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: summarize_sketch(sketch)
+                for name, sketch in sorted(self._sketches.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._sketches.clear()
+
+
+def summarize_sketch(sketch: DDSketch) -> Dict[str, Any]:
+    return {
+        'count': sketch.count,
+        'p50_ms': _round(sketch.quantile(0.5)),
+        'p95_ms': _round(sketch.quantile(0.95)),
+        'p99_ms': _round(sketch.quantile(0.99)),
+        'max_ms': _round(sketch.quantile(1.0)),
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+stage_histograms = StageHistograms()
+
+
+class FileSpanExporter(BackgroundLineWriter):
+    """
+    Append finished traces to a file as OTLP/JSON, one request per line.
+
+    The format is what an OTLP/HTTP collector accepts, so the file can be
+    replayed into one.
+    """
+
+    def __init__(self, path: str, max_queue: int = 10000):
+        super().__init__(path, _encode_trace, name='span-exporter', max_queue=max_queue)
+
+
+def _encode_trace(trace: Trace) -> str:
+    return json.dumps(trace.to_otlp(), separators=(',', ':'))
+
+
+_exporter: Optional[FileSpanExporter] = None
+_exporter_pid: Optional[int] = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter() -> Optional[FileSpanExporter]:
+    """Return this process' exporter, or None when TRACING_EXPORT_PATH is unset."""
+    global _exporter, _exporter_pid
+    path = getattr(settings, 'TRACING_EXPORT_PATH', '')
+    if not path:
+        return None
+    pid = os.getpid()
+    if _exporter is not None and _exporter_pid == pid and _exporter.path == path:
+        return _exporter
+    with _exporter_lock:
+        if _exporter is None or _exporter_pid != pid or _exporter.path != path:
+            _exporter = FileSpanExporter(path)
+            _exporter_pid = pid
+    return _exporter
+
+
+def shutdown_exporter(timeout: Optional[float] = None):
+    """Write out queued traces and stop the exporter thread."""
+    global _exporter
+    if _exporter is not None and _exporter_pid == os.getpid():
+        _exporter.stop(timeout)
+        _exporter = None
+
+
+register_shutdown_hook('span_exporter', shutdown_exporter)
+
+
+def read_otlp_durations(lines) -> Tuple[Dict[str, DDSketch], int]:
+    """Build per-span-name duration sketches (ms) from OTLP/JSON lines; returns (sketches, traces)."""
+    sketches: Dict[str, DDSketch] = {}
+    traces = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        traces += 1
+        for resource in json.loads(line).get('resourceSpans', []):
+            for scope in resource.get('scopeSpans', []):
+                for item in scope.get('spans', []):
+                    duration = (int(item['endTimeUnixNano']) - int(item['startTimeUnixNano'])) / 1e6
+                    sketches.setdefault(item['name'], DDSketch()).add(duration)
+    return sketches, traces
@@ -1,8 +1,49 @@
 from django.urls import path
-from .views import NextTrackingNumberView, HealthCheckView, MetricsView
+from .views import (
+    NextTrackingNumberView, TrackingNumberBatchView, HealthCheckView, LivenessView, ReadinessView,
+    MetricsView, MetricsSeriesView, TrackingRequestExportView, LaneDailyRollupView, CustomerDailyRollupView,
+    CustomerTrackingNumbersView, TrackingNumberVerifyView, TrackingRequestLookupView, ProfilerView,
+    ProfileListView, ProfileDownloadView, NumberLeaseView, NumberLeaseDetailView, NumberLeaseAssignmentsView
+)
 
 urlpatterns = [
     path('next-tracking-number', NextTrackingNumberView.as_view(), name='next-tracking-number'),
+    path('tracking-numbers/batch', TrackingNumberBatchView.as_view(), name='tracking-numbers-batch'),
+    path('leases', NumberLeaseView.as_view(), name='number-leases'),
+    path('leases/<uuid:lease_id>', NumberLeaseDetailView.as_view(), name='number-lease-detail'),
+    path(
+        'leases/<uuid:lease_id>/assignments',
+        NumberLeaseAssignmentsView.as_view(),
+        name='number-lease-assignments'
+    ),
     path('health', HealthCheckView.as_view(), name='health-check'),
+    path('health/live', LivenessView.as_view(), name='health-live'),
+    path('health/ready', ReadinessView.as_view(), name='health-ready'),
     path('metrics', MetricsView.as_view(), name='metrics'),
+    path('metrics/series', MetricsSeriesView.as_view(), name='metrics-series'),
+    path('exports/tracking-requests', TrackingRequestExportView.as_view(), name='export-tracking-requests'),
+    path('analytics/lanes/<str:lane>/daily', LaneDailyRollupView.as_view(), name='lane-daily-rollup'),
+    path(
+        'analytics/customers/<uuid:customer_id>/daily',
+        CustomerDailyRollupView.as_view(),
+        name='customer-daily-rollup'
+    ),
+    path(
+        'customers/<uuid:customer_id>/tracking-numbers',
+        CustomerTrackingNumbersView.as_view(),
+        name='customer-tracking-numbers'
+    ),
+    path(
+        'tracking-numbers/<str:tracking_number>/verify',
+        TrackingNumberVerifyView.as_view(),
+        name='tracking-number-verify'
+    ),
+    path(
+        'tracking-requests/<str:tracking_number>',
+        TrackingRequestLookupView.as_view(),
+        name='tracking-request-lookup'
+    ),
+    path('debug/profile', ProfilerView.as_view(), name='profiler'),
+    path('debug/profiles', ProfileListView.as_view(), name='profile-list'),
+    path('debug/profiles/<str:name>', ProfileDownloadView.as_view(), name='profile-download'),
 ]
@@ -1,18 +1,28 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import never_cache
-import uuid
+import os
 import logging
+import re
 import time
 
 from .serializers import TrackingNumberRequestSerializer, TrackingNumberResponseSerializer
-from .services import TrackingService
+from .services import TrackingService, find_tracking_request
 from .exceptions import TrackingAPIException
+from .health import readiness_monitor
+from .correlation import current_correlation_id
+from .replicas import read_database, replica_reads
+from . import tracing
 
 logger = logging.getLogger(__name__)
 
+TRACKING_NUMBER = re.compile(r'[A-Z0-9]{1,16}')
+
 
 @method_decorator(never_cache, name='dispatch')
 class NextTrackingNumberView(APIView):
@@ -38,10 +48,8 @@ class NextTrackingNumberView(APIView):
     def get(self, request):
         """Handle GET request for tracking number generation."""
         start_time = time.time()
-        correlation_id = str(uuid.uuid4())
-        
-        # Add correlation ID to request for tracking
-        request.correlation_id = correlation_id
+        # Set once per request by RequestLoggingMiddleware
+        correlation_id = current_correlation_id()
         
         logger.info(
             "Received tracking number generation request",
@@ -57,7 +65,9 @@ class NextTrackingNumberView(APIView):
             # Validate input parameters
             serializer = TrackingNumberRequestSerializer(data=request.query_params)
             
-            if not serializer.is_valid():
+            with tracing.span('validate'):
+                is_valid = serializer.is_valid()
+            if not is_valid:
                 logger.warning(
                     f"Invalid request parameters: {serializer.errors}",
                     extra={'correlation_id': correlation_id}
@@ -78,7 +88,9 @@ class NextTrackingNumberView(APIView):
             )
             
             # Serialize response
-            response_serializer = TrackingNumberResponseSerializer(result)
+            with tracing.span('serialize_response'):
+                response_serializer = TrackingNumberResponseSerializer(result)
+                response_data = response_serializer.data
             
             # Log successful response
             response_time = int((time.time() - start_time) * 1000)
@@ -91,7 +103,7 @@ class NextTrackingNumberView(APIView):
                 }
             )
             
-            return Response(response_serializer.data, status=status.HTTP_200_OK)
+            return Response(response_data, status=status.HTTP_200_OK)
             
         except TrackingAPIException as e:
             response_time = int((time.time() - start_time) * 1000)
@@ -130,6 +142,263 @@ class NextTrackingNumberView(APIView):
             )
 
 
+class TrackingNumberBatchView(APIView):
+    """
+    API endpoint to generate tracking numbers for many parcels of one customer.
+    
+    POST /tracking-numbers/batch
+    
+    Body (JSON):
+    - customer_id, customer_name, customer_slug: as for /next-tracking-number
+    - parcels: list of {origin_country_id, destination_country_id, weight, created_at}
+    
+    Either every parcel is valid and all numbers are issued (in parcel order),
+    or nothing is issued and the errors are returned by parcel index.
+    """
+    
+    max_reported_errors = 100
+    
+    def post(self, request):
+        """Handle POST request for batch tracking number generation."""
+        from .bulk import issue_batch
+        from .serializers import TrackingNumberBatchSerializer
+        
+        start_time = time.time()
+        correlation_id = current_correlation_id()
+        
+        serializer = TrackingNumberBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    'error': 'Invalid request parameters',
+                    'details': serializer.errors,
+                    'correlation_id': correlation_id
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        data = serializer.validated_data
+        customer = {key: data[key] for key in ('customer_id', 'customer_name', 'customer_slug')}
+        try:
+            result = issue_batch(data['parcels'], customer, correlation_id)
+        except Exception as e:
+            logger.error(
+                f"Unexpected error in batch generation: {str(e)}",
+                extra={'correlation_id': correlation_id}
+            )
+            return Response(
+                {'error': 'Internal server error', 'correlation_id': correlation_id},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        if result.errors:
+            reported = dict(sorted(result.errors.items())[:self.max_reported_errors])
+            return Response(
+                {
+                    'error': 'Invalid request parameters',
+                    'details': {'parcels': reported},
+                    'invalid_count': len(result.errors),
+                    'correlation_id': correlation_id
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if result.written != len(result.tracking_numbers):
+            # Never hand out numbers without their audit rows
+            logger.error(
+                f"Batch logged {result.written} of {len(result.tracking_numbers)} tracking numbers",
+                extra={'correlation_id': correlation_id}
+            )
+            return Response(
+                {'error': 'Internal server error', 'correlation_id': correlation_id},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        response_time = int((time.time() - start_time) * 1000)
+        logger.info(
+            f"Generated {len(result.tracking_numbers)} tracking numbers in {response_time}ms",
+            extra={
+                'correlation_id': correlation_id,
+                'customer_id': customer['customer_id'],
+                'response_time_ms': response_time
+            }
+        )
+        return Response({
+            'count': len(result.tracking_numbers),
+            'tracking_numbers': result.tracking_numbers,
+            'correlation_id': correlation_id,
+        })
+
+
+def _lease_body(lease) -> dict:
+    from .leases import lease_range
+    
+    first, last = lease_range(lease)
+    return {
+        'lease_id': str(lease.id),
+        'origin_country_id': lease.origin_country_id,
+        'destination_country_id': lease.destination_country_id,
+        'first_tracking_number': first,
+        'last_tracking_number': last,
+        'count': lease.count,
+        'expires_at': lease.expires_at.isoformat(),
+        'status': lease.status,
+    }
+
+
+class NumberLeaseView(APIView):
+    """
+    API endpoint to lease a block of tracking numbers for offline label printing.
+    
+    POST /leases
+    
+    Body (JSON):
+    - origin_country_id, destination_country_id, customer_id, customer_name,
+      customer_slug: as for /next-tracking-number
+    - count: numbers to reserve, up to LEASE_MAX_NUMBERS
+    - ttl_seconds: lease lifetime (default LEASE_DEFAULT_TTL_SECONDS)
+    
+    The numbers are consecutive, so the client can derive every one of them
+    from first_tracking_number and last_tracking_number; a lease is stored
+    as one row whatever its size.
+    """
+    
+    def post(self, request):
+        """Reserve the numbers and return the lease."""
+        from .leases import create_lease
+        from .serializers import NumberLeaseRequestSerializer
+        
+        correlation_id = current_correlation_id()
+        serializer = NumberLeaseRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    'error': 'Invalid request parameters',
+                    'details': serializer.errors,
+                    'correlation_id': correlation_id
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        data = serializer.validated_data
+        customer = {key: data[key] for key in ('customer_id', 'customer_name', 'customer_slug')}
+        ttl_seconds = data.get('ttl_seconds', getattr(settings, 'LEASE_DEFAULT_TTL_SECONDS', 86400))
+        try:
+            lease = create_lease(
+                data['origin_country_id'], data['destination_country_id'], customer, data['count'], ttl_seconds
+            )
+        except ValueError as e:
+            return Response(
+                {'error': str(e), 'correlation_id': correlation_id},
+                status=status.HTTP_409_CONFLICT
+            )
+        except Exception as e:
+            logger.error(
+                f"Unexpected error leasing tracking numbers: {str(e)}",
+                extra={'correlation_id': correlation_id}
+            )
+            return Response(
+                {'error': 'Internal server error', 'correlation_id': correlation_id},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        logger.info(
+            f"Leased {lease.count} tracking numbers as lease {lease.id}",
+            extra={'correlation_id': correlation_id, 'customer_id': customer['customer_id']}
+        )
+        return Response({**_lease_body(lease), 'correlation_id': correlation_id}, status=status.HTTP_201_CREATED)
+
+
+class NumberLeaseDetailView(APIView):
+    """
+    Show a lease and how many of its numbers have been reported.
+    
+    GET /leases/<lease_id>
+    
+    "assigned" counts reported numbers already committed; reports are
+    written in the background, so it can lag a report by a moment.
+    """
+    
+    def get(self, request, lease_id):
+        """Return the lease, or 404."""
+        from .leases import lease_usage
+        from .models import NumberLease
+        
+        lease = NumberLease.objects.filter(id=lease_id).first()
+        if lease is None:
+            return Response({'error': 'Lease not found'}, status=status.HTTP_404_NOT_FOUND)
+        if lease.status == NumberLease.STATUS_ACTIVE:
+            assigned, _ = lease_usage(lease)
+        else:
+            assigned = lease.assigned
+        return Response({**_lease_body(lease), 'assigned': assigned, 'returned': lease.returned})
+
+
+class NumberLeaseAssignmentsView(APIView):
+    """
+    API endpoint for clients to report the leased numbers they printed.
+    
+    POST /leases/<lease_id>/assignments
+    
+    Body (JSON):
+    - assignments: list of {tracking_number, weight, assigned_at}, up to
+      LEASE_MAX_ASSIGNMENTS
+    
+    Returns 202 once the rows are queued for the group commit writer.
+    Numbers outside the lease are rejected by index; numbers reported
+    before are counted as duplicates, so a report can be retried safely.
+    """
+    
+    max_reported_errors = 100
+    
+    def post(self, request, lease_id):
+        """Queue audit rows for the reported numbers."""
+        from .leases import LeaseClosed, reconcile
+        from .models import NumberLease
+        from .serializers import LeaseAssignmentReportSerializer
+        
+        correlation_id = current_correlation_id()
+        lease = NumberLease.objects.filter(id=lease_id).first()
+        if lease is None:
+            return Response({'error': 'Lease not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        serializer = LeaseAssignmentReportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    'error': 'Invalid request parameters',
+                    'details': serializer.errors,
+                    'correlation_id': correlation_id
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            result = reconcile(lease, serializer.validated_data['assignments'], correlation_id)
+        except LeaseClosed as e:
+            return Response(
+                {'error': str(e), 'correlation_id': correlation_id},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        logger.info(
+            f"Accepted {result['accepted']} assignments for lease {lease.id} "
+            f"({result['duplicates']} duplicates, {len(result['rejected'])} rejected)",
+            extra={'correlation_id': correlation_id}
+        )
+        return Response(
+            {
+                'lease_id': str(lease.id),
+                'accepted': result['accepted'],
+                'duplicates': result['duplicates'],
+                'rejected': dict(sorted(result['rejected'].items())[:self.max_reported_errors]),
+                'rejected_count': len(result['rejected']),
+                'correlation_id': correlation_id,
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
 class HealthCheckView(APIView):
     """Health check endpoint for monitoring."""
     
@@ -142,41 +411,78 @@ class HealthCheckView(APIView):
         })
 
 
+class LivenessView(APIView):
+    """Liveness probe: the worker is up and able to serve requests."""
+    
+    def get(self, request):
+        """Return liveness status without touching any dependency."""
+        return Response({
+            'status': 'alive',
+            'timestamp': time.time()
+        })
+
+
+class ReadinessView(APIView):
+    """Readiness probe backed by cached dependency checks."""
+    
+    def get(self, request):
+        """Return the cached readiness snapshot, 503 if any check fails."""
+        snapshot = readiness_monitor.snapshot()
+        response_status = (
+            status.HTTP_200_OK if snapshot['status'] == 'ready'
+            else status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        return Response(snapshot, status=response_status)
+
+
 class MetricsView(APIView):
-    """Basic metrics endpoint for monitoring."""
+    """
+    Basic metrics endpoint for monitoring.
+    
+    GET /metrics?window=24h
+    
+    Query Parameters:
+    - window: "1h", "24h" (default) or "7d"
+    
+    The aggregates are cached per window (see tracking.metrics), so a burst
+    of scrapers runs them once; "stale" is true while a refresh is pending.
+    """
     
     def get(self, request):
         """Return basic API metrics."""
+        from .metrics import WINDOWS, DEFAULT_WINDOW, metrics_cache
+        
+        window = request.query_params.get('window', DEFAULT_WINDOW)
+        if window not in WINDOWS:
+            return Response(
+                {
+                    'error': 'Invalid request parameters',
+                    'details': {'window': [f"Must be one of: {', '.join(WINDOWS)}."]}
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         try:
-            from .models import TrackingNumberRequest, APIMetrics
-            from django.db.models import Count, Avg
-            from datetime import datetime, timedelta
+            from datetime import datetime
             
-            # Get metrics for last 24 hours
-            last_24h = datetime.now() - timedelta(hours=24)
+            aggregates, age, stale = metrics_cache.get(window)
+            data = {
+                **aggregates,
+                'cache_age_seconds': round(age, 3),
+                'stale': stale,
+                'timestamp': datetime.now().isoformat()
+            }
             
-            tracking_stats = TrackingNumberRequest.objects.filter(
-                created_at__gte=last_24h
-            ).aggregate(
-                total_requests=Count('id')
-            )
+            if getattr(settings, 'DB_POOL_ENABLED', False):
+                from .db_backends.postgresql_pool.base import pool_stats
+                data['db_pool'] = pool_stats()
             
-            api_stats = APIMetrics.objects.filter(
-                timestamp__gte=last_24h
-            ).aggregate(
-                total_api_calls=Count('id'),
-                avg_response_time=Avg('response_time_ms'),
-                success_rate=Count('id', filter=models.Q(status_code__lt=400)) * 100.0 / Count('id')
-            )
+            # Per-stage latency of sampled requests served by this worker
+            stages = tracing.stage_histograms.summary()
+            if stages:
+                data['stages'] = stages
             
-            return Response({
-                'period': '24h',
-                'tracking_requests': tracking_stats['total_requests'] or 0,
-                'api_calls': api_stats['total_api_calls'] or 0,
-                'avg_response_time_ms': round(api_stats['avg_response_time'] or 0, 2),
-                'success_rate_percent': round(api_stats['success_rate'] or 0, 2),
-                'timestamp': datetime.now().isoformat()
-            })
+            return Response(data)
             
         except Exception as e:
             logger.error(f"Error retrieving metrics: {str(e)}")
@@ -184,3 +490,431 @@ class MetricsView(APIView):
                 {'error': 'Unable to retrieve metrics'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+@method_decorator(replica_reads(), name='get')
+class MetricsSeriesView(APIView):
+    """
+    API call time series from the downsampled metrics tiers.
+    
+    GET /metrics/series?window=30d&resolution=1h&endpoint=/next-tracking-number
+    
+    Query Parameters:
+    - window: how far back, e.g. "90m", "24h" (default) or "365d"
+    - resolution: bucket width, one of 1m, 5m (default), 15m, 1h, 6h, 1d
+    - endpoint: optional URL route, e.g. /tracking-numbers/<str:tracking_number>/verify
+    
+    The coarsest tier (1m or 1h rollups, see tracking.timeseries) that
+    still keeps the window at that resolution answers the query.
+    """
+    
+    def get(self, request):
+        """Return per-bucket call counts, errors and latency percentiles."""
+        from .timeseries import MAX_POINTS, RESOLUTIONS, parse_duration, series
+        
+        errors = {}
+        window = request.query_params.get('window', '24h')
+        resolution = request.query_params.get('resolution', '5m')
+        endpoint = request.query_params.get('endpoint') or None
+        try:
+            duration = parse_duration(window)
+        except ValueError:
+            errors['window'] = ['Must be a number followed by m, h or d, e.g. "24h".']
+        if resolution not in RESOLUTIONS:
+            errors['resolution'] = [f"Must be one of: {', '.join(RESOLUTIONS)}."]
+        elif 'window' not in errors and duration.total_seconds() / RESOLUTIONS[resolution] > MAX_POINTS:
+            errors['resolution'] = [f'Too fine for this window; at most {MAX_POINTS} buckets are returned.']
+        
+        if not errors:
+            try:
+                data = series(duration, RESOLUTIONS[resolution], endpoint)
+            except ValueError:
+                errors['resolution'] = ['No tier keeps this resolution for the whole window.']
+        if errors:
+            return Response(
+                {'error': 'Invalid request parameters', 'details': errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({'window': window, 'resolution': resolution, 'endpoint': endpoint, **data})
+
+
+class TrackingRequestExportView(APIView):
+    """
+    Stream logged tracking requests as CSV or NDJSON.
+    
+    GET /exports/tracking-requests
+    
+    Query Parameters:
+    - export_format: "csv" (default) or "ndjson"
+    - customer_id: UUID (optional)
+    - lane: origin and destination country codes, e.g. "MY-ID" (optional)
+    - since / until: RFC 3339 timestamps bounding created_at (optional)
+    """
+    
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        """Return a streaming export of the matching rows."""
+        from .exports import EXPORT_FORMATS, iter_export
+        from .filters import TrackingRequestFilterSerializer
+        
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {
+                    'error': 'Invalid request parameters',
+                    'details': {'export_format': [f"Must be one of: {', '.join(EXPORT_FORMATS)}"]}
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = TrackingRequestFilterSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(
+                {'error': 'Invalid request parameters', 'details': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        logger.info(
+            f"Starting {export_format} export of tracking requests",
+            extra={'filters': dict(request.query_params)}
+        )
+        
+        response = StreamingHttpResponse(
+            iter_export(export_format, serializer.validated_data, using=read_database()),
+            content_type=EXPORT_FORMATS[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="tracking-requests.{export_format}"'
+        return response
+
+
+class DailyRollupView(APIView):
+    """Base view for per-day analytics served from the rollup tables."""
+    
+    permission_classes = [IsAdminUser]
+    max_days = 366
+    
+    def get_days(self, request):
+        """Parse the ?days= window, defaulting to 30."""
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= self.max_days:
+            return None
+        return days
+    
+    def respond(self, request, queryset, extra):
+        """Summarize the rollup rows of the requested window."""
+        from .rollups import summarize_daily
+        
+        days = self.get_days(request)
+        if days is None:
+            return Response(
+                {
+                    'error': 'Invalid request parameters',
+                    'details': {'days': [f'Must be an integer between 1 and {self.max_days}']}
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({**extra, **summarize_daily(queryset, days)})
+
+
+@method_decorator(replica_reads(), name='get')
+class LaneDailyRollupView(DailyRollupView):
+    """
+    Daily parcel counts and weight percentiles for one lane.
+    
+    GET /analytics/lanes/<origin>-<destination>/daily?days=30
+    """
+    
+    def get(self, request, lane):
+        """Return the lane's daily series for the last N days."""
+        from .filters import parse_lane
+        from .models import LaneDailyRollup
+        
+        try:
+            origin, destination = parse_lane(lane)
+        except ValueError as e:
+            return Response(
+                {'error': 'Invalid request parameters', 'details': {'lane': [str(e)]}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = LaneDailyRollup.objects.filter(
+            origin_country_id=origin, destination_country_id=destination
+        )
+        return self.respond(request, queryset, {'lane': f'{origin}-{destination}'})
+
+
+@method_decorator(replica_reads(), name='get')
+class CustomerDailyRollupView(DailyRollupView):
+    """
+    Daily parcel counts and weight percentiles for one customer.
+    
+    GET /analytics/customers/<customer_id>/daily?days=30
+    """
+    
+    def get(self, request, customer_id):
+        """Return the customer's daily series for the last N days."""
+        from .models import CustomerDailyRollup
+        
+        queryset = CustomerDailyRollup.objects.filter(customer_id=customer_id)
+        return self.respond(request, queryset, {'customer_id': str(customer_id)})
+
+
+@method_decorator(replica_reads(), name='get')
+class CustomerTrackingNumbersView(APIView):
+    """
+    List the tracking numbers issued to a customer, newest first.
+    
+    GET /customers/<customer_id>/tracking-numbers
+    
+    Query Parameters:
+    - lane: origin and destination country codes, e.g. "MY-ID" (optional)
+    - since / until: RFC 3339 timestamps bounding created_at (optional)
+    - limit: page size, 1-200 (default 50)
+    - cursor: next_cursor from the previous page (optional)
+    """
+    
+    permission_classes = [IsAdminUser]
+    
+    fields = (
+        'created_at', 'id', 'tracking_number', 'origin_country_id',
+        'destination_country_id', 'weight'
+    )
+    
+    def get(self, request, customer_id):
+        """Return one keyset page of the customer's history."""
+        from .filters import CustomerHistoryQuerySerializer, filter_tracking_requests
+        from .models import TrackingNumberRequest
+        from .pagination import InvalidCursor, after_cursor, merge_keyset_pages
+        from .shards import read_alias, scatter
+        
+        serializer = CustomerHistoryQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(
+                {'error': 'Invalid request parameters', 'details': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        filters = {**serializer.validated_data, 'customer_id': customer_id}
+        
+        # Served entirely from the (customer_id, created_at, id) index range
+        # of each shard; rows of a bucket being rebalanced may be on either
+        def shard_page(alias):
+            queryset = filter_tracking_requests(TrackingNumberRequest.objects.using(read_alias(alias)), filters)
+            queryset = queryset.order_by('-created_at', '-id').values_list(*self.fields)
+            return list(after_cursor(queryset, filters.get('cursor'))[:filters['limit'] + 1])
+        
+        try:
+            rows, next_cursor = merge_keyset_pages(scatter(shard_page), filters['limit'])
+        except InvalidCursor as e:
+            return Response(
+                {'error': 'Invalid request parameters', 'details': {'cursor': [str(e)]}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = [
+            {
+                'tracking_number': tracking_number,
+                'origin_country_id': origin,
+                'destination_country_id': destination,
+                'weight': str(weight),
+                'created_at': created_at.isoformat(),
+            }
+            for created_at, _, tracking_number, origin, destination, weight in rows
+        ]
+        return Response({
+            'customer_id': str(customer_id),
+            'results': results,
+            'next_cursor': next_cursor,
+        })
+
+
+@method_decorator(never_cache, name='dispatch')
+@method_decorator(replica_reads(), name='get')
+class TrackingNumberVerifyView(APIView):
+    """
+    Tell whether a tracking number was issued, e.g. for a carrier checking a label.
+    
+    GET /tracking-numbers/<tracking_number>/verify
+    
+    Numbers the issued-number filter has never seen are answered from the
+    filter alone ("source": "filter"); the rest, including its false
+    positives, are looked up by find_tracking_request: in the tracking_number
+    index ("source": "index"), unloaded audit segments ("segments") and the
+    cold archive ("archive"). Leased numbers not reported yet are issued
+    while their lease is active ("source": "lease").
+    """
+    
+    def get(self, request, tracking_number):
+        """Return whether the number was issued and, if so, its lane and issue time."""
+        from .bloom import might_be_issued
+        from .leases import find_lease
+        
+        if not TRACKING_NUMBER.fullmatch(tracking_number):
+            return Response(
+                {
+                    'error': 'Invalid request parameters',
+                    'details': {'tracking_number': ['Must match ^[A-Z0-9]{1,16}$.']}
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with tracing.span('filter_check'):
+            maybe_issued = might_be_issued(tracking_number)
+        if maybe_issued is False and settings.BLOOM_TRUST_NEGATIVE:
+            row, source = None, 'filter'
+        else:
+            row, source = find_tracking_request(tracking_number)
+        if row is None:
+            lease = find_lease(tracking_number)
+            if lease is not None:
+                return Response({
+                    'tracking_number': tracking_number,
+                    'issued': True,
+                    'source': 'lease',
+                    'origin_country_id': lease.origin_country_id,
+                    'destination_country_id': lease.destination_country_id,
+                    'issued_at': lease.created_at.isoformat(),
+                })
+        
+        body = {'tracking_number': tracking_number, 'issued': row is not None, 'source': source}
+        if row is not None:
+            body.update({
+                'origin_country_id': row['origin_country_id'],
+                'destination_country_id': row['destination_country_id'],
+                'issued_at': row['created_at'].isoformat(),
+            })
+        return Response(body)
+
+
+@method_decorator(replica_reads(), name='get')
+class TrackingRequestLookupView(APIView):
+    """
+    Look up the full audit record of a tracking number, e.g. for a claim.
+    
+    GET /tracking-requests/<tracking_number>
+    
+    Searches the table, unloaded audit segments and the cold archive, in
+    that order; "source" says where the record was found.
+    """
+    
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request, tracking_number):
+        """Return the record, or 404."""
+        if not TRACKING_NUMBER.fullmatch(tracking_number):
+            return Response(
+                {
+                    'error': 'Invalid request parameters',
+                    'details': {'tracking_number': ['Must match ^[A-Z0-9]{1,16}$.']}
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        row, source = find_tracking_request(tracking_number)
+        if row is None:
+            return Response({'error': 'Tracking number not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            **row,
+            'weight': str(row['weight']),
+            'customer_id': str(row['customer_id']),
+            'request_timestamp': row['request_timestamp'].isoformat(),
+            'created_at': row['created_at'].isoformat(),
+            'source': source,
+        })
+
+
+class ProfilerView(APIView):
+    """
+    Start a sampling profile of the worker that serves this request.
+    
+    POST /debug/profile {"seconds": 30, "interval_ms": 5}
+    
+    Profiles every thread of this process in the background and writes the
+    collapsed stacks (flamegraph.pl / speedscope input) to PROFILER_DIR.
+    GET reports the profile running in this worker, if any.
+    """
+    
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        """Return the running profile of this worker."""
+        from .profiling import active_profiler
+        
+        profiler = active_profiler()
+        return Response({
+            'pid': os.getpid(),
+            'running': profiler is not None,
+            'profile': profiler.name if profiler is not None else None,
+        })
+    
+    def post(self, request):
+        """Start profiling this worker."""
+        from .profiling import ProfilerBusy, start_sampling
+        from .serializers import ProfileRequestSerializer
+        
+        serializer = ProfileRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {'error': 'Invalid request parameters', 'details': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            profiler = start_sampling(**serializer.validated_data)
+        except ProfilerBusy as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        
+        logger.info(
+            f"Started {profiler.seconds:.0f}s sampling profile {profiler.name}",
+            extra={'user': request.user.get_username()}
+        )
+        return Response(
+            {
+                'pid': profiler.pid,
+                'profile': profiler.name,
+                'seconds': profiler.seconds,
+                'interval_ms': profiler.interval * 1000,
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class ProfileListView(APIView):
+    """
+    List stored profiles, newest first.
+    
+    GET /debug/profiles
+    """
+    
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        """Return the stored profiles."""
+        from .profiling import list_profiles
+        
+        return Response({'results': list_profiles()})
+
+
+class ProfileDownloadView(APIView):
+    """
+    Download one stored profile.
+    
+    GET /debug/profiles/<name>
+    
+    Sampling profiles are collapsed stacks; request profiles are named after
+    the request's correlation id and load with pstats or snakeviz.
+    """
+    
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request, name):
+        """Return the profile as an attachment."""
+        from .profiling import profile_path
+        
+        path = profile_path(name)
+        if path is None:
+            return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
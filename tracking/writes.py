@@ -0,0 +1,404 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar, Token
+from typing import Any, Dict, List, Optional, Set
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+from .health import register_check
+from .lifecycle import register_shutdown_hook
+from .replicas import note_writes
+from .shards import database_for, get_shards
+from .sqlite import writer_lock
+
+logger = logging.getLogger(__name__)
+
+WRITE_MODE_DIRECT = 'direct'
+WRITE_MODE_REQUEST = 'request'
+WRITE_MODE_GROUP = 'group'
+
+
+class WriteTimeout(Exception):
+    """The group commit writer did not confirm a row in time."""
+
+
+class CommitFailed(Exception):
+    """The transactions holding a unit of work's insert() rows did not commit."""
+
+
+class UnitOfWork:
+    """Rows a request defers to its end, and the transactions insert() opened for it."""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.rows: List[Any] = []
+        self.open: Set[str] = set()
+        self.stack = ExitStack()
+
+    def begin(self, using: str):
+        """Open the request's transaction on `using`, holding its writer lock until the end."""
+        if using not in self.open:
+            self.stack.enter_context(writer_lock(connections[using]))
+            self.stack.enter_context(transaction.atomic(using=using))
+            self.open.add(using)
+
+
+_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar('tracking_unit_of_work', default=None)
+
+
+def get_write_mode() -> str:
+    """Return the configured write mode: direct, request or group."""
+    return getattr(settings, 'TRACKING_WRITE_MODE', WRITE_MODE_REQUEST)
+
+
+def begin_unit_of_work(mode: Optional[str] = None) -> Token:
+    """Start collecting the rows written by the current request, in `mode` or the configured one."""
+    return _unit_of_work.set(UnitOfWork(mode or get_write_mode()))
+
+
+def end_unit_of_work(token: Token):
+    """
+    Write the rows recorded since begin_unit_of_work and commit the request.
+
+    Rows for a database insert() opened a transaction on are written into it
+    before it commits; the rest are committed according to the write mode.
+    Rows insert() accepted commit even if the recorded ones fail, since their
+    numbers were already handed out. Raises CommitFailed if the rows insert()
+    accepted did not commit, so the caller must not hand their numbers out.
+    """
+    unit = _unit_of_work.get()
+    _unit_of_work.reset(token)
+    if unit is None:
+        return
+
+    later = []
+    try:
+        with unit.stack:
+            for using, rows in _by_database(unit.rows).items():
+                if using not in unit.open:
+                    later.extend(rows)
+                    continue
+                try:
+                    with transaction.atomic(using=using):
+                        _insert_rows(rows, using)
+                except Exception as e:
+                    logger.warning(f"Failed to write {len(rows)} recorded rows: {str(e)}")
+    except Exception as e:
+        raise CommitFailed(f"Commit of {', '.join(sorted(unit.open))} failed: {str(e)}") from e
+    if later:
+        commit_unit_of_work(later, unit.mode)
+
+
+def record(instance) -> bool:
+    """
+    Defer saving a model instance to the active unit of work.
+
+    Returns False when no unit of work is active; the caller then saves the
+    instance itself. Rows that must be unique go through insert() instead.
+    """
+    unit = _unit_of_work.get()
+    if unit is None:
+        return False
+    unit.rows.append(instance)
+    return True
+
+
+def insert(instance) -> bool:
+    """
+    Insert a row whose constraints must hold before the request goes on.
+
+    Returns False when no unit of work is active; the caller then saves the
+    instance itself. In request mode the row is inserted under a savepoint of
+    the request's transaction, which commits at end_unit_of_work. In group
+    mode it is handed to the group commit writer and the caller waits up to
+    WRITE_BUFFER_COMMIT_TIMEOUT_SECONDS for the commit. Either way a
+    duplicate (e.g. a colliding tracking number) raises IntegrityError here,
+    while the caller can still retry.
+    """
+    unit = _unit_of_work.get()
+    if unit is None:
+        return False
+
+    if unit.mode == WRITE_MODE_GROUP:
+        ticket = get_group_writer().submit([instance])
+        if not ticket.wait(getattr(settings, 'WRITE_BUFFER_COMMIT_TIMEOUT_SECONDS', 5.0)):
+            raise WriteTimeout(f'{type(instance).__name__} row not committed in time')
+        if ticket.dropped:
+            raise IntegrityError(f'{type(instance).__name__} row rejected by the group commit')
+        return True
+
+    using = database_for(instance)
+    unit.begin(using)
+    if using == DEFAULT_DB_ALIAS:
+        note_writes([instance])
+    with transaction.atomic(using=using):
+        instance.save(force_insert=True, using=using)
+    return True
+
+
+def _by_database(instances: List[Any]) -> Dict[str, List[Any]]:
+    by_database: Dict[str, List[Any]] = defaultdict(list)
+    for instance in instances:
+        by_database[database_for(instance)].append(instance)
+    return by_database
+
+
+def write_rows(instances: List[Any], dropped: Optional[List[Any]] = None) -> int:
+    """
+    Insert instances in a single transaction, one multi-row INSERT per model.
+
+    With DATABASE_SHARDS the rows are split by shard and each shard gets its
+    own transaction. If the batch violates a constraint (e.g. a duplicate
+    tracking number) the rows are retried one by one under savepoints so a
+    single bad row does not discard the rest; rejected rows are appended to
+    `dropped` if given. Returns the number of rows written.
+    """
+    if not instances:
+        return 0
+
+    written = 0
+    for using, rows in _by_database(instances).items():
+        with writer_lock(connections[using]):
+            written += _insert_rows(rows, using, dropped)
+    return written
+
+
+def _insert_rows(rows: List[Any], using: str, dropped: Optional[List[Any]] = None) -> int:
+    if using == DEFAULT_DB_ALIAS:
+        # Explicit .using() bypasses ReplicaRouter.db_for_write, which marks read-your-writes
+        note_writes(rows)
+    by_model: Dict[Any, List[Any]] = defaultdict(list)
+    for instance in rows:
+        by_model[type(instance)].append(instance)
+    return _write_rows(rows, by_model, using, dropped)
+
+
+def _write_rows(instances: List[Any], by_model: Dict[Any, List[Any]], using: str,
+                dropped: Optional[List[Any]] = None) -> int:
+    try:
+        with transaction.atomic(using=using):
+            for model, rows in by_model.items():
+                model.objects.using(using).bulk_create(rows)
+        return len(instances)
+    except IntegrityError as e:
+        logger.warning(f"Batch insert of {len(instances)} rows failed, retrying row by row: {str(e)}")
+
+    written = 0
+    with transaction.atomic(using=using):
+        for instance in instances:
+            try:
+                with transaction.atomic(using=using):
+                    instance.save(force_insert=True, using=using)
+                written += 1
+            except IntegrityError as e:
+                logger.error(
+                    f"Dropped {type(instance).__name__} row: {str(e)}",
+                    extra={'correlation_id': getattr(instance, 'correlation_id', None)}
+                )
+                if dropped is not None:
+                    dropped.append(instance)
+    return written
+
+
+class WriteTicket:
+    """Tells the caller of GroupCommitWriter.submit() when its rows are committed."""
+
+    def __init__(self, count: int):
+        self.dropped: List[Any] = []
+        self._remaining = count
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not count:
+            self._done.set()
+
+    def resolve(self, count: int, dropped: List[Any]):
+        """Mark `count` rows as handled, `dropped` of them rejected."""
+        with self._lock:
+            self.dropped.extend(dropped)
+            self._remaining -= count
+            if self._remaining <= 0:
+                self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every row is committed or dropped; False on timeout."""
+        return self._done.wait(timeout)
+
+
+class GroupCommitWriter:
+    """
+    Background writer that commits rows from many requests together.
+
+    Requests hand their rows to submit() and return immediately, or wait on
+    the returned ticket when they need to know the rows were accepted. A single
+    thread drains the queue, waiting up to WRITE_BUFFER_MAX_DELAY_MS for more
+    rows, and writes up to WRITE_BUFFER_MAX_BATCH rows per transaction, so a
+    busy worker pays one commit (and one WAL fsync) for many requests.
+    """
+
+    def __init__(self, max_batch: int, max_delay_ms: float, max_depth: int):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_depth = max_depth
+        self._queue: 'queue.Queue[Any]' = queue.Queue()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._idle = threading.Condition(self._pending_lock)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+        self.stats = {'rows': 0, 'commits': 0, 'failures': 0, 'overflows': 0}
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        """Rows accepted but not yet committed."""
+        return self._pending
+
+    @property
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def submit(self, instances: List[Any]) -> WriteTicket:
+        """Queue rows for the next group commit; the ticket tells when they are committed."""
+        ticket = WriteTicket(len(instances))
+        if not instances:
+            return ticket
+        # Committed later on the writer's thread, so mark read-your-writes here
+        note_writes(instances)
+        if self._pending + len(instances) > self.max_depth or not self.is_alive:
+            # Buffer full or writer gone: write in the caller rather than drop rows
+            self.stats['overflows'] += 1
+            dropped: List[Any] = []
+            write_rows(instances, dropped)
+            ticket.resolve(len(instances), dropped)
+            return ticket
+        with self._pending_lock:
+            self._pending += len(instances)
+        for instance in instances:
+            self._queue.put((instance, ticket))
+        return ticket
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted row is committed; False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Flush outstanding rows and stop the writer thread."""
+        self.flush(timeout=timeout)
+        self._stopping.set()
+        self._thread.join(timeout=timeout)
+
+    def _next_batch(self) -> List[Any]:
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        try:
+            while not (self._stopping.is_set() and self._queue.empty()):
+                batch = self._next_batch()
+                if batch:
+                    self._commit(batch)
+        finally:
+            connections.close_all()
+
+    def _commit(self, batch: List[Any]):
+        instances = [instance for instance, _ in batch]
+        backoff = 0.05
+        while True:
+            dropped: List[Any] = []
+            try:
+                self.stats['rows'] += write_rows(instances, dropped)
+                self.stats['commits'] += 1
+                break
+            except Exception as e:
+                # Database unavailable: keep the rows and retry rather than lose audit data
+                self.stats['failures'] += 1
+                logger.warning(f"Group commit of {len(batch)} rows failed, retrying: {str(e)}")
+                for alias in get_shards():
+                    connections[alias].close()
+                if self._stopping.is_set() and backoff > 5:
+                    logger.error(f"Giving up on {len(batch)} rows while shutting down")
+                    dropped = instances
+                    break
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+        rejected = {id(instance) for instance in dropped}
+        for instance, ticket in batch:
+            ticket.resolve(1, [instance] if id(instance) in rejected else [])
+        with self._idle:
+            self._pending -= len(batch)
+            if self._pending == 0:
+                self._idle.notify_all()
+
+
+_writer: Optional[GroupCommitWriter] = None
+_writer_pid: Optional[int] = None
+_writer_lock = threading.Lock()
+
+
+def get_group_writer() -> GroupCommitWriter:
+    """Return this process' group commit writer, starting it on first use."""
+    global _writer, _writer_pid
+    pid = os.getpid()
+    if _writer is not None and _writer_pid == pid:
+        return _writer
+    with _writer_lock:
+        if _writer is None or _writer_pid != pid:
+            _writer = GroupCommitWriter(
+                max_batch=getattr(settings, 'WRITE_BUFFER_MAX_BATCH', 500),
+                max_delay_ms=getattr(settings, 'WRITE_BUFFER_MAX_DELAY_MS', 20),
+                max_depth=getattr(settings, 'WRITE_BUFFER_MAX_DEPTH', 10000),
+            )
+            _writer_pid = pid
+    return _writer
+
+
+def shutdown_group_writer(timeout: Optional[float] = None):
+    """Drain and stop the writer if this process started one."""
+    global _writer
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.stop(timeout=timeout)
+        _writer = None
+
+
+def commit_unit_of_work(instances: List[Any], mode: Optional[str] = None):
+    """Persist the rows of a finished unit of work according to the write mode."""
+    if (mode or get_write_mode()) == WRITE_MODE_GROUP:
+        get_group_writer().submit(instances)
+    else:
+        write_rows(instances)
+
+
+def check_write_buffer() -> Dict[str, Any]:
+    """Readiness check: the group commit buffer is draining and not backed up."""
+    mode = get_write_mode()
+    if mode != WRITE_MODE_GROUP or _writer is None or _writer_pid != os.getpid():
+        return {'mode': mode, 'depth': 0}
+    depth = _writer.depth
+    if not _writer.is_alive:
+        raise RuntimeError(f'group commit writer stopped with {depth} rows pending')
+    if depth >= _writer.max_depth:
+        raise RuntimeError(f'write buffer full ({depth}/{_writer.max_depth} rows)')
+    return {'mode': mode, 'depth': depth, **_writer.stats}
+
+
+register_check('write_buffer', check_write_buffer)
+register_shutdown_hook('group_commit_writer', shutdown_group_writer)
@@ -1,7 +1,6 @@
 import os
 from pathlib import Path
-from decouple import config
-import dj_database_url
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -16,31 +15,46 @@ ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1,0.0.0.0', c
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATIC_URL = '/static/'
+
+# Startup profile: "full" serves the API and the admin site; "api" is the
+# cold-start optimized profile for autoscaled API dynos. It leaves out the
+# admin, sessions and messages apps and their middleware (staff endpoints
+# then authenticate with HTTP Basic only).
+STARTUP_PROFILE = config('STARTUP_PROFILE', default='full')
+ADMIN_ENABLED = STARTUP_PROFILE != 'api'
+# Resolve URLs, serializers and translations at boot instead of on the first request
+STARTUP_PREWARM = config('STARTUP_PREWARM', default=True, cast=bool)
+
+CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])
+CORS_ENABLED = DEBUG or bool(CORS_ALLOWED_ORIGINS)
+
 # Application definition
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    *(['django.contrib.admin'] if ADMIN_ENABLED else []),
     'django.contrib.auth',
     'django.contrib.contenttypes',
-    'django.contrib.sessions',
-    'django.contrib.messages',
+    *(['django.contrib.sessions', 'django.contrib.messages'] if ADMIN_ENABLED else []),
     'django.contrib.staticfiles',
     'rest_framework',
-    'corsheaders',
-    'django_extensions',
+    *(['corsheaders'] if CORS_ENABLED else []),
+    # Development tooling only
+    *(['django_extensions'] if DEBUG else []),
     'tracking',
 ]
 
 MIDDLEWARE = [
-    'corsheaders.middleware.CorsMiddleware',
+    *(['corsheaders.middleware.CorsMiddleware'] if CORS_ENABLED else []),
     'tracking.middleware.RequestLoggingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    *(['django.contrib.sessions.middleware.SessionMiddleware'] if ADMIN_ENABLED else []),
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    *([
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    ] if ADMIN_ENABLED else []),
 ]
 
 ROOT_URLCONF = 'tracking_api.urls'
@@ -54,8 +68,10 @@ TEMPLATES = [
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
+                *([
+                    'django.contrib.auth.context_processors.auth',
+                    'django.contrib.messages.context_processors.messages',
+                ] if ADMIN_ENABLED else []),
             ],
         },
     },
@@ -64,11 +80,103 @@ TEMPLATES = [
 WSGI_APPLICATION = 'tracking_api.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': dj_database_url.config(
-        default=config('DATABASE_URL', default='sqlite:///db.sqlite3')
-    )
-}
+# Persistent connections: each worker thread keeps its connection for
+# DB_CONN_MAX_AGE seconds instead of reconnecting on every request.
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
+DATABASE_URL = config('DATABASE_URL', default='sqlite:///db.sqlite3')
+
+
+def database_from_url(url):
+    if url.startswith('sqlite:///'):
+        # Plain SQLite file paths need no URL parsing (and no dj_database_url import)
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': url[len('sqlite:///'):],
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        }
+    import dj_database_url
+
+    return dj_database_url.parse(url, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=DB_CONN_HEALTH_CHECKS)
+
+
+DATABASES = {'default': database_from_url(DATABASE_URL)}
+
+# Read replicas: DATABASE_REPLICA_URLS is a comma-separated list of
+# DATABASE_URL-style URLs, added as databases "replica1", "replica2", ...
+# Analytics, lookups, exports and admin changelists read from a replica whose
+# lag (measured every REPLICA_LAG_CHECK_SECONDS) is within
+# REPLICA_MAX_LAG_SECONDS; a correlation id that wrote in the last
+# REPLICA_STICKY_SECONDS reads from the primary instead. Writes and all other
+# reads use the primary.
+DATABASE_REPLICA_URLS = config('DATABASE_REPLICA_URLS', default='', cast=Csv())
+DATABASE_REPLICAS = []
+for index, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica{index}'] = {**database_from_url(url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{index}')
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=5.0, cast=float)
+REPLICA_LAG_CHECK_SECONDS = config('REPLICA_LAG_CHECK_SECONDS', default=5.0, cast=float)
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5.0, cast=float)
+REPLICA_STICKY_CACHE_ALIAS = config('REPLICA_STICKY_CACHE_ALIAS', default='default')
+
+# Write sharding of tracking_requests: DATABASE_SHARD_URLS is a
+# comma-separated list of DATABASE_URL-style URLs, added as databases
+# "shard1", "shard2", ... next to the default database, which is shard zero.
+# Rows go to one of 36 buckets by SHARD_KEY ("customer" or "lane") and a
+# shard map assigns buckets to databases; the map is kept in the default
+# database and cached for SHARD_MAP_CACHE_TTL seconds per process. Run
+# "migrate --database shardN" for every shard and move buckets with the
+# rebalance_shards command. Read replicas apply to the default database only.
+DATABASE_SHARD_URLS = config('DATABASE_SHARD_URLS', default='', cast=Csv())
+DATABASE_SHARDS = ['default']
+for index, url in enumerate(DATABASE_SHARD_URLS, start=1):
+    DATABASES[f'shard{index}'] = database_from_url(url)
+    DATABASE_SHARDS.append(f'shard{index}')
+SHARD_KEY = config('SHARD_KEY', default='customer')
+SHARD_MAP_CACHE_TTL = config('SHARD_MAP_CACHE_TTL', default=30.0, cast=float)
+DATABASE_ROUTERS = ['tracking.shards.ShardRouter', 'tracking.replicas.ReplicaRouter']
+
+# SQLite tuned mode for single-node deployments: WAL journaling, relaxed
+# fsync, busy timeouts and mmap on every connection, and all inserts funneled
+# through the group commit writer (see TRACKING_WRITE_MODE below).
+SQLITE_TUNED = config('SQLITE_TUNED', default=False, cast=bool)
+SQLITE_SYNCHRONOUS = config('SQLITE_SYNCHRONOUS', default='NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = config('SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int)
+SQLITE_MMAP_SIZE = config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int)
+
+for database in DATABASES.values():
+    if SQLITE_TUNED and database['ENGINE'] == 'django.db.backends.sqlite3':
+        database.setdefault('OPTIONS', {})['timeout'] = SQLITE_BUSY_TIMEOUT_MS / 1000
+
+# psycopg 3 connection pool (PostgreSQL only). Each gunicorn worker owns one
+# pool, so the server sees up to WEB_CONCURRENCY * DB_POOL_MAX_SIZE
+# connections; keep that below max_connections. A worker needs one connection
+# per request thread plus background writers and probes, hence the default of
+# GUNICORN_THREADS + 2.
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=3, cast=int)
+GUNICORN_THREADS = config('GUNICORN_THREADS', default=1, cast=int)
+DB_POOL_ENABLED = config('DB_POOL_ENABLED', default=False, cast=bool)
+DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=1, cast=int)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=GUNICORN_THREADS + 2, cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=5.0, cast=float)
+DB_POOL_MAX_IDLE = config('DB_POOL_MAX_IDLE', default=600.0, cast=float)
+DB_POOL_MAX_LIFETIME = config('DB_POOL_MAX_LIFETIME', default=3600.0, cast=float)
+DB_MAX_CONNECTIONS = config('DB_MAX_CONNECTIONS', default=100, cast=int)
+
+for database in DATABASES.values():
+    if DB_POOL_ENABLED and database['ENGINE'] == 'django.db.backends.postgresql':
+        database['ENGINE'] = 'tracking.db_backends.postgresql_pool'
+        # The pool owns connection reuse; Django must hand connections back after each request
+        database['CONN_MAX_AGE'] = 0
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_idle': DB_POOL_MAX_IDLE,
+            'max_lifetime': DB_POOL_MAX_LIFETIME,
+        }
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -110,10 +218,140 @@ REST_FRAMEWORK = {
     ],
     'EXCEPTION_HANDLER': 'tracking.exceptions.custom_exception_handler',
 }
+if not ADMIN_ENABLED:
+    # No session middleware in the api profile
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] = [
+        'rest_framework.authentication.BasicAuthentication',
+    ]
 
-# CORS settings
+# CORS settings (CORS_ALLOWED_ORIGINS is read above)
 CORS_ALLOW_ALL_ORIGINS = DEBUG
-CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])
+
+# Write path: 'direct' commits every insert on its own, 'request' commits all
+# inserts of a request in one transaction, 'group' hands them to a background
+# writer that commits many requests per transaction.
+TRACKING_WRITE_MODE = config('TRACKING_WRITE_MODE', default='group' if SQLITE_TUNED else 'request')
+WRITE_BUFFER_MAX_BATCH = config('WRITE_BUFFER_MAX_BATCH', default=500, cast=int)
+WRITE_BUFFER_MAX_DELAY_MS = config('WRITE_BUFFER_MAX_DELAY_MS', default=20, cast=int)
+WRITE_BUFFER_MAX_DEPTH = config('WRITE_BUFFER_MAX_DEPTH', default=10000, cast=int)
+# How long a request waits for the group commit of its audit row before failing
+WRITE_BUFFER_COMMIT_TIMEOUT_SECONDS = config('WRITE_BUFFER_COMMIT_TIMEOUT_SECONDS', default=5.0, cast=float)
+
+# Audit trail store. "segments" appends TrackingNumberRequest rows to rotating
+# segment files in AUDIT_SEGMENT_DIR (fsync'ed as a group every
+# AUDIT_SEGMENT_FSYNC_MS) instead of the database; manage.py
+# load_audit_segments imports sealed segments into the table.
+AUDIT_STORE = config('AUDIT_STORE', default='database')
+AUDIT_SEGMENT_DIR = config('AUDIT_SEGMENT_DIR', default=os.path.join(BASE_DIR, 'audit_segments'))
+AUDIT_SEGMENT_MAX_BYTES = config('AUDIT_SEGMENT_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+AUDIT_SEGMENT_FSYNC_MS = config('AUDIT_SEGMENT_FSYNC_MS', default=20, cast=float)
+
+# Bulk generation (POST /tracking-numbers/batch, manage.py generate_tracking_numbers).
+# Batches of at least BULK_PARALLEL_THRESHOLD parcels are split across a pool of
+# BULK_WORKERS processes (0 = one per CPU).
+BULK_WORKERS = config('BULK_WORKERS', default=0, cast=int)
+BULK_PARALLEL_THRESHOLD = config('BULK_PARALLEL_THRESHOLD', default=5000, cast=int)
+BULK_MAX_BATCH = config('BULK_MAX_BATCH', default=100000, cast=int)
+BULK_START_METHOD = config('BULK_START_METHOD', default='forkserver')
+
+# Per-customer tracking number templates (TrackingNumberFormat). Lookups are
+# cached per process for FORMAT_CACHE_TTL seconds; a template must span
+# FORMAT_MIN_SPACE_FACTOR times the customer's expected volume.
+FORMAT_CACHE_TTL = config('FORMAT_CACHE_TTL', default=60.0, cast=float)
+FORMAT_MIN_SPACE_FACTOR = config('FORMAT_MIN_SPACE_FACTOR', default=1000, cast=int)
+
+# Filter of issued tracking numbers (manage.py rebuild_issued_filter), mapped
+# by every worker so GET /tracking-numbers/<n>/verify can rule out numbers
+# that were never issued without a query. Empty BLOOM_PATH turns it off.
+# Set BLOOM_TRUST_NEGATIVE to False if numbers are also issued by hosts that
+# do not share the file; every answer then comes from the index.
+BLOOM_PATH = config('BLOOM_PATH', default='')
+BLOOM_CAPACITY = config('BLOOM_CAPACITY', default=10_000_000, cast=int)
+BLOOM_ERROR_RATE = config('BLOOM_ERROR_RATE', default=0.001, cast=float)
+BLOOM_TRUST_NEGATIVE = config('BLOOM_TRUST_NEGATIVE', default=True, cast=bool)
+
+# Cold archive (manage.py archive_tracking_requests): old rows move to
+# compressed files under ARCHIVE_DIR, one per day and lane, in blocks of
+# ARCHIVE_BLOCK_ROWS rows that lookups decompress one at a time.
+ARCHIVE_DIR = config('ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive'))
+ARCHIVE_BLOCK_ROWS = config('ARCHIVE_BLOCK_ROWS', default=1000, cast=int)
+ARCHIVE_COMPRESSION_LEVEL = config('ARCHIVE_COMPRESSION_LEVEL', default=6, cast=int)
+
+# Number leases (POST /leases): blocks of up to LEASE_MAX_NUMBERS numbers a
+# client assigns offline and reports back in batches of up to
+# LEASE_MAX_ASSIGNMENTS. Reports are accepted until LEASE_GRACE_SECONDS after
+# expiry; manage.py expire_number_leases then voids the unused numbers, or
+# with LEASE_EXPIRY_POLICY=return gives those above the highest reported
+# number back to the lane. A lane with less than LEASE_MIN_FREE_RATIO of its
+# lease numbers left is logged and reported by expire_number_leases.
+LEASE_MAX_NUMBERS = config('LEASE_MAX_NUMBERS', default=1000000, cast=int)
+LEASE_DEFAULT_TTL_SECONDS = config('LEASE_DEFAULT_TTL_SECONDS', default=86400, cast=int)
+LEASE_MAX_TTL_SECONDS = config('LEASE_MAX_TTL_SECONDS', default=604800, cast=int)
+LEASE_MAX_ASSIGNMENTS = config('LEASE_MAX_ASSIGNMENTS', default=10000, cast=int)
+LEASE_GRACE_SECONDS = config('LEASE_GRACE_SECONDS', default=300, cast=int)
+LEASE_EXPIRY_POLICY = config('LEASE_EXPIRY_POLICY', default='void')
+LEASE_MIN_FREE_RATIO = config('LEASE_MIN_FREE_RATIO', default=0.01, cast=float)
+
+# Rows fetched per round trip when streaming exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Incremental daily rollups (python manage.py update_rollups)
+ROLLUP_BATCH_SIZE = config('ROLLUP_BATCH_SIZE', default=5000, cast=int)
+ROLLUP_SAFETY_LAG_SECONDS = config('ROLLUP_SAFETY_LAG_SECONDS', default=60, cast=int)
+
+# API metrics tiers (python manage.py compact_metrics): api_metrics rows are
+# folded into 1-minute rollups and complete hours into 1-hour rollups; each
+# level is dropped after its retention once the next level holds it.
+METRICS_RAW_RETENTION_HOURS = config('METRICS_RAW_RETENTION_HOURS', default=24, cast=int)
+METRICS_MINUTE_RETENTION_DAYS = config('METRICS_MINUTE_RETENTION_DAYS', default=30, cast=int)
+METRICS_HOUR_RETENTION_DAYS = config('METRICS_HOUR_RETENTION_DAYS', default=730, cast=int)
+
+# /metrics aggregates are cached per window in the METRICS_CACHE_ALIAS cache
+# (shared by every worker using the same backend). Entries older than
+# METRICS_CACHE_TTL seconds are served for up to METRICS_CACHE_STALE_SECONDS
+# more while one refresh runs in the background; 0 TTL disables the cache.
+METRICS_CACHE_ALIAS = config('METRICS_CACHE_ALIAS', default='default')
+METRICS_CACHE_TTL = config('METRICS_CACHE_TTL', default=10.0, cast=float)
+METRICS_CACHE_STALE_SECONDS = config('METRICS_CACHE_STALE_SECONDS', default=300.0, cast=float)
+METRICS_CACHE_LOCK_SECONDS = config('METRICS_CACHE_LOCK_SECONDS', default=30.0, cast=float)
+
+# Health checks
+HEALTH_CHECK_CACHE_TTL = config('HEALTH_CHECK_CACHE_TTL', default=2.0, cast=float)
+HEALTH_CHECK_REFRESH_INTERVAL = config('HEALTH_CHECK_REFRESH_INTERVAL', default=1.0, cast=float)
+
+# Request tracing. A TRACING_SAMPLE_RATE fraction of requests (or those sent
+# with a sampled W3C traceparent header) record per-stage spans; sampled
+# spans feed the per-stage histograms in /metrics and, if TRACING_EXPORT_PATH
+# is set, are appended there as OTLP/JSON lines.
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=0.0, cast=float)
+TRACING_EXPORT_PATH = config('TRACING_EXPORT_PATH', default='')
+TRACING_SERVICE_NAME = config('TRACING_SERVICE_NAME', default='tracking-api')
+
+# Traffic capture for manage.py replay_traffic: a CAPTURE_SAMPLE_RATE fraction
+# of requests (method, path, query, body up to CAPTURE_MAX_BODY_BYTES, status
+# and latency) is appended to CAPTURE_PATH as NDJSON.
+CAPTURE_SAMPLE_RATE = config('CAPTURE_SAMPLE_RATE', default=0.0, cast=float)
+CAPTURE_PATH = config('CAPTURE_PATH', default='')
+CAPTURE_MAX_BODY_BYTES = config('CAPTURE_MAX_BODY_BYTES', default=65536, cast=int)
+
+# Header carrying the correlation id in and out; a well-formed inbound value
+# (up to 36 characters) is reused, otherwise one is generated.
+CORRELATION_ID_HEADER = config('CORRELATION_ID_HEADER', default='X-Correlation-ID')
+
+# On-demand profiling. Staff can start a sampling profile of a worker with
+# POST /debug/profile (or by sending it PROFILER_SIGNAL); traced requests sent
+# with "X-Profile: 1" are run under cProfile when PROFILER_REQUEST_ENABLED.
+# Results are kept in PROFILER_DIR.
+PROFILER_DIR = config('PROFILER_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILER_MAX_FILES = config('PROFILER_MAX_FILES', default=200, cast=int)
+PROFILER_DEFAULT_SECONDS = config('PROFILER_DEFAULT_SECONDS', default=30, cast=float)
+PROFILER_MAX_SECONDS = config('PROFILER_MAX_SECONDS', default=300, cast=float)
+PROFILER_SAMPLE_INTERVAL_MS = config('PROFILER_SAMPLE_INTERVAL_MS', default=5, cast=float)
+PROFILER_SIGNAL = config('PROFILER_SIGNAL', default='SIGPROF')
+PROFILER_REQUEST_ENABLED = config('PROFILER_REQUEST_ENABLED', default=False, cast=bool)
+
+# Paths skipped by RequestLoggingMiddleware (no log lines, no APIMetrics rows)
+REQUEST_LOGGING_EXCLUDED_PATHS = ['/health', '/health/live', '/health/ready']
 
 # Logging configuration
 LOGGING = {
@@ -121,7 +359,7 @@ LOGGING = {
     'disable_existing_loggers': False,
     'formatters': {
         'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
+            'format': '{levelname} {asctime} {module} {process:d} {thread:d} [{correlation_id}] {message}',
             'style': '{',
         },
         'simple': {
@@ -129,7 +367,13 @@ LOGGING = {
             'style': '{',
         },
         'json': {
-            'format': '{"level": "%(levelname)s", "time": "%(asctime)s", "module": "%(module)s", "message": "%(message)s"}',
+            'format': '{"level": "%(levelname)s", "time": "%(asctime)s", "module": "%(module)s", "correlation_id": "%(correlation_id)s", "message": "%(message)s"}',
+        },
+    },
+    'filters': {
+        # Adds the request's correlation id to every record
+        'correlation_id': {
+            '()': 'tracking.correlation.CorrelationIdFilter',
         },
     },
     'handlers': {
@@ -138,11 +382,13 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': 'tracking_api.log',
             'formatter': 'json',
+            'filters': ['correlation_id'],
         },
         'console': {
             'level': 'INFO',
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
+            'filters': ['correlation_id'],
         },
     },
     'root': {